@@ -0,0 +1,250 @@
+"""
+エージェントサーバーとのバイナリIPC実装
+Unixドメインソケット上で長さプレフィックス付きmsgpackフレームを多重化して送受信し、
+スレッドの会話履歴はエージェント側が保持している部分との差分のみを送信する
+"""
+
+import hashlib
+import itertools
+import socket
+import struct
+import threading
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from metrics import metrics
+
+try:
+    import msgpack
+except ImportError:  # msgpackがない環境ではHTTPのみを使用
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# フレーム形式: 4バイトのビッグエンディアン長 + msgpack本体
+_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+def ipc_available() -> bool:
+    """IPCトランスポートが利用可能か（msgpackがインストールされているか）"""
+    return msgpack is not None
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    body = msgpack.packb(message, use_bin_type=True)
+    return _HEADER.pack(len(body)) + body
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("IPC connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def read_frame(sock: socket.socket) -> Tuple[Dict[str, Any], int]:
+    """フレームを1つ読み取り (メッセージ, フレームのバイト数) を返す"""
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ConnectionError(f"IPC frame too large: {length} bytes")
+    return msgpack.unpackb(_recv_exact(sock, length), raw=False), _HEADER.size + length
+
+class _PendingReply:
+    def __init__(self):
+        self.done = threading.Event()
+        self.reply: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+def context_digest(data: bytes) -> str:
+    """会話履歴のUTF-8バイト列のハッシュ（エージェント側の thread-context.ts と同じ SHA-256）"""
+    return hashlib.sha256(data).hexdigest()
+
+class ContextSync:
+    """エージェント側が保持しているスレッド履歴を記録し、差分を計算するクラス
+
+    長さはUTF-8のバイト数で数える（JavaScriptの文字列長（UTF-16）とPythonの文字数はずれるため）。
+    会話履歴は最新の一定件数のみのため、長いスレッドでは先頭の発言が落ちる。保持分の先頭を行単位で
+    落とした残りが新しい履歴の先頭と一致すれば、落とすバイト数（drop）と残りの続きだけを送る。
+    """
+
+    def __init__(self, max_threads: int = 10000):
+        self.max_threads = max_threads
+        self._synced: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def delta(self, thread_id: str, context: str) -> Tuple[int, int, str, str]:
+        """(保持分の先頭から落とすバイト数, 残りのバイト数, 残りのハッシュ, 差分) を返す
+
+        保持分のどの行以降とも続かない場合（履歴の途中が変わった場合）は全体を送る。
+        """
+        with self._lock:
+            synced = self._synced.get(thread_id)
+        if synced:
+            data = context.encode("utf-8")
+            drop = self._find_drop(synced, data)
+            if drop is not None:
+                retained = len(synced) - drop
+                try:
+                    return drop, retained, context_digest(synced[drop:]), data[retained:].decode("utf-8")
+                except UnicodeDecodeError:
+                    pass
+        return 0, 0, "", context
+
+    @staticmethod
+    def _find_drop(synced: bytes, data: bytes) -> Optional[int]:
+        """保持分の行頭のうち、そこから末尾までが新しい履歴の先頭と一致する最初の位置"""
+        if data.startswith(synced):
+            return 0
+        # 新しい履歴の先頭行が現れる行頭だけを比べる
+        newline = data.find(b"\n")
+        first_line = data if newline < 0 else data[:newline]
+        if not first_line:
+            return None
+        position = synced.find(first_line, 1)
+        while position > 0:
+            if synced[position - 1] == 0x0A and data.startswith(synced[position:]):
+                return position
+            position = synced.find(first_line, position + 1)
+        return None
+
+    def update(self, thread_id: str, context: str):
+        """エージェントが保持した履歴を記録"""
+        data = context.encode("utf-8")
+        with self._lock:
+            if thread_id not in self._synced and len(self._synced) >= self.max_threads:
+                self._synced.pop(next(iter(self._synced)))
+            self._synced[thread_id] = data
+
+    def forget(self, thread_id: str):
+        with self._lock:
+            self._synced.pop(thread_id, None)
+
+class AgentIPCClient:
+    """1つのエージェントサーバーとの永続的な多重化IPC接続"""
+
+    def __init__(self, socket_path: str, connect_timeout: float = 1.0):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self.context_sync = ContextSync()
+        self._sock: Optional[socket.socket] = None
+        self._connect_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending: Dict[int, _PendingReply] = {}
+        self._ids = itertools.count(1)
+
+    def _ensure_connected(self) -> socket.socket:
+        with self._connect_lock:
+            if self._sock is not None:
+                return self._sock
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as e:
+                sock.close()
+                # 接続時のタイムアウトもリクエストのタイムアウトと区別して接続失敗として扱う
+                raise ConnectionError(f"IPC connect to {self.socket_path} failed: {e}") from e
+            sock.settimeout(None)
+            self._sock = sock
+            threading.Thread(target=self._read_loop, args=(sock,), name="agent-ipc-reader", daemon=True).start()
+            logger.info(f"[AgentIPC] Connected to {self.socket_path}")
+            return sock
+
+    def _read_loop(self, sock: socket.socket):
+        """応答フレームを読み取り、リクエストIDごとの待機者に配布"""
+        error: BaseException = ConnectionError("IPC connection closed")
+        try:
+            while True:
+                reply, size = read_frame(sock)
+                metrics.increment("ipc.bytes_received", size)
+                pending = self._pending.pop(reply.get("id"), None)
+                if pending is not None:
+                    pending.reply = reply
+                    pending.done.set()
+        except (OSError, ConnectionError, ValueError) as e:
+            error = e if isinstance(e, ConnectionError) else ConnectionError(str(e))
+        finally:
+            self._disconnect(sock, error)
+
+    def _disconnect(self, sock: socket.socket, error: BaseException):
+        with self._connect_lock:
+            if self._sock is sock:
+                self._sock = None
+        try:
+            sock.close()
+        except OSError:
+            pass
+        # 接続断の時点で応答待ちのリクエストは失敗させる
+        for request_id in list(self._pending):
+            pending = self._pending.pop(request_id, None)
+            if pending is not None:
+                pending.error = error
+                pending.done.set()
+
+    def request(self, method: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """リクエストを送信して応答を待つ（接続失敗はConnectionError、時間切れはTimeoutError）"""
+        sock = self._ensure_connected()
+        request_id = next(self._ids)
+        pending = _PendingReply()
+        self._pending[request_id] = pending
+
+        frame = encode_frame({"id": request_id, "method": method, "params": params})
+        try:
+            with self._write_lock:
+                sock.sendall(frame)
+        except OSError as e:
+            self._pending.pop(request_id, None)
+            self._disconnect(sock, ConnectionError(str(e)))
+            raise ConnectionError(str(e)) from e
+        metrics.increment("ipc.bytes_sent", len(frame))
+        metrics.increment("ipc.requests")
+
+        if not pending.done.wait(timeout):
+            self._pending.pop(request_id, None)
+            raise TimeoutError(f"IPC request timed out after {timeout}s")
+        if pending.error is not None:
+            raise pending.error
+        return pending.reply
+
+    def search(self, payload: Dict[str, Any], timeout: float) -> Tuple[int, Dict[str, Any]]:
+        """検索リクエストを送信し (ステータス, 応答本体) を返す
+
+        会話履歴はエージェント側の保持分（先頭の contextDrop バイトを落とした残りの contextOffset バイト、
+        そのハッシュが contextDigest）との差分（contextDelta）のみを送り、エージェント側の履歴と一致しない場合（409）は
+        全体を送り直す。
+        """
+        thread_id = payload.get("threadId")
+        context = payload.get("context") or ""
+        params = {key: value for key, value in payload.items() if key != "context"}
+
+        if thread_id and context:
+            drop, offset, digest, delta = self.context_sync.delta(thread_id, context)
+            params["contextDrop"] = drop
+            params["contextOffset"] = offset
+            params["contextDigest"] = digest
+            params["contextDelta"] = delta
+        elif context:
+            params["context"] = context
+
+        reply = self.request("search", params, timeout)
+        if reply.get("status") == 409 and thread_id and context:
+            logger.info(f"[AgentIPC] Agent lost context for thread {thread_id}, resending full history")
+            metrics.increment("ipc.context_resync")
+            params["contextDrop"] = 0
+            params["contextOffset"] = 0
+            params["contextDigest"] = ""
+            params["contextDelta"] = context
+            reply = self.request("search", params, timeout)
+
+        status = reply.get("status", 500)
+        body = reply.get("body") or {}
+        if thread_id and context and status == 200:
+            self.context_sync.update(thread_id, context)
+        return status, body
+
+    def close(self):
+        with self._connect_lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+エージェント呼び出しワーカー
+ジョブキュー（job_queue.py）から発言を取り出してエージェントを呼び出し、結果をSlackのスレッドに投稿する
+Slackボット本体とは別プロセスで、任意のノードで複数起動できる（同じコンシューマーグループで分担）
+
+- エージェントサーバーはワーカーごとに起動する（MastraBridge、AGENT_INSTANCES などの設定はボット本体と同じ）
+- 会話履歴は THREAD_MEMORY_OWNER=agent（エージェント側、AGENT_THREAD_STORE=redis）で全ワーカーと共有する
+- 処理中は可視性タイムアウトを延長し続け、ワーカーが停止したジョブは他のワーカーが引き取る
+- エージェントに接続できない・タイムアウトした場合は再試行し、試行回数の上限を超えたらエラーを投稿する
+
+使用方法:
+  AGENT_EXECUTION=queue python app.py            # Slackボットはジョブの登録のみ
+  python agent_worker.py                         # ワーカーを起動（REDIS_URL, SLACK_BOT_TOKEN が必要）
+  python agent_worker.py --concurrency 8 --consumer worker-a
+"""
+
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+import logging
+
+from dotenv import load_dotenv
+
+from job_queue import AgentJob, RedisJobQueue
+from diagnostics import diagnostics_server
+from metrics import metrics
+from slack_ui import agent_error_message, agent_response_text, get_tool_fingerprint
+from thread_memory import agent_owns_thread_memory
+
+logger = logging.getLogger(__name__)
+
+# 再試行すれば成功する見込みのあるエージェントのエラー
+RETRYABLE_ERRORS = ("接続できません", "タイムアウト")
+
+class RetryableJobError(RuntimeError):
+    """ジョブを登録し直して再試行するエラー"""
+
+class AgentWorker:
+    """ジョブキューからジョブを取り出し、エージェントの応答をSlackに投稿するワーカー"""
+
+    def __init__(self, queue: RedisJobQueue, bridge, client, consumer: Optional[str] = None,
+                 concurrency: int = 4, block_ms: int = 2000):
+        self.queue = queue
+        self.bridge = bridge
+        self.client = client
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self.block_ms = block_ms
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._active: Dict[str, AgentJob] = {}
+        self._active_lock = threading.Lock()
+
+    def start(self):
+        """ジョブの取り出しと可視性タイムアウトの延長を開始"""
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"agent-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="agent-worker-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info(f"[Worker] ⚡️ Consumer {self.consumer} started with {self.concurrency} workers")
+
+    def stop(self, timeout: float = 30):
+        """新しいジョブの取り出しを止め、処理中のジョブの完了を待つ（残ったジョブは他のワーカーが引き取る）"""
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        logger.info(f"[Worker] Consumer {self.consumer} stopped")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # エージェントサーバーが利用できない間は取り出さない（他のワーカーに任せる）
+            if not self.bridge.ready.wait(1):
+                continue
+            try:
+                jobs = self.queue.claim(self.consumer, count=1, block_ms=self.block_ms)
+            except Exception as e:
+                logger.warning(f"[Worker] Failed to claim jobs: {e}")
+                self._stopping.wait(1)
+                continue
+            for job in jobs:
+                self.handle(job)
+
+    def _heartbeat(self):
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while not self._stopping.wait(interval):
+            with self._active_lock:
+                jobs = list(self._active.values())
+            for job in jobs:
+                try:
+                    self.queue.touch(job, self.consumer)
+                except Exception as e:
+                    logger.warning(f"[Worker] Failed to extend job {job.job_id}: {e}")
+
+    def handle(self, job: AgentJob):
+        """ジョブを処理し、完了・再試行を記録"""
+        with self._active_lock:
+            self._active[job.job_id] = job
+        try:
+            self.process(job)
+        except RetryableJobError as e:
+            self.queue.retry(job, str(e))
+        except Exception as e:
+            logger.error(f"[Worker] ❌ Job {job.job_id} failed: {type(e).__name__}: {e}")
+            self.queue.retry(job, f"{type(e).__name__}: {e}")
+        else:
+            self.queue.ack(job)
+        finally:
+            with self._active_lock:
+                self._active.pop(job.job_id, None)
+
+    def process(self, job: AgentJob):
+        """エージェントを呼び出して応答をスレッドに投稿"""
+        started = time.monotonic()
+        waited = time.time() - job.enqueued_at
+        logger.info(f"[Worker] Processing job {job.job_id} (attempt {job.attempt}, queued {waited:.1f}s): "
+                    f"{job.text[:50]}...")
+        loading = self.client.chat_postMessage(
+            channel=job.channel, thread_ts=job.thread_ts, text="🔄 処理中... 検索を開始しています"
+        )
+
+        payload = {"message": job.text, "threadId": job.thread_ts, "context": None, "userId": job.user_id}
+        if agent_owns_thread_memory():
+            payload["memory"] = "agent"
+
+        # スレッド内の返信は会話履歴に依存するため相乗りしない（発言のtsが不明なジョブも同様）
+        has_history = not job.message_ts or job.thread_ts != job.message_ts
+        fingerprint = None
+        if job.user_id and not has_history:
+            try:
+                fingerprint = get_tool_fingerprint(job.user_id)
+            except Exception as fingerprint_error:
+                logger.warning(f"[Worker] Failed to get tool fingerprint: {fingerprint_error}")
+
+        try:
+            result = self.bridge.search_with_payload(payload, fingerprint=fingerprint, has_history=has_history)
+        finally:
+            try:
+                self.client.chat_delete(channel=loading["channel"], ts=loading["ts"])
+            except Exception as delete_error:
+                logger.warning(f"[Worker] Failed to delete loading message: {delete_error}")
+
+        error = result.get("error")
+        if error is not None:
+            if any(marker in error for marker in RETRYABLE_ERRORS) and job.attempt < self.queue.max_attempts:
+                raise RetryableJobError(error)
+            self.client.chat_postMessage(channel=job.channel, thread_ts=job.thread_ts, text=agent_error_message(error))
+            metrics.increment("worker.jobs.failed")
+            logger.error(f"[Worker] Job {job.job_id} failed: {error}")
+            return
+
+        response = agent_response_text(result)
+        self.client.chat_postMessage(channel=job.channel, thread_ts=job.thread_ts, text=response)
+        metrics.increment("worker.jobs.succeeded")
+        logger.info(f"[Worker] ✅ Job {job.job_id} answered in {time.monotonic() - started:.1f}s")
+
+def create_slack_client():
+    """Slack Web APIクライアント（SLACK_API_BASE_URL で接続先を変更可能）"""
+    from slack_sdk import WebClient
+    if os.getenv("SLACK_API_BASE_URL"):
+        return WebClient(token=os.environ.get("SLACK_BOT_TOKEN"), base_url=os.environ["SLACK_API_BASE_URL"])
+    return WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Agent worker consuming the Redis job queue")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("AGENT_WORKER_CONCURRENCY", "4")))
+    parser.add_argument("--consumer", default=os.getenv("AGENT_WORKER_NAME"), help="consumer name (default: host-pid)")
+    parser.add_argument("--diagnostics-port", type=int, default=int(os.getenv("AGENT_WORKER_DIAGNOSTICS_PORT", "0")),
+                        help="localhost port for /debug endpoints (0: disabled)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not agent_owns_thread_memory():
+        logger.warning("[Worker] ⚠️ THREAD_MEMORY_OWNER is not 'agent': thread history is not shared between workers")
+
+    from job_queue import job_queue
+    from mastra_bridge import mastra_bridge
+
+    if not mastra_bridge.start():
+        raise SystemExit("Failed to start Mastra agent server")
+
+    worker = AgentWorker(job_queue, mastra_bridge, create_slack_client(), consumer=args.consumer,
+                         concurrency=args.concurrency)
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    metrics.register_gauge("job_queue", job_queue.stats)
+    diagnostics_server.start(args.diagnostics_port)
+    worker.start()
+    try:
+        while not stopped.wait(60):
+            logger.info(f"[Worker] Queue: {job_queue.stats()}")
+    finally:
+        worker.stop()
+        mastra_bridge.stop()
+
+if __name__ == "__main__":
+    main()
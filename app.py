@@ -1,38 +1,111 @@
+import time
+
+# 起動時刻（最初のイベント受信までの時間を計測）
+_PROCESS_STARTED_AT = time.monotonic()
+
 import os
 import re
 import logging
 import atexit
-from slack_bolt import App
+from slack_bolt import App, BoltResponse
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+from slack_sdk import WebClient
 from dotenv import load_dotenv
 from mastra_bridge import mastra_bridge
-from thread_memory import thread_memory
+from thread_memory import thread_memory, agent_owns_thread_memory
+from message_router import message_router
+from event_filter import event_filter, edited_message_ts
+from event_dedup import event_deduplicator
+from event_recorder import event_recorder
+from inflight_requests import InFlightRequest, inflight_requests
+from thread_coalescer import PendingTurn, thread_coalescer
+from job_queue import job_queue, queue_execution_enabled
+from lanes import LaneFull, fast_lane, heavy_lane
 from slack_ui import (
-    create_mcp_services_blocks, 
-    create_service_status_blocks,
-    create_auth_in_progress_blocks,
-    create_auth_success_blocks,
-    create_auth_error_blocks,
+    render_mcp_blocks,
+    render_auth_start_blocks,
+    render_auth_success_blocks,
     generate_oauth_state,
-    generate_oauth_url
+    generate_oauth_url,
+    get_tool_fingerprint,
+    agent_error_message,
+    agent_response_text
 )
-from vibelogger import create_file_logger
+from metrics import metrics
+from diagnostics import diagnostics_server
 
 # 環境変数の読み込み
 load_dotenv()
 
+class _LazyVibeLogger:
+    """最初の使用時にvibeloggerを読み込むプロキシ（起動を遅らせないため）"""
+    
+    def __init__(self, name):
+        self._name = name
+        self._logger = None
+    
+    def __getattr__(self, attr):
+        if self._logger is None:
+            from vibelogger import create_file_logger
+            self._logger = create_file_logger(self._name)
+        return getattr(self._logger, attr)
+
 # vibeloggerの設定
-vibe_logger = create_file_logger("slack_bot")
+vibe_logger = _LazyVibeLogger("slack_bot")
 
 # 既存のログ設定（フォールバック用）
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Slackアプリの初期化
-app = App(token=os.environ.get("SLACK_BOT_TOKEN"))
+# SLACK_API_BASE_URL でWeb APIの接続先を変更可能（ベンチマークでモックサーバーを使う場合など）
+# リスナーは高速レーンで実行し、エージェント呼び出しのみ重いレーンに移す
+if os.getenv("SLACK_API_BASE_URL"):
+    app = App(
+        client=WebClient(token=os.environ.get("SLACK_BOT_TOKEN"), base_url=os.environ["SLACK_API_BASE_URL"]),
+        listener_executor=fast_lane
+    )
+else:
+    app = App(token=os.environ.get("SLACK_BOT_TOKEN"), listener_executor=fast_lane)
+
+# 最初のイベント受信までの時間を記録
+_first_event_logged = False
+
+@app.middleware
+def record_time_to_first_event(next):
+    """起動から最初のリクエスト受信までの時間をログとメトリクスに記録"""
+    global _first_event_logged
+    if not _first_event_logged:
+        _first_event_logged = True
+        elapsed_ms = (time.monotonic() - _PROCESS_STARTED_AT) * 1000
+        metrics.register_gauge("startup.time_to_first_event_ms", lambda: round(elapsed_ms, 1))
+        logger.info(f"⏱️ Time to first event: {elapsed_ms:.0f} ms")
+    return next()
+
+# 匿名化したイベントログを記録（EVENT_LOG_PATH 指定時のみ、再送や破棄されるイベントも含む）
+if event_recorder is not None:
+    @app.middleware
+    def record_event_log(body, next):
+        event_recorder.record(body)
+        return next()
+
+# Slackによる再送イベントを破棄
+@app.middleware
+def drop_duplicate_events(body, next):
+    """同じevent_idのイベントは1回だけ処理する"""
+    if body.get("type") == "event_callback" and not event_deduplicator.claim_event(body.get("event_id")):
+        return BoltResponse(status=200, body="")
+    return next()
+
+# ボット宛てになり得ないメッセージイベントをリスナー実行前に破棄
+@app.middleware
+def drop_irrelevant_events(body, context, next):
+    """サブタイプ・ボット投稿・対象外チャンネル・無関係なメッセージを早期に破棄"""
+    if not event_filter.process(body, context):
+        return BoltResponse(status=200, body="")
+    return next()
 
 # 「hello」メッセージに応答
-@app.message("hello")
 def message_hello(message, say):
     """ユーザーが「hello」と送信した時の応答処理"""
     user_id = message['user']
@@ -40,7 +113,6 @@ def message_hello(message, say):
     logger.info(f"Responded to hello message from user {user_id}")
 
 # ヘルプメッセージ
-@app.message(re.compile(r"(help|ヘルプ|助けて)"))
 def handle_help_message(message, say):
     """ヘルプ関連のメッセージに応答"""
     help_text = """
@@ -60,7 +132,6 @@ For more information, please contact the development team.
     logger.info(f"Help message sent to user {message['user']}")
 
 # 時間表示機能
-@app.message(re.compile(r"(time|時間|時刻)"))
 def handle_time_message(message, say):
     """時間関連のメッセージに応答"""
     from datetime import datetime
@@ -69,7 +140,6 @@ def handle_time_message(message, say):
     logger.info(f"Time request from user {message['user']}")
 
 # ジョーク機能
-@app.message(re.compile(r"(joke|ジョーク|冗談)"))
 def handle_joke_message(message, say):
     """ジョーク関連のメッセージに応答"""
     jokes = [
@@ -85,14 +155,12 @@ def handle_joke_message(message, say):
     logger.info(f"Joke request from user {message['user']}")
 
 # 挨拶機能の拡張
-@app.message(re.compile(r"(good morning|おはよう|おはようございます)"))
 def handle_good_morning(message, say):
     """おはようメッセージに応答"""
     user_id = message['user']
     say(f"おはようございます <@{user_id}>! 🌅 今日も一日頑張りましょう！")
     logger.info(f"Good morning message from user {user_id}")
 
-@app.message(re.compile(r"(good night|おやすみ|おやすみなさい)"))
 def handle_good_night(message, say):
     """おやすみメッセージに応答"""
     user_id = message['user']
@@ -106,9 +174,121 @@ def global_error_handler(error, body, logger):
     logger.exception(f"Error: {error}")
     logger.info(f"Request body: {body}")
 
+# 重いレーンが満杯の場合の応答
+LANE_FULL_MESSAGE = "⏳ 現在リクエストが集中しています。しばらくしてからもう一度お試しください。"
+
+# 同じスレッドで同じユーザーが続けて送信した場合、実行中の前の質問を取り消す（集約が無効な場合）
+CANCEL_SUPERSEDED = os.getenv("CANCEL_SUPERSEDED", "true").lower() == "true"
+
+# エージェント呼び出しをジョブキューに登録し、別プロセスのワーカー（agent_worker.py）に任せる
+QUEUE_EXECUTION = queue_execution_enabled()
+if QUEUE_EXECUTION:
+    metrics.register_gauge("job_queue", job_queue.stats)
+
+def enqueue_agent_job(channel, thread_ts, user_id, text, message_ts=None) -> bool:
+    """発言をジョブキューに登録（Redisに接続できない場合はFalse）"""
+    try:
+        job_id = job_queue.enqueue(channel, thread_ts, user_id, text, message_ts)
+    except Exception as e:
+        logger.error(f"[Slack] ❌ Failed to enqueue agent job for thread {thread_ts}: {e}")
+        return False
+    # 以降のメンションなし返信を事前フィルターで通過させる
+    event_filter.participation.add(thread_ts)
+    logger.info(f"[Slack] Enqueued job {job_id} for thread {thread_ts}")
+    return True
+
+# 質問が届く前に、エージェント側でユーザーの準備（MCPサーバーの起動など）を始める
+AGENT_PREWARM = os.getenv("AGENT_PREWARM", "true").lower() == "true"
+
+def prewarm_agent(user_id, refresh=False):
+    """ユーザーの準備を高速レーンで依頼し、完了は待たない（ジョブキューを使う場合はワーカー側で準備するため行わない）"""
+    if not AGENT_PREWARM or QUEUE_EXECUTION or not user_id:
+        return
+    try:
+        fast_lane.submit(mastra_bridge.prewarm, user_id, refresh)
+    except LaneFull:
+        logger.debug(f"[Slack] Fast lane full, skipping prewarm for user {user_id}")
+
+def cancel_request(request: InFlightRequest, reason: str) -> bool:
+    """実行中のリクエストを取り消し、送信済みであればエージェント側の処理も中断させる"""
+    if not inflight_requests.cancel(request, reason):
+        return False
+    mastra_bridge.cancel(request.request_id)
+    return True
+
 # Mastraエージェントを呼び出す共通関数
-def process_message_with_mastra(message_text, thread_ts, say, user_id=None, client=None):
-    """Mastraエージェントでメッセージを処理する共通関数"""
+def process_message_with_mastra(message_text, thread_ts, say, user_id=None, client=None, channel=None, message_ts=None):
+    """Mastraエージェントでメッセージを処理する共通関数（重いレーンで実行し、リスナーのスレッドはすぐに解放）"""
+    # app_mentionとメッセージリスナーの二重起動を防ぐ（1メッセージにつき1回のみ）
+    if not event_deduplicator.claim_message(channel, message_ts):
+        return
+    
+    # 同じユーザーの待機中・実行中の発言があるスレッドでは、続けて送信されるメッセージを待ち、1つの発言にまとめてから処理する
+    # （最初のメッセージは待たずに処理を始める）
+    if thread_coalescer.enabled and user_id and (
+        thread_coalescer.has_pending(thread_ts, user_id)
+        or any(previous.user_id == user_id for previous in inflight_requests.in_thread(thread_ts))
+    ):
+        thread_coalescer.add(thread_ts, user_id, channel, message_ts, message_text, say, client)
+        return
+    
+    if CANCEL_SUPERSEDED and user_id:
+        for previous in inflight_requests.in_thread(thread_ts):
+            if previous.user_id == user_id:
+                cancel_request(previous, "superseded")
+    
+    submit_agent_request([(message_ts, message_text)], thread_ts, say, user_id, client, channel)
+
+def flush_thread_turn(turn: PendingTurn):
+    """まとめた発言を処理（同じユーザーの実行中の前の発言は取り消して先頭に含める）
+
+    取り消せた前の発言は投稿を確定していないため、どちらのスレッド記憶にも記録されていない。
+    """
+    parts = list(turn.parts)
+    for previous in reversed(inflight_requests.in_thread(turn.thread_ts)):
+        if previous.user_id == turn.user_id and cancel_request(previous, "merged"):
+            parts = previous.parts + parts
+    submit_agent_request(parts, turn.thread_ts, turn.say, turn.user_id, turn.client, turn.channel)
+
+def submit_thread_turn(turn: PendingTurn):
+    """まとめた発言を高速レーンに投入（満杯の場合は混雑を伝え、発言は破棄する）"""
+    try:
+        fast_lane.submit(flush_thread_turn, turn)
+    except LaneFull:
+        logger.warning(f"[Slack] Fast lane full, rejecting coalesced message in thread {turn.thread_ts}")
+        turn.say(LANE_FULL_MESSAGE, thread_ts=turn.thread_ts)
+
+thread_coalescer.on_flush = submit_thread_turn
+
+def submit_agent_request(parts, thread_ts, say, user_id=None, client=None, channel=None):
+    """(メッセージのts, 本文) のリストを1つの発言として実行中のリクエストに登録し、重いレーンに投入"""
+    # ジョブキューを使う場合はワーカーに任せる（編集・削除による取り消しの対象外）
+    if QUEUE_EXECUTION:
+        if not enqueue_agent_job(channel, thread_ts, user_id, "\n".join(text for _, text in parts), parts[0][0]):
+            say(agent_error_message("エージェントサーバーに接続できません"), thread_ts=thread_ts)
+        return
+    
+    request = inflight_requests.start(channel, thread_ts, user_id, parts)
+    try:
+        heavy_lane.submit(_process_message_with_mastra, request.text, thread_ts, say, user_id, client, request)
+    except LaneFull:
+        inflight_requests.finish(request)
+        logger.warning(f"[Slack] Heavy lane full, rejecting message in thread {thread_ts}")
+        say(LANE_FULL_MESSAGE, thread_ts=thread_ts)
+
+def _process_message_with_mastra(message_text, thread_ts, say, user_id=None, client=None, request=None):
+    """Mastraエージェントでメッセージを処理し、結果をスレッドに投稿"""
+    try:
+        _run_agent_request(message_text, thread_ts, say, user_id, client, request)
+    finally:
+        if request is not None:
+            inflight_requests.finish(request)
+
+def _run_agent_request(message_text, thread_ts, say, user_id, client, request):
+    # 待機中に取り消された場合は何もしない
+    if request is not None and request.is_cancelled:
+        return
+    
     # 処理中メッセージを送信（ローディングアニメーション付き）
     loading_message = say("🔄 処理中... 検索を開始しています", thread_ts=thread_ts)
     loading_ts = loading_message['ts']
@@ -130,12 +310,15 @@ def process_message_with_mastra(message_text, thread_ts, say, user_id=None, clie
     )
     
     try:
+        # 会話履歴をエージェント側で保持する場合は、新しい発言のみを送信
+        agent_memory = agent_owns_thread_memory()
+        has_history = thread_ts in event_filter.participation
+        
         # スレッドの会話履歴を取得
-        context = thread_memory.get_context(thread_ts)
+        context = None if agent_memory else thread_memory.get_context(thread_ts)
         
-        # ユーザーメッセージをスレッド記憶に追加
-        if user_id:
-            thread_memory.add_message(thread_ts, "user", message_text, user_id)
+        # 以降のメンションなし返信を事前フィルターで通過させる
+        event_filter.participation.add(thread_ts)
         
         # 新しいサーバーAPIに対応したペイロードを作成
         payload = {
@@ -144,6 +327,13 @@ def process_message_with_mastra(message_text, thread_ts, say, user_id=None, clie
             "context": context if context else None,
             "userId": user_id  # SlackユーザーIDを追加
         }
+        if request is not None:
+            payload["requestId"] = request.request_id
+        if agent_memory:
+            payload["memory"] = "agent"
+            # 取り消し可能なリクエストは、応答の投稿を確定してから記録する（エージェント側では記録しない）
+            if request is not None:
+                payload["recordTurn"] = False
         
         # 処理状況を更新
         if client and loading_ts:
@@ -156,8 +346,17 @@ def process_message_with_mastra(message_text, thread_ts, say, user_id=None, clie
             except Exception as update_error:
                 logger.warning(f"Failed to update loading message: {update_error}")
         
+        # 同じツールを持つユーザーからの同一質問は実行中の呼び出しに相乗り
+        fingerprint = None
+        has_history = has_history or bool(context)
+        if user_id and not has_history:
+            try:
+                fingerprint = get_tool_fingerprint(user_id)
+            except Exception as fingerprint_error:
+                logger.warning(f"Failed to get tool fingerprint: {fingerprint_error}")
+        
         # Mastraエージェントで処理
-        result = mastra_bridge.search_with_payload(payload)
+        result = mastra_bridge.search_with_payload(payload, fingerprint=fingerprint, has_history=has_history)
         
         # ローディングメッセージを削除
         if client and loading_ts:
@@ -169,11 +368,21 @@ def process_message_with_mastra(message_text, thread_ts, say, user_id=None, clie
             except Exception as delete_error:
                 logger.warning(f"Failed to delete loading message: {delete_error}")
         
+        # 取り消された場合は応答を投稿せず、スレッド記憶にも残さない
+        # （スレッド記憶には投稿を確定した発言のみを記録するため、まとめ直した発言が前の発言と重複しない）
+        if result.get("cancelled") or (request is not None and not inflight_requests.settle(request)):
+            logger.info(f"[Slack] Discarded cancelled request in thread {thread_ts}")
+            return
+        
+        # ユーザーメッセージをスレッド記憶に追加
+        if user_id and not agent_memory:
+            thread_memory.add_message(thread_ts, "user", message_text, user_id)
+        
         if "error" in result:
             # エラーの種類に応じたメッセージを生成
             error_detail = result['error']
+            error_msg = agent_error_message(error_detail)
             if "レート制限" in error_detail or "rate limit" in error_detail.lower():
-                error_msg = "⚠️ APIレート制限に達しました。数分後に再度お試しください。"
                 # 詳細情報がある場合はログに出力
                 if 'details' in result:
                     logger.error(f"[Slack] Rate limit details: {result['details']}")
@@ -188,32 +397,23 @@ def process_message_with_mastra(message_text, thread_ts, say, user_id=None, clie
                         },
                         human_note="Anthropic APIのレート制限に達しました。ツール数削減やリクエスト間隔調整が必要"
                     )
-            elif "タイムアウト" in error_detail:
-                error_msg = "⏱️ 処理がタイムアウトしました。もう一度お試しください。"
-            elif "接続できません" in error_detail:
-                error_msg = "🔌 サービスに接続できません。しばらくしてからお試しください。"
-            elif "認証" in error_detail or "auth" in error_detail.lower():
-                error_msg = "🔐 認証エラーが発生しました。`/mcp` コマンドでサービス連携を確認してください。"
-            else:
-                error_msg = f"❌ エラーが発生しました: {error_detail}"
             
             say(error_msg, thread_ts=thread_ts)
             logger.error(f"[Slack] Error: {result['error']}")
         else:
-            response = result.get('response', 'No response')
-            
             # 警告がある場合は追加
+            response = agent_response_text(result)
             warning = result.get('warning')
-            if warning:
-                if "MCPツール" in warning:
-                    response = f"⚠️ 一部機能が制限されています: {warning}\n\n{response}"
-                else:
-                    response = f"⚠️ {warning}\n\n{response}"
+            
+            # 次の発言が届く前にエージェント側のスレッド記憶に記録してから投稿
+            if agent_memory and request is not None:
+                mastra_bridge.record_turn(thread_ts, message_text, result.get('response', ''), user_id)
             
             say(response, thread_ts=thread_ts)
             
             # ボットの応答をスレッド記憶に追加
-            thread_memory.add_message(thread_ts, "assistant", response)
+            if not agent_memory:
+                thread_memory.add_message(thread_ts, "assistant", response)
             
             logger.info(f"[Slack] Response sent: {len(response)} chars")
             
@@ -237,14 +437,13 @@ def process_message_with_mastra(message_text, thread_ts, say, user_id=None, clie
         say(error_msg, thread_ts=thread_ts)
 
 # 検索機能（Mastraエージェント統合）
-@app.message(re.compile(r"(search|検索|探して|調べて)"))
 def handle_search_message(message, say, client):
     """検索関連のメッセージをMastraエージェントで処理"""
     user_id = message['user']
     text = message['text']
     thread_ts = message.get('thread_ts', message['ts'])
     
-    process_message_with_mastra(text, thread_ts, say, user_id, client)
+    process_message_with_mastra(text, thread_ts, say, user_id, client, message['channel'], message['ts'])
     logger.info(f"Search request from user {user_id}")
 
 # メンションされた時の検索処理
@@ -258,30 +457,46 @@ def handle_app_mention_events(body, say, logger, client):
     
     mention_text = text.split(">", 1)[1].strip() if ">" in text else ""
     
+    # ローディングメッセージの投稿・連投の集約待ちの間にユーザーのMCPサーバーを準備させる
+    prewarm_agent(user_id)
+    
     if mention_text:
         # メンションされた場合は全てMastraエージェントで処理
-        process_message_with_mastra(mention_text, thread_ts, say, user_id, client)
-    else:
+        process_message_with_mastra(mention_text, thread_ts, say, user_id, client, event['channel'], event['ts'])
+    elif event_deduplicator.claim_message(event['channel'], event['ts']):
         # メンションだけで内容がない場合
         say("こんにちは！何かお手伝いできることはありますか？ 💬", thread_ts=thread_ts)
         
         try:
-            # 挨拶メッセージとして処理
-            thread_memory.add_message(thread_ts, "user", "挨拶", user_id)
-            greeting_message = "ユーザーが挨拶をしてきました。友好的に応答してください。"
-            result = mastra_bridge.search(greeting_message, thread_id=thread_ts)
-            if "error" not in result:
-                response = result.get('response', '')
-                if response:
-                    say(response, thread_ts=thread_ts)
-                    thread_memory.add_message(thread_ts, "assistant", response)
-        except Exception as e:
-            logger.error(f"Greeting error: {e}")
+            heavy_lane.submit(greet_with_mastra, thread_ts, say, user_id, event['channel'])
+        except LaneFull:
+            logger.warning(f"[Slack] Heavy lane full, skipping greeting in thread {thread_ts}")
     
     logger.info(f"Responded to mention from user {user_id}")
 
+def greet_with_mastra(thread_ts, say, user_id, channel=None):
+    """挨拶メッセージとしてエージェントに応答を依頼"""
+    greeting_message = "ユーザーが挨拶をしてきました。友好的に応答してください。"
+    if QUEUE_EXECUTION:
+        enqueue_agent_job(channel, thread_ts, user_id, greeting_message)
+        return
+    
+    try:
+        agent_memory = agent_owns_thread_memory()
+        if not agent_memory:
+            thread_memory.add_message(thread_ts, "user", "挨拶", user_id)
+        event_filter.participation.add(thread_ts)
+        result = mastra_bridge.search(greeting_message, thread_id=thread_ts, memory="agent" if agent_memory else None)
+        if "error" not in result:
+            response = result.get('response', '')
+            if response:
+                say(response, thread_ts=thread_ts)
+                if not agent_memory:
+                    thread_memory.add_message(thread_ts, "assistant", response)
+    except Exception as e:
+        logger.error(f"Greeting error: {e}")
+
 # スレッド内でのメンションなし応答
-@app.message("")
 def handle_thread_messages(message, say, logger, client):
     """スレッド内でのメンションなしメッセージに応答"""
     # メンションチェック - メンションの場合はスキップ
@@ -293,17 +508,86 @@ def handle_thread_messages(message, say, logger, client):
     if not thread_ts:
         return
     
-    # このスレッドに過去の履歴があるかチェック
-    if not thread_memory.has_history(thread_ts):
+    # このスレッドでボットが会話しているかチェック（履歴をエージェント側で保持する場合も参加記録で判定）
+    if thread_ts not in event_filter.participation and not thread_memory.has_history(thread_ts):
         return
     
     user_id = message['user']
     text = message['text']
+    prewarm_agent(user_id)
     
     # Mastraエージェントで処理
-    process_message_with_mastra(text, thread_ts, say, user_id, client)
+    process_message_with_mastra(text, thread_ts, say, user_id, client, message['channel'], message['ts'])
     logger.info(f"Thread message from user {user_id}")
 
+# ローカルで完結するインテントのハンドラー
+LOCAL_INTENT_HANDLERS = {
+    "hello": message_hello,
+    "help": handle_help_message,
+    "time": handle_time_message,
+    "joke": handle_joke_message,
+    "good_morning": handle_good_morning,
+    "good_night": handle_good_night,
+}
+
+# 全メッセージの単一ディスパッチャー
+@app.message("")
+def handle_message(message, say, logger, client, context):
+    """メッセージを1回だけ分類し、優先度の最も高いハンドラーにのみ振り分ける"""
+    # 事前フィルターで分類済みの場合はその結果を使う
+    if "intent" in context:
+        intent = context["intent"]
+    else:
+        intent = message_router.classify(message.get('text', ''))
+    
+    if intent is None:
+        # 該当インテントなし：スレッド内の継続会話として扱う
+        handle_thread_messages(message, say, logger, client)
+    elif intent.local:
+        # 軽量インテントはRedisやスレッド記憶を参照せずに即応答
+        LOCAL_INTENT_HANDLERS[intent.name](message, say)
+    else:
+        handle_search_message(message, say, client)
+
+def resubmit_without(request: InFlightRequest, message_ts, text, say, client):
+    """取り消した発言を、編集後の本文（空の場合はメッセージを除いて）で処理し直す"""
+    parts = [(part_ts, text if part_ts == message_ts else part_text) for part_ts, part_text in request.parts]
+    parts = [(part_ts, part_text) for part_ts, part_text in parts if part_text]
+    if parts:
+        submit_agent_request(parts, request.thread_ts, say, request.user_id, client, request.channel)
+        logger.info(f"Re-running changed turn in thread {request.thread_ts}")
+
+# 待機中・実行中の質問が編集された場合は、編集後の内容で処理し直す
+@app.event({"type": "message", "subtype": "message_changed"})
+def handle_message_changed(event, say, client):
+    """編集されたメッセージを待機中の発言に反映、または実行中リクエストを取り消して再実行"""
+    edited = event.get("message") or {}
+    previous = event.get("previous_message") or {}
+    # リンクの展開などで本文が変わらない編集は無視
+    if edited.get("text") == previous.get("text"):
+        return
+    
+    channel, message_ts = event.get("channel"), edited_message_ts(event)
+    text = re.sub(r"<@[A-Z0-9]+>", "", edited.get("text") or "").strip()
+    if thread_coalescer.edit(channel, message_ts, text):
+        return
+    
+    request = inflight_requests.find(channel, message_ts)
+    if request is not None and cancel_request(request, "edited"):
+        resubmit_without(request, message_ts, text, say, client)
+
+# 待機中・実行中の質問が削除された場合は取り消す（まとめた他のメッセージは処理し直す）
+@app.event({"type": "message", "subtype": "message_deleted"})
+def handle_message_deleted(event, say, client):
+    """削除されたメッセージを待機中の発言から除く、または実行中リクエストを取り消す"""
+    channel, message_ts = event.get("channel"), edited_message_ts(event)
+    if thread_coalescer.remove(channel, message_ts):
+        return
+    
+    request = inflight_requests.find(channel, message_ts)
+    if request is not None and cancel_request(request, "deleted"):
+        resubmit_without(request, message_ts, "", say, client)
+
 # Slash command handler for /mcp
 @app.command("/mcp")
 def handle_mcp_command(ack, body, client):
@@ -324,10 +608,8 @@ def handle_mcp_command(ack, body, client):
         human_note="ユーザーがMCP連携サービス管理画面を開いた"
     )
     
-    # Create blocks for MCP services
-    blocks = []
-    blocks.extend(create_service_status_blocks(user_id))
-    blocks.extend(create_mcp_services_blocks())
+    # Create blocks for MCP services (pre-serialized JSON)
+    blocks = render_mcp_blocks(user_id)
     
     # Send ephemeral message
     client.chat_postEphemeral(
@@ -367,14 +649,7 @@ def handle_connect_notion(ack, body, client):
         return
     
     # Send auth URL
-    blocks = create_auth_in_progress_blocks("Notion")
-    blocks.append({
-        "type": "section",
-        "text": {
-            "type": "mrkdwn",
-            "text": f"<{auth_url}|🔗 ここをクリックしてNotionと連携>"
-        }
-    })
+    blocks = render_auth_start_blocks("Notion", auth_url)
     
     client.chat_postEphemeral(
         channel=channel_id,
@@ -412,14 +687,7 @@ def handle_connect_google_drive(ack, body, client):
         return
     
     # Send auth URL
-    blocks = create_auth_in_progress_blocks("Google Drive")
-    blocks.append({
-        "type": "section",
-        "text": {
-            "type": "mrkdwn",
-            "text": f"<{auth_url}|🔗 ここをクリックしてGoogle Driveと連携>"
-        }
-    })
+    blocks = render_auth_start_blocks("Google Drive", auth_url)
     
     client.chat_postEphemeral(
         channel=channel_id,
@@ -484,21 +752,40 @@ def handle_link_shared(body, say, client):
             service = params.get("service", ["unknown"])[0]
             
             service_name = "Notion" if service == "notion" else "Google Drive"
-            blocks = create_auth_success_blocks(service_name)
+            blocks = render_auth_success_blocks(service_name)
+            
+            # 新しいトークンでMCPサーバーを準備し直させる（最初の質問を待たせない）
+            prewarm_agent(event.get("user"), refresh=True)
             
             # Post to channel
             say(blocks=blocks, text=f"{service_name}連携完了")
 
+def start_agent_server():
+    """STARTUP_MODE に応じてエージェントサーバーを起動（sequential の場合は起動完了まで戻らない）"""
+    if QUEUE_EXECUTION:
+        # エージェントサーバーはワーカー（agent_worker.py）側で起動する
+        logger.info("Agent calls are queued for agent_worker.py")
+    elif os.getenv("STARTUP_MODE", "parallel").lower() == "sequential":
+        # エージェントサーバーの起動完了を待ってから接続
+        logger.info("Starting Mastra agent server...")
+        if not mastra_bridge.start():
+            logger.error("Failed to start Mastra agent server. Some features may not work.")
+    else:
+        # Socket Modeの接続と並行してエージェントサーバーを起動
+        # 起動完了前に届いたリクエストはブリッジ内で待機する
+        logger.info("Starting Mastra agent server in background...")
+        mastra_bridge.start_in_background()
+
 # アプリの起動
 if __name__ == "__main__":
-    # Mastraエージェントサーバーを起動
-    logger.info("Starting Mastra agent server...")
-    if not mastra_bridge.start():
-        logger.error("Failed to start Mastra agent server. Some features may not work.")
+    start_agent_server()
     
     # 終了時にMastraサーバーを停止
     atexit.register(mastra_bridge.stop)
     
+    # 診断用エンドポイント（ローカルからのみ、DIAGNOSTICS_PORT=0 で無効）
+    diagnostics_server.start()
+    
     # Socket Modeハンドラーの作成と起動
     handler = SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
     logger.info("⚡️ Slack bot is starting...")
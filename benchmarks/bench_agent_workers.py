@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+エージェントサーバーのマルチインスタンスベンチマーク
+スタブモデル（AGENT_STUB_MODEL=true）で1・2・4インスタンスを起動し、スループットを比較
+
+使用方法:
+  python benchmarks/bench_agent_workers.py [--workers 1 2 4] [--requests 200] [--concurrency 16]
+  python benchmarks/bench_agent_workers.py --command "python /path/to/fake_agent.py"  # Node以外のサーバーで計測
+"""
+
+import argparse
+import logging
+import os
+import shlex
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def run(instances: int, args) -> dict:
+    """指定インスタンス数でサーバーを起動し、並列リクエストを送信"""
+    from mastra_bridge import MastraBridge
+
+    bridge = MastraBridge(port=args.port, instances=instances)
+    if args.command:
+        bridge.supervisor.cmd = shlex.split(args.command)
+    if not bridge.start():
+        raise SystemExit(f"failed to start {instances} agent instance(s)")
+
+    def call(i: int) -> float:
+        start = time.perf_counter()
+        result = bridge.search_with_payload({
+            "message": f"benchmark question {i}",
+            "threadId": f"bench-{i}",
+            "userId": f"U{i % args.users:04d}",
+        })
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return time.perf_counter() - start
+
+    try:
+        # ウォームアップ
+        call(0)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = sorted(executor.map(call, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        bridge.stop()
+
+    return {
+        "instances": instances,
+        "throughput": args.requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent server multi-instance benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--port", type=int, default=3101)
+    parser.add_argument("--cpu-ms", type=int, default=20)
+    parser.add_argument("--latency-ms", type=int, default=200)
+    parser.add_argument("--command", help="override the server command (default: npm run server)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ["AGENT_STUB_MODEL"] = "true"
+    os.environ["AGENT_STUB_CPU_MS"] = str(args.cpu_ms)
+    os.environ["AGENT_STUB_LATENCY_MS"] = str(args.latency_ms)
+
+    print(f"{'instances':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for instances in args.workers:
+        result = run(instances, args)
+        print(f"{result['instances']:>9} {result['throughput']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
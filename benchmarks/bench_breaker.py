@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+サーキットブレーカーと適応タイムアウトの障害試験
+障害を注入できる偽エージェントサーバー（fake_agent.py）に対して MastraBridge から一定間隔でリクエストを送り、
+正常 → 障害（応答なし・500エラー）→ 復旧 の各段階で、呼び出しがスレッドを占有した時間と応答の内訳を計測する
+
+確認する動作:
+  - 障害中は失敗率が閾値を超えた時点で遮断し、以降の呼び出しは即座に失敗する
+  - タイムアウトは正常時の応答時間から決まり、固定の60秒より短い
+  - 障害の解除後、クールダウンを経た試行リクエストの成功で復旧する
+  - レート制限のエラーは、挨拶（search）・質問（search_with_payload）のどちらの経路でも遮断の判定に含めない
+
+使用方法:
+  python benchmarks/bench_breaker.py                               # 応答なし障害で試験
+  python benchmarks/bench_breaker.py --fault error:0.8 --rate 20
+  python benchmarks/bench_breaker.py --no-breaker                  # 比較用（遮断なし・固定タイムアウト）
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+def classify(result: dict) -> str:
+    error = result.get("error")
+    if error is None:
+        return "ok"
+    if "タイムアウト" in error:
+        return "timeout"
+    if "接続できません" in error:
+        return "fail_fast"
+    return "error"
+
+def main():
+    parser = argparse.ArgumentParser(description="Circuit breaker fault-injection test")
+    parser.add_argument("--fault", default="hang:1", help="fault spec during the outage (see fake_agent.py)")
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second")
+    parser.add_argument("--healthy-seconds", type=float, default=8.0)
+    parser.add_argument("--outage-seconds", type=float, default=15.0)
+    parser.add_argument("--recovery-seconds", type=float, default=12.0)
+    parser.add_argument("--agent-latency", default="lognormal:300,0.3")
+    parser.add_argument("--agent-port", type=int, default=3311)
+    parser.add_argument("--cooldown", type=float, default=3.0, help="AGENT_BREAKER_COOLDOWN_SECONDS")
+    parser.add_argument("--min-timeout", type=float, default=1.0, help="AGENT_TIMEOUT_MIN_SECONDS")
+    parser.add_argument("--no-breaker", action="store_true", help="disable the breaker and use a fixed 60s timeout")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "FAKE_AGENT_LATENCY": args.agent_latency,
+        "FAKE_AGENT_HANG_SECONDS": "90",
+        "AGENT_BREAKER_COOLDOWN_SECONDS": str(args.cooldown),
+        "AGENT_BREAKER_WINDOW_SECONDS": "10",
+        "AGENT_TIMEOUT_MIN_SECONDS": str(args.min_timeout),
+    })
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+
+    from circuit_breaker import AdaptiveTimeout, CircuitBreaker
+    from mastra_bridge import MastraBridge
+    from metrics import metrics
+
+    bridge = MastraBridge(port=args.agent_port, instances=1)
+    bridge.supervisor.cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_agent.py")]
+    if args.no_breaker:
+        bridge.breaker = CircuitBreaker(min_calls=10**9)
+        bridge.timeout = AdaptiveTimeout(maximum=60.0, min_samples=10**9)
+    if not bridge.start():
+        raise SystemExit("failed to start the fake agent server")
+    faults_url = f"{bridge.supervisor.instances[0].base_url}/api/faults"
+
+    # レート制限（遮断しないこと）: 試験用のブレーカーで、挨拶と質問の両方の経路から送る
+    breaker = bridge.breaker
+    bridge.breaker = CircuitBreaker(min_calls=5, window_seconds=60)
+    requests.post(faults_url, json={"faults": "ratelimit:1"}, timeout=5)
+    rate_limited = [bridge.search(f"レート制限試験 {index}") for index in range(10)] + [
+        bridge.search_with_payload({"message": f"レート制限試験 {index}", "userId": f"U{index}"})
+        for index in range(10, 20)
+    ]
+    rate_limit_breaker = bridge.breaker.snapshot()
+    bridge.breaker = breaker
+
+    phases = [("healthy", args.healthy_seconds, ""), ("outage", args.outage_seconds, args.fault),
+              ("recovery", args.recovery_seconds, "")]
+    results = []
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=256)
+
+    def call(phase: str, index: int):
+        started = time.monotonic()
+        result = bridge.search_with_payload({"message": f"障害試験 {index}", "userId": f"U{index}"})
+        with lock:
+            results.append((phase, started, time.monotonic() - started, classify(result), bridge.breaker.state))
+
+    start = time.monotonic()
+    index = 0
+    for phase, duration, fault in phases:
+        requests.post(faults_url, json={"faults": fault}, timeout=5)
+        print(f"[{time.monotonic() - start:6.1f}s] phase {phase} (faults: {fault or 'none'}, "
+              f"timeout {bridge.timeout.current():.1f}s, breaker {bridge.breaker.state})")
+        phase_end = time.monotonic() + duration
+        while time.monotonic() < phase_end:
+            executor.submit(call, phase, index)
+            index += 1
+            time.sleep(1 / args.rate)
+    print(f"[{time.monotonic() - start:6.1f}s] waiting for outstanding calls...")
+    executor.shutdown(wait=True)
+    bridge.stop()
+
+    print(f"\n{'phase':<10} {'calls':>6} {'ok':>6} {'timeout':>8} {'error':>6} {'fail_fast':>10} "
+          f"{'mean held (s)':>14} {'max held (s)':>13}")
+    for phase, _, _ in phases:
+        rows = [row for row in results if row[0] == phase]
+        outcomes = Counter(row[3] for row in rows)
+        held = [row[2] for row in rows]
+        print(f"{phase:<10} {len(rows):>6} {outcomes['ok']:>6} {outcomes['timeout']:>8} {outcomes['error']:>6} "
+              f"{outcomes['fail_fast']:>10} {sum(held) / max(1, len(held)):>14.2f} {max(held, default=0):>13.2f}")
+
+    # 障害解除後に最初に成功した呼び出しまでの時間
+    recovery_start = min((row[1] for row in results if row[0] == "recovery"), default=None)
+    recovered = min((row[1] for row in results if row[0] == "recovery" and row[3] == "ok"), default=None)
+    if recovery_start is not None and recovered is not None:
+        print(f"\nrecovered {recovered - recovery_start:.1f}s after the fault was cleared")
+    snapshot = metrics.snapshot()
+    print(f"breaker opened {snapshot.get('breaker.agent.opened', 0)} times, "
+          f"rejected {snapshot.get('breaker.agent.rejected', 0)} calls; final timeout {bridge.timeout.current():.1f}s")
+    print(f"rate limited    {len(rate_limited)} calls (search and search_with_payload) -> breaker {rate_limit_breaker}")
+
+    failed = (
+        rate_limit_breaker["state"] != "closed"
+        or rate_limit_breaker["failures"] != 0
+        or not all("error" in result and "接続できません" not in result["error"] for result in rate_limited)
+    )
+    if failed:
+        print("\nFAILED")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
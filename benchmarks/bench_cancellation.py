@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+取り消したリクエストとスレッド記憶の整合性の確認
+偽エージェントサーバー・Slack Web APIモック（--slack-latency-ms で処理中メッセージの削除などを遅くする）を使い、
+app.py のハンドラーを実際に通して、エージェントの応答が返ってから投稿を確定するまでの間に
+元のメッセージが削除された場合・同じユーザーが続けて送信した場合を再現する
+
+確認すること（記憶の保持先は THREAD_MEMORY_OWNER=agent、merged-local のみ local）:
+  - answered      取り消されなかった質問は、応答が投稿され、スレッド記憶に1往復だけ記録されること
+  - deleted       エージェントの応答後・投稿前に削除された質問は、応答が投稿されず、スレッド記憶にも残らないこと
+  - merged        エージェントの応答後・投稿前に続けて送信された場合、前の発言はまとめ直した発言にのみ含まれ、
+                  応答は1回だけ投稿されること（集約の待ち時間は --coalesce-window-ms）
+                  最初のメッセージは集約を待たずに処理を始めること（submitted、受信から実行中のリクエストへの登録まで）
+  - merged-local  同じ操作で、このプロセスのスレッド記憶にも前の発言が重複しないこと
+
+使用方法:
+  python benchmarks/bench_cancellation.py
+  python benchmarks/bench_cancellation.py --slack-latency-ms 600 --agent-latency-ms 300
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_slack import BOT_USER_ID, FakeSocketModeSource, MockSlackAPI, _envelope  # noqa: E402
+
+USER_ID = "U001"
+
+def load_app(args, slack_api: MockSlackAPI):
+    """外部サービスを偽物に差し替えて app.py を読み込む"""
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_API_BASE_URL": slack_api.base_url,
+        "SLACK_ALLOWED_CHANNELS": "",
+        "DEDUP_BACKEND": "memory",
+        "THREAD_MEMORY_OWNER": "agent",
+        "THREAD_COALESCE_WINDOW_MS": "0",
+        "AGENT_PREWARM": "false",
+        "AGENT_EXECUTION": "inline",
+        "FAKE_AGENT_LATENCY": f"fixed:{args.agent_latency_ms}",
+    })
+
+    import fakeredis
+    import slack_ui
+    slack_ui._redis_client = fakeredis.FakeRedis()
+
+    import app as app_module
+    from mastra_bridge import MastraBridge
+
+    bridge = MastraBridge(port=args.agent_port, instances=1)
+    bridge.supervisor.cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_agent.py")]
+    if not bridge.start():
+        raise SystemExit("failed to start the fake agent server")
+    app_module.mastra_bridge = bridge
+    return app_module, bridge
+
+class Scenario:
+    """1つのスレッドでの操作と、偽エージェント・Slackモックの観測"""
+
+    def __init__(self, args, source: FakeSocketModeSource, slack_api: MockSlackAPI, channel: str, thread_ts: str):
+        self.args = args
+        self.source = source
+        self.slack_api = slack_api
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.agent_url = f"http://127.0.0.1:{args.agent_port}"
+        self._events = 0
+
+    def _deliver(self, event: dict):
+        self._events += 1
+        self.source.deliver(_envelope(dict(event, channel=self.channel), f"Ev-{self.channel}-{self._events}"))
+
+    def mention(self, ts: str, text: str):
+        self._deliver({"type": "app_mention", "user": USER_ID, "text": f"<@{BOT_USER_ID}> {text}", "ts": ts,
+                       "thread_ts": self.thread_ts, "channel_type": "channel"})
+
+    def delete(self, ts: str):
+        self._deliver({"type": "message", "subtype": "message_deleted", "deleted_ts": ts, "hidden": True,
+                       "previous_message": {"type": "message", "user": USER_ID, "ts": ts, "thread_ts": self.thread_ts},
+                       "channel_type": "channel"})
+
+    def health(self) -> dict:
+        return requests.get(f"{self.agent_url}/api/health", timeout=5).json()
+
+    def wait_for_answers(self, count: int):
+        """偽エージェントが count 件の応答を返すまで待機"""
+        deadline = time.monotonic() + 30
+        while self.health()["requests"] < count:
+            if time.monotonic() > deadline:
+                raise SystemExit(f"{self.channel}: the fake agent did not answer")
+            time.sleep(0.005)
+
+    def settle(self):
+        """処理中メッセージの削除・応答の投稿が終わるまで待機"""
+        time.sleep(self.args.slack_latency_ms * 4 / 1000 + 0.5)
+
+    def replies(self) -> int:
+        return len(self.slack_api.replies.get(self.channel, []))
+
+    def thread(self) -> dict:
+        """偽エージェントが記録した発言と応答、最後に受け取った context"""
+        return requests.get(f"{self.agent_url}/api/threads/{self.thread_ts}", timeout=5).json()
+
+    def history(self) -> list:
+        return self.thread()["messages"]
+
+def check_merged(scenario: Scenario, answers_before: int, recorded, inflight) -> list:
+    """前の質問への応答が返った直後に続きを送信し、まとめ直した発言だけが記録・送信されたか確認（問題の一覧を返す）"""
+    name = scenario.channel[1:].lower()
+    failures = []
+    first, second = "先月の売上資料を探して", "営業部のものです"
+    started = time.perf_counter()
+    scenario.mention(scenario.thread_ts, first)
+    while not inflight.in_thread(scenario.thread_ts):
+        time.sleep(0.001)
+    submitted_ms = (time.perf_counter() - started) * 1000
+    scenario.wait_for_answers(answers_before + 1)
+    scenario.mention(f"{scenario.thread_ts[:-1]}9", second)
+    scenario.wait_for_answers(answers_before + 2)
+    scenario.settle()
+    turns = recorded()
+    context = scenario.thread()["context"] or ""
+    print(f"{name + ':':<14}submitted in {submitted_ms:.0f} ms, {scenario.replies()} reply, recorded {turns}, "
+          f"context repeats it {context.count(first)} time(s)")
+    if submitted_ms >= scenario.args.coalesce_window_ms / 2:
+        failures.append(f"{name}: the first message waited for the coalescing window")
+    if scenario.replies() != 1 or turns != [f"{first}\n{second}"] or first in context:
+        failures.append(f"{name}: expected one reply, only the merged turn in memory and no repeat in its context")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Cancelled requests and agent-side thread memory")
+    parser.add_argument("--slack-latency-ms", type=float, default=400, help="per Slack Web API call")
+    parser.add_argument("--agent-latency-ms", type=int, default=200)
+    parser.add_argument("--coalesce-window-ms", type=float, default=200)
+    parser.add_argument("--agent-port", type=int, default=3841)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    slack_api = MockSlackAPI(latency_ms=args.slack_latency_ms)
+    slack_api.start()
+    app_module, bridge = load_app(args, slack_api)
+    source = FakeSocketModeSource(app_module.app)
+    failures = []
+
+    try:
+        # 取り消されない質問
+        answered = Scenario(args, source, slack_api, "CANSWERED", "1700000000.000100")
+        answered.mention("1700000000.000100", "先週の議事録を探して")
+        answered.wait_for_answers(1)
+        answered.settle()
+        history = answered.history()
+        print(f"{'answered:':<14}{answered.replies()} reply, {len(history)} messages in agent memory")
+        if answered.replies() != 1 or len(history) != 2:
+            failures.append("answered: expected 1 reply and 1 recorded turn")
+
+        # エージェントの応答後、処理中メッセージの削除中に元のメッセージを削除
+        deleted = Scenario(args, source, slack_api, "CDELETED", "1700000000.000200")
+        deleted.mention("1700000000.000200", "来週の予定を確認して")
+        deleted.wait_for_answers(2)
+        deleted.delete("1700000000.000200")
+        deleted.settle()
+        history = deleted.history()
+        print(f"{'deleted:':<14}{deleted.replies()} reply, {len(history)} messages in agent memory")
+        if deleted.replies() != 0 or history:
+            failures.append("deleted: the cancelled turn was posted or recorded")
+
+        # 続けて送信されたメッセージは、実行中の前の発言を取り消してまとめ直す
+        app_module.thread_coalescer.window = args.coalesce_window_ms / 1000
+        merged = Scenario(args, source, slack_api, "CMERGED", "1700000000.000300")
+        # エージェント側の記録は（発言, 応答）の順に並ぶ
+        failures += check_merged(merged, 2, lambda: merged.history()[::2], app_module.inflight_requests)
+        os.environ["THREAD_MEMORY_OWNER"] = "local"
+        merged_local = Scenario(args, source, slack_api, "CMERGED-LOCAL", "1700000000.000400")
+        failures += check_merged(merged_local, 4, lambda: [
+            message.content for message in app_module.thread_memory.threads.get(merged_local.thread_ts, [])
+            if message.role == "user"
+        ], app_module.inflight_requests)
+    finally:
+        source.close()
+        bridge.stop()
+        slack_api.stop()
+
+    if failures:
+        print("\nFAILED")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+診断用エンドポイント（diagnostics.py）の負荷と正確さの確認
+会話履歴（ThreadMemory）に複数スレッドから書き込みながら GET /debug を繰り返し取得し、次を計測・確認する
+
+計測項目: GET /debug・/debug/memory の応答時間（書き込み中と書き込み後、10秒ごとの取得に耐えること）、
+          ThreadMemory.stats() の処理時間
+          （書き込み中の応答時間は、書き込みスレッドとのGILの取り合いによる待ちを含む）
+確認する動作:
+  - 並行して追加・削除・クリアした後のメッセージ数・使用メモリの概算が、全件を数え直した値と一致する
+  - 使用メモリの概算が、tracemalloc で計測した実際の増加量に近い
+  - tracemalloc の計測中は、確保の多い箇所に会話履歴の追加（thread_memory.py）が含まれ、2回目の取得で増加分を返す
+  - 計測の開始前の GET /debug/tracemalloc は409、存在しないパスは404
+
+使用方法:
+  python benchmarks/bench_diagnostics.py
+  python benchmarks/bench_diagnostics.py --threads 20000 --writers 16
+"""
+
+import argparse
+import gc
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from diagnostics import DiagnosticsServer  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from thread_memory import ThreadMemory, _THREAD_OVERHEAD, _message_bytes  # noqa: E402
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(sorted_values: list, p: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def fill(memory: ThreadMemory, threads: int, messages: int, writers: int, seed: int):
+    """複数スレッドから追加し、一部を削除・クリアする（上限を超えた古いメッセージの削除も発生する）"""
+    def write(worker: int):
+        rng = random.Random(seed + worker)
+        for index in range(worker, threads, writers):
+            thread_id = f"1700{index:06d}.000100"
+            for turn in range(messages):
+                role = "user" if turn % 2 == 0 else "assistant"
+                memory.add_message(thread_id, role, f"{role} {turn} " + "あ" * rng.randint(10, 400), f"U{worker}")
+            if index % 7 == 0:
+                last = memory.threads[thread_id][-1]
+                memory.remove_message(thread_id, last.role, last.content)
+            if index % 11 == 0:
+                memory.clear_thread(thread_id)
+
+    workers = [threading.Thread(target=write, args=(worker,)) for worker in range(writers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def recount(memory: ThreadMemory) -> dict:
+    """全件を走査して数え直した値"""
+    return {
+        "threads": len(memory.threads),
+        "messages": sum(len(messages) for messages in memory.threads.values()),
+        "bytes": sum(_message_bytes(msg) for messages in memory.threads.values() for msg in messages)
+        + len(memory.threads) * _THREAD_OVERHEAD + sys.getsizeof(memory.threads),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape cost and accuracy of the diagnostics endpoints")
+    parser.add_argument("--threads", type=int, default=5000, help="conversation threads in ThreadMemory")
+    parser.add_argument("--messages", type=int, default=25, help="messages added per thread (max 20 are kept)")
+    parser.add_argument("--writers", type=int, default=8, help="concurrent writer threads")
+    parser.add_argument("--scrape-ms", type=int, default=20, help="interval between scrapes while writing")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    registry = Metrics()
+    memory = ThreadMemory()
+    registry.register_gauge("thread_memory", memory.stats)
+    registry.register_gauge("lane.fast", lambda: {"workers": 8, "pending": 0, "active": 0})
+    server = DiagnosticsServer(registry=registry)
+    if not server.start(free_port()):
+        raise SystemExit("failed to start the diagnostics server")
+    base_url = f"http://127.0.0.1:{server.port}"
+    session = requests.Session()
+
+    # 書き込み中に繰り返し取得
+    scrape_latencies = []
+    stop = threading.Event()
+
+    def scrape():
+        while not stop.is_set():
+            for path in ("/debug", "/debug/memory"):
+                started = time.perf_counter()
+                response = session.get(base_url + path, timeout=5)
+                response.raise_for_status()
+                scrape_latencies.append((time.perf_counter() - started) * 1000)
+            stop.wait(args.scrape_ms / 1000)
+
+    scraper = threading.Thread(target=scrape)
+    scraper.start()
+    started = time.perf_counter()
+    fill(memory, args.threads, args.messages, args.writers, args.seed)
+    fill_seconds = time.perf_counter() - started
+    stop.set()
+    scraper.join()
+
+    # 書き込み後（保持量が最大の状態）の取得
+    idle_latencies = []
+    for _ in range(100):
+        for path in ("/debug", "/debug/memory"):
+            started = time.perf_counter()
+            session.get(base_url + path, timeout=5).raise_for_status()
+            idle_latencies.append((time.perf_counter() - started) * 1000)
+    idle_latencies.sort()
+
+    reported = session.get(base_url + "/debug", timeout=5).json()["metrics"]["thread_memory"]
+    exact = recount(memory)
+    stats_started = time.perf_counter()
+    for _ in range(1000):
+        memory.stats()
+    stats_us = (time.perf_counter() - stats_started) * 1000
+    scrape_latencies.sort()
+
+    # tracemalloc の計測中に新しく書き込み、概算と実際の増加量を比べる
+    not_tracing = session.get(base_url + "/debug/tracemalloc", timeout=5)
+    not_found = session.get(base_url + "/debug/unknown", timeout=5)
+    traced_memory = ThreadMemory()
+    traced_threads = args.threads // 5
+    session.post(base_url + "/debug/tracemalloc/start", timeout=5).raise_for_status()
+    first_top = session.get(base_url + "/debug/tracemalloc?top=10", timeout=30).json()
+    gc.collect()
+    before, _ = tracemalloc.get_traced_memory()
+    fill(traced_memory, traced_threads, args.messages, args.writers, args.seed)
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    top = session.get(base_url + "/debug/tracemalloc?top=10", timeout=30).json()
+    traced_summary = session.get(base_url + "/debug/memory", timeout=5).json()["tracemalloc"]
+    session.post(base_url + "/debug/tracemalloc/stop", timeout=5).raise_for_status()
+    estimate = traced_memory.stats()["bytes"]
+    actual = after - before
+    server.stop()
+
+    # location は "<ファイル>:<行>"
+    locations = [entry["location"][0].rsplit(":", 1)[0] for entry in top["top"]]
+    growth = [entry["location"][0].rsplit(":", 1)[0] for entry in top.get("growth", [])]
+    print(f"thread memory   {exact['threads']:,} threads, {exact['messages']:,} messages "
+          f"(filled by {args.writers} writers in {fill_seconds:.1f}s)")
+    print(f"reported        {reported}")
+    print(f"recounted       {exact}")
+    print(f"scrape idle     p50 {percentile(idle_latencies, 50):.2f} ms, p99 {percentile(idle_latencies, 99):.2f} ms "
+          f"({len(idle_latencies)} scrapes)")
+    print(f"scrape writing  p50 {percentile(scrape_latencies, 50):.2f} ms, p99 {percentile(scrape_latencies, 99):.2f} ms "
+          f"({len(scrape_latencies)} scrapes while {args.writers} threads write)")
+    print(f"stats() cost    {stats_us:.1f} us per call")
+    print(f"estimate        {estimate / 1e6:.2f} MB vs traced growth {actual / 1e6:.2f} MB "
+          f"({estimate / actual:.0%}) for {traced_threads:,} threads")
+    print(f"tracemalloc     snapshot {top['elapsed_ms']} ms, traced {traced_summary['traced'] / 1e6:.1f} MB, "
+          f"overhead {traced_summary['overhead'] / 1e6:.1f} MB")
+    for entry in top["top"][:5]:
+        print(f"  top           {entry['size'] / 1e6:7.2f} MB  {os.path.relpath(entry['location'][0], REPO_DIR)}")
+    print(f"status          before start {not_tracing.status_code}, unknown path {not_found.status_code}")
+
+    failed = (
+        {key: reported[key] for key in exact} != exact
+        or percentile(idle_latencies, 99) >= 20
+        or scrape_latencies[-1] >= 1000
+        or not 0.75 <= estimate / actual <= 1.25
+        or not any(location.endswith("thread_memory.py") for location in locations)
+        or not any(location.endswith("thread_memory.py") for location in growth)
+        or "growth" in first_top
+        or not_tracing.status_code != 409
+        or not_found.status_code != 404
+    )
+    if failed:
+        print("\nFAILED")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
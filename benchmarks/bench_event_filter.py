@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+イベント事前フィルターのベンチマーク
+イベントログを再生し、破棄率と従来のリスナー処理に対するCPU時間の削減量を計測
+
+使用方法:
+  python benchmarks/bench_event_filter.py                     # 合成ログを生成して再生
+  python benchmarks/bench_event_filter.py --log events.jsonl  # 1行1イベントのJSONLを再生
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_router import LEGACY_PATTERNS  # noqa: E402
+from event_filter import EventFilter, ThreadParticipation  # noqa: E402
+from thread_memory import ThreadMemory  # noqa: E402
+
+CHATTER = [
+    "了解です",
+    "明日のリリースは14時からでお願いします",
+    "LGTM 👍",
+    "このPR見てもらえますか？",
+    "ランチ行きましょう",
+]
+
+def build_event_log(count: int, seed: int, participating: list) -> list:
+    """忙しいワークスペースを模した決定的なイベント列を生成"""
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        ts = f"{1700000000 + i}.{i % 1000000:06d}"
+        channel = f"C{rng.randint(1, 40):04d}"
+        roll = rng.random()
+        if roll < 0.30:
+            event = {"type": "message", "subtype": "bot_message", "bot_id": "B0001", "text": rng.choice(CHATTER)}
+        elif roll < 0.40:
+            event = {"type": "message", "subtype": rng.choice(["message_changed", "message_deleted"])}
+        elif roll < 0.45:
+            event = {"type": "message", "subtype": "channel_join", "text": "<@U1> has joined the channel"}
+        elif roll < 0.80:
+            event = {"type": "message", "user": "U1", "text": rng.choice(CHATTER)}
+        elif roll < 0.90:
+            event = {"type": "message", "user": "U2", "text": rng.choice(CHATTER), "thread_ts": f"{rng.randint(1, 10**6)}.000001"}
+        elif roll < 0.95:
+            event = {"type": "message", "user": "U3", "text": rng.choice(CHATTER), "thread_ts": rng.choice(participating)}
+        else:
+            event = {"type": "message", "user": "U4", "text": rng.choice(["hello", "検索 議事録", "今何時？"])}
+        event.setdefault("channel", channel)
+        event.setdefault("ts", ts)
+        events.append(event)
+    return events
+
+def load_event_log(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# Boltのapp.message()リスナーが受け付けるサブタイプ
+BOLT_MESSAGE_SUBTYPES = (None, "bot_message", "file_share", "thread_broadcast")
+
+def _listener(event: dict, memory: ThreadMemory):
+    """リスナー本体（キャッチオールのスレッド判定相当）"""
+    text = event.get("text") or ""
+    thread_ts = event.get("thread_ts")
+    if "<@" not in text and thread_ts:
+        memory.has_history(thread_ts)
+
+def run_legacy(events: list, memory: ThreadMemory, executor: ThreadPoolExecutor):
+    """従来の処理：全リスナーを照合し、一致したリスナーごとにワーカースレッドで実行"""
+    futures = []
+    for event in events:
+        if event.get("subtype") not in BOLT_MESSAGE_SUBTYPES:
+            continue
+        text = event.get("text") or ""
+        for pattern in LEGACY_PATTERNS:
+            if pattern.search(text):
+                futures.append(executor.submit(_listener, event, memory))
+    for future in futures:
+        future.result()
+
+def run_filtered(events: list, event_filter: EventFilter, memory: ThreadMemory, executor: ThreadPoolExecutor):
+    """事前フィルター適用後の処理：通過したイベントのみ1つのリスナーで実行"""
+    futures = []
+    for event in events:
+        body = {"type": "event_callback", "event": event}
+        if event_filter.process(body, {}):
+            futures.append(executor.submit(_listener, event, memory))
+    for future in futures:
+        future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Event pre-filter benchmark")
+    parser.add_argument("--log", help="JSONL event log to replay")
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    participating = [f"{1600000000 + i}.000100" for i in range(50)]
+    memory = ThreadMemory()
+    participation = ThreadParticipation()
+    for thread_ts in participating:
+        memory.add_message(thread_ts, "assistant", "previous answer")
+        participation.add(thread_ts)
+
+    events = load_event_log(args.log) if args.log else build_event_log(args.events, args.seed, participating)
+    event_filter = EventFilter(participation=participation)
+
+    # Boltの既定と同じくリスナーはスレッドプールで実行（ワーカーのCPU時間も計測対象）
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        start = time.process_time()
+        run_legacy(events, memory, executor)
+        legacy_cpu = time.process_time() - start
+
+        start = time.process_time()
+        run_filtered(events, event_filter, memory, executor)
+        filtered_cpu = time.process_time() - start
+
+    stats = event_filter.stats()
+    print(f"events        {stats['seen']:,}")
+    print(f"passed        {stats['passed']:,}")
+    print(f"drop ratio    {stats['drop_ratio']:.1%}")
+    print(f"legacy CPU    {legacy_cpu * 1000:.1f} ms")
+    print(f"filtered CPU  {filtered_cpu * 1000:.1f} ms")
+    print(f"CPU saved     {(1 - filtered_cpu / legacy_cpu):.1%}" if legacy_cpu else "CPU saved     n/a")
+    print(f"dropped       {stats['dropped_by_reason']}")
+
+if __name__ == "__main__":
+    main()
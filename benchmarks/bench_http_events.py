@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+HTTP Events API モード（http_app.py）の負荷試験
+gunicorn の複数ワーカーで http_app を起動し、署名付きの合成イベントを並列にPOSTして次を計測・確認する
+（Redisは fakeredis のTCPサーバー、Slack Web APIはモック、エージェント呼び出しはジョブキューへの登録まで）
+
+計測項目: ackまでのレイテンシ（p50/p95/p99/最大、3秒以内であること）、スループット
+確認する動作:
+  - メンションの message と app_mention の2イベント・Slackの再送は、どのワーカーが受けても1件のジョブになる
+  - 参加中スレッドへのメンションなし返信は、参加を記録したワーカー以外が受けても処理される（状態はRedisで共有）
+  - ローカルで完結するインテントはワーカー内で応答する
+  - 署名が不正・タイムスタンプが古いリクエストは401で拒否する
+
+使用方法:
+  python benchmarks/bench_http_events.py
+  python benchmarks/bench_http_events.py --workers 4 --threads 8 --events 3000 --concurrency 64
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_slack import MockSlackAPI, build_workload  # noqa: E402
+
+SIGNING_SECRET = "bench-signing-secret"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(sorted_values: list, p: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def signed_headers(body: bytes, secret: str = SIGNING_SECRET, timestamp: int = None) -> dict:
+    """Slackと同じ v0 署名のヘッダー"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    basestring = f"v0:{timestamp}:".encode() + body
+    signature = "v0=" + hmac.new(secret.encode(), basestring, hashlib.sha256).hexdigest()
+    return {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": str(timestamp),
+        "X-Slack-Signature": signature,
+    }
+
+REDIS_SERVER = """
+import sys
+from fakeredis import TcpFakeServer
+server = TcpFakeServer(("127.0.0.1", int(sys.argv[1])), server_type="redis")
+server.daemon_threads = True
+server.serve_forever()
+"""
+
+def start_redis():
+    """fakeredis のTCPサーバー（gunicornの各ワーカーから共有、負荷をかける側とGILを分けるため別プロセス）"""
+    import redis
+    port = free_port()
+    process = subprocess.Popen([sys.executable, "-c", REDIS_SERVER, str(port)])
+    url = f"redis://127.0.0.1:{port}/0"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            redis.Redis.from_url(url).ping()
+            return process, url
+        except redis.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("fake redis server did not start")
+
+def start_gunicorn(args, env: dict, port: int) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "gunicorn", "http_app:flask_app",
+        "-w", str(args.workers), "-k", "gthread", "--threads", str(args.threads),
+        "-b", f"127.0.0.1:{port}", "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env)
+    # 全ワーカーの起動（アプリの読み込み）を待ってから計測する
+    ready_pids = set()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("gunicorn exited during startup")
+        try:
+            response = requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            if response.ok:
+                ready_pids.add(response.json()["pid"])
+                if len(ready_pids) >= args.workers:
+                    return process
+                continue
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("gunicorn did not become ready")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the HTTP Events API mode")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument("--events", type=int, default=2000, help="messages in the synthetic workload")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent HTTP clients")
+    parser.add_argument("--redelivery-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import redis
+
+    redis_server, redis_url = start_redis()
+    slack_api = MockSlackAPI()
+    slack_api.start()
+
+    items, participating = build_workload(args.events, args.seed, args.redelivery_rate)
+    client = redis.Redis.from_url(redis_url)
+    # fakeredis のTCPサーバーはエラー応答の後に接続を閉じるため、ワーカーが作成を試みないよう先に作成しておく
+    client.xgroup_create("agent:jobs", "agent-workers", id="0", mkstream=True)
+    # 参加中のスレッドは、どのワーカーにも記録がない状態から始める（Redisにのみ存在）
+    for thread_ts in participating:
+        client.set(f"participation:{thread_ts}", 1)
+
+    env = dict(os.environ)
+    env.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+        "SLACK_API_BASE_URL": slack_api.base_url,
+        "SLACK_ALLOWED_CHANNELS": "",
+        "REDIS_URL": redis_url,
+        "DEDUP_BACKEND": "redis",
+        "THREAD_STATE_BACKEND": "redis",
+        "THREAD_MEMORY_OWNER": "agent",
+        "AGENT_EXECUTION": "queue",
+        "THREAD_COALESCE_WINDOW_MS": "0",
+        "EVENT_LOG_PATH": "",
+    })
+    port = free_port()
+    gunicorn = start_gunicorn(args, env, port)
+    url = f"http://127.0.0.1:{port}/slack/events"
+
+    local = threading.local()
+
+    def post(item):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = json.dumps(item.body, ensure_ascii=False).encode()
+        headers = signed_headers(body)
+        if item.kind == "redelivery":
+            headers.update({"X-Slack-Retry-Num": "1", "X-Slack-Retry-Reason": "http_timeout"})
+        started = time.perf_counter()
+        response = session.post(url, data=body, headers=headers, timeout=10)
+        return response.status_code, time.perf_counter() - started
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(post, items))
+        elapsed = time.perf_counter() - started
+
+        # 不正な署名・古いタイムスタンプ
+        body = json.dumps(items[0].body).encode()
+        bad_signature = requests.post(url, data=body, headers=signed_headers(body, secret="wrong"), timeout=10)
+        stale = requests.post(url, data=body, headers=signed_headers(body, timestamp=int(time.time()) - 600),
+                              timeout=10)
+
+        # ack後に実行されるリスナーの完了を待つ
+        expected_jobs = sum(1 for item in items if item.kind in ("mention", "thread") and item.expect)
+        expected_local = sorted(item.expect for item in items if item.kind == "local")
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            jobs = client.xlen("agent:jobs")
+            if jobs >= expected_jobs and all(slack_api.replies.get(channel) for channel in expected_local):
+                break
+            time.sleep(0.2)
+        time.sleep(1)
+        jobs = client.xlen("agent:jobs")
+    finally:
+        # SIGINT: キープアライブ中の接続の終了を待たずに停止する
+        gunicorn.send_signal(signal.SIGINT)
+        gunicorn.wait(timeout=30)
+        slack_api.stop()
+        redis_server.kill()
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = Counter(status for status, _ in results)
+    local_replies = sum(1 for channel in expected_local if slack_api.replies.get(channel))
+    print(f"workers         {args.workers} x {args.threads} threads, {args.concurrency} concurrent clients")
+    print(f"requests        {len(results):,} in {elapsed:.1f}s ({len(results) / elapsed:,.0f} req/s)")
+    print(f"status          {dict(statuses)}")
+    print(f"ack latency     p50 {percentile(latencies, 50) * 1000:.1f} ms, p95 {percentile(latencies, 95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+    print(f"agent jobs      {jobs} (expected {expected_jobs})")
+    print(f"local replies   {local_replies} (expected {len(expected_local)})")
+    print(f"bad signature   {bad_signature.status_code}, stale timestamp {stale.status_code}")
+
+    failed = (
+        set(statuses) != {200}
+        or latencies[-1] >= 3
+        or jobs != expected_jobs
+        or local_replies != len(expected_local)
+        or bad_signature.status_code != 401
+        or stale.status_code != 401
+    )
+    if failed:
+        print("\nFAILED")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+エージェント通信方式のベンチマーク
+HTTP+JSON（会話履歴を毎回全送信）とIPC+msgpack（差分のみ送信）について、
+スレッドが伸びるにつれたリクエストあたりの送信バイト数と、ループバックでの往復時間を比較
+（会話履歴は ThreadMemory と同じく最新20件のため、11ターン目以降は先頭の発言が落ちる）
+計測の前に、日本語・絵文字を含む履歴の差分がUTF-8のバイト数とSHA-256で計算されること、
+先頭の発言が落ちた履歴も全体を送り直さずに差分で復元できることを確認する
+（期待値は slack-mcp-agent/scripts/check-thread-context.ts と共通）
+
+使用方法:
+  python benchmarks/bench_ipc.py [--turns 20] [--turn-chars 400] [--requests 2000]
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agent_ipc import AgentIPCClient, ContextSync, encode_frame, ipc_available, read_frame  # noqa: E402
+from thread_memory import ThreadMemory  # noqa: E402
+
+REPLY = {"response": "了解しました。" * 20, "threadId": "bench", "timestamp": "2024-01-01T00:00:00Z"}
+
+# 日本語・絵文字（サロゲートペア・肌の色・ZWJ結合）を含む履歴と、各ターンまでのUTF-8のバイト数・SHA-256
+CONTEXT_TURNS = [
+    "user: 議事録 👍🏽 を探して\n",
+    "assistant: 了解です 👨\u200d👩\u200d👧 🎉\n",
+    "user: 続きもお願いします 🙏\n",
+]
+CONTEXT_SYNCED = [
+    (38, "0da8e8571385377b94bfd32bf5c9df95e4862183f487e5a15ae6c24730ec803d"),
+    (86, "88ea33d3d88a98899c016d764291a5efc0573a9158a9fade37210a585c720870"),
+]
+# 先頭のターンが落ちた場合（保持分 T0+T1、新しい履歴 T1+T2）: 落とすバイト数・残りのバイト数・残りのSHA-256
+CONTEXT_TRIMMED = (38, 48, "cfc07aa5764074764b8de49647d6aa1cfe9a3d402f87353800bfd3b2fdfcc1c6")
+
+def check_context_sync():
+    """マルチバイト文字・絵文字を含む履歴の差分が、エージェント側と同じ単位・ハッシュで計算されること"""
+    sync = ContextSync()
+    thread_id = "1700000000.000100"
+    context = ""
+    frames = []
+    for turn in CONTEXT_TURNS:
+        context += turn
+        _, offset, digest, delta = sync.delta(thread_id, context)
+        frames.append((offset, digest, delta))
+        sync.update(thread_id, context)
+
+    checks = {
+        "offsets are UTF-8 bytes with SHA-256 prefix digests": [frame[:2] for frame in frames[1:]] == CONTEXT_SYNCED,
+        "offsets differ from the character count": CONTEXT_SYNCED[0][0] != len(CONTEXT_TURNS[0]),
+        "deltas are the new turns": [frame[2] for frame in frames] == CONTEXT_TURNS,
+    }
+    # 長さが同じで内容の異なる履歴（探→調、どちらも3バイト）は全体を送る
+    edited = CONTEXT_TURNS[0].replace("探", "調") + CONTEXT_TURNS[1]
+    checks["a different prefix of the same length resends everything"] = (
+        sync.delta(thread_id, edited) == (0, 0, "", edited))
+
+    # 先頭の発言が落ちた履歴は、落とすバイト数と続きだけを送る
+    sync.update(thread_id, CONTEXT_TURNS[0] + CONTEXT_TURNS[1])
+    trimmed = sync.delta(thread_id, CONTEXT_TURNS[1] + CONTEXT_TURNS[2])
+    checks["a dropped head is sent as a byte count with the retained digest"] = (
+        trimmed == CONTEXT_TRIMMED + (CONTEXT_TURNS[2],))
+
+    # 件数の上限で古い発言が落ち続ける ThreadMemory の履歴（エージェント側の復元を模擬）
+    memory = ThreadMemory(max_messages=4)
+    sync = ContextSync()
+    agent_context, full_resends, restored = "", 0, True
+    for turn in range(8):
+        context = memory.get_context(thread_id)
+        if context:
+            drop, offset, _, delta = sync.delta(thread_id, context)
+            full_resends += offset == 0
+            base = agent_context.encode("utf-8")[drop:drop + offset].decode("utf-8") if offset else ""
+            agent_context = base + delta
+            restored = restored and agent_context == context
+            sync.update(thread_id, context)
+        memory.add_message(thread_id, "user", f"質問{turn} 👍🏽 議事録")
+        memory.add_message(thread_id, "assistant", f"回答{turn} 👨\u200d👩\u200d👧\n2行目 🎉")
+    checks["a trimmed thread memory is restored from deltas"] = restored
+    checks["a trimmed thread memory needs no full resend after the first turn"] = full_resends == 1
+
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'NG':<3} {name}")
+    if not all(checks.values()):
+        print("\nFAILED")
+        sys.exit(1)
+    print()
+
+def build_turns(turns: int, turn_chars: int) -> list:
+    """スレッドの各ターンで送信されるペイロードを生成（会話履歴は ThreadMemory の最新20件）"""
+    memory = ThreadMemory()
+    thread_id = "1700000000.000100"
+    payloads = []
+    for i in range(turns):
+        message = f"質問{i}: " + "あ" * (turn_chars // 2)
+        payloads.append({
+            "message": message,
+            "threadId": thread_id,
+            "userId": "U0001",
+            "context": memory.get_context(thread_id),
+        })
+        memory.add_message(thread_id, "user", message, "U0001")
+        memory.add_message(thread_id, "assistant", "い" * (turn_chars // 2))
+    return payloads
+
+def http_request_bytes(session: requests.Session, url: str, payload: dict) -> int:
+    """requestsが送信するHTTPリクエスト（リクエスト行・ヘッダー・本文）のバイト数"""
+    prepared = session.prepare_request(requests.Request("POST", url, json=payload))
+    head = f"POST {prepared.path_url} HTTP/1.1\r\n" + "".join(
+        f"{key}: {value}\r\n" for key, value in prepared.headers.items()
+    ) + "Host: localhost:3001\r\n\r\n"
+    return len(head.encode()) + len(prepared.body or b"")
+
+def ipc_request_bytes(client: AgentIPCClient, request_id: int, payload: dict) -> int:
+    """AgentIPCClient.search と同じ差分計算を行った場合のフレームのバイト数"""
+    thread_id = payload["threadId"]
+    drop, offset, digest, delta = client.context_sync.delta(thread_id, payload["context"])
+    params = {key: value for key, value in payload.items() if key != "context"}
+    params["contextDrop"] = drop
+    params["contextOffset"] = offset
+    params["contextDigest"] = digest
+    params["contextDelta"] = delta
+    client.context_sync.update(thread_id, payload["context"])
+    return len(encode_frame({"id": request_id, "method": "search", "params": params}))
+
+def compare_sizes(args):
+    payloads = build_turns(args.turns, args.turn_chars)
+    session = requests.Session()
+    client = AgentIPCClient("/nonexistent.sock")
+
+    print(f"{'turn':>4} {'http bytes':>11} {'ipc bytes':>10} {'ratio':>7}")
+    total_http = total_ipc = 0
+    for i, payload in enumerate(payloads):
+        http_bytes = http_request_bytes(session, "http://localhost:3001/api/agent/search", payload)
+        ipc_bytes = ipc_request_bytes(client, i + 1, payload)
+        total_http += http_bytes
+        total_ipc += ipc_bytes
+        if i in (0, 1) or (i + 1) % max(1, args.turns // 5) == 0:
+            print(f"{i + 1:>4} {http_bytes:>11,} {ipc_bytes:>10,} {ipc_bytes / http_bytes:>7.1%}")
+    print(f"{'all':>4} {total_http:>11,} {total_ipc:>10,} {total_ipc / total_http:>7.1%}")
+
+class _EchoHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書き込むため、Nagleと遅延ACKによる40ms待ちを避ける
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(REPLY).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _EchoIPCHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request, _ = read_frame(self.request)
+            except ConnectionError:
+                return
+            self.request.sendall(encode_frame({"id": request["id"], "status": 200, "body": REPLY}))
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def _measure(call, count: int) -> list:
+    call(0)  # ウォームアップ（接続確立）
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+def compare_round_trip(args):
+    payload = build_turns(args.turns, args.turn_chars)[-1]
+
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHTTPHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{http_server.server_address[1]}/api/agent/search"
+    session = requests.Session()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "bench-agent.sock")
+    ipc_server = _UnixServer(socket_path, _EchoIPCHandler)
+    threading.Thread(target=ipc_server.serve_forever, daemon=True).start()
+    client = AgentIPCClient(socket_path)
+
+    try:
+        http = _measure(lambda i: session.post(url, json=payload, timeout=10).json(), args.requests)
+        ipc = _measure(lambda i: client.search(payload, timeout=10), args.requests)
+    finally:
+        client.close()
+        http_server.shutdown()
+        ipc_server.shutdown()
+        os.unlink(socket_path)
+
+    print(f"\n{'transport':>9} {'p50 us':>9} {'p95 us':>9}")
+    for name, latencies in (("http", http), ("ipc", ipc)):
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1e6
+        print(f"{name:>9} {p50:>9.0f} {p95:>9.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent transport benchmark")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--turn-chars", type=int, default=400)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    if not ipc_available() or not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("msgpack and Unix domain sockets are required")
+    logging.basicConfig(level=logging.WARNING)
+
+    check_context_sync()
+    compare_sizes(args)
+    compare_round_trip(args)
+
+if __name__ == "__main__":
+    main()
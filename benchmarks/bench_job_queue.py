@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+ジョブキュー（job_queue.py）とワーカー（agent_worker.py）の試験
+fakeredis・Slack Web APIモック・偽エージェントサーバーを使い、外部サービスなしで次の動作を確認する
+
+確認する動作:
+  - 登録したジョブはすべて、ちょうど1回ずつスレッドに応答が投稿される
+  - ジョブを取り出したまま停止したワーカー（ack しない）のジョブは、可視性タイムアウト後に他のワーカーが引き取る
+  - 処理が可視性タイムアウトより長くかかっても、処理中は期限が延長されて二重に実行されない
+  - 投稿に失敗し続けるジョブは試行回数の上限で dead letter ストリームへ移る
+  - 別々のスレッドへの同じ返信はそれぞれエージェントを呼び出し、会話履歴のない同じ質問だけが1回の呼び出しにまとまる
+
+使用方法:
+  python benchmarks/bench_job_queue.py
+  python benchmarks/bench_job_queue.py --jobs 200 --workers 3 --concurrency 8 --agent-latency fixed:300
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_slack import MockSlackAPI  # noqa: E402
+
+POISON_CHANNEL = "CPOISON"
+
+def upstream_calls(worker, bridge, jobs) -> int:
+    """ジョブを同時に処理し、エージェントサーバーが受けた呼び出しの回数を返す"""
+    agent_url = bridge.supervisor.instances[0].base_url
+
+    def received() -> int:
+        return requests.get(f"{agent_url}/api/health", timeout=5).json()["received"]
+
+    barrier = threading.Barrier(len(jobs))
+
+    def process(job):
+        barrier.wait()
+        worker.process(job)
+
+    before = received()
+    threads = [threading.Thread(target=process, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return received() - before
+
+class FlakySlackClient:
+    """特定のチャンネルへの投稿だけ失敗させるSlackクライアント"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def chat_postMessage(self, **kwargs):
+        if kwargs.get("channel") == POISON_CHANNEL and not kwargs.get("text", "").startswith("🔄"):
+            raise RuntimeError("channel_not_found")
+        return self.client.chat_postMessage(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis job queue and agent worker test")
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=2, help="worker processes (simulated in-process)")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs processed at once per worker")
+    parser.add_argument("--crashed", type=int, default=3, help="jobs held by a worker that dies without ack")
+    parser.add_argument("--visibility", type=float, default=1.5, help="visibility timeout in seconds")
+    parser.add_argument("--agent-latency", default="fixed:2500", help="see benchmarks/fake_agent.py")
+    parser.add_argument("--agent-port", type=int, default=3801)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    os.environ.update({"FAKE_AGENT_LATENCY": args.agent_latency, "THREAD_MEMORY_OWNER": "agent"})
+
+    import fakeredis
+    from slack_sdk import WebClient
+    import slack_ui
+    from agent_worker import AgentWorker
+    from job_queue import AgentJob, RedisJobQueue
+    from mastra_bridge import MastraBridge
+    from metrics import metrics
+
+    redis_server = fakeredis.FakeServer()
+    slack_ui._redis_client = fakeredis.FakeRedis(server=redis_server)
+
+    def make_queue() -> RedisJobQueue:
+        # ワーカーごとに別の接続（別プロセスと同じく状態はRedisのみで共有）
+        queue = RedisJobQueue("redis://unused", visibility_timeout=args.visibility, max_attempts=3)
+        queue._client = fakeredis.FakeRedis(server=redis_server)
+        return queue
+
+    slack_api = MockSlackAPI()
+    slack_api.start()
+    bridge = MastraBridge(port=args.agent_port, instances=1)
+    bridge.supervisor.cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_agent.py")]
+    if not bridge.start():
+        raise SystemExit("failed to start the fake agent server")
+
+    try:
+        producer = make_queue()
+        channels = [f"C{index:04d}" for index in range(args.jobs)]
+        for index, channel in enumerate(channels):
+            producer.enqueue(channel, f"1700000000.{index:06d}", f"U{index % 7}", f"質問 {index}")
+        producer.enqueue(POISON_CHANNEL, "1700000001.000000", "U0", "投稿できない質問")
+
+        # 取り出したまま応答しなくなったワーカー
+        crashed = make_queue().claim("crashed-worker", count=args.crashed, block_ms=0)
+
+        client = FlakySlackClient(WebClient(token="xoxb-bench", base_url=slack_api.base_url))
+        workers = [
+            AgentWorker(make_queue(), bridge, client, consumer=f"worker-{index}", concurrency=args.concurrency,
+                        block_ms=200)
+            for index in range(args.workers)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+
+        answered = slack_api.wait_for(channels, timeout=args.timeout)
+        elapsed = time.perf_counter() - started
+        # 毒ジョブが上限まで再試行されるのを待つ
+        deadline = time.monotonic() + args.timeout
+        while producer.stats()["dead"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.2)
+        for worker in workers:
+            worker.stop()
+
+        # 同じユーザーの同じ文面（別々のスレッドへの返信と、会話履歴のない新しいスレッド）
+        now = time.time()
+        replies_in_threads = [
+            AgentJob(f"reply-{index}", f"CHIST{index}", f"1700000002.00000{index}", "U0", "それの続きを教えて", now,
+                     message_ts=f"1700000003.00000{index}")
+            for index in range(2)
+        ]
+        new_threads = [
+            AgentJob(f"new-{index}", f"CNEW{index}", f"1700000004.00000{index}", "U0", "先週の議事録を探して", now,
+                     message_ts=f"1700000004.00000{index}")
+            for index in range(2)
+        ]
+        reply_calls = upstream_calls(workers[0], bridge, replies_in_threads)
+        new_thread_calls = upstream_calls(workers[0], bridge, new_threads)
+    finally:
+        bridge.stop()
+        slack_api.stop()
+
+    replies = Counter({channel: len(slack_api.replies.get(channel, [])) for channel in channels})
+    duplicates = sorted(channel for channel, count in replies.items() if count > 1)
+    missing = sorted(channel for channel, count in replies.items() if count == 0)
+    stats = producer.stats()
+
+    print(f"jobs            {args.jobs} (+1 poison), {args.workers} workers x {args.concurrency}")
+    print(f"all answered    {answered} in {elapsed:.1f}s")
+    print(f"missing         {len(missing)}")
+    print(f"duplicates      {len(duplicates)}")
+    print(f"crashed jobs    {len(crashed)} held, {metrics.get('jobs.reclaimed')} reclaimed")
+    print(f"retried         {metrics.get('jobs.retried')}")
+    print(f"queue           {stats}")
+    print(f"same text       2 thread replies -> {reply_calls} upstream call(s), "
+          f"2 new threads -> {new_thread_calls} upstream call(s)")
+
+    failed = (
+        missing or duplicates or stats["dead"] != 1 or stats["queued"] or stats["in_progress"]
+        or reply_calls != 2 or new_thread_calls != 1
+    )
+    if failed:
+        print("\nFAILED")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
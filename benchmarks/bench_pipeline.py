@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+メッセージ処理パイプライン全体のオフラインベンチマーク
+偽のSocket Modeイベント源・Slack Web APIモック・偽エージェントサーバー・fakeredisを使い、
+app.py のミドルウェアとハンドラーを実際に通して計測する（外部サービス不要）
+
+計測項目: スループット、応答までのレイテンシ（p50/p95/p99）、メッセージあたりのSlack API呼び出し数、メモリ増加量
+
+使用方法:
+  python benchmarks/bench_pipeline.py                                  # 既定の負荷で計測
+  python benchmarks/bench_pipeline.py --messages 2000 --rate 50        # 毎秒50件のポアソン到着
+  python benchmarks/bench_pipeline.py --agent-latency fixed:200 --json baseline.json
+  python benchmarks/bench_pipeline.py --compare baseline.json          # 基準結果との差分を表示
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_slack import FakeSocketModeSource, MockSlackAPI, build_workload, deliver_workload  # noqa: E402
+
+def rss_bytes() -> int:
+    """現在の常駐メモリ（Linux以外では最大常駐メモリ）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def load_app(args, slack_api: MockSlackAPI):
+    """外部サービスを偽物に差し替えて app.py を読み込む"""
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_API_BASE_URL": slack_api.base_url,
+        "SLACK_ALLOWED_CHANNELS": "",
+        "DEDUP_BACKEND": args.dedup_backend,
+        "THREAD_MEMORY_OWNER": args.thread_memory,
+        "FAKE_AGENT_LATENCY": args.agent_latency,
+        "FAKE_AGENT_SEED": str(args.seed),
+        "FAKE_AGENT_CPU_MS": str(args.agent_cpu_ms),
+    })
+
+    import fakeredis
+    import slack_ui
+    from event_dedup import RedisTTLSet, event_deduplicator
+
+    # Redisを使う箇所はすべて同じfakeredisサーバーを参照
+    redis_server = fakeredis.FakeServer()
+    slack_ui._redis_client = fakeredis.FakeRedis(server=redis_server)
+    if isinstance(event_deduplicator.store, RedisTTLSet):
+        event_deduplicator.store._client = fakeredis.FakeRedis(server=redis_server)
+
+    import app as app_module
+    from mastra_bridge import MastraBridge
+
+    # 実エージェントを誤って使わないよう、専用ポートで偽エージェントを起動
+    bridge = MastraBridge(port=args.agent_port, instances=args.agent_instances)
+    bridge.supervisor.cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_agent.py")]
+    if not bridge.start():
+        raise SystemExit("failed to start the fake agent server")
+    app_module.mastra_bridge = bridge
+    return app_module, bridge
+
+def seed_participation(app_module, threads: list):
+    """既にボットが会話中のスレッドとして登録（スレッド返信が処理対象になるように）"""
+    for thread_ts in threads:
+        app_module.event_filter.participation.add(thread_ts)
+        if not app_module.agent_owns_thread_memory():
+            app_module.thread_memory.add_message(thread_ts, "assistant", "previous answer")
+
+def run(args) -> dict:
+    slack_api = MockSlackAPI(latency_ms=args.slack_latency_ms)
+    slack_api.start()
+    app_module, bridge = load_app(args, slack_api)
+
+    items, participating = build_workload(args.messages, args.seed, args.redelivery_rate)
+    seed_participation(app_module, participating)
+    source = FakeSocketModeSource(app_module.app, concurrency=args.concurrency)
+
+    # ウォームアップ（初回のauth.testや遅延読み込みを計測から除外）
+    warmup, warmup_threads = build_workload(20, args.seed + 1000, 0)
+    seed_participation(app_module, warmup_threads)
+    for item in warmup:
+        item.body["event"]["channel"] = "W" + str(item.body["event"].get("channel", ""))
+        item.body["event_id"] = "W" + item.body["event_id"]
+    deliver_workload(source, warmup, 0, args.seed)
+    slack_api.wait_for(["W" + item.expect for item in warmup if item.expect], timeout=60)
+
+    gc.collect()
+    rss_before = rss_bytes()
+    calls_before = slack_api.api_calls()
+
+    start = time.perf_counter()
+    deliver_workload(source, items, args.rate, args.seed)
+    expected = [item for item in items if item.expect]
+    completed = slack_api.wait_for([item.expect for item in expected], timeout=args.timeout)
+    elapsed = time.perf_counter() - start
+
+    source.close()
+    gc.collect()
+    rss_after = rss_bytes()
+    agent_requests = sum(
+        requests.get(f"{instance.base_url}/api/health", timeout=5).json().get("requests", 0)
+        for instance in bridge.supervisor.healthy_instances()
+    )
+    bridge.stop()
+    slack_api.stop()
+
+    latencies = {}
+    for item in expected:
+        responded_at = slack_api.responses.get(item.expect)
+        if responded_at is not None:
+            latencies.setdefault(item.kind, []).append((responded_at - item.injected_at) * 1000)
+    all_latencies = sorted(value for values in latencies.values() for value in values)
+
+    calls = slack_api.api_calls() - calls_before
+    kinds = Counter(item.kind for item in items)
+    # メンションは message と app_mention の2イベントで1メッセージ
+    mentions = kinds["mention"] // 2
+    user_messages = sum(count for kind, count in kinds.items() if kind != "redelivery") - mentions
+    agent_messages = mentions + kinds["thread"]
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+        "completed": completed,
+        "events": len(items),
+        "user_messages": user_messages,
+        "agent_messages": agent_messages,
+        "expected_responses": len(expected),
+        "answered": len(all_latencies),
+        "elapsed_s": elapsed,
+        "throughput_msg_s": user_messages / elapsed,
+        "latency_ms": {
+            "p50": percentile(all_latencies, 50),
+            "p95": percentile(all_latencies, 95),
+            "p99": percentile(all_latencies, 99),
+        },
+        "latency_by_kind_ms": {
+            kind: {"p50": percentile(sorted(values), 50), "p95": percentile(sorted(values), 95)}
+            for kind, values in sorted(latencies.items())
+        },
+        "slack_calls": dict(calls),
+        "slack_calls_per_message": sum(calls.values()) / user_messages,
+        # ローカルインテントは1回の投稿で完結するため、残りをエージェント宛てのメッセージに割り当てる
+        "slack_calls_per_agent_message": (sum(calls.values()) - kinds["local"]) / max(1, agent_messages),
+        "agent_requests": agent_requests,
+        "rss_growth_mb": (rss_after - rss_before) / 2**20,
+        "metrics": app_module.metrics.snapshot(),
+    }
+
+def print_report(result: dict, baseline: dict = None):
+    def row(label, key_path, fmt="{:.1f}", lower_is_better=True):
+        value = result
+        base = baseline
+        for key in key_path:
+            value = value[key]
+            base = base.get(key) if isinstance(base, dict) else None
+        line = f"{label:<28} {fmt.format(value):>12}"
+        if isinstance(base, (int, float)) and base:
+            change = (value - base) / base
+            better = (change < 0) == lower_is_better
+            line += f"   {'+' if change >= 0 else ''}{change:.1%} vs baseline {'✓' if better or change == 0 else '✗'}"
+        print(line)
+
+    print(f"events delivered             {result['events']:>12,}")
+    print(f"user messages                {result['user_messages']:>12,}")
+    print(f"responses                    {result['answered']:>7,}/{result['expected_responses']:<5,}"
+          f"{'' if result['completed'] else ' (timed out)'}")
+    row("throughput (msg/s)", ["throughput_msg_s"], lower_is_better=False)
+    row("latency p50 (ms)", ["latency_ms", "p50"])
+    row("latency p95 (ms)", ["latency_ms", "p95"])
+    row("latency p99 (ms)", ["latency_ms", "p99"])
+    row("slack calls / message", ["slack_calls_per_message"], "{:.2f}")
+    row("slack calls / agent message", ["slack_calls_per_agent_message"], "{:.2f}")
+    row("RSS growth (MB)", ["rss_growth_mb"])
+    for kind, values in result["latency_by_kind_ms"].items():
+        print(f"  {kind:<26} p50 {values['p50']:>8.1f} ms   p95 {values['p95']:>8.1f} ms")
+    print(f"agent requests               {result['agent_requests']:>12,}")
+    print(f"slack calls                  {result['slack_calls']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--messages", type=int, default=1000, help="number of workload steps")
+    parser.add_argument("--rate", type=float, default=100.0, help="arrival rate per second (0 = burst)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=10, help="Socket Mode worker threads")
+    parser.add_argument("--redelivery-rate", type=float, default=0.03)
+    parser.add_argument("--agent-latency", default="lognormal:800,0.5", help="see benchmarks/fake_agent.py")
+    parser.add_argument("--agent-cpu-ms", type=float, default=0.0)
+    parser.add_argument("--agent-port", type=int, default=3301)
+    parser.add_argument("--agent-instances", type=int, default=1)
+    parser.add_argument("--slack-latency-ms", type=float, default=20.0)
+    parser.add_argument("--dedup-backend", choices=["memory", "redis"], default="memory")
+    parser.add_argument("--thread-memory", choices=["agent", "local"], default="agent")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", help="write the result to this file")
+    parser.add_argument("--compare", help="baseline result (JSON) to compare against")
+    args = parser.parse_args()
+
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.compare = os.path.abspath(args.compare) if args.compare else None
+    # vibeloggerなどのファイル出力がリポジトリを汚さないよう一時ディレクトリで実行
+    os.chdir(tempfile.mkdtemp(prefix="bench-pipeline-"))
+    logging.basicConfig(level=logging.WARNING)
+
+    result = run(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
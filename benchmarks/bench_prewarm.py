@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+ユーザーごとの準備の事前開始（prewarm）の効果の計測
+偽エージェントサーバーで、ユーザーごとの準備（トークン取得・MCPサーバーの起動の代わり、FAKE_AGENT_SETUP_MS）と
+保持期間を模擬し、app.py のハンドラーを実際に通してメンションから最初の応答の投稿までの時間を比べる
+
+計測する場面:
+  - cold (prewarm off)  準備のないユーザーのメンション、事前準備なし（従来の動作）
+  - cold (prewarm on)   準備のないユーザーのメンション、受信時に事前準備を開始（連投の集約待ちの間に準備が進む）
+  - warm follow-up      応答後のスレッドでの続きの質問（準備は保持期間内のため再利用される）
+
+使用方法:
+  python benchmarks/bench_prewarm.py
+  python benchmarks/bench_prewarm.py --users 20 --setup-ms 4000 --coalesce-ms 1200 --agent-latency fixed:1500
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_slack import BOT_USER_ID, FakeSocketModeSource, MockSlackAPI, _envelope  # noqa: E402
+
+def percentile(sorted_values: list, p: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def mention_events(user: str, channel: str, ts: str, text: str) -> list:
+    """メンション付きの質問（Slackは message と app_mention の2イベントを送る）"""
+    base = {"user": user, "text": f"<@{BOT_USER_ID}> {text}", "ts": ts, "channel": channel, "channel_type": "channel"}
+    return [
+        _envelope(dict(base, type="message"), f"Ev-{channel}-m"),
+        _envelope(dict(base, type="app_mention"), f"Ev-{channel}-a"),
+    ]
+
+def wait_for_replies(slack_api: MockSlackAPI, channels: list, count: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(len(slack_api.replies.get(channel, [])) >= count for channel in channels):
+            return True
+        time.sleep(0.02)
+    return False
+
+def run_phase(source, slack_api, name: str, users: int, spacing: float, timeout: float) -> dict:
+    """ユーザーごとに別のチャンネルでメンションし、続けて同じスレッドで質問する"""
+    channels = [f"C{name.upper()}{index:03d}" for index in range(users)]
+    injected = {}
+    for index, channel in enumerate(channels):
+        ts = f"1700000{index:03d}.000100"
+        injected[channel] = time.perf_counter()
+        for body in mention_events(f"U{name.upper()}{index:03d}", channel, ts, f"検索 {name} の資料 {index}"):
+            source.deliver(body)
+        time.sleep(spacing)
+    if not wait_for_replies(slack_api, channels, 1, timeout):
+        raise SystemExit(f"{name}: not all mentions were answered")
+    first = sorted((slack_api.replies[channel][0] - injected[channel]) * 1000 for channel in channels)
+
+    # 応答後のスレッドでの続きの質問
+    follow_injected = {}
+    for index, channel in enumerate(channels):
+        event = {"type": "message", "user": f"U{name.upper()}{index:03d}", "text": "もう少し詳しく",
+                 "ts": f"1700000{index:03d}.000200", "thread_ts": f"1700000{index:03d}.000100",
+                 "channel": channel, "channel_type": "channel"}
+        follow_injected[channel] = time.perf_counter()
+        source.deliver(_envelope(event, f"Ev-{channel}-f"))
+        time.sleep(spacing)
+    if not wait_for_replies(slack_api, channels, 2, timeout):
+        raise SystemExit(f"{name}: not all follow-ups were answered")
+    follow = sorted((slack_api.replies[channel][1] - follow_injected[channel]) * 1000 for channel in channels)
+    return {"first": first, "follow": follow}
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first answer with and without agent prewarming")
+    parser.add_argument("--users", type=int, default=10, help="distinct users (cold) per phase")
+    parser.add_argument("--setup-ms", type=int, default=2500, help="per-user setup time of the fake agent")
+    parser.add_argument("--coalesce-ms", type=int, default=1200, help="THREAD_COALESCE_WINDOW_MS")
+    parser.add_argument("--agent-latency", default="fixed:800", help="see benchmarks/fake_agent.py")
+    parser.add_argument("--spacing-ms", type=int, default=100, help="interval between users")
+    parser.add_argument("--agent-port", type=int, default=3811)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    slack_api = MockSlackAPI()
+    slack_api.start()
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_API_BASE_URL": slack_api.base_url,
+        "SLACK_ALLOWED_CHANNELS": "",
+        "DEDUP_BACKEND": "memory",
+        "THREAD_MEMORY_OWNER": "agent",
+        "THREAD_COALESCE_WINDOW_MS": str(args.coalesce_ms),
+        "FAKE_AGENT_LATENCY": args.agent_latency,
+        "FAKE_AGENT_SETUP_MS": str(args.setup_ms),
+        "AGENT_PREWARM": "true",
+    })
+
+    import fakeredis
+    import slack_ui
+    slack_ui._redis_client = fakeredis.FakeRedis()
+
+    import app as app_module
+    from mastra_bridge import MastraBridge
+
+    bridge = MastraBridge(port=args.agent_port, instances=1)
+    bridge.supervisor.cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_agent.py")]
+    if not bridge.start():
+        raise SystemExit("failed to start the fake agent server")
+    app_module.mastra_bridge = bridge
+    source = FakeSocketModeSource(app_module.app, concurrency=10)
+    health_url = f"{bridge.supervisor.instances[0].base_url}/api/health"
+
+    try:
+        results = {}
+        setups = {}
+        for name, prewarm in (("off", False), ("on", True)):
+            app_module.AGENT_PREWARM = prewarm
+            before = requests.get(health_url, timeout=5).json()["setups"]
+            results[name] = run_phase(source, slack_api, name, args.users, args.spacing_ms / 1000, args.timeout)
+            setups[name] = requests.get(health_url, timeout=5).json()["setups"] - before
+        health = requests.get(health_url, timeout=5).json()
+    finally:
+        source.close()
+        bridge.stop()
+        slack_api.stop()
+
+    def row(label: str, values: list) -> str:
+        return f"{label:<22} p50 {percentile(values, 50):7.0f} ms   p95 {percentile(values, 95):7.0f} ms"
+
+    print(f"users {args.users} per phase, setup {args.setup_ms} ms, coalesce window {args.coalesce_ms} ms, "
+          f"agent latency {args.agent_latency}")
+    print(row("cold (prewarm off)", results["off"]["first"]))
+    print(row("cold (prewarm on)", results["on"]["first"]))
+    print(row("warm follow-up", sorted(results["off"]["follow"] + results["on"]["follow"])))
+    reduction = percentile(results["off"]["first"], 50) - percentile(results["on"]["first"], 50)
+    print(f"time to first answer reduced by {reduction:.0f} ms at p50 "
+          f"({reduction / percentile(results['off']['first'], 50):.0%})")
+    print(f"agent setups          off {setups['off']}, on {setups['on']} (one per user), "
+          f"prewarm requests {health['prewarms']}")
+
+    # 事前準備で隠せるのは、準備時間と質問の処理開始までの待ち時間の短い方
+    expected_reduction = min(args.setup_ms, args.coalesce_ms) * 0.5
+    failed = (
+        reduction < expected_reduction
+        or setups["off"] != args.users
+        or setups["on"] != args.users
+        or percentile(results["on"]["follow"], 50) >= percentile(results["on"]["first"], 50)
+    )
+    if failed:
+        print("\nFAILED")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
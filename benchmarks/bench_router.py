@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+メッセージルーターのベンチマーク
+従来の積み上げ型正規表現リスナーと単一パスのMessageRouterで、1秒あたりの処理イベント数を比較
+（Bolt側のリスナーごとのオーバーヘッドは含まないため、実運用での差はこれより大きい）
+計測の前に、代表的な文の分類結果を確認する（会話の一部に含まれるキーワードでローカル応答にならないこと）
+
+使用方法: python benchmarks/bench_router.py [--events 200000] [--seed 42]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from message_router import MessageRouter  # noqa: E402
+
+# app.py に以前登録されていたリスナーのパターン（登録順）
+LEGACY_PATTERNS = [
+    re.compile(re.escape("hello")),
+    re.compile(r"(help|ヘルプ|助けて)"),
+    re.compile(r"(time|時間|時刻)"),
+    re.compile(r"(joke|ジョーク|冗談)"),
+    re.compile(r"(good morning|おはよう|おはようございます)"),
+    re.compile(r"(good night|おやすみ|おやすみなさい)"),
+    re.compile(r"(search|検索|探して|調べて)"),
+    re.compile(""),  # キャッチオール
+]
+
+SAMPLE_MESSAGES = [
+    "hello",
+    "おはようございます！",
+    "今何時？",
+    "プロジェクトの進捗を検索して",
+    "先週のミーティングメモを探して",
+    "了解です、ありがとうございます",
+    "明日のリリースは14時からでお願いします",
+    "LGTM 👍",
+    "joke please",
+    "help",
+    "この件、誰かレビューお願いできますか？ " * 4,
+    "おやすみなさい",
+]
+
+# (文, 期待するインテント)。None はスレッド内の継続会話としてエージェントに渡す
+CLASSIFICATION_CASES = [
+    ("hello", "hello"),
+    ("<@U0BOT> こんにちは！", "hello"),
+    ("今何時？", "time"),
+    ("時間を教えて", "time"),
+    ("help", "help"),
+    ("使い方を教えてください", "help"),
+    ("おはようございます！", "good_morning"),
+    ("joke please", "joke"),
+    ("プロジェクトの進捗を検索して", "search"),
+    ("時間があれば先週の議事録を探して", "search"),
+    # 会話の一部に含まれるキーワード
+    ("この作業の時間を見積もって", None),
+    ("それにかかる時間はどれくらい？", None),
+    ("what time does the meeting start tomorrow", None),
+    ("この関数の使い方がわからない", None),
+    ("i need help with the deployment script", None),
+    ("こんにちは、先ほどの件の続きです", None),
+    ("了解です、ありがとうございます", None),
+]
+
+def check_classification(router: MessageRouter) -> bool:
+    """代表的な文の分類結果を確認し、誤りを表示する"""
+    ok = True
+    for text, expected in CLASSIFICATION_CASES:
+        intent = router.classify(text)
+        actual = intent.name if intent else None
+        if actual != expected:
+            print(f"misclassified  {text!r}: {actual} (expected {expected})")
+            ok = False
+    print(f"classification {len(CLASSIFICATION_CASES)} cases {'ok' if ok else 'FAILED'}")
+    return ok
+
+def build_events(count: int, seed: int) -> list:
+    """決定的なメッセージ列を生成"""
+    rng = random.Random(seed)
+    return [rng.choice(SAMPLE_MESSAGES) for _ in range(count)]
+
+def run_legacy(events: list) -> int:
+    """全パターンを毎回評価（Boltの積み上げリスナー相当）"""
+    fired = 0
+    for text in events:
+        for pattern in LEGACY_PATTERNS:
+            if pattern.search(text):
+                fired += 1
+    return fired
+
+def run_router(router: MessageRouter, events: list) -> int:
+    """1回の分類で処理先を決定"""
+    fired = 0
+    for text in events:
+        router.classify(text)
+        fired += 1
+    return fired
+
+def measure(label: str, func, events: list):
+    start = time.perf_counter()
+    fired = func(events)
+    elapsed = time.perf_counter() - start
+    rate = len(events) / elapsed if elapsed else float("inf")
+    print(f"{label:<10} {rate:>12,.0f} events/sec  ({fired / len(events):.2f} handlers/event)")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description="Message router benchmark")
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    router = MessageRouter()
+    if not check_classification(router):
+        print("\nFAILED")
+        sys.exit(1)
+    events = build_events(args.events, args.seed)
+
+    legacy_rate = measure("legacy", run_legacy, events)
+    router_rate = measure("router", lambda evs: run_router(router, evs), events)
+    print(f"speedup    {router_rate / legacy_rate:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+同一リクエストの相乗り（SingleFlight）の確認
+応答の遅い偽エージェントサーバー（fake_agent.py）に、同じ質問を複数スレッドから同時に送り、次を確認する
+
+  - 同時に届いた同じ質問（会話履歴なし・同じユーザー）は、エージェントへの1回の呼び出しにまとまる
+  - すべての呼び出し元が同じ結果を受け取り、所要時間は1回分の応答時間に収まる
+  - 質問が異なる場合はまとめない（対照）
+  - エージェントのエラーは待っていたすべての呼び出し元に届き、次の呼び出しには持ち越さない
+  - 呼び出し自体が例外を送出した場合も、待っていたすべての呼び出し元に同じ例外が届き、次の呼び出しでは再実行する
+
+使用方法:
+  python benchmarks/bench_single_flight.py
+  python benchmarks/bench_single_flight.py --callers 50 --latency-ms 2000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+def run_concurrently(callers: int, call):
+    """全呼び出し元をバリアで揃えて同時に呼び出し、(結果または例外のリスト, 経過秒) を返す"""
+    barrier = threading.Barrier(callers)
+
+    def run(index):
+        barrier.wait()
+        try:
+            return call(index)
+        except Exception as e:
+            return e
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        results = list(executor.map(run, range(callers)))
+    return results, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent identical agent calls are coalesced into one")
+    parser.add_argument("--callers", type=int, default=20, help="concurrent identical calls")
+    parser.add_argument("--latency-ms", type=int, default=1000, help="fake agent response time")
+    parser.add_argument("--agent-port", type=int, default=3821)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ.update({
+        "FAKE_AGENT_LATENCY": f"fixed:{args.latency_ms}",
+        # エラーも応答時間の後に返し、待っている呼び出し元がいる状態でエラーにする
+        "FAKE_AGENT_HANG_SECONDS": str(args.latency_ms / 1000),
+    })
+
+    from mastra_bridge import MastraBridge, SingleFlight
+    from metrics import metrics
+
+    bridge = MastraBridge(port=args.agent_port, instances=1)
+    bridge.supervisor.cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_agent.py")]
+    if not bridge.start():
+        raise SystemExit("failed to start the fake agent server")
+    agent_url = bridge.supervisor.instances[0].base_url
+
+    def received() -> int:
+        return requests.get(f"{agent_url}/api/health", timeout=5).json()["received"]
+
+    def ask(message: str):
+        return lambda index: bridge.search_with_payload(
+            {"message": message, "threadId": f"1700000{index:03d}.000100", "userId": "U001"})
+
+    checks = {}
+    latency = args.latency_ms / 1000
+    try:
+        # 同じ質問
+        before, coalesced_before = received(), metrics.get("bridge.coalesced")
+        results, elapsed = run_concurrently(args.callers, ask("先週の議事録を探して"))
+        upstream = received() - before
+        responses = {result.get("response") for result in results}
+        print(f"identical       {args.callers} callers -> {upstream} upstream call(s) in {elapsed * 1000:.0f} ms, "
+              f"{len(responses)} distinct result(s), coalesced {metrics.get('bridge.coalesced') - coalesced_before}")
+        checks["identical calls share one upstream call"] = upstream == 1
+        checks["every caller gets the same result"] = (
+            len(responses) == 1 and all("error" not in result for result in results))
+        checks["callers wait about one response time"] = elapsed < latency * 2
+
+        # 異なる質問（対照）
+        before = received()
+        results, elapsed = run_concurrently(args.callers, lambda index: ask(f"質問 {index}")(index))
+        upstream = received() - before
+        print(f"distinct        {args.callers} callers -> {upstream} upstream call(s) in {elapsed * 1000:.0f} ms")
+        checks["distinct calls are not coalesced"] = upstream == args.callers
+
+        # エージェントのエラー
+        requests.post(f"{agent_url}/api/faults", json={"faults": "hang:1"}, timeout=5)
+        before = received()
+        results, elapsed = run_concurrently(args.callers, ask("エラーになる質問"))
+        upstream = received() - before
+        errors = {result.get("error") for result in results}
+        print(f"upstream error  {args.callers} callers -> {upstream} upstream call(s), {len(errors)} distinct error(s): "
+              f"{next(iter(errors))!r:.60}")
+        checks["an upstream error reaches every waiter"] = upstream == 1 and len(errors) == 1 and None not in errors
+        requests.post(f"{agent_url}/api/faults", json={"faults": ""}, timeout=5)
+        before = received()
+        retry = ask("エラーになる質問")(0)
+        print(f"retry           {received() - before} upstream call(s), error={retry.get('error')!r}")
+        checks["the error is not cached for the next call"] = received() - before == 1 and "error" not in retry
+    finally:
+        bridge.stop()
+
+    # 呼び出し自体が例外を送出する場合
+    single_flight = SingleFlight()
+    calls = []
+
+    def failing():
+        calls.append(time.monotonic())
+        time.sleep(0.2)
+        raise RuntimeError("agent exploded")
+
+    results, _ = run_concurrently(args.callers, lambda index: single_flight.do("key", failing))
+    raised = {id(result) for result in results if isinstance(result, RuntimeError)}
+    retried, _ = run_concurrently(1, lambda index: single_flight.do("key", lambda: {"response": "ok"}))
+    print(f"exception       {args.callers} callers -> {len(calls)} call(s), {len(raised)} distinct exception(s), "
+          f"next call {retried[0]}")
+    checks["an exception reaches every waiter"] = (
+        len(calls) == 1 and len(raised) == 1 and all(isinstance(result, RuntimeError) for result in results))
+    checks["the exception is not cached for the next call"] = retried[0] == ({"response": "ok"}, False)
+    checks["no call is left in flight"] = single_flight.in_flight() == 0 and bridge.single_flight.in_flight() == 0
+
+    print()
+    for name, ok in checks.items():
+        print(f"{'ok' if ok else 'NG':<3} {name}")
+    if not all(checks.values()):
+        print("\nFAILED")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+/mcp 画面の描画ベンチマーク
+従来の毎回dictを組み立てる方式と、JSON化済みテンプレートを連結する slack_ui.render_mcp_blocks で、
+Slack APIへ送る本文（JSON）を作るまでの1回あたりの時間とメモリ確保量を比較する
+Redisはfakeredisを使用（接続済みサービスの取得時間は両方式に共通で含まれる）
+
+使用方法: python benchmarks/bench_slack_ui.py [--iterations 20000] [--connected 2]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import fakeredis  # noqa: E402
+
+import slack_ui  # noqa: E402
+
+def legacy_mcp_blocks(user_id: str) -> list:
+    """テンプレート導入前の create_service_status_blocks + create_mcp_services_blocks 相当"""
+    blocks = [{"type": "header", "text": {"type": "plain_text", "text": "📊 接続済みサービス"}}]
+    services = slack_ui.get_connected_services(user_id)
+    if not services:
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": "現在、接続されているサービスはありません。"}})
+    for service in services:
+        service_text = f"{'✅' if service['connected'] else '❌'} *{service['name']}*"
+        if service.get('workspace_info'):
+            service_text += f"\n📁 ワークスペース: {service['workspace_info']}"
+        service_text += f"\n🕒 接続日時: {service['connected_at']}"
+        blocks.append({
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": service_text},
+            "accessory": {
+                "type": "button", "text": {"type": "plain_text", "text": "切断"}, "style": "danger",
+                "value": service['type'], "action_id": f"disconnect_{service['type']}"
+            }
+        })
+    blocks.append({"type": "divider"})
+    blocks.extend([
+        {"type": "header", "text": {"type": "plain_text", "text": "🔗 MCP サービス連携"}},
+        {"type": "section", "text": {"type": "mrkdwn", "text": "どのサービスと連携しますか？"}},
+        {"type": "actions", "elements": [
+            {"type": "button", "text": {"type": "plain_text", "text": "📝 Notion"}, "style": "primary",
+             "value": "notion", "action_id": "connect_notion"},
+            {"type": "button", "text": {"type": "plain_text", "text": "📁 Google Drive"}, "style": "primary",
+             "value": "google-drive", "action_id": "connect_google_drive"},
+        ]},
+    ])
+    return blocks
+
+def request_body(blocks) -> str:
+    """slack_sdk が chat.postEphemeral の本文を作るのと同じくJSON化"""
+    return json.dumps({"channel": "C1", "user": "U1", "blocks": blocks, "text": "MCP サービス連携設定"})
+
+def measure(label: str, func, iterations: int):
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+
+    # 1回の呼び出し中に確保されたメモリのピーク（呼び出し後に解放される一時オブジェクトを含む）
+    tracemalloc.start()
+    sample = min(iterations, 1000)
+    peak_total = 0
+    for _ in range(sample):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        func()
+        peak_total += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    print(f"{label:<36} {per_call_us:>9.2f} µs/call   {peak_total / sample:>9,.0f} B peak/call")
+    return per_call_us
+
+def main():
+    parser = argparse.ArgumentParser(description="/mcp rendering micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--connected", type=int, choices=[0, 1, 2], default=2, help="connected services")
+    args = parser.parse_args()
+
+    os.environ.setdefault("NOTION_OAUTH_CLIENT_ID", "bench-client")
+    slack_ui._redis_client = fakeredis.FakeRedis()
+    tokens = [
+        ("notion", {"connectedAt": "2024-06-01T10:00:00", "metadata": {
+            "workspace_name": "Bench", "owner": {"user": {"name": "Bench User"}}}}),
+        ("google-drive", {"connectedAt": "2024-06-02T10:00:00", "metadata": {}}),
+    ]
+    for service_type, data in tokens[:args.connected]:
+        slack_ui._redis_client.set(f"oauth:tokens:U1:{service_type}", json.dumps(data))
+
+    # 出力が同じであることを確認
+    assert legacy_mcp_blocks("U1") == json.loads(slack_ui.render_mcp_blocks("U1"))
+
+    print(f"connected services: {args.connected}, iterations: {args.iterations:,}")
+    measure("get_connected_services (Redis)", lambda: slack_ui.get_connected_services("U1"), args.iterations)
+    legacy = measure("legacy dict blocks + body", lambda: request_body(legacy_mcp_blocks("U1")), args.iterations)
+    templated = measure("template render + body", lambda: request_body(slack_ui.render_mcp_blocks("U1")),
+                        args.iterations)
+    print(f"speedup (end to end): {legacy / templated:.2f}x")
+
+    # Redisの取得を除いた描画部分のみ
+    services = slack_ui.get_connected_services("U1")
+    slack_ui.get_connected_services = lambda user_id: services
+    legacy = measure("legacy dict blocks + body (no I/O)", lambda: request_body(legacy_mcp_blocks("U1")),
+                     args.iterations)
+    templated = measure("template render + body (no I/O)", lambda: request_body(slack_ui.render_mcp_blocks("U1")),
+                        args.iterations)
+    print(f"speedup (rendering only): {legacy / templated:.2f}x")
+    measure("generate_oauth_url", lambda: slack_ui.generate_oauth_url("notion", "state123"), args.iterations)
+
+if __name__ == "__main__":
+    main()
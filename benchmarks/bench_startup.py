@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+起動方式（STARTUP_MODE=sequential / parallel）ごとの、起動から最初のイベント・応答までの時間の計測
+起動に時間のかかる偽エージェントサーバー（FAKE_AGENT_STARTUP_MS、Node.jsとMastraの読み込みの代わり）で、
+app.py の start_agent_server() を実際に呼び出し、Socket Modeの接続（--connect-ms）の直後に届くイベントを処理する
+
+計測する時間（app.py の読み込み開始から、各方式で別プロセスとして --runs 回起動した中央値）:
+  - first event   最初のイベントの受信（startup.time_to_first_event_ms）
+  - local reply   ローカルで完結する発言（hello）への応答
+  - agent answer  接続直後のメンションへのエージェントの応答（parallel では起動完了までブリッジ内で待つ）
+
+使用方法:
+  python benchmarks/bench_startup.py
+  python benchmarks/bench_startup.py --agent-startup-ms 8000 --connect-ms 500 --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+def run_child(args):
+    """1回分の起動（別プロセス）: 起動から各時点までのミリ秒をJSONで出力する"""
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    from fake_slack import BOT_USER_ID, FakeSocketModeSource, MockSlackAPI, _envelope
+
+    slack_api = MockSlackAPI()
+    slack_api.start()
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_API_BASE_URL": slack_api.base_url,
+        "SLACK_ALLOWED_CHANNELS": "",
+        "DEDUP_BACKEND": "memory",
+        "THREAD_MEMORY_OWNER": "agent",
+        "THREAD_COALESCE_WINDOW_MS": "0",
+        "AGENT_PREWARM": "false",
+        "AGENT_EXECUTION": "inline",
+        "STARTUP_MODE": args.mode,
+        "FAKE_AGENT_STARTUP_MS": str(args.agent_startup_ms),
+        "FAKE_AGENT_LATENCY": f"fixed:{args.agent_latency_ms}",
+    })
+
+    import fakeredis
+    import slack_ui
+    slack_ui._redis_client = fakeredis.FakeRedis()
+
+    import app as app_module
+    from mastra_bridge import MastraBridge
+
+    bridge = MastraBridge(port=args.agent_port, instances=1)
+    bridge.supervisor.cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_agent.py")]
+    app_module.mastra_bridge = bridge
+    # perf_counter（モックの記録時刻）を app.py の起動時刻（monotonic）の基準に揃える
+    offset = time.perf_counter() - time.monotonic()
+    started_at = app_module._PROCESS_STARTED_AT + offset
+
+    try:
+        app_module.start_agent_server()
+        # Socket Modeの接続（WebSocketのハンドシェイク）
+        time.sleep(args.connect_ms / 1000)
+        source = FakeSocketModeSource(app_module.app)
+        source.deliver(_envelope({"type": "message", "user": "U001", "text": "hello", "ts": "1700000000.000100",
+                                  "channel": "CLOCAL", "channel_type": "channel"}, "Ev-local"))
+        mention = {"user": "U002", "text": f"<@{BOT_USER_ID}> 先週の議事録を探して", "ts": "1700000000.000200",
+                   "channel": "CAGENT", "channel_type": "channel"}
+        source.deliver(_envelope(dict(mention, type="message"), "Ev-agent-m"))
+        source.deliver(_envelope(dict(mention, type="app_mention"), "Ev-agent-a"))
+        if not slack_api.wait_for(["CLOCAL", "CAGENT"], timeout=args.agent_startup_ms / 1000 + 60):
+            raise SystemExit(f"{args.mode}: no reply")
+        result = {
+            "first_event": app_module.metrics.snapshot()["startup.time_to_first_event_ms"],
+            "local_reply": (slack_api.replies["CLOCAL"][0] - started_at) * 1000,
+            "agent_answer": (slack_api.replies["CAGENT"][0] - started_at) * 1000,
+        }
+        source.close()
+    finally:
+        bridge.stop()
+        slack_api.stop()
+    print(json.dumps(result), flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first event with sequential and parallel startup")
+    parser.add_argument("--agent-startup-ms", type=int, default=4000, help="fake agent server boot time")
+    parser.add_argument("--agent-latency-ms", type=int, default=500)
+    parser.add_argument("--connect-ms", type=int, default=300, help="simulated Socket Mode handshake")
+    parser.add_argument("--runs", type=int, default=3, help="process starts per mode")
+    parser.add_argument("--agent-port", type=int, default=3831)
+    parser.add_argument("--mode", choices=("sequential", "parallel"), help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    results = {}
+    for mode in ("sequential", "parallel"):
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--mode", mode,
+                 "--agent-startup-ms", str(args.agent_startup_ms), "--agent-latency-ms", str(args.agent_latency_ms),
+                 "--connect-ms", str(args.connect_ms), "--agent-port", str(args.agent_port)],
+                cwd=REPO_DIR, capture_output=True, text=True, timeout=args.agent_startup_ms / 1000 + 120,
+            )
+            if output.returncode != 0:
+                print(output.stderr[-2000:])
+                raise SystemExit(f"{mode} run failed")
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+    print(f"agent startup {args.agent_startup_ms} ms, agent latency {args.agent_latency_ms} ms, "
+          f"Socket Mode connect {args.connect_ms} ms, median of {args.runs} runs")
+    print(f"{'':<14}{'sequential':>12}{'parallel':>12}")
+    for key, label in (("first_event", "first event"), ("local_reply", "local reply"), ("agent_answer", "agent answer")):
+        print(f"{label:<14}{results['sequential'][key]:>9.0f} ms{results['parallel'][key]:>9.0f} ms")
+    saved = results["sequential"]["first_event"] - results["parallel"]["first_event"]
+    print(f"time to first event reduced by {saved:.0f} ms")
+
+    # parallel では最初のイベントがエージェントの起動を待たず、エージェントの応答も遅くならないこと
+    failed = (
+        saved < args.agent_startup_ms * 0.8
+        or results["parallel"]["agent_answer"] > results["sequential"]["agent_answer"] + 500
+    )
+    if failed:
+        print("\nFAILED")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
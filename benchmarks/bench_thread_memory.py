@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+ThreadMemoryの並行アクセスの試験とロック競合のベンチマーク
+ロックなし（従来の実装）・全体で1つのロック・ストライプ化したロックの3方式を比較する
+
+確認する動作:
+  - 負荷試験: 多数のスレッドから少数の会話に同時に追加し、失われたメッセージ数と件数上限の超過を数える
+    （ロックなしでは古いメッセージの削除と追加が競合して失われる。ロックありの方式は0件であること）
+  - 競合ベンチマーク: 多数の会話に並行して追加・コンテキスト取得を行い、処理件数/秒を比較する
+
+使用方法:
+  python benchmarks/bench_thread_memory.py
+  python benchmarks/bench_thread_memory.py --workers 32 --conversations 500 --ops 20000
+  python benchmarks/bench_thread_memory.py --stress-only
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from thread_memory import Message, ThreadMemory  # noqa: E402
+
+class UnsafeThreadMemory(ThreadMemory):
+    """ロックなしで読み込み・変更・書き戻しを行う従来の実装（比較用）"""
+
+    def add_message(self, thread_id: str, role: str, content: str, user_id: Optional[str] = None):
+        if thread_id not in self.threads:
+            self.threads[thread_id] = []
+        self.threads[thread_id].append(Message(role=role, content=content, timestamp=time.time(), user_id=user_id))
+        current_time = time.time()
+        max_age_seconds = self.max_age_hours * 3600
+        self.threads[thread_id] = [
+            msg for msg in self.threads[thread_id]
+            if current_time - msg.timestamp <= max_age_seconds
+        ]
+        if len(self.threads[thread_id]) > self.max_messages:
+            self.threads[thread_id] = self.threads[thread_id][-self.max_messages:]
+
+    def get_context(self, thread_id: str) -> str:
+        messages = self.threads.get(thread_id, [])[-self.max_messages:]
+        return "\n".join(f"{msg.role}: {msg.content}" for msg in messages)
+
+def variants():
+    return {
+        "unsafe": lambda max_messages: UnsafeThreadMemory(max_messages=max_messages),
+        "global-lock": lambda max_messages: ThreadMemory(max_messages=max_messages, stripes=1),
+        "striped": lambda max_messages: ThreadMemory(max_messages=max_messages, stripes=64),
+    }
+
+def run_threads(workers: int, target):
+    start_barrier = threading.Barrier(workers)
+
+    def run(index: int):
+        start_barrier.wait()
+        target(index)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+def stress(factory, workers: int, per_worker: int, conversations: int) -> dict:
+    """少数の会話への同時追加で、失われたメッセージ数と件数上限の超過を数える"""
+    # 上限に達しない設定で全件が残ることを確認
+    memory = factory(workers * per_worker)
+    run_threads(workers, lambda index: [
+        memory.add_message(f"t{i % conversations}", "user", f"{index}:{i}") for i in range(per_worker)
+    ])
+    stored = sum(len(messages) for messages in memory.threads.values())
+
+    # 上限に達する設定で、上限を超えて残っていないことを確認
+    limit = 20
+    bounded = factory(limit)
+    run_threads(workers, lambda index: [
+        bounded.add_message(f"t{i % conversations}", "user", f"{index}:{i}") for i in range(per_worker)
+    ])
+    oversized = sum(1 for messages in bounded.threads.values() if len(messages) > limit)
+    return {"lost": workers * per_worker - stored, "oversized_threads": oversized}
+
+def contention(factory, workers: int, conversations: int, ops: int) -> float:
+    """多数の会話への追加・コンテキスト取得の処理件数/秒"""
+    memory = factory(20)
+
+    def work(index: int):
+        for i in range(ops // workers):
+            thread_id = f"t{(index * 7919 + i) % conversations}"
+            memory.add_message(thread_id, "user", "質問")
+            memory.get_context(thread_id)
+
+    elapsed = run_threads(workers, work)
+    return (ops // workers) * workers / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="ThreadMemory stress test and lock contention benchmark")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--conversations", type=int, default=200, help="conversations in the contention run")
+    parser.add_argument("--ops", type=int, default=50_000, help="add+get pairs in the contention run")
+    parser.add_argument("--stress-workers", type=int, default=32)
+    parser.add_argument("--stress-messages", type=int, default=2_000, help="messages per stress worker")
+    parser.add_argument("--stress-only", action="store_true")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    # スレッドの切り替えを頻繁にして競合を起こしやすくする
+    sys.setswitchinterval(1e-6)
+
+    failed = False
+    print(f"stress: {args.stress_workers} threads x {args.stress_messages} messages into 4 conversations")
+    for name, factory in variants().items():
+        result = stress(factory, args.stress_workers, args.stress_messages, conversations=4)
+        print(f"  {name:<12} lost {result['lost']:>6}  over the limit {result['oversized_threads']}")
+        if name != "unsafe" and (result["lost"] or result["oversized_threads"]):
+            failed = True
+
+    if not args.stress_only:
+        sys.setswitchinterval(0.005)
+        print(f"\ncontention: {args.workers} threads, {args.conversations} conversations, {args.ops:,} add+get")
+        for name, factory in variants().items():
+            print(f"  {name:<12} {contention(factory, args.workers, args.conversations, args.ops):>10,.0f} ops/s")
+
+    if failed:
+        print("\nFAILED: a locked variant lost messages")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用の偽エージェントサーバー
+Node.jsエージェントサーバーと同じHTTP API（/api/health, /api/agent/search, /api/agent/threads/turns,
+/api/agent/cancel, /api/agent/prewarm）を提供し、
+応答時間を指定した分布から決定的に生成する（同じメッセージ・スレッドには常に同じ遅延）
+
+使用方法:
+  AGENT_PORT=3001 FAKE_AGENT_LATENCY=lognormal:800,0.5 python benchmarks/fake_agent.py
+  python benchmarks/bench_agent_workers.py --command "python benchmarks/fake_agent.py"
+
+遅延分布（FAKE_AGENT_LATENCY、単位ミリ秒）:
+  fixed:200            常に200ms
+  uniform:100,300      100〜300msの一様分布
+  exp:200              平均200msの指数分布
+  lognormal:800,0.5    中央値800ms・σ=0.5の対数正規分布（LLM応答に近い裾の重い分布）
+
+障害の注入（FAKE_AGENT_FAULTS、検索リクエストに対する割合）:
+  error:0.2,hang:0.1   20%を500エラー、10%を FAKE_AGENT_HANG_SECONDS 秒（既定120秒）応答しない
+  ratelimit:1          すべてをレート制限の500エラー（エージェントサーバーと同じ日本語のメッセージ）
+  実行中に POST /api/faults {"faults": "hang:1"} で変更できる（空文字で解除）
+  （応答しない障害も、FAKE_AGENT_HANG_SECONDS 秒後に接続が残っていれば500エラーを返す）
+  GET /api/health の received は障害・取り消しを含む受信した検索リクエスト数、requests は正常に応答した数
+
+取り消し: requestId 付きの検索は POST /api/agent/cancel {"requestId": ...} で待機を打ち切り、499 を返す
+
+スレッド記憶: memory="agent" の検索は応答時に（recordTurn=False の場合は /api/agent/threads/turns で）記録し、
+  GET /api/threads/<threadId> で記録された発言と応答の一覧、最後に応答した検索の context を返す
+
+起動時間（FAKE_AGENT_STARTUP_MS、既定0）: 待ち受けを始めるまでの時間（Node.jsとMastraの読み込みの代わり）
+
+ユーザーごとの準備（FAKE_AGENT_SETUP_MS、既定0＝なし）:
+  userId 付きの検索は、そのユーザーの準備（トークン取得・MCPサーバーの起動の代わり）の完了を待ってから応答する
+  準備は最後の使用から FAKE_AGENT_IDLE_SECONDS 秒（既定120秒）保持し、POST /api/agent/prewarm {"userId": ...} で事前に開始できる
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def parse_latency(spec: str):
+    """遅延分布の指定を解析し、乱数生成器から遅延（秒）を返す関数を作成"""
+    kind, _, raw = spec.partition(":")
+    params = [float(value) for value in raw.split(",") if value]
+    if kind == "fixed":
+        return lambda rng: params[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1]) / 1000
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / params[0]) / 1000
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1]) / 1000
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+def parse_faults(spec: str) -> dict:
+    """障害の指定（"error:0.2,hang:0.1"）を解析"""
+    faults = {}
+    for part in filter(None, (value.strip() for value in spec.split(","))):
+        kind, _, rate = part.partition(":")
+        if kind not in ("error", "hang", "ratelimit"):
+            raise ValueError(f"unknown fault: {kind}")
+        faults[kind] = float(rate)
+    return faults
+
+class FakeAgentState:
+    """偽エージェントの設定と統計"""
+
+    def __init__(self):
+        self.port = int(os.environ.get("AGENT_PORT", "3001"))
+        self.seed = os.environ.get("FAKE_AGENT_SEED", "42")
+        self.latency = parse_latency(os.environ.get("FAKE_AGENT_LATENCY", "lognormal:800,0.5"))
+        self.cpu_ms = float(os.environ.get("FAKE_AGENT_CPU_MS", "0"))
+        self.response_chars = int(os.environ.get("FAKE_AGENT_RESPONSE_CHARS", "400"))
+        self.faults = parse_faults(os.environ.get("FAKE_AGENT_FAULTS", ""))
+        self.hang_seconds = float(os.environ.get("FAKE_AGENT_HANG_SECONDS", "120"))
+        self.fault_rng = random.Random(self.seed)
+        self.setup_seconds = float(os.environ.get("FAKE_AGENT_SETUP_MS", "0")) / 1000
+        self.idle_seconds = float(os.environ.get("FAKE_AGENT_IDLE_SECONDS", "120"))
+        # ユーザーID → [準備完了のEvent, 最後に使用した時刻]
+        self.users = {}
+        self.setups = 0
+        self.prewarms = 0
+        self.threads = {}
+        self.contexts = {}
+        self.requests = 0
+        # 障害の注入・取り消しを含む、受信した検索リクエスト数
+        self.received = 0
+        self.cancelled = 0
+        self.active = {}
+        self.lock = threading.Lock()
+
+    def rng_for(self, payload: dict) -> random.Random:
+        """リクエスト内容から決定的な乱数生成器を作成（到着順に依存しない）"""
+        key = f"{self.seed}:{payload.get('threadId')}:{payload.get('message')}"
+        return random.Random(hashlib.blake2b(key.encode(), digest_size=8).digest())
+
+    def inject_fault(self):
+        """注入する障害を選択（None は正常応答）"""
+        with self.lock:
+            roll = self.fault_rng.random()
+        for kind, rate in self.faults.items():
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+
+    def user_ready(self, user_id: str):
+        """ユーザーの準備を開始（保持中・準備中であればそれを使う）し、(完了を表すEvent, 状態) を返す"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is not None and entry[0].is_set() and now - entry[1] >= self.idle_seconds:
+                entry = None
+            if entry is None:
+                ready = threading.Event()
+                entry = self.users[user_id] = [ready, now]
+                self.setups += 1
+                timer = threading.Timer(self.setup_seconds, ready.set)
+                timer.daemon = True
+                timer.start()
+                state = "started"
+            else:
+                state = "warm" if entry[0].is_set() else "warming"
+            entry[1] = now
+        return entry[0], state
+
+    def prewarm(self, payload: dict) -> dict:
+        with self.lock:
+            self.prewarms += 1
+        if not self.setup_seconds:
+            return {"state": "skipped"}
+        _, state = self.user_ready(payload["userId"])
+        return {"state": state}
+
+    def search(self, payload: dict):
+        """検索を模擬（取り消された場合は None）"""
+        if self.setup_seconds and payload.get("userId"):
+            ready, _ = self.user_ready(payload["userId"])
+            ready.wait()
+        rng = self.rng_for(payload)
+        delay = self.latency(rng)
+        request_id = payload.get("requestId")
+        cancelled = threading.Event()
+        if request_id:
+            with self.lock:
+                self.active[request_id] = cancelled
+        try:
+            busy_until = time.perf_counter() + self.cpu_ms / 1000
+            while time.perf_counter() < busy_until:
+                pass
+            if cancelled.wait(delay):
+                return None
+        finally:
+            if request_id:
+                with self.lock:
+                    self.active.pop(request_id, None)
+
+        thread_id = payload.get("threadId")
+        response = f"[fake:{self.port}] {payload.get('message', '')[:50]} " + "あ" * self.response_chars
+        with self.lock:
+            self.requests += 1
+            if thread_id:
+                self.contexts[thread_id] = payload.get("context")
+            if payload.get("memory") == "agent" and thread_id and payload.get("recordTurn", True):
+                self.threads.setdefault(thread_id, []).extend([payload.get("message"), response])
+        return {"response": response, "threadId": thread_id or "default", "timestamp": time.time()}
+
+    def cancel(self, payload: dict) -> dict:
+        with self.lock:
+            event = self.active.pop(payload.get("requestId"), None)
+            if event is not None:
+                self.cancelled += 1
+        if event is not None:
+            event.set()
+        return {"cancelled": event is not None}
+
+    def record_turn(self, payload: dict) -> dict:
+        with self.lock:
+            self.threads.setdefault(payload["threadId"], []).extend([payload["message"], payload["response"]])
+        return {"recorded": True}
+
+STATE = None
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/health":
+            self._reply(200, {"status": "ok", "service": "Fake Agent", "requests": STATE.requests,
+                              "received": STATE.received,
+                              "cancelled": STATE.cancelled, "setups": STATE.setups, "prewarms": STATE.prewarms})
+        elif self.path.startswith("/api/threads/"):
+            thread_id = self.path.rsplit("/", 1)[-1]
+            with STATE.lock:
+                messages = list(STATE.threads.get(thread_id, []))
+                context = STATE.contexts.get(thread_id)
+            self._reply(200, {"messages": messages, "context": context})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/agent/search":
+            with STATE.lock:
+                STATE.received += 1
+            fault = STATE.inject_fault()
+            if fault == "hang":
+                time.sleep(STATE.hang_seconds)
+            if fault == "ratelimit":
+                self._reply(500, {"error": "エージェント処理中にエラーが発生しました",
+                                  "details": "APIレート制限に達しました。数分後に再度お試しください。"})
+            elif fault is not None:
+                self._reply(500, {"error": "Internal server error", "details": f"injected fault: {fault}"})
+            else:
+                result = STATE.search(payload)
+                if result is None:
+                    self._reply(499, {"error": "cancelled"})
+                else:
+                    self._reply(200, result)
+        elif self.path == "/api/faults":
+            STATE.faults = parse_faults(payload.get("faults", ""))
+            self._reply(200, {"faults": STATE.faults})
+        elif self.path == "/api/agent/cancel":
+            self._reply(200, STATE.cancel(payload))
+        elif self.path == "/api/agent/prewarm":
+            if payload.get("userId"):
+                self._reply(200, STATE.prewarm(payload))
+            else:
+                self._reply(400, {"error": "userId is required"})
+        elif self.path == "/api/agent/threads/turns":
+            self._reply(200, STATE.record_turn(payload))
+        else:
+            self._reply(404, {"error": "not found"})
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # 応答しない障害を注入した接続は、クライアントがタイムアウトで切断済み
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def main():
+    global STATE
+    STATE = FakeAgentState()
+    time.sleep(float(os.environ.get("FAKE_AGENT_STARTUP_MS", "0")) / 1000)
+    server = Server(("127.0.0.1", STATE.port), Handler)
+    print(f"fake agent listening on {STATE.port}", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+ベンチマーク用の偽Slack
+- MockSlackAPI: Slack Web APIのモックサーバー（SLACK_API_BASE_URL で接続先に指定）。呼び出しを記録する
+- FakeSocketModeSource: Socket Modeの代わりにイベントエンベロープをBoltアプリへ直接配送する
+- build_workload: 忙しいワークスペースを模した決定的なイベント列を生成する
+"""
+
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl
+
+BOT_USER_ID = "UBOT"
+TEAM_ID = "T0BENCH"
+
+class MockSlackAPI:
+    """Slack Web APIのモック（呼び出し回数と、チャンネルごとの最初の応答時刻を記録）"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.calls: Counter = Counter()
+        self.responses: Dict[str, float] = {}
+        # チャンネルごとの応答投稿時刻（処理中メッセージを除く）
+        self.replies: Dict[str, List[float]] = {}
+        self._ts = itertools.count(1)
+        self._cond = threading.Condition()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 256
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="mock-slack-api", daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+
+    def api_calls(self) -> Counter:
+        """アプリからの呼び出し回数（起動時の認証確認を除く）"""
+        return Counter({method: count for method, count in self.calls.items() if method != "auth.test"})
+
+    def wait_for(self, channels: List[str], timeout: float) -> bool:
+        """指定チャンネルすべてに応答が投稿されるまで待機"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not all(channel in self.responses for channel in channels):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _record(self, method: str, params: dict) -> dict:
+        now = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        with self._cond:
+            self.calls[method] += 1
+            channel = params.get("channel")
+            text = params.get("text") or ""
+            # 処理中メッセージ（🔄）以外の投稿をメッセージへの応答とみなす
+            if method == "chat.postMessage" and not text.startswith("🔄"):
+                self.replies.setdefault(channel, []).append(now)
+                if channel not in self.responses:
+                    self.responses[channel] = now
+                    self._cond.notify_all()
+
+        if method == "auth.test":
+            return {"ok": True, "url": "https://bench.slack.com/", "team": "bench", "user": "bench-bot",
+                    "team_id": TEAM_ID, "user_id": BOT_USER_ID, "bot_id": "B0BENCH"}
+        if method in ("chat.postMessage", "chat.update", "chat.delete"):
+            ts = params.get("ts") or f"1800000000.{next(self._ts):06d}"
+            return {"ok": True, "channel": params.get("channel"), "ts": ts,
+                    "message": {"text": params.get("text"), "ts": ts}}
+        return {"ok": True}
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    params = json.loads(raw or b"{}")
+                else:
+                    params = dict(parse_qsl(raw.decode()))
+                method = self.path.rsplit("/", 1)[-1]
+                body = json.dumps(api._record(method, params)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+class FakeSocketModeSource:
+    """Socket Modeクライアントと同様に、受信したエンベロープをワーカースレッドでBoltアプリに渡す"""
+
+    def __init__(self, app, concurrency: int = 10):
+        from slack_bolt.request import BoltRequest
+        self._request = BoltRequest
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fake-socket-mode")
+        # 受信からディスパッチ開始までの待ち時間（ワーカー不足による待ち行列）
+        self.queue_delays: List[float] = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def deliver(self, body: dict):
+        with self._lock:
+            self._pending += 1
+        self.executor.submit(self._dispatch, body, time.perf_counter())
+
+    def _dispatch(self, body: dict, received_at: float):
+        self.queue_delays.append(time.perf_counter() - received_at)
+        with self._lock:
+            self._pending -= 1
+        self.app.dispatch(self._request(body=body, mode="socket_mode"))
+
+    def pending(self) -> int:
+        """ディスパッチ待ちのエンベロープ数"""
+        return self._pending
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+@dataclass
+class WorkloadItem:
+    body: dict
+    kind: str
+    # 応答が投稿されるチャンネル（応答を期待しないイベントはNone）
+    expect: Optional[str] = None
+    injected_at: float = field(default=0.0)
+
+QUESTIONS = [
+    "検索 先週の議事録",
+    "探して リリース手順",
+    "調べて オンボーディング資料",
+    "検索 障害報告 {i}",
+    "探して 設計ドキュメント {i}",
+]
+FOLLOW_UPS = ["もう少し詳しく", "それの担当者は？", "リンクを教えて", "要約して {i}"]
+CHATTER = ["了解です", "LGTM 👍", "ランチ行きましょう", "明日のリリースは14時からです"]
+
+def _envelope(event: dict, event_id: str) -> dict:
+    return {
+        "type": "event_callback",
+        "team_id": TEAM_ID,
+        "api_app_id": "A0BENCH",
+        "event_id": event_id,
+        "event_time": int(time.time()),
+        "authorizations": [{"team_id": TEAM_ID, "user_id": BOT_USER_ID, "is_bot": True}],
+        "event": event,
+    }
+
+def build_workload(count: int, seed: int, redelivery_rate: float = 0.03):
+    """決定的なイベント列と、ボットが参加済みとするスレッドの一覧を返す
+
+    構成: メンション付きの質問（message + app_mention の2イベント）、参加中スレッドへの返信、
+    ローカルで完結するインテント、破棄されるべき雑談・ボット投稿・編集、Slackによる再送
+    """
+    rng = random.Random(seed)
+    items: List[WorkloadItem] = []
+    participating: List[str] = []
+    event_ids = itertools.count(1)
+
+    for i in range(count):
+        ts = f"1700000000.{i:06d}"
+        user = f"U{rng.randint(1, 50):04d}"
+        roll = rng.random()
+        if roll < 0.35:
+            channel = f"CM{i:06d}"
+            question = rng.choice(QUESTIONS).format(i=i)
+            text = f"<@{BOT_USER_ID}> {question}"
+            base = {"user": user, "text": text, "ts": ts, "channel": channel, "channel_type": "channel"}
+            items.append(WorkloadItem(_envelope(dict(base, type="message"), f"Ev{next(event_ids)}"), "mention", channel))
+            items.append(WorkloadItem(_envelope(dict(base, type="app_mention"), f"Ev{next(event_ids)}"), "mention"))
+        elif roll < 0.50:
+            channel = f"CT{i:06d}"
+            root = f"1600000000.{i:06d}"
+            participating.append(root)
+            event = {"type": "message", "user": user, "text": rng.choice(FOLLOW_UPS).format(i=i),
+                     "ts": ts, "thread_ts": root, "channel": channel, "channel_type": "channel"}
+            items.append(WorkloadItem(_envelope(event, f"Ev{next(event_ids)}"), "thread", channel))
+        elif roll < 0.65:
+            channel = f"CL{i:06d}"
+            event = {"type": "message", "user": user, "text": rng.choice(["hello", "今何時？", "help"]),
+                     "ts": ts, "channel": channel, "channel_type": "channel"}
+            items.append(WorkloadItem(_envelope(event, f"Ev{next(event_ids)}"), "local", channel))
+        else:
+            channel = f"C{rng.randint(1, 20):04d}"
+            kind = rng.random()
+            if kind < 0.4:
+                event = {"type": "message", "subtype": "bot_message", "bot_id": "B0OTHER", "text": rng.choice(CHATTER)}
+            elif kind < 0.55:
+                event = {"type": "message", "subtype": rng.choice(["message_changed", "message_deleted"])}
+            elif kind < 0.85:
+                event = {"type": "message", "user": user, "text": rng.choice(CHATTER)}
+            else:
+                event = {"type": "message", "user": user, "text": rng.choice(CHATTER),
+                         "thread_ts": f"1500000000.{rng.randint(1, 10**6):06d}"}
+            event.update(ts=ts, channel=channel, channel_type="channel")
+            items.append(WorkloadItem(_envelope(event, f"Ev{next(event_ids)}"), "dropped"))
+
+        # Slackによる再送（同じevent_idのエンベロープをもう一度配送）
+        if rng.random() < redelivery_rate:
+            items.append(WorkloadItem(dict(items[-1].body), "redelivery"))
+
+    return items, participating
+
+def deliver_workload(source: FakeSocketModeSource, items: List[WorkloadItem], rate: float, seed: int):
+    """イベントを配送（rate>0 の場合はポアソン到着で毎秒rate件、0の場合は一括）"""
+    rng = random.Random(seed + 1)
+    next_at = time.perf_counter()
+    for item in items:
+        if rate > 0:
+            next_at += rng.expovariate(rate)
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        item.injected_at = time.perf_counter()
+        source.deliver(item.body)
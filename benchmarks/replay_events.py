@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+記録したイベントログの再生による負荷試験
+EVENT_LOG_PATH で記録した匿名化イベントログ（event_recorder.py）から合成イベントを作り、
+記録時と同じ間隔（または --speed 倍速）で app.py のミドルウェアとハンドラーに流す
+外部サービスは bench_pipeline.py と同じ偽物（Slack APIモック・偽エージェント・fakeredis）を使う
+
+計測項目: 応答までのレイテンシ（p50/p95/p99）、Socket Modeワーカーの待ち時間、
+ThreadMemoryのスレッド数・メッセージ数、エージェントへの同時リクエスト数、メモリ使用量の推移
+
+使用方法:
+  EVENT_LOG_PATH=events.jsonl.gz python app.py                  # 本番相当の環境でイベントを記録
+  python benchmarks/replay_events.py events.jsonl.gz            # 記録時と同じ速度で再生
+  python benchmarks/replay_events.py events.jsonl.gz --speed 10 --thread-memory local
+  python benchmarks/replay_events.py events.jsonl.gz --max-events 5000 --json replay.json
+"""
+
+import argparse
+import gc
+import gzip
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import load_app, percentile, rss_bytes, seed_participation  # noqa: E402
+from fake_slack import BOT_USER_ID, FakeSocketModeSource, MockSlackAPI, _envelope  # noqa: E402
+from message_router import DEFAULT_INTENTS  # noqa: E402
+
+# インテントごとの代表キーワード（合成テキストに使用）
+INTENT_KEYWORDS = {intent.name: intent.keywords[0] for intent in DEFAULT_INTENTS}
+LOCAL_INTENTS = {intent.name for intent in DEFAULT_INTENTS if intent.local}
+PADDING = "・"
+
+def read_log(path: str, max_events: Optional[int] = None) -> List[dict]:
+    """イベントログを読み込む（ヘッダー行は除く）"""
+    opener = gzip.open if path.endswith(".gz") else open
+    records = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "v" in record:
+                if record["v"] != 1:
+                    raise SystemExit(f"unsupported event log version: {record['v']}")
+                continue
+            records.append(record)
+            if max_events and len(records) >= max_events:
+                break
+    return records
+
+class Synthesizer:
+    """匿名化レコードから、ハッシュの対応関係を保った合成イベントを作成"""
+
+    def __init__(self):
+        self._ts: Dict[str, str] = {}
+        self._counter = itertools.count(1)
+
+    def ts(self, key: str) -> str:
+        if key not in self._ts:
+            self._ts[key] = f"1700000000.{next(self._counter):06d}"
+        return self._ts[key]
+
+    @staticmethod
+    def text(record: dict) -> str:
+        prefix = f"<@{BOT_USER_ID}> " if record.get("@") else ""
+        keyword = INTENT_KEYWORDS.get(record.get("i"), "")
+        body = prefix + keyword
+        return body + PADDING * max(0, record.get("n", 0) - len(body))
+
+    def envelope(self, record: dict) -> dict:
+        event = {
+            "type": record.get("k") or "message",
+            "channel": "C" + (record.get("c") or "UNKNOWN"),
+            "channel_type": record.get("ct", "channel"),
+            "ts": self.ts(record.get("m") or f"anon-{id(record)}"),
+            "text": self.text(record),
+        }
+        if record.get("th"):
+            event["thread_ts"] = self.ts(record["th"])
+        if record.get("st"):
+            event["subtype"] = record["st"]
+        if record.get("b"):
+            event["bot_id"] = "B0OTHER"
+            event.setdefault("subtype", "bot_message")
+        elif record.get("u"):
+            event["user"] = "U" + record["u"]
+        # 再送は同じevent_idになるよう記録したハッシュをそのまま使う
+        return _envelope(event, "Ev" + (record.get("e") or str(next(self._counter))))
+
+def expects_reply(record: dict) -> bool:
+    """ボットの応答が投稿されるはずのイベントか（メンションは message と app_mention の組のうち message 側で数える）"""
+    if record.get("k") != "message" or record.get("b") or record.get("st"):
+        return False
+    return bool(record.get("@") or record.get("p") or record.get("i") in LOCAL_INTENTS)
+
+class Sampler:
+    """再生中の内部状態を一定間隔で記録"""
+
+    def __init__(self, app_module, bridge, source: FakeSocketModeSource, interval: float):
+        self.app_module = app_module
+        self.bridge = bridge
+        self.source = source
+        self.interval = interval
+        self.samples: List[dict] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replay-sampler", daemon=True)
+        self._started = time.perf_counter()
+
+    def listener_backlog(self) -> int:
+        """Boltのリスナー実行スレッドプールで待機中のハンドラー数"""
+        executor = getattr(self.app_module.app._listener_runner, "listener_executor", None)
+        if hasattr(executor, "queued"):
+            return executor.queued()
+        work_queue = getattr(executor, "_work_queue", None)
+        return work_queue.qsize() if work_queue is not None else 0
+
+    def sample(self) -> dict:
+        threads = self.app_module.thread_memory.threads
+        return {
+            "t": round(time.perf_counter() - self._started, 2),
+            "rss_mb": rss_bytes() / 2**20,
+            "queued_events": self.source.pending(),
+            "queued_listeners": self.listener_backlog(),
+            "queued_agent_calls": self.app_module.heavy_lane.queued(),
+            "agent_outstanding": sum(instance.outstanding for instance in self.bridge.supervisor.instances),
+            "agent_in_flight": self.bridge.single_flight.in_flight(),
+            "memory_threads": len(threads),
+            "memory_messages": sum(len(messages) for messages in list(threads.values())),
+            "participating": len(self.app_module.event_filter.participation),
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append(self.sample())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(self.sample())
+
+def match_replies(injected: Dict[str, List[float]], replies: Dict[str, List[float]]) -> List[float]:
+    """チャンネルごとに、応答を未応答の最も古いイベントへ順に対応付けてレイテンシ（ms）を求める"""
+    latencies = []
+    for channel, sent in injected.items():
+        pending = deque(sorted(sent))
+        for replied_at in sorted(replies.get(channel, [])):
+            if pending and pending[0] <= replied_at:
+                latencies.append((replied_at - pending.popleft()) * 1000)
+    return sorted(latencies)
+
+def run(args) -> dict:
+    records = read_log(args.log, args.max_events)
+    if not records:
+        raise SystemExit("no events in the log")
+
+    slack_api = MockSlackAPI(latency_ms=args.slack_latency_ms)
+    slack_api.start()
+    app_module, bridge = load_app(args, slack_api)
+
+    synthesizer = Synthesizer()
+    # ログ開始前から参加していたスレッド（親メッセージがログにないもの）を登録
+    logged_messages = {record.get("m") for record in records}
+    seeded = {record["th"] for record in records
+              if record.get("p") and record.get("th") and record["th"] not in logged_messages}
+    seed_participation(app_module, [synthesizer.ts(thread) for thread in seeded])
+
+    source = FakeSocketModeSource(app_module.app, concurrency=args.concurrency)
+    sampler = Sampler(app_module, bridge, source, args.sample_interval)
+    envelopes = [synthesizer.envelope(record) for record in records]
+
+    gc.collect()
+    rss_before = rss_bytes()
+    injected: Dict[str, List[float]] = {}
+    seen_events = set()
+    sampler.start()
+    start = time.perf_counter()
+    origin = records[0].get("t", 0.0)
+    for record, body in zip(records, envelopes):
+        delay = (record.get("t", origin) - origin) / args.speed - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+        # 再送（同じイベントID）は重複排除されるため応答を期待しない
+        if expects_reply(record) and record.get("e") not in seen_events:
+            injected.setdefault(body["event"]["channel"], []).append(time.perf_counter())
+        seen_events.add(record.get("e"))
+        source.deliver(body)
+    replay_elapsed = time.perf_counter() - start
+
+    # 未処理のイベントと応答を待つ
+    source.close()
+    expected = sum(len(sent) for sent in injected.values())
+    deadline = time.monotonic() + args.timeout
+    idle_since = None
+    while time.monotonic() < deadline:
+        if sum(len(slack_api.replies.get(channel, [])) for channel in injected) >= expected:
+            break
+        # 応答のないイベント（エラーや破棄）があるため、エージェント呼び出しが1秒間なければ終了
+        busy = bridge.single_flight.in_flight() or sum(i.outstanding for i in bridge.supervisor.instances)
+        idle_since = None if busy else (idle_since or time.monotonic())
+        if idle_since and time.monotonic() - idle_since > 1.0:
+            break
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    rss_after = rss_bytes()
+    bridge.stop()
+    slack_api.stop()
+
+    latencies = match_replies(injected, slack_api.replies)
+    queue_delays = sorted(delay * 1000 for delay in source.queue_delays)
+    samples = sampler.samples
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "events": len(records),
+        "event_kinds": dict(Counter(record.get("st") or record.get("k") for record in records)),
+        "recorded_span_s": records[-1].get("t", 0.0) - origin,
+        "replay_s": replay_elapsed,
+        "elapsed_s": elapsed,
+        "expected_responses": expected,
+        "answered": len(latencies),
+        "latency_ms": {p: percentile(latencies, q) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "queue_delay_ms": {p: percentile(queue_delays, q) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "peak": {key: max(sample[key] for sample in samples) for key in samples[0] if key != "t"},
+        "rss_growth_mb": (rss_after - rss_before) / 2**20,
+        "slack_calls": dict(slack_api.api_calls()),
+        "timeline": samples,
+        "metrics": app_module.metrics.snapshot(),
+    }
+
+def print_report(result: dict):
+    print(f"events replayed              {result['events']:>12,}")
+    print(f"recorded span / replay (s)   {result['recorded_span_s']:>12.1f} / {result['replay_s']:.1f}")
+    print(f"responses                    {result['answered']:>7,}/{result['expected_responses']:<5,}")
+    for label, key in (("latency", "latency_ms"), ("worker queue delay", "queue_delay_ms")):
+        values = result[key]
+        print(f"{label + ' (ms)':<28} p50 {values['p50']:>8.1f}   p95 {values['p95']:>8.1f}   p99 {values['p99']:>8.1f}")
+    print(f"RSS growth (MB)              {result['rss_growth_mb']:>12.1f}")
+    print("peaks:")
+    for key, value in result["peak"].items():
+        print(f"  {key:<26} {value:>12,.1f}")
+    print("timeline (t, queued events/listeners, agent outstanding, memory threads/messages, RSS MB):")
+    step = max(1, len(result["timeline"]) // 20)
+    for sample in result["timeline"][::step]:
+        print(f"  {sample['t']:>7.1f}s {sample['queued_events']:>6}/{sample['queued_listeners']:<6} {sample['agent_outstanding']:>6}"
+              f" {sample['memory_threads']:>8}/{sample['memory_messages']:<8} {sample['rss_mb']:>8.1f}")
+    print(f"event kinds                  {result['event_kinds']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an anonymized event log through the app")
+    parser.add_argument("log", help="event log written with EVENT_LOG_PATH (.jsonl or .jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier (1 = recorded pace)")
+    parser.add_argument("--max-events", type=int, default=0, help="replay only the first N events")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=10, help="Socket Mode worker threads")
+    parser.add_argument("--agent-latency", default="lognormal:800,0.5", help="see benchmarks/fake_agent.py")
+    parser.add_argument("--agent-cpu-ms", type=float, default=0.0)
+    parser.add_argument("--agent-port", type=int, default=3301)
+    parser.add_argument("--agent-instances", type=int, default=1)
+    parser.add_argument("--slack-latency-ms", type=float, default=20.0)
+    parser.add_argument("--dedup-backend", choices=["memory", "redis"], default="memory")
+    parser.add_argument("--thread-memory", choices=["agent", "local"], default="agent")
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", help="write the result to this file")
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    args.log = os.path.abspath(args.log)
+    args.json = os.path.abspath(args.json) if args.json else None
+    # 再生中のアプリが記録を上書きしないようにする
+    os.environ.pop("EVENT_LOG_PATH", None)
+    os.chdir(tempfile.mkdtemp(prefix="replay-events-"))
+    logging.basicConfig(level=logging.WARNING)
+
+    result = run(args)
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
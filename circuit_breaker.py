@@ -0,0 +1,162 @@
+"""
+エージェント呼び出し用のサーキットブレーカーと適応タイムアウト
+- CircuitBreaker: 直近の一定時間のエラー・タイムアウト率が閾値を超えると遮断し、即座に失敗させる
+  クールダウン後は少数の試行リクエストのみ通し（半開）、成功すれば復旧する
+- AdaptiveTimeout: 直近の成功リクエストの応答時間のパーセンタイルからタイムアウトを決める
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """時間窓内の失敗率で開閉するサーキットブレーカー"""
+
+    def __init__(
+        self,
+        name: str = "agent",
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        window_seconds: float = 60.0,
+        cooldown_seconds: float = 30.0,
+        half_open_probes: int = 1
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+        # (時刻, 失敗したか)
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _transition(self, state: str, now: float):
+        if state == self.state:
+            return
+        logger.warning(f"[CircuitBreaker] {self.name}: {self.state} -> {state}")
+        self.state = state
+        self._probes = 0
+        if state == OPEN:
+            self.opened_at = now
+            metrics.increment(f"breaker.{self.name}.opened")
+        elif state == CLOSED:
+            self._calls.clear()
+
+    def allow(self) -> bool:
+        """リクエストを送信してよいか判定（半開時は試行リクエストの枠を確保する）"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.cooldown_seconds:
+                    metrics.increment(f"breaker.{self.name}.rejected")
+                    return False
+                self._transition(HALF_OPEN, now)
+            if self.state == HALF_OPEN:
+                # 試行リクエストの結果が届かないまま時間が経った場合は次の試行を許可
+                if self._probes >= self.half_open_probes and now - self._probe_started < self.cooldown_seconds:
+                    metrics.increment(f"breaker.{self.name}.rejected")
+                    return False
+                self._probes += 1
+                self._probe_started = now
+            return True
+
+    def record(self, failed: bool):
+        """allow() で許可したリクエストの結果を記録"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._transition(OPEN if failed else CLOSED, now)
+                return
+            if self.state == OPEN:
+                # 遮断前に送信済みだったリクエストの結果は判定に使わない
+                return
+
+            self._calls.append((now, failed))
+            self._prune(now)
+            if failed and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_failed in self._calls if call_failed)
+                if failures / len(self._calls) >= self.failure_rate:
+                    logger.error(
+                        f"[CircuitBreaker] {self.name}: {failures}/{len(self._calls)} calls failed "
+                        f"in {self.window_seconds:.0f}s, opening for {self.cooldown_seconds:.0f}s"
+                    )
+                    self._transition(OPEN, now)
+
+    def snapshot(self) -> Dict[str, object]:
+        """メトリクス用の現在の状態"""
+        with self._lock:
+            self._prune(time.monotonic())
+            failures = sum(1 for _, failed in self._calls if failed)
+            return {"state": self.state, "calls": len(self._calls), "failures": failures}
+
+class AdaptiveTimeout:
+    """直近の成功時の応答時間から、パーセンタイル×倍率のタイムアウトを算出"""
+
+    def __init__(
+        self,
+        minimum: float = 15.0,
+        maximum: float = 60.0,
+        percentile: float = 99.0,
+        multiplier: float = 2.0,
+        sample_size: int = 200,
+        min_samples: int = 20
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._latencies: Deque[float] = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """成功したリクエストの応答時間を記録"""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def current(self) -> float:
+        """現在のタイムアウト（秒）。サンプルが少ない間は上限値"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.maximum
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.minimum, min(self.maximum, ordered[index] * self.multiplier))
+
+def create_agent_breaker() -> CircuitBreaker:
+    """環境変数の設定でエージェント用のサーキットブレーカーを作成"""
+    return CircuitBreaker(
+        name="agent",
+        failure_rate=float(os.getenv("AGENT_BREAKER_FAILURE_RATE", "0.5")),
+        min_calls=int(os.getenv("AGENT_BREAKER_MIN_CALLS", "10")),
+        window_seconds=float(os.getenv("AGENT_BREAKER_WINDOW_SECONDS", "60")),
+        cooldown_seconds=float(os.getenv("AGENT_BREAKER_COOLDOWN_SECONDS", "30")),
+    )
+
+def create_agent_timeout() -> AdaptiveTimeout:
+    """環境変数の設定でエージェント呼び出しの適応タイムアウトを作成"""
+    return AdaptiveTimeout(
+        minimum=float(os.getenv("AGENT_TIMEOUT_MIN_SECONDS", "15")),
+        maximum=float(os.getenv("AGENT_TIMEOUT_MAX_SECONDS", "60")),
+    )
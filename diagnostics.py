@@ -0,0 +1,234 @@
+"""
+実行中のプロセスの診断用HTTPサーバー（ローカルからのみ、標準ライブラリのみ使用）
+応答が遅くなった時に、メトリクス・メモリ・会話履歴の保持量・メモリを確保している箇所を確認する
+
+エンドポイント:
+  GET  /debug                      メトリクスとプロセスのメモリをまとめて取得（定期的な取得用）
+  GET  /debug/metrics              カウンターとゲージ（レーン・サーキットブレーカー・会話履歴など）
+  GET  /debug/memory               RSS・GC・スレッド数・tracemalloc の計測量
+  GET  /debug/tracemalloc          メモリを確保している箇所の上位と前回の取得からの増加分
+                                   （?top=20&group=lineno|filename|traceback、計測の開始が必要）
+  POST /debug/tracemalloc/start    計測を開始（?frames=1、計測中は処理が遅くなるため調査の間だけ有効にする）
+  POST /debug/tracemalloc/stop     計測を終了
+
+GET /debug・/debug/metrics・/debug/memory は全件の走査をしないため、10秒ごとの取得に耐える
+
+使用方法:
+  DIAGNOSTICS_PORT=3090 python app.py   # 既定で 127.0.0.1:3090 で待ち受け（0 で無効）
+  curl -s localhost:3090/debug
+  curl -s -X POST localhost:3090/debug/tracemalloc/start && sleep 60 && curl -s localhost:3090/debug/tracemalloc
+"""
+
+import gc
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import logging
+
+from metrics import Metrics, metrics
+
+logger = logging.getLogger(__name__)
+
+# 計測の対象外（tracemalloc 自身・モジュールの読み込み）
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+def _rss_bytes() -> Optional[int]:
+    """現在のRSS（/proc がない環境では None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return None
+
+def process_memory() -> dict:
+    """プロセスのメモリ・GC・スレッドの状態"""
+    # Linux の ru_maxrss はKB単位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    result = {
+        "pid": os.getpid(),
+        "rss": _rss_bytes(),
+        "peak_rss": peak,
+        "threads": threading.active_count(),
+        "gc": {
+            "pending": gc.get_count(),
+            "collections": [generation["collections"] for generation in gc.get_stats()],
+            "uncollectable": sum(generation["uncollectable"] for generation in gc.get_stats()),
+        },
+        "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+    }
+    if tracemalloc.is_tracing():
+        current, peak_traced = tracemalloc.get_traced_memory()
+        result["tracemalloc"].update({
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced": current,
+            "peak_traced": peak_traced,
+            "overhead": tracemalloc.get_tracemalloc_memory(),
+        })
+    return result
+
+class MemoryTracer:
+    """tracemalloc の開始・終了と、確保の多い箇所の集計（前回の集計との差分を含む）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._previous_at = 0.0
+
+    def start(self, frames: int = 1) -> dict:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                return {"tracing": True, "started": False, "frames": tracemalloc.get_traceback_limit()}
+            tracemalloc.start(frames)
+            self._previous = None
+        logger.info(f"[Diagnostics] tracemalloc started ({frames} frames)")
+        return {"tracing": True, "started": True, "frames": frames}
+
+    def stop(self) -> dict:
+        with self._lock:
+            was_tracing = tracemalloc.is_tracing()
+            tracemalloc.stop()
+            self._previous = None
+        if was_tracing:
+            logger.info("[Diagnostics] tracemalloc stopped")
+        return {"tracing": False, "stopped": was_tracing}
+
+    def top(self, limit: int = 20, group: str = "lineno") -> dict:
+        """確保しているメモリの多い箇所の上位と、前回の集計からの増加の多い箇所"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not tracing (POST /debug/tracemalloc/start)")
+            started = time.perf_counter()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+            stats = snapshot.statistics(group)
+            result = {
+                "group": group,
+                "total": sum(stat.size for stat in stats),
+                "top": [self._format(stat.traceback, stat.size, stat.count) for stat in stats[:limit]],
+            }
+            if self._previous is not None:
+                growth = [diff for diff in snapshot.compare_to(self._previous, group) if diff.size_diff > 0]
+                result["growth_since_seconds"] = round(time.monotonic() - self._previous_at, 1)
+                result["growth"] = [
+                    dict(self._format(diff.traceback, diff.size, diff.count), size_diff=diff.size_diff,
+                         count_diff=diff.count_diff)
+                    for diff in growth[:limit]
+                ]
+            self._previous = snapshot
+            self._previous_at = time.monotonic()
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    @staticmethod
+    def _format(traceback: tracemalloc.Traceback, size: int, count: int) -> dict:
+        return {
+            "location": [f"{frame.filename}:{frame.lineno}" for frame in traceback],
+            "size": size,
+            "count": count,
+        }
+
+class DiagnosticsServer:
+    """/debug/* に応答するHTTPサーバー（デーモンスレッドで実行）"""
+
+    def __init__(self, registry: Metrics = metrics, tracer: Optional[MemoryTracer] = None):
+        self.registry = registry
+        self.tracer = tracer or MemoryTracer()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def port(self) -> Optional[int]:
+        return self._server.server_address[1] if self._server else None
+
+    def start(self, port: Optional[int] = None, host: str = "127.0.0.1") -> bool:
+        """待ち受けを開始（DIAGNOSTICS_PORT=0 の場合・ポートを使用できない場合は False）"""
+        if self._server is not None:
+            return True
+        if port is None:
+            port = int(os.getenv("DIAGNOSTICS_PORT", "3090"))
+        if port <= 0:
+            return False
+        try:
+            self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        except OSError as e:
+            logger.warning(f"[Diagnostics] ⚠️ Cannot listen on {host}:{port}: {e}")
+            return False
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="diagnostics", daemon=True).start()
+        logger.info(f"[Diagnostics] Listening on http://{host}:{self.port}/debug")
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def summary(self) -> dict:
+        return {"timestamp": time.time(), "memory": process_memory(), "metrics": self.registry.snapshot()}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                routes = {
+                    "/debug": server.summary,
+                    "/debug/metrics": server.registry.snapshot,
+                    "/debug/memory": process_memory,
+                    "/debug/tracemalloc": lambda: server.tracer.top(
+                        limit=int(query.get("top", ["20"])[0]),
+                        group=query.get("group", ["lineno"])[0],
+                    ),
+                }
+                self._dispatch(routes.get(url.path.rstrip("/") or "/"))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                routes = {
+                    "/debug/tracemalloc/start": lambda: server.tracer.start(int(query.get("frames", ["1"])[0])),
+                    "/debug/tracemalloc/stop": server.tracer.stop,
+                }
+                self._dispatch(routes.get(url.path.rstrip("/")))
+
+            def _dispatch(self, route):
+                if route is None:
+                    self._send(404, {"error": "not found"})
+                    return
+                try:
+                    self._send(200, route())
+                except RuntimeError as e:
+                    self._send(409, {"error": str(e)})
+                except ValueError as e:
+                    self._send(400, {"error": str(e)})
+                except Exception as e:
+                    logger.exception(f"[Diagnostics] ❌ {self.path} failed: {e}")
+                    self._send(500, {"error": str(e)})
+
+            def _send(self, status: int, body: dict):
+                data = json.dumps(body, ensure_ascii=False, default=str).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(f"[Diagnostics] {format % args}")
+
+        return Handler
+
+# グローバルインスタンス
+diagnostics_server = DiagnosticsServer()
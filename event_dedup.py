@@ -0,0 +1,110 @@
+"""
+イベント重複排除の実装
+Slackの再送・二重配信を event_id とチャンネル+ts で検出し、1つのユーザーメッセージにつきエージェント呼び出しを最大1回に制限
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class TTLSet:
+    """プロセス内のTTL付きキー集合"""
+
+    def __init__(self, ttl_seconds: int = 600, purge_interval: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._entries: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._adds_since_purge = 0
+
+    def add(self, key: str) -> bool:
+        """キーを追加（既に有効なキーが存在する場合はFalse）"""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+
+            self._entries[key] = now + self.ttl_seconds
+            self._adds_since_purge += 1
+            if self._adds_since_purge >= self.purge_interval:
+                self._purge(now)
+            return True
+
+    def _purge(self, now: float):
+        """期限切れのキーを削除"""
+        self._entries = {key: exp for key, exp in self._entries.items() if exp > now}
+        self._adds_since_purge = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisTTLSet:
+    """Redis上のTTL付きキー集合（複数プロセス間で共有）"""
+
+    def __init__(self, redis_url: str, ttl_seconds: int = 600, prefix: str = "dedup:"):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url)
+        return self._client
+
+    def add(self, key: str) -> bool:
+        """SET NXでキーを追加（既に存在する場合はFalse）"""
+        try:
+            return bool(self.client.set(f"{self.prefix}{key}", 1, nx=True, ex=self.ttl_seconds))
+        except Exception as e:
+            # Redis障害時は重複排除を諦めて処理を継続
+            logger.warning(f"[EventDedup] Redis unavailable, allowing event: {e}")
+            return True
+
+    def __len__(self) -> int:
+        return 0
+
+class EventDeduplicator:
+    """event_id とメッセージ単位の重複を判定するクラス"""
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else TTLSet()
+
+    def claim_event(self, event_id: Optional[str]) -> bool:
+        """イベントの処理権を取得（再送されたイベントはFalse）"""
+        if not event_id:
+            return True
+        if self.store.add(f"event:{event_id}"):
+            return True
+        metrics.increment("dedup.suppressed.event")
+        logger.info(f"[EventDedup] Suppressed redelivered event {event_id}")
+        return False
+
+    def claim_message(self, channel: Optional[str], ts: Optional[str]) -> bool:
+        """ユーザーメッセージに対するエージェント呼び出し権を取得（二重配信はFalse）"""
+        if not channel or not ts:
+            return True
+        if self.store.add(f"message:{channel}:{ts}"):
+            return True
+        metrics.increment("dedup.suppressed.message")
+        logger.info(f"[EventDedup] Suppressed duplicate agent call for message {channel}:{ts}")
+        return False
+
+def _create_store():
+    ttl = int(os.getenv("DEDUP_TTL_SECONDS", "600"))
+    if os.getenv("DEDUP_BACKEND", "memory").lower() == "redis":
+        return RedisTTLSet(os.getenv("REDIS_URL", "redis://localhost:6379"), ttl_seconds=ttl)
+    return TTLSet(ttl_seconds=ttl)
+
+# グローバルインスタンス
+event_deduplicator = EventDeduplicator(_create_store())
+metrics.register_gauge("dedup.tracked_keys", lambda: len(event_deduplicator.store))
@@ -0,0 +1,214 @@
+"""
+イベント事前フィルターの実装
+ボット宛てになり得ないメッセージイベントをリスナー実行前に破棄し、リスナーには候補イベントのみを渡す
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+import logging
+
+from inflight_requests import InFlightRequests, inflight_requests
+from message_router import Intent, MessageRouter, message_router
+from metrics import metrics
+from thread_coalescer import ThreadCoalescer, thread_coalescer
+
+logger = logging.getLogger(__name__)
+
+# ボットが処理することのないメッセージサブタイプ
+IGNORED_SUBTYPES = frozenset({
+    "bot_message",
+    "message_changed",
+    "message_deleted",
+    "message_replied",
+    "channel_join",
+    "channel_leave",
+    "channel_topic",
+    "channel_purpose",
+    "channel_name",
+    "channel_archive",
+    "channel_unarchive",
+    "group_join",
+    "group_leave",
+    "pinned_item",
+    "unpinned_item",
+    "ekm_access_denied",
+})
+
+# 実行中・待機中のリクエストを取り消すために通過させるサブタイプ（元のメッセージが実行中・待機中の場合のみ）
+CANCELLING_SUBTYPES = frozenset({"message_changed", "message_deleted"})
+
+def edited_message_ts(event: Dict[str, Any]) -> Optional[str]:
+    """編集・削除イベントの対象メッセージのts"""
+    if event.get("subtype") == "message_deleted":
+        return event.get("deleted_ts") or (event.get("previous_message") or {}).get("ts")
+    return (event.get("message") or {}).get("ts")
+
+class ThreadParticipation:
+    """ボットが参加しているスレッドを保持する上限付きLRUセット"""
+
+    def __init__(self, max_threads: int = 10000):
+        self.max_threads = max_threads
+        self._threads: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, thread_id: str):
+        """スレッドを参加中として記録"""
+        with self._lock:
+            self._threads[thread_id] = None
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+
+    def discard(self, thread_id: str):
+        """スレッドを参加中から外す"""
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def __contains__(self, thread_id: str) -> bool:
+        # dictの参照はGILで保護されるためロック不要
+        return thread_id in self._threads
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+class RedisThreadParticipation(ThreadParticipation):
+    """Redisで共有するボット参加中スレッドの集合（HTTPモードで複数ワーカーが別々にイベントを受ける場合）
+
+    プロセス内のLRUを参照結果のキャッシュとし、見つからない場合のみRedisに問い合わせる。
+    """
+
+    def __init__(self, redis_url: str, ttl_seconds: int = 7 * 24 * 3600, prefix: str = "participation:",
+                 max_threads: int = 10000):
+        super().__init__(max_threads)
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url)
+        return self._client
+
+    def add(self, thread_id: str):
+        super().add(thread_id)
+        try:
+            self.client.set(f"{self.prefix}{thread_id}", 1, ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"[EventFilter] Redis unavailable, participation kept in this process only: {e}")
+
+    def discard(self, thread_id: str):
+        super().discard(thread_id)
+        try:
+            self.client.delete(f"{self.prefix}{thread_id}")
+        except Exception as e:
+            logger.warning(f"[EventFilter] Redis unavailable, failed to discard participation: {e}")
+
+    def __contains__(self, thread_id: str) -> bool:
+        if super().__contains__(thread_id):
+            return True
+        try:
+            found = bool(self.client.exists(f"{self.prefix}{thread_id}"))
+        except Exception as e:
+            logger.warning(f"[EventFilter] Redis unavailable, treating thread as not participating: {e}")
+            return False
+        if found:
+            super().add(thread_id)
+        return found
+
+class EventFilter:
+    """メッセージイベントを分類し、処理対象かどうかを判定するクラス"""
+
+    def __init__(
+        self,
+        router: MessageRouter = message_router,
+        participation: Optional[ThreadParticipation] = None,
+        allowed_channels: Optional[Iterable[str]] = None,
+        in_flight: InFlightRequests = inflight_requests,
+        coalescer: ThreadCoalescer = thread_coalescer,
+    ):
+        self.router = router
+        self.in_flight = in_flight
+        self.coalescer = coalescer
+        self.participation = participation if participation is not None else ThreadParticipation()
+        # 空の場合は全チャンネルを対象とする
+        self.allowed_channels = frozenset(allowed_channels or ())
+
+    def evaluate(self, event: Dict[str, Any]) -> Tuple[bool, Optional[Intent], str]:
+        """イベントを評価し、(通過可否, インテント, 理由) を返す"""
+        if event.get("subtype") in CANCELLING_SUBTYPES:
+            channel, message_ts = event.get("channel"), edited_message_ts(event)
+            if (self.in_flight.find(channel, message_ts) is not None
+                    or self.coalescer.has_message(channel, message_ts)):
+                return True, None, "cancel"
+
+        if event.get("bot_id") or event.get("subtype") in IGNORED_SUBTYPES:
+            return False, None, "subtype"
+
+        if (
+            self.allowed_channels
+            and event.get("channel_type") != "im"
+            and event.get("channel") not in self.allowed_channels
+        ):
+            return False, None, "channel"
+
+        text = event.get("text") or ""
+        intent = self.router.classify(text)
+        if intent is not None:
+            return True, intent, "intent"
+
+        # インテントなし：ボットが参加中のスレッドへのメンションなし返信のみ通過
+        thread_ts = event.get("thread_ts")
+        if thread_ts and "<@" not in text and thread_ts in self.participation:
+            return True, None, "thread"
+
+        return False, None, "irrelevant"
+
+    def process(self, body: Dict[str, Any], context: Dict[str, Any]) -> bool:
+        """Boltリクエストを評価してメトリクスを記録し、通過させる場合はTrueを返す"""
+        event = body.get("event") or {}
+        if body.get("type") != "event_callback" or event.get("type") != "message":
+            return True
+
+        passed, intent, reason = self.evaluate(event)
+        if passed:
+            metrics.increment("event_filter.passed")
+            # リスナー側で再分類しないよう結果を引き渡す
+            context["intent"] = intent
+        else:
+            metrics.increment(f"event_filter.dropped.{reason}")
+        return passed
+
+    def stats(self) -> Dict[str, Any]:
+        """通過・破棄の統計を取得"""
+        passed = metrics.get("event_filter.passed")
+        dropped_by_reason = {
+            reason: metrics.get(f"event_filter.dropped.{reason}")
+            for reason in ("subtype", "channel", "irrelevant")
+        }
+        seen = passed + sum(dropped_by_reason.values())
+        return {
+            "seen": seen,
+            "passed": passed,
+            "dropped": seen - passed,
+            "dropped_by_reason": dropped_by_reason,
+            "drop_ratio": (seen - passed) / seen if seen else 0.0,
+            "participating_threads": len(self.participation),
+        }
+
+def _channels_from_env() -> Tuple[str, ...]:
+    value = os.getenv("SLACK_ALLOWED_CHANNELS", "")
+    return tuple(channel.strip() for channel in value.split(",") if channel.strip())
+
+def _create_participation() -> ThreadParticipation:
+    if os.getenv("THREAD_STATE_BACKEND", "memory").lower() == "redis":
+        return RedisThreadParticipation(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    return ThreadParticipation()
+
+# グローバルインスタンス
+event_filter = EventFilter(participation=_create_participation(), allowed_channels=_channels_from_env())
+metrics.register_gauge("event_filter.participating_threads", lambda: len(event_filter.participation))
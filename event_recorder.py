@@ -0,0 +1,148 @@
+"""
+イベントログの記録
+受信したイベントのメタデータ（種類・チャンネル・スレッド・時刻・文字数・インテント）を匿名化してJSONLに記録する
+本文やIDは保存せず、チャンネル・ユーザー・タイムスタンプは鍵付きハッシュに置き換える
+EVENT_LOG_PATH を指定した場合のみ有効（.gz で終わる場合はgzip圧縮）
+
+記録形式（1行目はヘッダー、以降1イベント1行）:
+  {"v": 1, "started_at": "..."}
+  {"t": 秒, "k": 種類, "st": サブタイプ, "c": チャンネル, "ct": チャンネル種別, "th": スレッド,
+   "m": メッセージ, "u": ユーザー, "b": ボット投稿, "n": 文字数, "i": インテント, "@": メンション,
+   "e": イベントID, "p": 記録時点でボットがスレッドに参加中}
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+import logging
+
+from event_filter import event_filter
+from message_router import MessageRouter, message_router
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOG_VERSION = 1
+
+class EventRecorder:
+    """イベントのメタデータを匿名化し、バックグラウンドスレッドでファイルに書き込むクラス"""
+
+    def __init__(
+        self,
+        path: str,
+        salt: Optional[bytes] = None,
+        router: Optional[MessageRouter] = None,
+        participating: Optional[Callable[[str], bool]] = None,
+        flush_interval: float = 1.0
+    ):
+        self.path = path
+        # ソルトを指定しない場合はプロセスごとにランダム（同じログ内でのみ対応付け可能）
+        self.salt = hashlib.blake2b(salt, digest_size=32).digest() if salt is not None else secrets.token_bytes(32)
+        self.router = router or message_router
+        self.participating = participating
+        self.flush_interval = flush_interval
+        self._started = time.monotonic()
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name="event-recorder", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        logger.info(f"[EventRecorder] Recording anonymized events to {path}")
+
+    def _hash(self, *parts: Optional[str]) -> Optional[str]:
+        if not parts[-1]:
+            return None
+        digest = hashlib.blake2b("\x1f".join(p or "" for p in parts).encode(), key=self.salt, digest_size=6)
+        return digest.hexdigest()
+
+    def describe(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """イベント本体から匿名化したレコードを作成（イベント以外はNone）"""
+        if body.get("type") != "event_callback":
+            return None
+        event = body.get("event") or {}
+        channel = event.get("channel")
+        text = event.get("text") or ""
+        thread_ts = event.get("thread_ts")
+
+        record: Dict[str, Any] = {
+            "t": round(time.monotonic() - self._started, 4),
+            "k": event.get("type"),
+            "c": self._hash(channel),
+            "m": self._hash(channel, event.get("ts")),
+            "n": len(text),
+            "e": self._hash(body.get("event_id")),
+        }
+        optional = {
+            "st": event.get("subtype"),
+            "ct": event.get("channel_type"),
+            # スレッドの親メッセージと同じハッシュになるよう、チャンネルとtsの組で計算
+            "th": self._hash(channel, thread_ts),
+            "u": self._hash(event.get("user")),
+            "b": 1 if event.get("bot_id") else None,
+            "@": 1 if "<@" in text else None,
+        }
+        intent = self.router.classify(text) if text else None
+        if intent is not None:
+            optional["i"] = intent.name
+        if thread_ts and self.participating is not None and self.participating(thread_ts):
+            optional["p"] = 1
+        record.update({key: value for key, value in optional.items() if value is not None})
+        return record
+
+    def record(self, body: Dict[str, Any]):
+        """イベントを記録キューに追加（リクエスト処理はブロックしない）"""
+        try:
+            record = self.describe(body)
+        except Exception as e:
+            logger.debug(f"[EventRecorder] Failed to describe event: {e}")
+            return
+        if record is not None:
+            self._queue.put(record)
+            metrics.increment("event_recorder.recorded")
+
+    def _open(self):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, "at", encoding="utf-8")
+        return open(self.path, "a", encoding="utf-8")
+
+    def _write_loop(self):
+        try:
+            f = self._open()
+        except OSError as e:
+            logger.error(f"[EventRecorder] ❌ Cannot open {self.path}: {e}")
+            return
+        with f:
+            f.write(json.dumps({"v": LOG_VERSION, "started_at": datetime.now().isoformat()}) + "\n")
+            while True:
+                try:
+                    record = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    f.flush()
+                    continue
+                if record is None:
+                    break
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def close(self, timeout: float = 5.0):
+        """キューに残ったレコードを書き出して終了"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+def create_event_recorder(participating: Optional[Callable[[str], bool]] = None) -> Optional[EventRecorder]:
+    """EVENT_LOG_PATH が設定されている場合のみレコーダーを作成"""
+    path = os.getenv("EVENT_LOG_PATH")
+    if not path:
+        return None
+    salt = os.getenv("EVENT_LOG_SALT")
+    return EventRecorder(path, salt=salt.encode() if salt else None, participating=participating)
+
+# グローバルインスタンス（EVENT_LOG_PATH 未設定の場合はNone）
+event_recorder = create_event_recorder(lambda thread_ts: thread_ts in event_filter.participation)
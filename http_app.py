@@ -0,0 +1,58 @@
+"""
+HTTP Events API モード
+Socket Modeの代わりに、SlackからのHTTPリクエスト（イベント・ボタン操作・/mcp）を受けるWSGIアプリ
+gunicorn の複数ワーカー・複数ノードで起動し、ロードバランサーの背後で水平にスケールできる
+
+- 署名の検証は Bolt が SLACK_SIGNING_SECRET で行う（不正な署名は401）
+- イベントはミドルウェア（重複排除・事前フィルター）のみ実行して即座に200を返し、
+  リスナーは応答後に高速レーンで、エージェント呼び出しは重いレーン（またはジョブキュー）で実行する
+- Slackの再送（X-Slack-Retry-Num）は event_id の重複排除で破棄する
+- ワーカー間で共有する状態はRedisに置く（DEDUP_BACKEND=redis, THREAD_STATE_BACKEND=redis、OAuthのstateは常にRedis）
+- 複数ワーカーで起動する場合は AGENT_EXECUTION=queue とし、エージェントは agent_worker.py で実行する
+  （inline の場合、各ワーカーが同じポートでエージェントサーバーを起動しようとするため1ワーカーに限る）
+
+使用方法:
+  gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:3000 http_app:flask_app
+  python http_app.py                     # 開発用（Flaskの開発サーバー、PORT で待ち受けポートを指定）
+
+SlackアプリのRequest URL（Event Subscriptions・Interactivity・Slash Commands）: https://<host>/slack/events
+"""
+
+import atexit
+import os
+import logging
+
+from flask import Flask, jsonify, request
+from slack_bolt.adapter.flask import SlackRequestHandler
+
+from app import QUEUE_EXECUTION, app
+from lanes import fast_lane, heavy_lane
+from mastra_bridge import mastra_bridge
+
+logger = logging.getLogger(__name__)
+
+flask_app = Flask(__name__)
+handler = SlackRequestHandler(app)
+
+@flask_app.route("/slack/events", methods=["POST"])
+def slack_events():
+    """Slackからのイベント・ボタン操作・スラッシュコマンド"""
+    return handler.handle(request)
+
+@flask_app.route("/health", methods=["GET"])
+def health():
+    """ロードバランサー向けのヘルスチェック"""
+    return jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "execution": "queue" if QUEUE_EXECUTION else "inline",
+        "lanes": {"fast": fast_lane.stats(), "heavy": heavy_lane.stats()},
+    })
+
+if not QUEUE_EXECUTION:
+    logger.warning("[HTTP] AGENT_EXECUTION=inline: run a single worker, or use AGENT_EXECUTION=queue with agent_worker.py")
+    mastra_bridge.start_in_background()
+    atexit.register(mastra_bridge.stop)
+
+if __name__ == "__main__":
+    flask_app.run(host="0.0.0.0", port=int(os.getenv("PORT", "3000")), threaded=True)
@@ -0,0 +1,108 @@
+"""
+実行中のエージェント呼び出しの管理
+元のメッセージ（チャンネル + ts）とスレッドごとに実行中のリクエストを保持し、
+メッセージの編集・削除や同じスレッドでの言い直しの際に、不要になった呼び出しを取り消せるようにする
+1つのリクエストは連続して送信された複数のメッセージをまとめた発言（parts）を持つことがある
+"""
+
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class InFlightRequest:
+    """実行中（または重いレーンで待機中）のエージェント呼び出し"""
+    request_id: str
+    channel: Optional[str]
+    thread_ts: str
+    user_id: Optional[str]
+    # (元のメッセージのts, 本文) の送信順のリスト
+    parts: List[Tuple[Optional[str], str]] = field(default_factory=list)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    cancel_reason: Optional[str] = None
+    # 応答の投稿を始めた（以降は取り消せない）
+    settled: bool = False
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.cancelled.is_set()
+
+    @property
+    def message_ts(self) -> Optional[str]:
+        """最後のメッセージのts"""
+        return self.parts[-1][0] if self.parts else None
+
+    @property
+    def text(self) -> str:
+        """エージェントに送信する発言（複数のメッセージは改行で連結）"""
+        return "\n".join(text for _, text in self.parts)
+
+class InFlightRequests:
+    """実行中のリクエストをメッセージとスレッドで引けるよう保持するクラス"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: Dict[str, InFlightRequest] = {}
+        self._by_message: Dict[Tuple[Optional[str], str], InFlightRequest] = {}
+
+    def start(self, channel: Optional[str], thread_ts: str, user_id: Optional[str],
+              parts: Sequence[Tuple[Optional[str], str]]) -> InFlightRequest:
+        """リクエストを登録（まとめた各メッセージから引けるようにする）"""
+        request = InFlightRequest(uuid.uuid4().hex, channel, thread_ts, user_id, list(parts))
+        with self._lock:
+            self._by_id[request.request_id] = request
+            for message_ts, _ in request.parts:
+                if message_ts:
+                    self._by_message[(channel, message_ts)] = request
+        return request
+
+    def finish(self, request: InFlightRequest):
+        """完了・取り消し済みのリクエストを登録から外す"""
+        with self._lock:
+            self._by_id.pop(request.request_id, None)
+            for message_ts, _ in request.parts:
+                if message_ts and self._by_message.get((request.channel, message_ts)) is request:
+                    del self._by_message[(request.channel, message_ts)]
+
+    def find(self, channel: Optional[str], message_ts: Optional[str]) -> Optional[InFlightRequest]:
+        """元のメッセージから実行中のリクエストを取得"""
+        if not message_ts:
+            return None
+        return self._by_message.get((channel, message_ts))
+
+    def in_thread(self, thread_ts: str) -> List[InFlightRequest]:
+        """スレッド内の実行中のリクエスト"""
+        with self._lock:
+            return [request for request in self._by_id.values() if request.thread_ts == thread_ts]
+
+    def settle(self, request: InFlightRequest) -> bool:
+        """応答の投稿前に呼び、以降の取り消しを受け付けない（既に取り消されている場合はFalse）"""
+        with self._lock:
+            if request.is_cancelled:
+                return False
+            request.settled = True
+            return True
+
+    def cancel(self, request: InFlightRequest, reason: str) -> bool:
+        """取り消しを記録（既に取り消し済み・応答の投稿を始めている場合はFalse）"""
+        with self._lock:
+            if request.is_cancelled or request.settled:
+                return False
+            request.cancel_reason = reason
+            request.cancelled.set()
+        metrics.increment(f"requests.cancelled.{reason}")
+        logger.info(f"[InFlight] 🛑 Cancelled request {request.request_id} in thread {request.thread_ts} ({reason})")
+        return True
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+# グローバルインスタンス
+inflight_requests = InFlightRequests()
+metrics.register_gauge("requests.in_flight", lambda: len(inflight_requests))
@@ -0,0 +1,212 @@
+"""
+エージェント呼び出しのジョブキュー（Redis Streams + コンシューマーグループ）
+AGENT_EXECUTION=queue の場合、Slackボット（app.py）は発言をジョブとして登録するだけにし、
+別プロセスのワーカー（agent_worker.py、任意のノードで複数起動可能）がジョブを取り出してエージェントを呼び出し、Slackに投稿する
+
+- 取り出したジョブは完了時に ack するまでコンシューマーグループの未完了リストに残る
+- 可視性タイムアウト（visibility_timeout 秒）を過ぎても ack されないジョブは、他のワーカーが引き取って再実行する
+  （ワーカーの異常終了・再起動で失われない）。処理中のワーカーは touch で期限を延長する
+- 失敗したジョブは試行回数を増やして登録し直し、max_attempts 回を超えたものは dead letter ストリームへ移す
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class AgentJob:
+    """ジョブキューに登録された発言"""
+    job_id: str
+    channel: str
+    thread_ts: str
+    user_id: str
+    text: str
+    enqueued_at: float
+    # 登録し直した回数 + 引き取られた回数を含む試行回数（1始まり）
+    attempt: int = 1
+    # 発言（まとめた場合は最初のメッセージ）のts（挨拶など発言に対応しないジョブは空）
+    message_ts: str = ""
+
+    @classmethod
+    def from_fields(cls, job_id, fields: Dict[bytes, bytes], deliveries: int = 1) -> "AgentJob":
+        values = {key.decode(): value.decode() for key, value in fields.items()}
+        return cls(
+            job_id=job_id.decode() if isinstance(job_id, bytes) else job_id,
+            channel=values.get("channel", ""),
+            thread_ts=values.get("thread_ts", ""),
+            user_id=values.get("user", ""),
+            text=values.get("text", ""),
+            enqueued_at=float(values.get("enqueued_at", 0)),
+            attempt=int(values.get("attempt", 1)) + deliveries - 1,
+            message_ts=values.get("message_ts", ""),
+        )
+
+    def fields(self, attempt: Optional[int] = None) -> Dict[str, str]:
+        return {
+            "channel": self.channel,
+            "thread_ts": self.thread_ts,
+            "user": self.user_id,
+            "text": self.text,
+            "enqueued_at": repr(self.enqueued_at),
+            "attempt": str(self.attempt if attempt is None else attempt),
+            "message_ts": self.message_ts,
+        }
+
+class RedisJobQueue:
+    """Redis Streamsのコンシューマーグループを使った、少なくとも1回配送のジョブキュー"""
+
+    def __init__(
+        self,
+        redis_url: str,
+        stream: str = "agent:jobs",
+        group: str = "agent-workers",
+        visibility_timeout: float = 120,
+        max_attempts: int = 3,
+        max_length: int = 100000,
+    ):
+        self.redis_url = redis_url
+        self.stream = stream
+        self.group = group
+        self.dead_stream = f"{stream}:dead"
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.max_length = max_length
+        self._client = None
+        self._group_ready = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url)
+        return self._client
+
+    def ensure_group(self):
+        """コンシューマーグループを作成（既に存在する場合は何もしない）"""
+        if self._group_ready:
+            return
+        import redis
+        # 作成済みの場合はエラー応答を発生させない（多数のワーカーが起動時に確認するため）
+        if self.client.exists(self.stream) and any(
+            group["name"] in (self.group, self.group.encode()) for group in self.client.xinfo_groups(self.stream)
+        ):
+            self._group_ready = True
+            return
+        try:
+            self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"[JobQueue] Created consumer group {self.group} on {self.stream}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def enqueue(self, channel: str, thread_ts: str, user_id: str, text: str, message_ts: str = "") -> str:
+        """ジョブを登録してジョブIDを返す"""
+        self.ensure_group()
+        job = AgentJob("", channel, thread_ts, user_id, text, time.time(), message_ts=message_ts or "")
+        job_id = self.client.xadd(self.stream, job.fields(), maxlen=self.max_length, approximate=True)
+        metrics.increment("jobs.enqueued")
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    def claim(self, consumer: str, count: int = 1, block_ms: int = 5000) -> List[AgentJob]:
+        """ジョブを取り出す（可視性タイムアウトを過ぎた他のワーカーのジョブを優先して引き取る）"""
+        self.ensure_group()
+        jobs = self._reclaim(consumer, count)
+        if jobs:
+            return jobs
+
+        response = self.client.xreadgroup(self.group, consumer, {self.stream: ">"}, count=count, block=block_ms)
+        for _, entries in response or []:
+            for job_id, fields in entries:
+                # 読み込み前に削除されたエントリは fields が空になる
+                if fields:
+                    jobs.append(AgentJob.from_fields(job_id, fields))
+                else:
+                    self.client.xack(self.stream, self.group, job_id)
+        metrics.increment("jobs.claimed", len(jobs))
+        return jobs
+
+    def _reclaim(self, consumer: str, count: int) -> List[AgentJob]:
+        min_idle_ms = int(self.visibility_timeout * 1000)
+        _, entries, *_ = self.client.xautoclaim(
+            self.stream, self.group, consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count
+        )
+        jobs = []
+        for job_id, fields in entries:
+            if not fields:
+                self.client.xack(self.stream, self.group, job_id)
+                continue
+            pending = self.client.xpending_range(self.stream, self.group, min=job_id, max=job_id, count=1)
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            job = AgentJob.from_fields(job_id, fields, deliveries)
+            logger.warning(f"[JobQueue] Reclaimed job {job.job_id} after visibility timeout (attempt {job.attempt})")
+            metrics.increment("jobs.reclaimed")
+            if job.attempt > self.max_attempts:
+                self._bury(job, "visibility timeout exceeded too many times")
+            else:
+                jobs.append(job)
+        return jobs
+
+    def touch(self, job: AgentJob, consumer: str):
+        """処理中のジョブの可視性タイムアウトを延長"""
+        self.client.xclaim(self.stream, self.group, consumer, min_idle_time=0, message_ids=[job.job_id], justid=True)
+
+    def ack(self, job: AgentJob):
+        """完了したジョブを削除"""
+        pipe = self.client.pipeline()
+        pipe.xack(self.stream, self.group, job.job_id)
+        pipe.xdel(self.stream, job.job_id)
+        pipe.execute()
+        metrics.increment("jobs.completed")
+
+    def retry(self, job: AgentJob, error: str) -> bool:
+        """失敗したジョブを試行回数を増やして登録し直す（上限を超えた場合は dead letter に移してFalse）"""
+        if job.attempt >= self.max_attempts:
+            self._bury(job, error)
+            return False
+        pipe = self.client.pipeline()
+        pipe.xadd(self.stream, job.fields(job.attempt + 1), maxlen=self.max_length, approximate=True)
+        pipe.xack(self.stream, self.group, job.job_id)
+        pipe.xdel(self.stream, job.job_id)
+        pipe.execute()
+        metrics.increment("jobs.retried")
+        logger.warning(f"[JobQueue] Retrying job {job.job_id} (attempt {job.attempt + 1}): {error}")
+        return True
+
+    def _bury(self, job: AgentJob, error: str):
+        pipe = self.client.pipeline()
+        pipe.xadd(self.dead_stream, {**job.fields(), "error": error[:500]}, maxlen=self.max_length, approximate=True)
+        pipe.xack(self.stream, self.group, job.job_id)
+        pipe.xdel(self.stream, job.job_id)
+        pipe.execute()
+        metrics.increment("jobs.dead")
+        logger.error(f"[JobQueue] ❌ Job {job.job_id} moved to {self.dead_stream} after {job.attempt} attempts: {error}")
+
+    def stats(self) -> Dict[str, int]:
+        """待機中・処理中・dead letter のジョブ数"""
+        self.ensure_group()
+        pending = self.client.xpending(self.stream, self.group)["pending"]
+        return {
+            "queued": max(0, self.client.xlen(self.stream) - pending),
+            "in_progress": pending,
+            "dead": self.client.xlen(self.dead_stream),
+        }
+
+def queue_execution_enabled() -> bool:
+    """エージェント呼び出しをジョブキュー経由でワーカーに任せるか（AGENT_EXECUTION=queue）"""
+    return os.getenv("AGENT_EXECUTION", "inline").lower() == "queue"
+
+# グローバルインスタンス（Redisへの接続は最初の使用時）
+job_queue = RedisJobQueue(
+    os.getenv("REDIS_URL", "redis://localhost:6379"),
+    stream=os.getenv("AGENT_JOB_STREAM", "agent:jobs"),
+    group=os.getenv("AGENT_JOB_GROUP", "agent-workers"),
+    visibility_timeout=float(os.getenv("AGENT_JOB_VISIBILITY_SECONDS", "120")),
+    max_attempts=int(os.getenv("AGENT_JOB_MAX_ATTEMPTS", "3")),
+)
@@ -0,0 +1,84 @@
+"""
+処理レーン（専用スレッドプール）の管理
+- fast_lane: Boltのリスナー全般（ローカルインテント、/mcp、ボタン操作のack）を実行する
+- heavy_lane: エージェント呼び出し（process_message_with_mastra）を実行する
+エージェント呼び出しが詰まっても、軽い応答やインタラクティブ操作のackが待たされないようにする
+"""
+
+import os
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class LaneFull(RuntimeError):
+    """レーンの待ち行列が上限に達している"""
+
+class Lane(Executor):
+    """ワーカー数と待ち行列の上限を持つスレッドプール（上限超過時は LaneFull を送出）"""
+
+    def __init__(self, name: str, workers: int, queue_limit: int):
+        self.name = name
+        self.workers = workers
+        # 0 の場合は待ち行列を制限しない
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"lane-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        with self._lock:
+            if self.queue_limit and self._pending - self._active >= self.queue_limit:
+                metrics.increment(f"lane.{self.name}.rejected")
+                raise LaneFull(f"{self.name} lane is full ({self._pending} pending)")
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._run, fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        metrics.increment(f"lane.{self.name}.submitted")
+        return future
+
+    def _run(self, fn: Callable, args: tuple, kwargs: dict):
+        with self._lock:
+            self._active += 1
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.exception(f"[Lane] ❌ Task failed in {self.name} lane: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._pending -= 1
+
+    def queued(self) -> int:
+        """ワーカーの空きを待っているタスク数"""
+        return self._pending - self._active
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "active": self._active, "queued": self.queued()}
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+# グローバルインスタンス
+fast_lane = Lane(
+    "fast",
+    workers=int(os.getenv("LANE_FAST_WORKERS", "8")),
+    queue_limit=int(os.getenv("LANE_FAST_QUEUE", "500")),
+)
+heavy_lane = Lane(
+    "heavy",
+    workers=int(os.getenv("LANE_HEAVY_WORKERS", "10")),
+    queue_limit=int(os.getenv("LANE_HEAVY_QUEUE", "100")),
+)
+metrics.register_gauge("lane.fast", fast_lane.stats)
+metrics.register_gauge("lane.heavy", heavy_lane.stats)
@@ -1,133 +1,549 @@
 import subprocess
+import hashlib
+import itertools
+import json
 import os
 import requests
+import signal
+import threading
 import time
+import unicodedata
 import logging
-from typing import Optional, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, Hashable, Iterator, List, Tuple
+
+from agent_ipc import AgentIPCClient, ipc_available
+from circuit_breaker import CLOSED, create_agent_breaker, create_agent_timeout
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
+# エージェントサーバーが取り消されたリクエストに返すステータス
+CANCELLED_STATUS = 499
+# エージェントサーバー（子プロセス）の出力用
+agent_logger = logging.getLogger("mastra_agent")
 
-class MastraBridge:
-    """PythonからNode.js Mastraエージェントとの通信を管理するブリッジクラス"""
+def is_rate_limit_error(error_text: str) -> bool:
+    """レート制限によるエラーか（エージェントサーバーは日本語のメッセージに置き換えて返す）"""
+    return "レート制限" in error_text or "rate limit" in error_text.lower()
+
+def is_agent_failure(status: int, error_text: str) -> bool:
+    """サーキットブレーカーの失敗として数える応答か（レート制限はエージェントの障害ではないため含めない）"""
+    return status >= 500 and not is_rate_limit_error(error_text)
+
+def normalize_message(message: str) -> str:
+    """同一質問の判定用にメッセージを正規化（全角半角・大文字小文字・空白の揺れを吸収）"""
+    return " ".join(unicodedata.normalize("NFKC", message).lower().split())
+
+class _InFlightCall:
+    """実行中の呼び出しと、その結果を待つ呼び出し元の情報"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 1
+
+class SingleFlight:
+    """同じキーの同時呼び出しを1回の実行にまとめ、結果を全呼び出し元に配布するクラス"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _InFlightCall] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """funcを実行し (結果, 他の呼び出しと共有したか) を返す"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return dict(call.result), True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        if call.waiters > 1:
+            metrics.increment("bridge.coalesced", call.waiters - 1)
+            logger.info(f"[MastraBridge] Coalesced {call.waiters} identical requests into one agent call")
+        return call.result, call.waiters > 1
+
+    def waiters(self, key: Hashable) -> int:
+        """実行中の呼び出しの結果を待っている呼び出し元の数（実行中でなければ0）"""
+        call = self._calls.get(key)
+        return call.waiters if call is not None else 0
+
+    def in_flight(self) -> int:
+        """実行中のキー数を取得"""
+        return len(self._calls)
+
+class AgentInstance:
+    """1つのNode.jsエージェントサーバープロセスとその状態"""
     
-    def __init__(self, port: int = 3001):
+    def __init__(self, port: int, ipc_socket: Optional[str] = None):
         self.port = port
         self.base_url = f"http://localhost:{port}"
+        # バイナリIPCを使用する場合のUnixドメインソケットとクライアント
+        self.ipc_socket = ipc_socket
+        self.ipc = AgentIPCClient(ipc_socket) if ipc_socket else None
         self.process: Optional[subprocess.Popen] = None
-        self.mastra_project_path = os.path.join(os.path.dirname(__file__), 'slack-mcp-agent')
-        
-    def start(self) -> bool:
-        """Node.jsエージェントサーバーを起動"""
+        self.healthy = False
+        self.external = False  # 別プロセスで起動済みのサーバーを利用している場合
+        self.consecutive_failures = 0
+        self.restarts = 0
+        self.restart_delay = 0.0
+        self.next_restart_at: Optional[float] = None
+        self.spawned_at = 0.0
+        # 送信済みで応答待ちのリクエスト数（最小未処理数ロードバランシング用）
+        self.outstanding = 0
+    
+    def spawn(self, cmd: List[str], cwd: str, env: Dict[str, str]):
+        """プロセスを起動し、出力をログへ非同期に転送"""
+        env = dict(env, AGENT_PORT=str(self.port))
+        if self.ipc_socket:
+            env['AGENT_IPC_SOCKET'] = self.ipc_socket
+        self.process = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            # npm配下の子プロセスもまとめて停止できるよう新しいプロセスグループで起動
+            start_new_session=(os.name == 'posix')
+        )
+        self.next_restart_at = None
+        self.spawned_at = time.monotonic()
+        threading.Thread(
+            target=self._drain_output,
+            args=(self.process,),
+            name=f"agent-output-{self.port}",
+            daemon=True
+        ).start()
+    
+    def _drain_output(self, process: subprocess.Popen):
+        """子プロセスの出力を読み続ける（パイプが詰まってサーバーが停止するのを防ぐ）"""
         try:
-            # 既に起動している場合はスキップ
-            if self.is_running():
-                logger.info(f"[MastraBridge] ✅ Server already running on port {self.port}")
+            for line in process.stdout:
+                agent_logger.info(f"[agent:{self.port}] {line.rstrip()}")
+        except Exception as e:
+            logger.debug(f"[MastraBridge] Output drain for port {self.port} ended: {e}")
+    
+    def exited(self) -> bool:
+        """管理下のプロセスが終了しているか"""
+        return self.process is not None and self.process.poll() is not None
+    
+    def check_health(self, timeout: float = 2) -> bool:
+        """ヘルスチェックエンドポイントを確認"""
+        try:
+            response = requests.get(f"{self.base_url}/api/health", timeout=timeout)
+            return response.status_code == 200
+        except Exception:
+            return False
+    
+    def terminate(self, timeout: float = 10):
+        """プロセスグループごと停止"""
+        process = self.process
+        if process is None:
+            return
+        self.process = None
+        self.healthy = False
+        if process.poll() is not None:
+            return
+        try:
+            if os.name == 'posix':
+                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+            else:
+                process.terminate()
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[MastraBridge] Agent on port {self.port} did not stop, killing")
+            if os.name == 'posix':
+                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+            else:
+                process.kill()
+            process.wait()
+        except ProcessLookupError:
+            pass
+
+class AgentSupervisor:
+    """エージェントサーバー群の起動・ヘルス監視・再起動を行うクラス
+    
+    ヘルス監視はバックグラウンドスレッドで行い、異常なインスタンスは指数バックオフで再起動する。
+    リクエスト処理中に同期的な再起動は行わない。
+    """
+    
+    def __init__(
+        self,
+        project_path: str,
+        base_port: int = 3001,
+        instance_count: int = 1,
+        health_interval: float = 5.0,
+        failure_threshold: int = 3,
+        startup_grace: float = 60.0,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        use_ipc: bool = False
+    ):
+        self.project_path = project_path
+        self.instances = [
+            AgentInstance(port, ipc_socket=f"/tmp/slack-mcp-agent-{port}.sock" if use_ipc else None)
+            for port in range(base_port, base_port + max(1, instance_count))
+        ]
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.startup_grace = startup_grace
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.cmd = ['npm', 'run', 'server']
+        self.on_health_change: Optional[Callable[[bool], None]] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+    
+    def _build_env(self) -> Dict[str, str]:
+        """子プロセス用の環境変数を作成"""
+        env = os.environ.copy()
+        
+        # API キーを環境変数から取得
+        if 'GEMINI_API_KEY' in os.environ:
+            env['GOOGLE_GENERATIVE_AI_API_KEY'] = os.environ['GEMINI_API_KEY']
+            logger.info("[MastraBridge] ✓ Gemini API key configured")
+        
+        if 'NOTION_API_KEY' in os.environ:
+            env['NOTION_API_KEY'] = os.environ['NOTION_API_KEY']
+            logger.info("[MastraBridge] ✓ Notion API key configured")
+        
+        return env
+    
+    def start(self, timeout: float = 60) -> bool:
+        """全インスタンスを起動し、いずれかが利用可能になるまで待機"""
+        # Mastraプロジェクトディレクトリの存在確認
+        if not os.path.exists(self.project_path):
+            logger.error(f"[MastraBridge] ❌ Mastra project directory not found: {self.project_path}")
+            return False
+        
+        env = self._build_env()
+        logger.info(f"[MastraBridge] Starting Mastra server: {' '.join(self.cmd)}")
+        logger.info(f"[MastraBridge] Working directory: {self.project_path}")
+        
+        with self._lock:
+            for instance in self.instances:
+                if instance.process is not None and not instance.exited():
+                    continue
+                # 既に起動している場合はそのサーバーを利用
+                if instance.check_health():
+                    logger.info(f"[MastraBridge] ✅ Server already running on port {instance.port}")
+                    instance.external = True
+                    instance.healthy = True
+                    continue
+                instance.spawn(self.cmd, self.project_path, env)
+        
+        self._start_watchdog()
+        
+        # サーバーが起動するまで待機（依存関係のインストール時間を考慮）
+        ports = [instance.port for instance in self.instances]
+        logger.info(f"[MastraBridge] ⏳ Waiting for server startup on ports {ports}...")
+        if self._wait_for_any_healthy(timeout):
+            logger.info(f"[MastraBridge] ✅ {len(self.healthy_instances())}/{len(self.instances)} servers ready")
+            return True
+        
+        logger.error(f"[MastraBridge] ❌ Failed to start server after {int(timeout)} seconds")
+        return False
+    
+    def _wait_for_any_healthy(self, timeout: float) -> bool:
+        """サブ秒の指数バックオフでヘルスチェックをポーリング"""
+        started = time.monotonic()
+        deadline = started + timeout
+        delay = 0.05
+        next_report = 10
+        while time.monotonic() < deadline:
+            self.check_instances(allow_restart=False)
+            if self.healthy_instances():
                 return True
-            
-            # Mastraプロジェクトディレクトリの存在確認
-            if not os.path.exists(self.mastra_project_path):
-                logger.error(f"[MastraBridge] ❌ Mastra project directory not found: {self.mastra_project_path}")
+            if all(instance.exited() for instance in self.instances):
+                logger.error("[MastraBridge] ❌ All server processes exited during startup")
                 return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            elapsed = time.monotonic() - started
+            if elapsed >= next_report:
+                logger.info(f"[MastraBridge] ⏳ Still waiting... ({int(elapsed)}s elapsed)")
+                next_report += 10
+        return False
+    
+    def _start_watchdog(self):
+        if self._watchdog is not None and self._watchdog.is_alive():
+            return
+        self._stop_event.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="agent-watchdog", daemon=True)
+        self._watchdog.start()
+    
+    def _watch(self):
+        """一定間隔でインスタンスを監視"""
+        while not self._stop_event.wait(self.health_interval):
+            try:
+                self.check_instances()
+            except Exception as e:
+                logger.error(f"[MastraBridge] Watchdog error: {e}")
+    
+    def check_instances(self, allow_restart: bool = True):
+        """各インスタンスのヘルスを確認し、必要に応じて再起動を予約・実行"""
+        was_available = bool(self.healthy_instances())
+        now = time.monotonic()
+        
+        for instance in self.instances:
+            if instance.next_restart_at is not None:
+                if allow_restart and now >= instance.next_restart_at:
+                    logger.info(f"[MastraBridge] 🔄 Restarting agent on port {instance.port} (attempt {instance.restarts + 1})")
+                    instance.restarts += 1
+                    metrics.increment("bridge.agent_restarts")
+                    with self._lock:
+                        instance.spawn(self.cmd, self.project_path, self._build_env())
+                continue
             
-            # Node.jsサーバーを起動
-            env = os.environ.copy()
-            env['AGENT_PORT'] = str(self.port)
-            
-            # API キーを環境変数から取得
-            if 'GEMINI_API_KEY' in os.environ:
-                env['GOOGLE_GENERATIVE_AI_API_KEY'] = os.environ['GEMINI_API_KEY']
-                logger.info("[MastraBridge] ✓ Gemini API key configured")
-            
-            if 'NOTION_API_KEY' in os.environ:
-                env['NOTION_API_KEY'] = os.environ['NOTION_API_KEY']
-                logger.info("[MastraBridge] ✓ Notion API key configured")
-            
-            # 新しいMastraサーバーを起動
-            cmd = ['npm', 'run', 'server']
-            
-            logger.info(f"[MastraBridge] Starting Mastra server: {' '.join(cmd)}")
-            logger.info(f"[MastraBridge] Working directory: {self.mastra_project_path}")
-            
-            self.process = subprocess.Popen(
-                cmd,
-                cwd=self.mastra_project_path,
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            # サーバーが起動するまで待機
-            logger.info(f"[MastraBridge] ⏳ Waiting for server startup on port {self.port}...")
-            for i in range(60):  # 最大60秒待機（依存関係のインストール時間を考慮）
-                time.sleep(1)
-                if self.is_running():
-                    logger.info(f"[MastraBridge] ✅ Server started successfully on port {self.port}")
-                    return True
-                if i % 10 == 0 and i > 0:
-                    logger.info(f"[MastraBridge] ⏳ Still waiting... ({i}s elapsed)")
+            if instance.exited():
+                logger.error(f"[MastraBridge] ❌ Agent on port {instance.port} exited with code {instance.process.returncode}")
+                self._schedule_restart(instance, now)
+                continue
             
-            # プロセスのエラー出力を確認
-            if self.process:
-                try:
-                    stdout, stderr = self.process.communicate(timeout=1)
-                    if stderr:
-                        logger.error(f"[MastraBridge] ❌ Server error: {stderr.decode().strip()}")
-                    if stdout:
-                        logger.info(f"[MastraBridge] Server output: {stdout.decode().strip()}")
-                except:
-                    pass  # タイムアウトは無視
+            if instance.check_health():
+                instance.healthy = True
+                instance.consecutive_failures = 0
+                instance.restart_delay = 0.0
+                continue
             
-            logger.error("[MastraBridge] ❌ Failed to start server after 60 seconds")
+            instance.healthy = False
+            # 起動直後（依存関係のインストール中など）の未応答は失敗として数えない
+            if instance.process is not None and now - instance.spawned_at < self.startup_grace:
+                continue
+            instance.consecutive_failures += 1
+            # 閾値を超えて連続で失敗したら応答不能とみなす
+            if instance.consecutive_failures >= self.failure_threshold and allow_restart:
+                if instance.external:
+                    logger.warning(f"[MastraBridge] ⚠️ External agent on port {instance.port} is not responding")
+                    continue
+                logger.error(f"[MastraBridge] ❌ Agent on port {instance.port} failed {instance.consecutive_failures} health checks")
+                instance.terminate()
+                self._schedule_restart(instance, now)
+        
+        is_available = bool(self.healthy_instances())
+        if is_available != was_available and self.on_health_change:
+            self.on_health_change(is_available)
+    
+    def _schedule_restart(self, instance: AgentInstance, now: float):
+        """指数バックオフで再起動を予約"""
+        instance.healthy = False
+        instance.consecutive_failures = 0
+        instance.restart_delay = min(
+            instance.restart_delay * 2 if instance.restart_delay else self.initial_backoff,
+            self.max_backoff
+        )
+        instance.next_restart_at = now + instance.restart_delay
+        logger.info(f"[MastraBridge] ⏳ Restart of port {instance.port} scheduled in {instance.restart_delay:.1f}s")
+    
+    def mark_unhealthy(self, instance: AgentInstance):
+        """リクエスト失敗時、ヘルスチェックにも応答しなければ次回の監視まで振り分け対象から外す"""
+        if instance.check_health(timeout=1):
+            return
+        instance.healthy = False
+        if not self.healthy_instances() and self.on_health_change:
+            self.on_health_change(False)
+    
+    def healthy_instances(self) -> List[AgentInstance]:
+        """利用可能なインスタンスの一覧"""
+        return [instance for instance in self.instances if instance.healthy]
+    
+    def stop(self):
+        """監視を停止し、管理下の全プロセスを停止"""
+        self._stop_event.set()
+        for instance in self.instances:
+            instance.terminate()
+            instance.next_restart_at = None
+
+class MastraBridge:
+    """PythonからNode.js Mastraエージェントとの通信を管理するブリッジクラス"""
+    
+    def __init__(self, port: int = 3001, instances: Optional[int] = None):
+        self.port = port
+        self.base_url = f"http://localhost:{port}"
+        self.mastra_project_path = os.path.join(os.path.dirname(__file__), 'slack-mcp-agent')
+        self.supervisor = AgentSupervisor(
+            self.mastra_project_path,
+            base_port=port,
+            instance_count=instances if instances is not None else int(os.getenv("AGENT_INSTANCES", "1")),
+            health_interval=float(os.getenv("AGENT_HEALTH_INTERVAL", "5")),
+            use_ipc=self._ipc_enabled()
+        )
+        self.supervisor.on_health_change = self._on_health_change
+        self.single_flight = SingleFlight()
+        # エージェントやAnthropicの障害時にスレッドを長時間占有しないよう、失敗が続けば即座に失敗させる
+        self.breaker = create_agent_breaker()
+        self.timeout = create_agent_timeout()
+        # 起動完了までに届いたリクエストは失敗させずに待機させる
+        self.ready = threading.Event()
+        self.startup_wait_seconds = float(os.getenv("AGENT_STARTUP_WAIT_SECONDS", "90"))
+        self._startup_thread: Optional[threading.Thread] = None
+        self._round_robin = itertools.count()
+        self._balance_lock = threading.Lock()
+        # 担当インスタンスの未処理数が最小値よりこの数を超えて多い場合は固定振り分けを諦める
+        self.sticky_slack = int(os.getenv("AGENT_STICKY_SLACK", "2"))
+        # 送信済みのリクエストID → (送信先インスタンス, 相乗りのキー)（取り消し用）
+        self._sent_requests: Dict[str, Tuple[AgentInstance, Optional[Hashable]]] = {}
+        # ユーザーID → 最後に事前準備を依頼した時刻（同じユーザーへの依頼をこの間隔に1回にまとめる）
+        self._prewarmed: Dict[str, float] = {}
+        self.prewarm_interval = float(os.getenv("AGENT_PREWARM_INTERVAL_SECONDS", "30"))
+    
+    @staticmethod
+    def _ipc_enabled() -> bool:
+        """AGENT_TRANSPORT=ipc かつ msgpack が利用可能な場合にバイナリIPCを使用"""
+        if os.getenv("AGENT_TRANSPORT", "http").lower() != "ipc":
+            return False
+        if os.name != 'posix' or not ipc_available():
+            logger.warning("[MastraBridge] ⚠️ IPC transport unavailable (requires msgpack and Unix sockets), using HTTP")
+            return False
+        return True
+    
+    def start(self) -> bool:
+        """Node.jsエージェントサーバーを起動"""
+        try:
+            if self.supervisor.start():
+                self.ready.set()
+                return True
             return False
-            
         except Exception as e:
             logger.error(f"[MastraBridge] ❌ Startup error: {e}")
             return False
     
+    def _on_health_change(self, available: bool):
+        if available:
+            logger.info("[MastraBridge] ✅ Agent server available")
+            self.ready.set()
+        else:
+            logger.warning("[MastraBridge] ⚠️ No healthy agent server")
+            self.ready.clear()
+    
+    def start_in_background(self) -> threading.Thread:
+        """エージェントサーバーをバックグラウンドで起動（Socket Modeの接続を待たせない）"""
+        self._startup_thread = threading.Thread(target=self.start, name="mastra-bridge-start", daemon=True)
+        self._startup_thread.start()
+        return self._startup_thread
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """バックグラウンド起動中であれば、エージェントサーバーが利用可能になるまで待機"""
+        if self.ready.is_set():
+            return True
+        thread = self._startup_thread
+        if thread is None or not thread.is_alive():
+            return False
+        logger.info("[MastraBridge] ⏳ Agent server still starting, queuing request...")
+        thread.join(self.startup_wait_seconds if timeout is None else timeout)
+        return self.ready.is_set()
+    
     def stop(self):
         """Node.jsエージェントサーバーを停止"""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
-            self.process = None
-            logger.info("Mastra agent server stopped")
+        self.supervisor.stop()
+        self.ready.clear()
+        logger.info("Mastra agent server stopped")
     
     def is_running(self) -> bool:
-        """サーバーが実行中かチェック"""
+        """いずれかのサーバーが実行中かチェック"""
+        return any(instance.check_health() for instance in self.supervisor.instances)
+    
+    @staticmethod
+    def _affinity(user_id: str, instance: AgentInstance) -> int:
+        """ユーザーとインスタンスの組み合わせの重み（Rendezvous hashing）"""
+        digest = hashlib.blake2b(f"{user_id}:{instance.port}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+    
+    def _select_instance(self, healthy: List[AgentInstance], user_id: Optional[str]) -> AgentInstance:
+        """送信先を選択（ユーザー単位で固定しつつ、偏った場合は未処理数が最小のインスタンスへ）"""
+        least = min(instance.outstanding for instance in healthy)
+        if user_id:
+            # ユーザーごとに同じインスタンスへ送り、MCP・エージェントのキャッシュを活かす
+            preferred = max(healthy, key=lambda instance: self._affinity(user_id, instance))
+            if preferred.outstanding <= least + self.sticky_slack:
+                return preferred
+        
+        candidates = [instance for instance in healthy if instance.outstanding == least]
+        return candidates[next(self._round_robin) % len(candidates)]
+    
+    @contextmanager
+    def _lease_instance(self, user_id: Optional[str] = None) -> Iterator[Optional[AgentInstance]]:
+        """リクエストの送信先インスタンスを確保し、完了まで未処理数に計上"""
+        self.wait_until_ready()
+        with self._balance_lock:
+            healthy = self.supervisor.healthy_instances()
+            instance = self._select_instance(healthy, user_id) if healthy else None
+            if instance is not None:
+                instance.outstanding += 1
         try:
-            response = requests.get(f"{self.base_url}/api/health", timeout=2)
-            return response.status_code == 200
-        except:
-            return False
+            yield instance
+        finally:
+            if instance is not None:
+                with self._balance_lock:
+                    instance.outstanding -= 1
     
-    def search(self, message: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
-        """検索リクエストを送信"""
+    def search(self, message: str, thread_id: Optional[str] = None, memory: Optional[str] = None) -> Dict[str, Any]:
+        """検索リクエストを送信（memory="agent" の場合はエージェント側のスレッド記憶を使用）"""
+        if not self.breaker.allow():
+            logger.warning("[MastraBridge] ⚡ Circuit open, skipping agent request")
+            return {"error": "エージェントサーバーに接続できません"}
+        
+        timeout = self.timeout.current()
+        started = time.monotonic()
+        failed = True
         try:
             logger.info(f"[MastraBridge] Starting search request for message: {message[:50]}...")
             
-            if not self.is_running():
-                logger.error("[MastraBridge] Mastra agent server is not running")
-                logger.info("[MastraBridge] Attempting to restart the server...")
-                if not self.start():
-                    return {"error": "エージェントサーバーの起動に失敗しました"}
-            
             payload = {
                 "message": message,
                 "threadId": thread_id
             }
+            if memory:
+                payload["memory"] = memory
             
-            logger.info(f"[MastraBridge] Sending POST request to {self.base_url}/api/agent/search")
-            logger.info(f"[MastraBridge] Payload: {payload}")
-            
-            response = requests.post(
-                f"{self.base_url}/api/agent/search",
-                json=payload,
-                timeout=60  # より長いタイムアウトに変更
-            )
+            with self._lease_instance() as instance:
+                if instance is None:
+                    logger.error("[MastraBridge] Mastra agent server is not running")
+                    return {"error": "エージェントサーバーに接続できません"}
+                
+                logger.info(f"[MastraBridge] Sending POST request to {instance.base_url}/api/agent/search")
+                logger.info(f"[MastraBridge] Payload: {payload}")
+                
+                try:
+                    response = requests.post(
+                        f"{instance.base_url}/api/agent/search",
+                        json=payload,
+                        timeout=timeout
+                    )
+                except requests.exceptions.ConnectionError:
+                    self.supervisor.mark_unhealthy(instance)
+                    raise
             
             logger.info(f"[MastraBridge] Response status: {response.status_code}")
+            failed = is_agent_failure(response.status_code, response.text)
             
             if response.status_code == 200:
+                self.timeout.observe(time.monotonic() - started)
                 result = response.json()
                 logger.info(f"[MastraBridge] Success! Response: {result.get('response', '')[:100]}...")
                 return result
@@ -137,8 +553,8 @@ class MastraBridge:
                 return {"error": error_msg}
                 
         except requests.exceptions.Timeout:
-            logger.error("[MastraBridge] Request timeout after 60 seconds")
-            return {"error": "リクエストがタイムアウトしました（60秒）"}
+            logger.error(f"[MastraBridge] Request timeout after {timeout:.0f} seconds")
+            return {"error": f"リクエストがタイムアウトしました（{timeout:.0f}秒）"}
         except requests.exceptions.ConnectionError as e:
             logger.error(f"[MastraBridge] Connection error: {e}")
             return {"error": "エージェントサーバーに接続できません"}
@@ -146,41 +562,157 @@ class MastraBridge:
             logger.error(f"[MastraBridge] Error calling Mastra agent: {e}")
             logger.error(f"[MastraBridge] Exception type: {type(e).__name__}")
             return {"error": str(e)}
+        finally:
+            self.breaker.record(failed)
+    
+    def search_with_payload(
+        self,
+        payload: Dict[str, Any],
+        fingerprint: Optional[str] = None,
+        has_history: bool = False
+    ) -> Dict[str, Any]:
+        """ペイロード付き検索リクエストを送信（新しいサーバーAPI対応）
+        
+        会話履歴を持たないリクエストは、正規化したメッセージとツール識別子（fingerprint、
+        未指定時はユーザーID）が同じ実行中の呼び出しに相乗りし、1回のエージェント呼び出しの結果を共有する。
+        エージェント側のスレッド記憶を使う場合（memory="agent"）、相乗りしたスレッドにも応答を記録する
+        （recordTurn=False の場合は、呼び出し元が応答の投稿を確定してから record_turn で記録する）。
+        """
+        if payload.get('context') or has_history:
+            return self._send_search_request(payload)
+        
+        key = (
+            normalize_message(payload.get('message', '')),
+            fingerprint if fingerprint is not None else payload.get('userId'),
+        )
+        result, shared = self.single_flight.do(key, lambda: self._send_search_request(payload, key))
+        
+        thread_id = payload.get('threadId')
+        if (shared and payload.get('memory') == 'agent' and payload.get('recordTurn', True) and thread_id
+                and "error" not in result and result.get('threadId') != thread_id):
+            self.record_turn(thread_id, payload.get('message', ''), result.get('response', ''), payload.get('userId'))
+        return result
     
-    def search_with_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """ペイロード付き検索リクエストを送信（新しいサーバーAPI対応）"""
+    def record_turn(self, thread_id: str, message: str, response: str, user_id: Optional[str] = None) -> bool:
+        """エージェント側のスレッド記憶に1往復分の会話を記録"""
+        payload = {"threadId": thread_id, "message": message, "response": response}
+        try:
+            with self._lease_instance(user_id) as instance:
+                if instance is None:
+                    return False
+                status, _, error = self._post(instance, "recordTurn", "/api/agent/threads/turns", payload, timeout=10)
+        except Exception as e:
+            logger.warning(f"[MastraBridge] Failed to record thread turn for {thread_id}: {e}")
+            return False
+        if status != 200:
+            logger.warning(f"[MastraBridge] Failed to record thread turn for {thread_id}: HTTP {status} {error}")
+        return status == 200
+    
+    def cancel(self, request_id: str) -> bool:
+        """送信済みのリクエストの取り消しをエージェントサーバーに依頼（取り消せた場合はTrue）
+
+        他の呼び出し元が相乗りしている場合は、その呼び出し元のために実行を続ける。
+        """
+        with self._balance_lock:
+            sent = self._sent_requests.get(request_id)
+        if sent is None:
+            return False
+        instance, key = sent
+        if key is not None and self.single_flight.waiters(key) > 1:
+            logger.info(f"[MastraBridge] Request {request_id} is shared with other callers, not cancelling")
+            return False
+        try:
+            status, body, _ = self._post(instance, "cancel", "/api/agent/cancel", {"requestId": request_id}, timeout=5)
+        except Exception as e:
+            logger.warning(f"[MastraBridge] Failed to cancel request {request_id}: {e}")
+            return False
+        return status == 200 and bool(body.get("cancelled"))
+
+    def prewarm(self, user_id: str, refresh: bool = False) -> bool:
+        """質問が届く前に、ユーザーの準備（トークン取得・MCPサーバーの起動・ツール一覧の取得）を依頼（完了は待たない）
+
+        質問と同じインスタンスで準備されるよう、ユーザーの担当インスタンスに送る。
+        起動中・遮断中は送らない。refresh=True はトークンが変わった場合（OAuthの接続直後）で、準備をやり直させる。
+        """
+        if not user_id or not self.ready.is_set() or self.breaker.state != CLOSED:
+            return False
+        now = time.monotonic()
+        with self._balance_lock:
+            last = self._prewarmed.get(user_id)
+            if not refresh and last is not None and now - last < self.prewarm_interval:
+                return False
+            self._prewarmed[user_id] = now
+            if len(self._prewarmed) > 10000:
+                self._prewarmed = {
+                    user: at for user, at in self._prewarmed.items() if now - at < self.prewarm_interval
+                }
+            healthy = self.supervisor.healthy_instances()
+        if not healthy:
+            return False
+        
+        instance = max(healthy, key=lambda candidate: self._affinity(user_id, candidate))
+        payload = {"userId": user_id, "refresh": refresh}
+        try:
+            status, body, error = self._post(instance, "prewarm", "/api/agent/prewarm", payload, timeout=2)
+        except Exception as e:
+            logger.debug(f"[MastraBridge] Failed to prewarm user {user_id}: {e}")
+            return False
+        if status != 200:
+            logger.warning(f"[MastraBridge] Failed to prewarm user {user_id}: HTTP {status} {error}")
+            return False
+        metrics.increment("agent.prewarm")
+        logger.debug(f"[MastraBridge] Prewarm for user {user_id}: {body.get('state')}")
+        return True
+
+    def _send_search_request(self, payload: Dict[str, Any], key: Optional[Hashable] = None) -> Dict[str, Any]:
+        """エージェントサーバーに検索リクエストを送信（遮断中は送信せずに失敗させる）"""
+        if not self.breaker.allow():
+            logger.warning("[MastraBridge] ⚡ Circuit open, skipping agent request")
+            return {"error": "エージェントサーバーに接続できません"}
+        
+        timeout = self.timeout.current()
+        started = time.monotonic()
+        failed = True
         try:
             message = payload.get('message', '')
             logger.info(f"[MastraBridge] Starting enhanced search request: {message[:50]}...")
             
-            if not self.is_running():
-                logger.warning("[MastraBridge] Server not running, attempting restart...")
-                if not self.start():
-                    return {"error": "エージェントサーバーの起動に失敗しました"}
-            
-            logger.debug(f"[MastraBridge] Sending enhanced request to {self.base_url}/api/agent/search")
+            with self._lease_instance(payload.get('userId')) as instance:
+                if instance is None:
+                    logger.warning("[MastraBridge] No healthy agent server available")
+                    return {"error": "エージェントサーバーに接続できません"}
+                
+                request_id = payload.get('requestId')
+                if request_id:
+                    with self._balance_lock:
+                        self._sent_requests[request_id] = (instance, key)
+                try:
+                    status, result, full_error = self._post(
+                        instance, "search", "/api/agent/search", payload, timeout=timeout
+                    )
+                finally:
+                    if request_id:
+                        with self._balance_lock:
+                            self._sent_requests.pop(request_id, None)
             
-            response = requests.post(
-                f"{self.base_url}/api/agent/search",
-                json=payload,
-                timeout=60
-            )
+            logger.debug(f"[MastraBridge] Response status: {status}")
+            failed = is_agent_failure(status, full_error)
             
-            logger.debug(f"[MastraBridge] Response status: {response.status_code}")
+            if status == CANCELLED_STATUS:
+                logger.info(f"[MastraBridge] Request {payload.get('requestId')} was cancelled")
+                return {"error": "cancelled", "cancelled": True}
             
-            if response.status_code == 200:
-                result = response.json()
+            if status == 200:
+                self.timeout.observe(time.monotonic() - started)
                 response_text = result.get('response', '')
                 logger.info(f"[MastraBridge] ✅ Enhanced response generated ({len(response_text)} chars)")
                 return result
             else:
-                # エラーメッセージ全体を取得
-                full_error = response.text
-                error_msg = f"HTTP {response.status_code}: {full_error}"
+                error_msg = f"HTTP {status}: {full_error}"
                 logger.error(f"[MastraBridge] ❌ Full error: {error_msg}")
                 
                 # レート制限エラーの場合は特別な処理
-                if "rate limit" in full_error.lower():
+                if is_rate_limit_error(full_error):
                     return {
                         "error": "APIレート制限に達しました。しばらく待ってから再度お試しください。",
                         "details": full_error
@@ -189,14 +721,60 @@ class MastraBridge:
                 return {"error": f"エラー: {error_msg}"}
                 
         except requests.exceptions.Timeout:
-            logger.error("[MastraBridge] ❌ Request timeout after 60 seconds")
-            return {"error": "リクエストがタイムアウトしました（60秒）"}
+            logger.error(f"[MastraBridge] ❌ Request timeout after {timeout:.0f} seconds")
+            return {"error": f"リクエストがタイムアウトしました（{timeout:.0f}秒）"}
         except requests.exceptions.ConnectionError:
             logger.error("[MastraBridge] ❌ Connection error")
             return {"error": "エージェントサーバーに接続できません"}
         except Exception as e:
             logger.error(f"[MastraBridge] ❌ Enhanced search error: {type(e).__name__}: {e}")
             return {"error": f"予期しないエラー: {str(e)}"}
+        finally:
+            self.breaker.record(failed)
+
+    def _post(
+        self,
+        instance: AgentInstance,
+        method: str,
+        path: str,
+        payload: Dict[str, Any],
+        timeout: float = 60
+    ) -> Tuple[int, Dict[str, Any], str]:
+        """エージェントサーバーへリクエストを送信し (ステータス, 応答本体, エラー本文) を返す
+        
+        IPCが有効な場合はUnixドメインソケットで送信し、接続できない場合はHTTPにフォールバックする。
+        """
+        if instance.ipc is not None:
+            try:
+                if method == "search":
+                    status, body = instance.ipc.search(payload, timeout=timeout)
+                else:
+                    reply = instance.ipc.request(method, payload, timeout=timeout)
+                    status, body = reply.get("status", 500), reply.get("body") or {}
+                return status, body, json.dumps(body, ensure_ascii=False)
+            except TimeoutError as e:
+                raise requests.exceptions.Timeout(str(e)) from e
+            except (ConnectionError, OSError) as e:
+                logger.debug(f"[MastraBridge] IPC unavailable on port {instance.port}, falling back to HTTP: {e}")
+                metrics.increment("ipc.fallback_http")
+        
+        logger.debug(f"[MastraBridge] Sending request to {instance.base_url}{path}")
+        try:
+            response = requests.post(f"{instance.base_url}{path}", json=payload, timeout=timeout)
+        except requests.exceptions.ConnectionError:
+            self.supervisor.mark_unhealthy(instance)
+            raise
+        
+        if response.status_code == 200:
+            return 200, response.json(), ""
+        return response.status_code, {}, response.text
 
 # グローバルインスタンス
-mastra_bridge = MastraBridge()
\ No newline at end of file
+mastra_bridge = MastraBridge()
+metrics.register_gauge("bridge.in_flight_keys", mastra_bridge.single_flight.in_flight)
+metrics.register_gauge("bridge.breaker", mastra_bridge.breaker.snapshot)
+metrics.register_gauge("bridge.timeout_seconds", mastra_bridge.timeout.current)
+metrics.register_gauge("bridge.healthy_instances", lambda: len(mastra_bridge.supervisor.healthy_instances()))
+metrics.register_gauge("bridge.outstanding", lambda: {
+    instance.port: instance.outstanding for instance in mastra_bridge.supervisor.instances
+})
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+メッセージルーターの実装
+受信メッセージを1回のパターン照合で意図（インテント）に分類し、優先度付きでディスパッチ先を決定
+
+ローカルで完結するインテント（挨拶・時刻・ヘルプなど）は、メッセージ全体がキーワード
+（前後の「今」「を教えて」「please」・句読点・メンションは許容）の場合のみ該当とする。
+「この作業の時間を見積もって」のような会話の一部に含まれるキーワードでは定型文を返さない。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    keywords: Tuple[str, ...]
+    priority: int  # 小さいほど優先
+    local: bool = True  # True: ローカルで完結（Redis・スレッド記憶・エージェントを使わない）
+
+# 既定のインテント定義（優先度順）
+DEFAULT_INTENTS: Tuple[Intent, ...] = (
+    Intent("search", ("search", "検索", "探して", "調べて", "さがして", "しらべて"), priority=10, local=False),
+    Intent("help", ("help", "ヘルプ", "助けて", "使い方"), priority=20),
+    Intent("good_morning", ("good morning", "おはようございます", "おはよう"), priority=30),
+    Intent("good_night", ("good night", "おやすみなさい", "おやすみ"), priority=30),
+    Intent("hello", ("hello", "こんにちは", "こんばんは"), priority=40),
+    Intent("time", ("time", "時間", "時刻", "何時"), priority=50),
+    Intent("joke", ("joke", "ジョーク", "冗談"), priority=60),
+)
+
+# ローカルインテントのキーワードの前後に許容する語句
+LOCAL_PREFIX = r"(?:今|いま)?"
+LOCAL_SUFFIX = r"(?:\s*(?:please|me|です(?:か)?|を?教えて(?:ください)?|ください|は))?"
+
+# 照合前に除くメンションと、前後の空白・句読点
+_MENTION = re.compile(r"<@[^>]+>")
+_EDGE_CHARACTERS = " \t\n\u3000!！?？。、.,…~〜"
+# これより長いメッセージはローカルインテントとの照合を省く（メンションを含めても収まる長さ）
+LOCAL_MAX_CHARS = 64
+
+class MessageRouter:
+    """全インテントのキーワードを1つの正規表現にまとめ、1パスで分類するクラス
+
+    ローカルインテントはメッセージ全体との照合（アンカー付きの正規表現）で判定する。
+    """
+
+    def __init__(self, intents: Iterable[Intent] = DEFAULT_INTENTS):
+        self.intents: List[Intent] = sorted(intents, key=lambda intent: intent.priority)
+        self._by_keyword: Dict[str, Intent] = {}
+
+        for intent in self.intents:
+            for keyword in intent.keywords:
+                # 同じキーワードが複数インテントにある場合は優先度の高い方を採用
+                self._by_keyword.setdefault(keyword.lower(), intent)
+
+        # 長いキーワードを先に置き、「おはようございます」が「おはよう」に負けないようにする
+        keywords = sorted(self._by_keyword, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(keyword) for keyword in keywords if not self._by_keyword[keyword].local))
+        local_keywords = "|".join(re.escape(keyword) for keyword in keywords if self._by_keyword[keyword].local)
+        self.local_pattern = re.compile(f"{LOCAL_PREFIX}\\s*({local_keywords}){LOCAL_SUFFIX}") if local_keywords else None
+        remote = [intent for intent in self.intents if not intent.local]
+        self._top_priority = remote[0].priority if remote else None
+
+    def classify(self, text: Optional[str]) -> Optional[Intent]:
+        """テキストを分類し、最も優先度の高いインテントを返す（該当なしはNone）"""
+        if not text:
+            return None
+
+        text = text.lower()
+        best: Optional[Intent] = None
+        if self.pattern.pattern:
+            for keyword in self.pattern.findall(text):
+                intent = self._by_keyword[keyword]
+                if best is None or intent.priority < best.priority:
+                    best = intent
+                    # 最上位の優先度が見つかれば残りの照合は不要
+                    if best.priority == self._top_priority:
+                        return best
+
+        # ローカルインテントはメッセージ全体がキーワードの場合のみ
+        if self.local_pattern is not None and len(text) <= LOCAL_MAX_CHARS:
+            if "<@" in text:
+                text = _MENTION.sub("", text)
+            match = self.local_pattern.fullmatch(text.strip(_EDGE_CHARACTERS))
+            if match:
+                intent = self._by_keyword[match.group(1)]
+                if best is None or intent.priority < best.priority:
+                    best = intent
+        return best
+
+# グローバルインスタンス
+message_router = MessageRouter()
@@ -0,0 +1,55 @@
+"""
+プロセス内メトリクスの実装
+カウンターとゲージ（取得時に評価される関数）をスレッドセーフに管理
+"""
+
+import threading
+from typing import Any, Callable, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Metrics:
+    """カウンターとゲージを保持するシンプルなレジストリ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+
+    def increment(self, name: str, value: int = 1):
+        """カウンターを加算"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name: str) -> int:
+        """カウンターの現在値を取得"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def register_gauge(self, name: str, func: Callable[[], Any]):
+        """スナップショット時に評価されるゲージを登録"""
+        with self._lock:
+            self._gauges[name] = func
+
+    def snapshot(self) -> Dict[str, Any]:
+        """全カウンターとゲージの現在値を取得"""
+        with self._lock:
+            result: Dict[str, Any] = dict(self._counters)
+            gauges = list(self._gauges.items())
+
+        for name, func in gauges:
+            try:
+                result[name] = func()
+            except Exception as e:
+                logger.warning(f"[Metrics] Gauge {name} failed: {e}")
+                result[name] = None
+        return result
+
+    def reset(self):
+        """カウンターをリセット（ベンチマーク用）"""
+        with self._lock:
+            self._counters.clear()
+
+# グローバルインスタンス
+metrics = Metrics()
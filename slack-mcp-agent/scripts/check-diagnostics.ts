@@ -0,0 +1,92 @@
+// 診断用エンドポイント（/debug/*）で使う処理の検証スクリプト（オフライン、MCPサーバー・Redisは使わない）
+//   - メモリ・子プロセス・レート制限の取得が定期的な取得（10秒ごと）に耐える時間で終わること（所要時間を表示）
+//   - 子プロセスの一覧に孫プロセス（npx の先で起動するMCPサーバーに相当）が含まれ、終了後は消えること
+//   - ヒープのサンプリングで、オブジェクトを確保し続けている関数が上位に出ること
+//   - サンプリング・スナップショットは同時に1つまでであること
+// を確認する
+//
+// 使用方法: npm run check:diagnostics
+
+import assert from 'node:assert/strict';
+import { spawn } from 'node:child_process';
+import fs from 'node:fs';
+import {
+  childProcesses, DiagnosticsBusyError, eventLoopDelay, memorySnapshot, sampleHeapAllocations, writeHeapSnapshot
+} from '../src/utils/diagnostics';
+import { RateLimiter } from '../src/utils/rate-limiter';
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// 定期的な取得1回あたりの処理時間の上限
+const SCRAPE_BUDGET_MS = 20;
+
+function timeMs(task: () => unknown, iterations: number): number {
+  const started = process.hrtime.bigint();
+  for (let i = 0; i < iterations; i++) task();
+  return Number(process.hrtime.bigint() - started) / 1e6 / iterations;
+}
+
+// サンプリング中にオブジェクトを確保し続ける（上位に出ることを確認する関数）
+const retained: string[][] = [];
+function leakyAllocator() {
+  retained.push(Array.from({ length: 2000 }, (_, i) => `leak-${retained.length}-${i}`));
+}
+
+async function main() {
+  // 子プロセスと孫プロセス
+  const child = spawn('sh', ['-c', 'sleep 30 & wait'], { stdio: 'ignore' });
+  await sleep(200);
+  const processes = childProcesses();
+  assert.ok(processes, '/proc is available');
+  const mine = processes!.filter((info) => info.pid === child.pid || info.ppid === child.pid);
+  assert.ok(mine.some((info) => info.pid === child.pid), 'the direct child is listed');
+  assert.ok(mine.some((info) => info.ppid === child.pid && info.command === 'sleep'), 'the grandchild is listed');
+
+  // 定期的な取得の処理時間
+  const limiter = new RateLimiter();
+  await limiter.checkAndWait(1000);
+  const costs = {
+    memory: timeMs(memorySnapshot, 200),
+    children: timeMs(childProcesses, 200),
+    eventLoop: timeMs(eventLoopDelay, 200),
+    rateLimiter: timeMs(() => limiter.snapshot(), 200)
+  };
+  console.log('scrape cost per call (ms):', Object.fromEntries(Object.entries(costs).map(([key, value]) => [key, value.toFixed(3)])));
+  for (const [name, cost] of Object.entries(costs)) {
+    assert.ok(cost < SCRAPE_BUDGET_MS, `${name} is cheap enough to scrape every 10s`);
+  }
+  const window = limiter.snapshot();
+  assert.equal(window.tokenCount, 1000);
+  assert.ok(window.windowRemainingMs > 0 && window.windowRemainingMs <= window.windowMs);
+
+  child.kill();
+  const grandchild = mine.find((info) => info.ppid === child.pid)!;
+  process.kill(grandchild.pid);
+  await sleep(200);
+  const after = childProcesses()!;
+  assert.ok(!after.some((info) => info.pid === child.pid || info.pid === grandchild.pid), 'exited processes are gone');
+
+  // ヒープのサンプリング
+  const timer = setInterval(leakyAllocator, 10);
+  const sampling = sampleHeapAllocations(1000, 10);
+  await assert.rejects(writeHeapSnapshot(), DiagnosticsBusyError, 'one heap operation at a time');
+  const profile = await sampling;
+  clearInterval(timer);
+  console.log('top allocators:', profile.top.slice(0, 3).map((entry) => `${entry.function} ${entry.location} ${entry.bytes}B`));
+  assert.ok(profile.totalBytes > 0);
+  assert.ok(profile.top.slice(0, 5).some((entry) => entry.function === 'leakyAllocator' || entry.location.includes('check-diagnostics')),
+    'the allocating function is among the top allocators');
+
+  // ヒープスナップショット
+  const snapshot = await writeHeapSnapshot(fs.mkdtempSync('/tmp/agent-debug-'));
+  console.log(`heap snapshot: ${snapshot.bytes} bytes in ${snapshot.elapsedMs}ms`);
+  assert.ok(snapshot.bytes > 0);
+  fs.rmSync(snapshot.path);
+
+  console.log('✅ diagnostics checks passed');
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -0,0 +1,163 @@
+// Notionローカルインデックスの差分同期の検証スクリプト（オフライン、Notion APIは呼ばない）
+// プロセス内の偽Notion API（/v1/search と /v1/blocks/{id}/children）に対して同期を実行し、
+//   - 初回同期で全ページが取り込まれ、日本語の語句で検索できること
+//   - 2回目以降の同期では編集されたページの本文だけを取り直すこと
+//   - ゴミ箱に移動したページがインデックスから削除されること
+// を確認する
+//
+// 使用方法: npm run check:notion-index
+
+import assert from 'node:assert/strict';
+import { mkdtempSync, rmSync } from 'node:fs';
+import { createServer } from 'node:http';
+import type { AddressInfo } from 'node:net';
+import { tmpdir } from 'node:os';
+import { join } from 'node:path';
+import { NotionLocalIndex } from '../src/notion/local-index';
+import { NotionIndexSyncer } from '../src/notion/sync';
+
+interface FakePage {
+  id: string;
+  title: string;
+  body: string[];
+  lastEditedTime: string;
+  inTrash?: boolean;
+}
+
+const PAGE_COUNT = 120;
+const pages = new Map<string, FakePage>();
+for (let i = 0; i < PAGE_COUNT; i++) {
+  const id = `page-${String(i).padStart(3, '0')}`;
+  pages.set(id, {
+    id,
+    title: `週次定例 議事録 ${i}`,
+    body: [`第${i}回の議題は予算の確認です。`, `担当者 ${i % 7} がフォローします。`],
+    lastEditedTime: new Date(Date.UTC(2024, 0, 1, 0, i)).toISOString()
+  });
+}
+const blockRequests: string[] = [];
+
+function pageObject(page: FakePage) {
+  return {
+    object: 'page',
+    id: page.id,
+    url: `https://www.notion.so/${page.id}`,
+    last_edited_time: page.lastEditedTime,
+    in_trash: !!page.inTrash,
+    archived: !!page.inTrash,
+    properties: { Name: { type: 'title', title: [{ plain_text: page.title }] } }
+  };
+}
+
+function paginate<T>(items: T[], startCursor: string | undefined, pageSize: number) {
+  const start = startCursor ? Number(startCursor) : 0;
+  const next = start + pageSize;
+  return {
+    object: 'list',
+    results: items.slice(start, next),
+    has_more: next < items.length,
+    next_cursor: next < items.length ? String(next) : null
+  };
+}
+
+const server = createServer((req, res) => {
+  const url = new URL(req.url || '/', 'http://localhost');
+  let body = '';
+  req.on('data', (chunk) => (body += chunk));
+  req.on('end', () => {
+    res.setHeader('content-type', 'application/json');
+    if (req.method === 'POST' && url.pathname === '/v1/search') {
+      const params = JSON.parse(body || '{}');
+      const sorted = [...pages.values()].sort((a, b) => b.lastEditedTime.localeCompare(a.lastEditedTime));
+      res.end(JSON.stringify(paginate(sorted.map(pageObject), params.start_cursor, Math.min(params.page_size || 100, 100))));
+      return;
+    }
+    const match = url.pathname.match(/^\/v1\/blocks\/([^/]+)\/children$/);
+    if (req.method === 'GET' && match && pages.has(match[1])) {
+      blockRequests.push(match[1]);
+      const blocks = pages.get(match[1])!.body.map((text) => ({
+        type: 'paragraph',
+        paragraph: { rich_text: [{ plain_text: text }] }
+      }));
+      res.end(JSON.stringify(paginate(blocks, url.searchParams.get('start_cursor') || undefined, 100)));
+      return;
+    }
+    res.statusCode = 404;
+    res.end(JSON.stringify({ object: 'error', status: 404 }));
+  });
+});
+
+async function main() {
+  await new Promise<void>((resolve) => server.listen(0, '127.0.0.1', resolve));
+  const { port } = server.address() as AddressInfo;
+  const directory = mkdtempSync(join(tmpdir(), 'notion-index-'));
+  const index = new NotionLocalIndex(`file:${join(directory, 'index.db')}`);
+  const syncer = new NotionIndexSyncer(index, async () => 'offline-check', {
+    apiBaseUrl: `http://127.0.0.1:${port}/v1`
+  });
+
+  try {
+    // 初回同期
+    const first = await syncer.syncUser('U1');
+    assert.ok(first);
+    assert.equal(first.updated, PAGE_COUNT, 'initial sync indexes every page');
+    assert.equal(await index.pageCount('U1'), PAGE_COUNT);
+    console.log(`initial sync:     ${first.updated} pages, ${first.requests} API calls, ${first.durationMs} ms`);
+
+    const hits = await index.search('U1', '予算の確認 議事録 42');
+    assert.ok(hits.length > 0, 'search finds Japanese phrases');
+    assert.ok(hits.every((hit) => hit.url.startsWith('https://www.notion.so/')));
+    assert.deepEqual(await index.search('U2', '議事録'), [], 'other users see nothing');
+
+    // 変更なしの再同期（カーソルと同時刻のページだけを取り直す）
+    blockRequests.length = 0;
+    const unchanged = await syncer.syncUser('U1');
+    assert.ok(unchanged);
+    assert.ok(unchanged.updated <= 1, 'unchanged workspace refetches at most the cursor page');
+    console.log(`no-change resync: ${unchanged.updated} pages, ${unchanged.requests} API calls, ${unchanged.durationMs} ms`);
+
+    // 2ページを編集し、1ページをゴミ箱へ移動
+    const later = new Date(Date.UTC(2024, 1, 1)).toISOString();
+    pages.get('page-010')!.body = ['リリース手順を更新しました。'];
+    pages.get('page-010')!.lastEditedTime = later;
+    pages.get('page-020')!.title = '障害報告 ネットワーク';
+    pages.get('page-020')!.lastEditedTime = later;
+    pages.get('page-030')!.inTrash = true;
+    pages.get('page-030')!.lastEditedTime = later;
+
+    blockRequests.length = 0;
+    const incremental = await syncer.syncUser('U1');
+    assert.ok(incremental);
+    // 編集された2ページと、前回のカーソルと同時刻のページ（page-119）のみ
+    assert.deepEqual(new Set(blockRequests), new Set(['page-010', 'page-020', 'page-119']),
+      'only edited pages are refetched');
+    assert.equal(incremental.removed, 1);
+    assert.equal(await index.pageCount('U1'), PAGE_COUNT - 1, 'trashed page is removed');
+    console.log(`incremental sync: ${incremental.updated} pages, ${incremental.removed} removed, ` +
+      `${incremental.requests} API calls, ${incremental.durationMs} ms`);
+
+    assert.equal((await index.search('U1', 'リリース手順'))[0]?.id, 'page-010', 'edited body is searchable');
+    assert.equal((await index.search('U1', '障害報告'))[0]?.id, 'page-020', 'edited title is searchable');
+    assert.ok((await index.search('U1', '議事録 30')).every((hit) => hit.id !== 'page-030'));
+
+    const startedAt = process.hrtime.bigint();
+    const iterations = 200;
+    for (let i = 0; i < iterations; i++) {
+      await index.search('U1', `議事録 担当者 ${i % 7}`);
+    }
+    const perQueryMs = Number(process.hrtime.bigint() - startedAt) / 1e6 / iterations;
+    console.log(`local search:     ${perQueryMs.toFixed(2)} ms/query over ${PAGE_COUNT - 1} pages`);
+
+    console.log('✅ Notion local index syncs incrementally');
+  } finally {
+    syncer.stop();
+    index.close();
+    server.close();
+    rmSync(directory, { recursive: true, force: true });
+  }
+}
+
+main().catch((error) => {
+  console.error('❌ Notion local index check failed:', error.message);
+  process.exit(1);
+});
@@ -0,0 +1,108 @@
+// プロンプトプレフィックスの検証スクリプト（オフライン、Anthropic APIは呼ばない）
+// 記録用のfetchでエージェントが送信するリクエストを記録し、ターンをまたいで
+//   - ツール定義とシステムプロンプトがバイト単位で一致すること
+//   - 前のターンの会話履歴が次のターンのメッセージ列の先頭と一致すること
+//   - キャッシュブレークポイント（cache_control）が出力されていること
+// を確認する
+//
+// 使用方法: npm run check:prompt-prefix
+
+import assert from 'node:assert/strict';
+import { createAnthropic } from '@ai-sdk/anthropic';
+import { createTool } from '@mastra/core/tools';
+import { z } from 'zod';
+import { buildAssistantAgent } from '../src/mastra/agents/ai-assistant';
+import { BASE_INSTRUCTIONS, buildConversation, serviceInstructions } from '../src/mastra/prompt';
+import type { ThreadTurn } from '../src/utils/thread-store';
+
+const recorded: any[] = [];
+
+// Anthropic Messages APIの代わりに固定の応答を返すfetch
+const recordingFetch = async (_url: any, init?: any) => {
+  const body = JSON.parse(String(init?.body));
+  recorded.push(body);
+  return new Response(JSON.stringify({
+    id: `msg_${recorded.length}`,
+    type: 'message',
+    role: 'assistant',
+    model: body.model,
+    content: [{ type: 'text', text: `応答${recorded.length}` }],
+    stop_reason: 'end_turn',
+    stop_sequence: null,
+    usage: { input_tokens: 10, output_tokens: 5, cache_creation_input_tokens: 0, cache_read_input_tokens: 0 }
+  }), { status: 200, headers: { 'content-type': 'application/json' } });
+};
+
+function fakeTool(id: string) {
+  return createTool({
+    id,
+    description: `${id} のダミーツール`,
+    inputSchema: z.object({ query: z.string() }),
+    execute: async () => ({ ok: true })
+  });
+}
+
+// MCPサーバーは毎回異なる順序でツールを返すことがあるため、挿入順を変えて作成する
+function toolsInOrder(names: string[]) {
+  return Object.fromEntries(names.map((name) => [name, fakeTool(name)]));
+}
+
+const TOOL_ORDERS = [
+  ['notion_API-post-search', 'notion_API-retrieve-a-page', 'notion_API-post-database-query'],
+  ['notion_API-post-database-query', 'notion_API-post-search', 'notion_API-retrieve-a-page'],
+  ['notion_API-retrieve-a-page', 'notion_API-post-database-query', 'notion_API-post-search']
+];
+
+// cache_control の位置はターンごとに移動するため、履歴の比較では取り除く
+function withoutCacheControl(value: any): any {
+  return JSON.parse(JSON.stringify(value, (key, item) => (key === 'cache_control' ? undefined : item)));
+}
+
+async function main() {
+  const model = createAnthropic({ apiKey: 'offline-check', fetch: recordingFetch as any })('claude-sonnet-4-20250514');
+  const service = serviceInstructions(['notion'], true);
+  const history: ThreadTurn[] = [];
+
+  for (const [turn, order] of TOOL_ORDERS.entries()) {
+    // 実際のサーバーと同じく、リクエストごとにエージェントを作成する
+    const agent = buildAssistantAgent({
+      name: 'AI Assistant',
+      description: 'Notion情報検索アシスタント',
+      instructions: BASE_INSTRUCTIONS,
+      service,
+      model,
+      tools: toolsInOrder(order)
+    });
+    const message = `質問${turn + 1}`;
+    const result = await agent.generate(buildConversation({ history, service, message }), { threadId: 'check' });
+    const timestamp = Date.now();
+    history.push({ role: 'user', content: message, timestamp }, { role: 'assistant', content: result.text, timestamp });
+  }
+
+  assert.equal(recorded.length, TOOL_ORDERS.length, 'one request per turn');
+
+  for (let i = 1; i < recorded.length; i++) {
+    const previous = recorded[i - 1];
+    const current = recorded[i];
+    assert.equal(JSON.stringify(current.tools), JSON.stringify(previous.tools), `tools differ at turn ${i + 1}`);
+    assert.equal(JSON.stringify(current.system), JSON.stringify(previous.system), `system differs at turn ${i + 1}`);
+
+    // 前のターンで送った履歴（最後の新しい発言を除く）は次のターンの先頭と一致する
+    const previousHistory = withoutCacheControl(previous.messages.slice(0, -1));
+    const currentPrefix = withoutCacheControl(current.messages.slice(0, previousHistory.length));
+    assert.deepEqual(currentPrefix, previousHistory, `history prefix differs at turn ${i + 1}`);
+  }
+
+  const system = recorded[0].system;
+  assert.ok(Array.isArray(system) && system[system.length - 1].cache_control, 'system prompt has a cache breakpoint');
+  const lastHistory = recorded[recorded.length - 1].messages.at(-2);
+  assert.ok(JSON.stringify(lastHistory).includes('cache_control'), 'last history message has a cache breakpoint');
+
+  console.log(`✅ Prompt prefix is stable across ${recorded.length} turns`);
+  console.log(`   tools: ${recorded[0].tools.map((tool: any) => tool.name).join(', ')}`);
+}
+
+main().catch((error) => {
+  console.error('❌ Prompt prefix check failed:', error.message);
+  process.exit(1);
+});
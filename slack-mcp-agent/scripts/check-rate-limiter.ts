@@ -0,0 +1,51 @@
+// レート制限の予約（rate-limiter.ts）の検証スクリプト（オフライン、時刻は Date.now を差し替えて進める）
+//   - 取り消されたリクエストの予約は、予約した時間枠のうちであれば返却されること
+//   - 時間枠が切り替わった後の返却・実使用量の反映は、新しい時間枠の計上を減らさないこと
+// を確認する
+//
+// 使用方法: npm run check:rate-limiter
+
+import assert from 'node:assert/strict';
+import { RateLimiter } from '../src/utils/rate-limiter';
+
+const WINDOW_MS = 60 * 1000;
+
+async function main() {
+  const realNow = Date.now;
+  let now = realNow();
+  Date.now = () => now;
+  try {
+    const limiter = new RateLimiter();
+
+    // 同じ時間枠での返却
+    const cancelled = await limiter.checkAndWait(3000);
+    assert.equal(limiter.snapshot().tokenCount, 3000);
+    limiter.release(cancelled);
+    assert.equal(limiter.snapshot().tokenCount, 0, 'a reservation is released within its window');
+
+    // 予約の後に時間枠が切り替わり、新しい時間枠で別のリクエストが予約する
+    const stale = await limiter.checkAndWait(5000);
+    const staleUsage = await limiter.checkAndWait(4000);
+    now += WINDOW_MS + 1;
+    await limiter.checkAndWait(2000);
+    assert.equal(limiter.snapshot().tokenCount, 2000);
+    limiter.release(stale);
+    assert.equal(limiter.snapshot().tokenCount, 2000, 'a reservation from an expired window is not released');
+    limiter.recordUsage(staleUsage, { inputTokens: 100 });
+    assert.equal(limiter.snapshot().tokenCount, 2000, 'usage for an expired window does not change the new window');
+
+    // 同じ時間枠での実使用量の反映
+    const current = await limiter.checkAndWait(1000);
+    limiter.recordUsage(current, { inputTokens: 400, cacheCreationInputTokens: 100, cacheReadInputTokens: 900 });
+    assert.equal(limiter.snapshot().tokenCount, 2500, 'usage replaces the estimate within its window');
+  } finally {
+    Date.now = realNow;
+  }
+
+  console.log('✅ Rate limit reservations are released and adjusted only within their own window');
+}
+
+main().catch((error: any) => {
+  console.error('❌ Rate limiter check failed:', error.message);
+  process.exit(1);
+});
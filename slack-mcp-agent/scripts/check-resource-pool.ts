@@ -0,0 +1,139 @@
+// ユーザーごとの準備を保持するプール（事前準備）の検証スクリプト（オフライン、MCPサーバー・Redisは使わない）
+// 準備に一定時間かかる偽の読み込み関数で、
+//   - 同時の取得・事前準備中の取得は読み込みを1回にまとめること
+//   - 事前準備した場合、質問の到着から準備完了までの待ち時間が短くなること（待ち時間を表示）
+//   - 使用中は保持期間を過ぎても破棄せず、解放後に保持期間を過ぎたら破棄すること
+//   - refresh で読み込み直し、古い資源は使用中でなくなってから破棄すること
+//   - 読み込み結果が null・保持しない結果・失敗は保持しないこと
+//   - 保持数の上限を超えると使用中でない最も古いものから破棄すること
+// を確認する
+//
+// 使用方法: npm run check:resource-pool
+
+import assert from 'node:assert/strict';
+import { IdleResourcePool } from '../src/utils/resource-pool';
+
+// 準備にかかる時間（トークン取得・MCPサーバーの起動・ツール一覧の取得の代わり）
+const SETUP_MS = 300;
+// 事前準備の開始から質問の処理開始までの時間（ローディングメッセージの投稿・連投の集約待ちの代わり）
+const HEAD_START_MS = 200;
+
+interface FakeResources {
+  userId: string;
+  generation: number;
+  ok: boolean;
+}
+
+const loads: string[] = [];
+const disposed: string[] = [];
+let generation = 0;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function fakeLoad(userId: string): Promise<FakeResources | null> {
+  loads.push(userId);
+  await sleep(SETUP_MS);
+  if (userId.startsWith('no-token')) return null;
+  if (userId.startsWith('broken')) throw new Error('token store unavailable');
+  return { userId, generation: ++generation, ok: !userId.startsWith('partial') };
+}
+
+function createPool(options: { idleMs?: number; maxEntries?: number } = {}) {
+  return new IdleResourcePool<FakeResources>({
+    load: fakeLoad,
+    dispose: (value) => {
+      disposed.push(`${value.userId}#${value.generation}`);
+    },
+    keep: (value) => value.ok,
+    idleMs: options.idleMs ?? 60 * 1000,
+    maxEntries: options.maxEntries ?? 10,
+    sweepIntervalMs: 0
+  });
+}
+
+async function timeToReady(pool: IdleResourcePool<FakeResources>, userId: string): Promise<number> {
+  const started = Date.now();
+  await pool.get(userId);
+  return Date.now() - started;
+}
+
+async function main() {
+  const pool = createPool();
+
+  // 事前準備なし・あり・保持済みの待ち時間
+  const cold = await timeToReady(pool, 'U-cold');
+  pool.prewarm('U-warm');
+  await sleep(HEAD_START_MS);
+  const prewarmed = await timeToReady(pool, 'U-warm');
+  const warm = await timeToReady(pool, 'U-warm');
+  console.log(`time to ready: cold ${cold}ms, prewarmed ${HEAD_START_MS}ms ahead ${prewarmed}ms, warm ${warm}ms`);
+  assert.ok(prewarmed <= cold - HEAD_START_MS + 50, 'prewarming hides the head start from the setup time');
+  assert.ok(warm < 20, 'warm resources are returned without loading');
+  assert.deepEqual(loads, ['U-cold', 'U-warm'], 'the prewarmed load is reused by the request');
+
+  // 同時の取得は1回の読み込みにまとめる
+  loads.length = 0;
+  const results = await Promise.all([pool.get('U-burst'), pool.get('U-burst'), pool.get('U-burst')]);
+  assert.deepEqual(loads, ['U-burst'], 'concurrent gets share one load');
+  assert.ok(results.every((value) => value === results[0]));
+  assert.equal(pool.prewarm('U-burst'), 'warm');
+
+  // 使用中は保持期間を過ぎても破棄しない
+  const idlePool = createPool({ idleMs: 100 });
+  await idlePool.get('U-idle');
+  const release = idlePool.pin('U-idle');
+  await sleep(150);
+  assert.equal(idlePool.sweep(), 0, 'pinned resources are kept');
+  release();
+  assert.equal(idlePool.sweep(), 0, 'the idle time restarts at release');
+  await sleep(150);
+  assert.equal(idlePool.sweep(), 1, 'idle resources are disposed');
+  await sleep(0);
+  assert.ok(disposed.some((name) => name.startsWith('U-idle#')), 'the MCP server of idle resources is stopped');
+  assert.equal(idlePool.has('U-idle'), false);
+
+  // refresh で読み込み直し、古い資源は使用中でなくなってから破棄する
+  disposed.length = 0;
+  const before = await pool.get('U-refresh');
+  const releaseOld = pool.pin('U-refresh');
+  assert.equal(pool.prewarm('U-refresh', true), 'started');
+  const after = await pool.get('U-refresh');
+  assert.notEqual(before!.generation, after!.generation, 'refresh loads new resources');
+  await sleep(0);
+  assert.deepEqual(disposed, [], 'the old resources stay while in use');
+  releaseOld();
+  await sleep(0);
+  assert.deepEqual(disposed, [`U-refresh#${before!.generation}`], 'the old resources are disposed after release');
+
+  // トークンなし・保持しない結果・失敗は保持しない
+  loads.length = 0;
+  disposed.length = 0;
+  assert.equal(await pool.get('no-token'), null);
+  assert.equal((await pool.get('partial'))!.ok, false);
+  await assert.rejects(pool.get('broken'));
+  await pool.get('no-token');
+  await pool.get('partial');
+  await assert.rejects(pool.get('broken'));
+  assert.deepEqual(loads, ['no-token', 'partial', 'broken', 'no-token', 'partial', 'broken'], 'misses are not kept');
+  assert.equal(disposed.filter((name) => name.startsWith('partial')).length, 2, 'unkept results are disposed');
+
+  // 上限を超えると使用中でない最も古いものから破棄する
+  const smallPool = createPool({ maxEntries: 2 });
+  await smallPool.get('A');
+  const releaseA = smallPool.pin('A');
+  await smallPool.get('B');
+  await smallPool.get('C');
+  assert.equal(smallPool.has('A'), true, 'pinned resources are not evicted');
+  assert.equal(smallPool.has('B'), false, 'the least recently used idle resources are evicted');
+  assert.equal(smallPool.stats().evicted, 1);
+  releaseA();
+
+  console.log('stats:', JSON.stringify(pool.stats()));
+  await Promise.all([pool.close(), idlePool.close(), smallPool.close()]);
+  console.log('✅ resource pool checks passed');
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
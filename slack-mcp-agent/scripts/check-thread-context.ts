@@ -0,0 +1,82 @@
+// 会話履歴の差分送信（thread-context.ts）の検証スクリプト（オフライン、Python側と同じ単位・ハッシュであることを確認）
+// 日本語・絵文字（サロゲートペア・肌の色・ZWJ結合）を含むスレッドで、
+//   - Python側の agent_ipc.ContextSync が送る差分（UTF-8のバイト数とSHA-256）をそのまま適用して履歴を復元できること
+//     （期待値は Python で計算した値、benchmarks/bench_ipc.py の同じ履歴の確認と対になる）
+//   - 文字数（Python の len）や UTF-16 の長さ（JavaScript の length）の offset は一致しないものとして扱うこと
+//   - 長さが同じでも内容の異なる履歴（ハッシュの不一致）、ハッシュのない差分は適用しないこと
+//   - 先頭の発言が落ちた履歴（Python側は最新の一定件数のみ保持）は、落とすバイト数を受けて残りに続きを付け足すこと
+// を確認する
+//
+// 使用方法: npm run check:thread-context
+
+import assert from 'node:assert/strict';
+import { applyContextDelta, contextDigest } from '../src/utils/thread-context';
+
+const TURNS = [
+  'user: 議事録 👍🏽 を探して\n',
+  'assistant: 了解です 👨‍👩‍👧 🎉\n',
+  'user: 続きもお願いします 🙏\n'
+];
+
+// Python側で計算した、各ターンまでの履歴のUTF-8のバイト数とSHA-256
+const SYNCED = [
+  { bytes: 38, digest: '0da8e8571385377b94bfd32bf5c9df95e4862183f487e5a15ae6c24730ec803d' },
+  { bytes: 86, digest: '88ea33d3d88a98899c016d764291a5efc0573a9158a9fade37210a585c720870' }
+];
+// 保持分 T0+T1 から T0 を落とした残り（T1）のバイト数とSHA-256（新しい履歴は T1+T2）
+const TRIMMED = { drop: 38, bytes: 48, digest: 'cfc07aa5764074764b8de49647d6aa1cfe9a3d402f87353800bfd3b2fdfcc1c6' };
+
+function main() {
+  // 単位とハッシュがPython側と一致すること
+  let context = '';
+  for (const [index, synced] of SYNCED.entries()) {
+    context += TURNS[index];
+    assert.equal(Buffer.byteLength(context, 'utf8'), synced.bytes, `turn ${index + 1} is measured in UTF-8 bytes`);
+    assert.equal(contextDigest(context), synced.digest, `turn ${index + 1} digest matches Python`);
+  }
+  assert.notEqual(TURNS[0].length, SYNCED[0].bytes, 'UTF-16 length differs from the byte offset');
+
+  // Python側と同じ順序で差分を適用
+  const thread = '1700000000.000100';
+  assert.equal(applyContextDelta(thread, 0, TURNS[0], ''), TURNS[0]);
+  assert.equal(applyContextDelta(thread, SYNCED[0].bytes, TURNS[1], SYNCED[0].digest), TURNS[0] + TURNS[1]);
+  assert.equal(applyContextDelta(thread, SYNCED[1].bytes, TURNS[2], SYNCED[1].digest), TURNS.join(''),
+    'deltas after multibyte and emoji turns restore the full history');
+
+  // 文字数・UTF-16の長さの offset は不一致として扱い、全体の送り直し（409）を求める
+  const fresh = (id: string) => applyContextDelta(id, 0, TURNS[0], '');
+  fresh('code-points');
+  assert.equal(applyContextDelta('code-points', [...TURNS[0]].length, TURNS[1], SYNCED[0].digest), null,
+    'a code point offset is rejected');
+  fresh('utf-16');
+  assert.equal(applyContextDelta('utf-16', TURNS[0].length, TURNS[1], SYNCED[0].digest), null,
+    'a UTF-16 offset is rejected');
+
+  // 長さが同じで内容の異なる履歴（探→調、どちらも3バイト）
+  applyContextDelta('edited', 0, TURNS[0].replace('探', '調'), '');
+  assert.equal(applyContextDelta('edited', SYNCED[0].bytes, TURNS[1], SYNCED[0].digest), null,
+    'a different prefix of the same length is rejected by the digest');
+  fresh('no-digest');
+  assert.equal(applyContextDelta('no-digest', SYNCED[0].bytes, TURNS[1]), null, 'a delta without a digest is rejected');
+  // 不一致の後は保持内容を破棄し、全体の送り直しを受け付ける
+  assert.equal(applyContextDelta('edited', 0, TURNS[0] + TURNS[1], ''), TURNS[0] + TURNS[1]);
+
+  // 先頭の発言が落ちた履歴
+  assert.equal(applyContextDelta('trimmed', TRIMMED.bytes, TURNS[2], TRIMMED.digest, TRIMMED.drop), null,
+    'a trimmed delta for an unknown thread is rejected');
+  applyContextDelta('trimmed', 0, TURNS[0] + TURNS[1], '');
+  assert.equal(applyContextDelta('trimmed', TRIMMED.bytes, TURNS[2], TRIMMED.digest, TRIMMED.drop), TURNS[1] + TURNS[2],
+    'a dropped head is removed before the delta is appended');
+  applyContextDelta('mid-character', 0, TURNS[0] + TURNS[1], '');
+  assert.equal(applyContextDelta('mid-character', TRIMMED.bytes + 1, TURNS[2], TRIMMED.digest, TRIMMED.drop - 1), null,
+    'a drop that does not match the retained digest is rejected');
+
+  console.log('✅ Context deltas use UTF-8 byte offsets, dropped heads and SHA-256 digests shared with Python');
+}
+
+try {
+  main();
+} catch (error: any) {
+  console.error('❌ Thread context check failed:', error.message);
+  process.exit(1);
+}
@@ -0,0 +1,163 @@
+// ツール呼び出し結果キャッシュの検証スクリプト（オフライン、MCPサーバー・Notion APIは呼ばない）
+// Notion MCPツールと同じ形の結果を返す偽ツールをキャッシュで包み、
+//   - 同じ引数の読み取りは元のツールを呼ばずに返し、他のユーザーとは共有しないこと（引数のキー順・空白の違いは同一視）
+//   - 確認間隔を過ぎたページは last_edited_time の確認だけで再利用し、編集されていれば取り直すこと
+//   - last_edited_time（分単位）と同じ分のうちに取得した結果は、値が変わっていなくても取り直すこと
+//   - patch-page / post-page の実行で関連するページ・一覧の結果だけが破棄されること
+//   - 合計バイト数の上限を超えると古い結果から追い出されること
+// を確認する
+//
+// 使用方法: npm run check:tool-cache
+
+import assert from 'node:assert/strict';
+import { ToolResultCache, withToolCache, type FreshnessValidator } from '../src/utils/tool-cache';
+
+const pages = new Map<string, { title: string; lastEditedTime: string }>([
+  ['p1', { title: '週次定例', lastEditedTime: '2024-01-01T00:00:00.000Z' }],
+  ['p2', { title: 'リリース手順', lastEditedTime: '2024-01-02T00:00:00.000Z' }]
+]);
+const toolCalls: string[] = [];
+const validations: string[] = [];
+
+// Notion と同じく分単位に切り捨てた現在時刻
+function currentMinute(): string {
+  return new Date(Math.floor(Date.now() / 60_000) * 60_000).toISOString();
+}
+
+// MCPツールの結果と同じく、本文はJSON文字列で返す
+function mcpResult(body: any) {
+  return { content: [{ type: 'text', text: JSON.stringify(body) }] };
+}
+
+function pageBody(id: string) {
+  const page = pages.get(id)!;
+  return { object: 'page', id, last_edited_time: page.lastEditedTime, properties: { title: page.title } };
+}
+
+function fakeTool(name: string, run: (args: any) => any) {
+  return {
+    id: name,
+    description: `${name} の偽ツール`,
+    execute: async ({ context }: { context: any }) => {
+      toolCalls.push(name);
+      return run(context);
+    }
+  };
+}
+
+const MCP_TOOLS = {
+  'notion_API-retrieve-a-page': fakeTool('notion_API-retrieve-a-page', (args) => mcpResult(pageBody(args.page_id))),
+  'notion_API-post-search': fakeTool('notion_API-post-search', () =>
+    mcpResult({ object: 'list', results: [...pages.keys()].map(pageBody) })),
+  'notion_API-patch-page': fakeTool('notion_API-patch-page', (args) => {
+    pages.get(args.page_id)!.title = args.properties.title;
+    pages.get(args.page_id)!.lastEditedTime = currentMinute();
+    return mcpResult(pageBody(args.page_id));
+  }),
+  'notion_API-post-page': fakeTool('notion_API-post-page', () => {
+    pages.set('p3', { title: '新規ページ', lastEditedTime: currentMinute() });
+    return mcpResult(pageBody('p3'));
+  })
+};
+
+const validator: FreshnessValidator = async (_kind, id) => {
+  validations.push(id);
+  return pages.get(id)?.lastEditedTime ?? null;
+};
+
+function callsSince(start: number): string[] {
+  return toolCalls.slice(start);
+}
+
+async function main() {
+  // freshMs: 0 で毎回更新確認を行う
+  const cache = new ToolResultCache({ freshMs: 0, maxBytes: 1024 * 1024 });
+  const u1 = withToolCache(MCP_TOOLS, 'user:U1', validator, cache);
+  const u2 = withToolCache(MCP_TOOLS, 'user:U2', validator, cache);
+  const run = (tools: Record<string, any>, name: string, args: any) => tools[name].execute({ context: args });
+
+  // 同じ読み取りの繰り返し
+  let start = toolCalls.length;
+  await run(u1, 'notion_API-post-search', { query: '定例', page_size: 10 });
+  await run(u1, 'notion_API-post-search', { page_size: 10, query: ' 定例 ' });
+  await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p1' });
+  await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p1' });
+  assert.deepEqual(callsSince(start), ['notion_API-post-search', 'notion_API-retrieve-a-page'],
+    'repeated reads are served from the cache');
+  assert.deepEqual(validations, ['p1'], 'the page hit was revalidated by last_edited_time');
+
+  // 他のユーザーとは共有しない
+  start = toolCalls.length;
+  await run(u2, 'notion_API-retrieve-a-page', { page_id: 'p1' });
+  assert.deepEqual(callsSince(start), ['notion_API-retrieve-a-page'], 'scopes are isolated');
+
+  // Notion側で編集された場合は更新確認で検出して取り直す
+  pages.get('p1')!.lastEditedTime = '2024-03-01T00:00:00.000Z';
+  start = toolCalls.length;
+  const refreshed = await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p1' });
+  assert.deepEqual(callsSince(start), ['notion_API-retrieve-a-page'], 'edited page is refetched');
+  assert.ok(refreshed.content[0].text.includes('2024-03-01'));
+
+  // 取得と同じ分のうちの編集は last_edited_time が変わらない（Notion は分単位に切り捨てる）
+  pages.set('p4', { title: '議事録（下書き）', lastEditedTime: currentMinute() });
+  await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p4' });
+  pages.get('p4')!.title = '議事録（確定）';
+  start = toolCalls.length;
+  const sameMinute = await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p4' });
+  assert.deepEqual(callsSince(start), ['notion_API-retrieve-a-page'],
+    'a result fetched within the minute of its last_edited_time is refetched');
+  assert.ok(sameMinute.content[0].text.includes('（確定）'));
+  // その分を過ぎてから取得した結果は、同じ last_edited_time なら再利用する
+  pages.get('p4')!.lastEditedTime = new Date(Date.now() - 120_000).toISOString();
+  await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p4' });
+  start = toolCalls.length;
+  await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p4' });
+  assert.deepEqual(callsSince(start), [], 'a result fetched after that minute is revalidated');
+
+  // 書き込みで関連する結果を破棄
+  await run(u1, 'notion_API-patch-page', { page_id: 'p1', properties: { title: '週次定例（更新）' } });
+  start = toolCalls.length;
+  const afterPatch = await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p1' });
+  const searchAfterPatch = await run(u1, 'notion_API-post-search', { query: '定例', page_size: 10 });
+  assert.deepEqual(callsSince(start), ['notion_API-retrieve-a-page', 'notion_API-post-search'],
+    'patch-page invalidates the page and search results');
+  assert.ok(afterPatch.content[0].text.includes('（更新）'));
+  assert.ok(searchAfterPatch.content[0].text.includes('（更新）'));
+
+  // p1 は直前の編集と同じ分のうちに取得したため、無関係なページとしては p2 を使う
+  await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p2' });
+  start = toolCalls.length;
+  await run(u1, 'notion_API-post-page', { parent: { database_id: 'd1' }, properties: {} });
+  await run(u1, 'notion_API-post-search', { query: '定例', page_size: 10 });
+  await run(u1, 'notion_API-retrieve-a-page', { page_id: 'p2' });
+  assert.deepEqual(callsSince(start), ['notion_API-post-page', 'notion_API-post-search'],
+    'post-page invalidates search results but keeps unrelated pages');
+
+  const stats = cache.stats();
+  assert.ok(stats.invalidated >= 3);
+  console.log('stats:', stats);
+
+  // バイト数の上限によるLRU
+  const small = new ToolResultCache({ maxBytes: 4096, freshMs: 60_000 });
+  const bulky = withToolCache({
+    'notion_API-retrieve-a-page': fakeTool('notion_API-retrieve-a-page', (args) =>
+      mcpResult({ ...pageBody('p2'), id: args.page_id, padding: 'x'.repeat(200) }))
+  }, 'user:U1', validator, small);
+  for (let i = 0; i < 20; i++) {
+    await bulky['notion_API-retrieve-a-page'].execute({ context: { page_id: `bulk-${i}` } });
+  }
+  const bounded = small.stats();
+  assert.ok(bounded.bytes <= bounded.maxBytes && bounded.evicted > 0, 'entries are evicted by size');
+  start = toolCalls.length;
+  await bulky['notion_API-retrieve-a-page'].execute({ context: { page_id: 'bulk-19' } });
+  await bulky['notion_API-retrieve-a-page'].execute({ context: { page_id: 'bulk-0' } });
+  assert.deepEqual(callsSince(start), ['notion_API-retrieve-a-page'], 'least recently used entries go first');
+  console.log(`LRU: ${bounded.entries} entries, ${bounded.bytes}/${bounded.maxBytes} bytes, ${bounded.evicted} evicted`);
+
+  console.log('✅ Tool result cache serves repeats, revalidates pages and invalidates on writes');
+}
+
+main().catch((error) => {
+  console.error('❌ Tool cache check failed:', error.message);
+  process.exit(1);
+});
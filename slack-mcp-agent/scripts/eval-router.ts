@@ -0,0 +1,95 @@
+// 質問の振り分け（src/mastra/router.ts）の評価スクリプト（オフライン、モデルは呼ばない）
+// 正解ラベル付きの質問集に対して振り分け結果を集計し、
+//   - 段階ごとの混同行列と正解率
+//   - 通常モデルが必要な質問を下位に回した件数（小型モデルの ESCALATE 応答で取り直しになる）
+//   - 定型文で応答してはいけない質問を定型文に回した件数（0件であること）
+//   - 通常モデル（ツール付き）に送る入力トークンの見積もりを、全件を通常モデルで処理する場合と比較
+// を表示する
+//
+// 使用方法:
+//   npm run eval:router
+//   npm run eval:router -- --data scripts/data/router-eval.jsonl --min-confidence 0.7
+
+import { readFileSync } from 'node:fs';
+import { ROUTE_TIERS, routeMessage, type RouteTier } from '../src/mastra/router';
+
+interface LabeledMessage {
+  message: string;
+  label: RouteTier;
+  hasHistory?: boolean;
+}
+
+// 通常モデルで有効になるツール数の目安（検索 + 条件に応じて1〜2個）
+const FULL_TOOL_COUNT = 3;
+
+// RateLimiter.estimateTokens と同じ見積もり（1トークン≒4文字、ツール定義1個≒750トークン、余裕分500）
+function estimateTokens(message: string, toolCount: number): number {
+  return Math.ceil(message.length / 4) + toolCount * 750 + 500;
+}
+
+function option(name: string, fallback: string): string {
+  const index = process.argv.indexOf(`--${name}`);
+  return index >= 0 && process.argv[index + 1] ? process.argv[index + 1] : fallback;
+}
+
+function main() {
+  const path = option('data', 'scripts/data/router-eval.jsonl');
+  const minConfidence = Number(option('min-confidence', '0.6'));
+  const rows: LabeledMessage[] = readFileSync(path, 'utf8')
+    .split('\n')
+    .filter((line) => line.trim())
+    .map((line) => JSON.parse(line));
+
+  const matrix = Object.fromEntries(ROUTE_TIERS.map((label) => [label, { canned: 0, small: 0, full: 0 }])) as
+    Record<RouteTier, Record<RouteTier, number>>;
+  const underRouted: string[] = [];
+  const cannedMistakes: string[] = [];
+  let baselineTokens = 0;
+  let fullTokens = 0;
+  let smallTokens = 0;
+
+  for (const row of rows) {
+    const decision = routeMessage(row.message, { hasHistory: row.hasHistory }, minConfidence);
+    matrix[row.label][decision.tier]++;
+    baselineTokens += estimateTokens(row.message, FULL_TOOL_COUNT);
+
+    if (decision.tier === 'canned' && row.label !== 'canned') {
+      cannedMistakes.push(row.message);
+    }
+    if (decision.tier === 'small') {
+      smallTokens += estimateTokens(row.message, 0);
+    }
+    // 下位に回した通常モデル向けの質問は、小型モデルの切り替え要求後に通常モデルで処理される
+    if (decision.tier === 'full' || row.label === 'full') {
+      fullTokens += estimateTokens(row.message, FULL_TOOL_COUNT);
+    }
+    if (row.label === 'full' && decision.tier !== 'full') {
+      underRouted.push(`${row.message} → ${decision.tier} (${decision.predicted} ${decision.confidence.toFixed(2)})`);
+    }
+  }
+
+  const correct = ROUTE_TIERS.reduce((sum, tier) => sum + matrix[tier][tier], 0);
+  console.log(`dataset: ${path} (${rows.length} messages), min confidence ${minConfidence}`);
+  console.log(`\n${'label \\ routed'.padEnd(16)}${ROUTE_TIERS.map((tier) => tier.padStart(8)).join('')}`);
+  for (const label of ROUTE_TIERS) {
+    console.log(`${label.padEnd(16)}${ROUTE_TIERS.map((tier) => String(matrix[label][tier]).padStart(8)).join('')}`);
+  }
+  console.log(`\naccuracy: ${(correct / rows.length * 100).toFixed(1)}%`);
+  console.log(`over-routed (cheaper tier would do): ${
+    matrix.canned.small + matrix.canned.full + matrix.small.full}`);
+  console.log(`under-routed full questions (escalated by the small model): ${underRouted.length}`);
+  underRouted.forEach((line) => console.log(`  - ${line}`));
+  console.log(`canned replies to real questions: ${cannedMistakes.length}`);
+  cannedMistakes.forEach((line) => console.log(`  - ${line}`));
+
+  console.log(`\nestimated input tokens for the tool-equipped model:`);
+  console.log(`  always full: ${baselineTokens.toLocaleString()}`);
+  console.log(`  routed:      ${fullTokens.toLocaleString()} (${(100 - fullTokens / baselineTokens * 100).toFixed(1)}% less), ` +
+    `plus ${smallTokens.toLocaleString()} on the small model`);
+
+  if (cannedMistakes.length > 0) {
+    process.exit(1);
+  }
+}
+
+main();
@@ -0,0 +1,94 @@
+import net from 'node:net';
+import fs from 'node:fs';
+import { encode, decode } from './utils/msgpack';
+
+// バイナリIPCサーバー（Unixドメインソケット + 長さプレフィックス付きmsgpackフレーム）
+// 1つの接続上で複数のリクエストを多重化し、応答はリクエストIDで対応付ける
+
+export interface IPCReply {
+  status: number;
+  body: Record<string, any>;
+}
+
+export type IPCHandler = (method: string, params: any) => Promise<IPCReply>;
+
+const HEADER_BYTES = 4;
+const MAX_FRAME_BYTES = 16 * 1024 * 1024;
+
+function encodeFrame(message: Record<string, any>): Buffer {
+  const body = encode(message);
+  const header = Buffer.alloc(HEADER_BYTES);
+  header.writeUInt32BE(body.byteLength);
+  return Buffer.concat([header, body]);
+}
+
+export function startIPCServer(socketPath: string, handler: IPCHandler): net.Server {
+  // 前回のプロセスが残したソケットファイルを削除
+  if (fs.existsSync(socketPath)) {
+    fs.unlinkSync(socketPath);
+  }
+  
+  const server = net.createServer((socket) => {
+    let buffer = Buffer.alloc(0);
+    
+    const handleFrame = async (frame: Buffer) => {
+      let request: any;
+      try {
+        request = decode(frame);
+      } catch (error) {
+        console.error('[IPC] ❌ Invalid frame, closing connection:', error);
+        socket.destroy();
+        return;
+      }
+      
+      let reply: IPCReply;
+      try {
+        reply = await handler(request.method, request.params || {});
+      } catch (error: any) {
+        reply = {
+          status: 500,
+          body: {
+            error: 'エージェント処理中にエラーが発生しました',
+            details: error?.message || 'Unknown error'
+          }
+        };
+      }
+      
+      if (!socket.destroyed) {
+        socket.write(encodeFrame({ id: request.id, ...reply }));
+      }
+    };
+    
+    socket.on('data', (chunk: Buffer) => {
+      buffer = buffer.length ? Buffer.concat([buffer, chunk]) : chunk;
+      
+      while (buffer.length >= HEADER_BYTES) {
+        const length = buffer.readUInt32BE(0);
+        if (length > MAX_FRAME_BYTES) {
+          console.error(`[IPC] ❌ Frame too large (${length} bytes), closing connection`);
+          socket.destroy();
+          return;
+        }
+        if (buffer.length < HEADER_BYTES + length) break;
+        
+        const frame = buffer.subarray(HEADER_BYTES, HEADER_BYTES + length);
+        buffer = buffer.subarray(HEADER_BYTES + length);
+        void handleFrame(frame);
+      }
+    });
+    
+    socket.on('error', (error) => {
+      console.error('[IPC] Connection error:', error.message);
+    });
+  });
+  
+  server.listen(socketPath, () => {
+    console.log(`🔌 IPC endpoint: ${socketPath}`);
+  });
+  
+  server.on('error', (error) => {
+    console.error('[IPC] ❌ Failed to start IPC server:', error);
+  });
+  
+  return server;
+}
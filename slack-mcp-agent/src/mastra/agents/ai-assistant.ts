@@ -4,6 +4,14 @@ import { MCPClient } from "@mastra/mcp";
 import { OAuthTokenManager } from "../../oauth/token-manager";
 // import { createFileLogger } from "vibelogger";
 import { getToolConfigForMessage } from "../tool-config";
+import { BASE_INSTRUCTIONS, FALLBACK_INSTRUCTIONS, serviceInstructions, sortTools } from "../prompt";
+import { LIGHT_INSTRUCTIONS } from "../router";
+import { notionLocalIndexEnabled } from "../../notion/local-index";
+import { getNotionIndexSyncer } from "../../notion/sync";
+import { createNotionLocalSearchTool, NOTION_LOCAL_SEARCH_TOOL } from "../../notion/tool";
+import { createNotionValidator, toolCacheScope, withToolCache } from "../../utils/tool-cache";
+import { withAbortSignal } from "../../utils/cancellation";
+import { IdleResourcePool } from "../../utils/resource-pool";
 
 // vibeloggerの初期化（一時的に無効化）
 // const logger = createFileLogger("mastra_agent");
@@ -12,6 +20,148 @@ import { getToolConfigForMessage } from "../tool-config";
 const agentCache = new Map<string, { agent: Agent; timestamp: number }>();
 const CACHE_TTL = 60 * 60 * 1000; // 1時間
 
+// 接続中のユーザーごとのMCPクライアント数（診断用、起動して disconnect していないもの）
+let liveMcpClients = 0;
+
+// ユーザーごとの準備（トークン取得・MCPサーバーの起動・ツール一覧の取得）の結果
+export interface UserResources {
+  notionTokens: any;
+  mcp: MCPClient | null;
+  // MCPサーバーのツール一覧（取得に失敗した場合は null、その結果は保持しない）
+  allTools: Record<string, any> | null;
+}
+
+// トークンを取得してMCPサーバーを起動する（トークンがない場合は null）
+async function loadUserResources(userId: string): Promise<UserResources | null> {
+  const started = Date.now();
+  console.log(`[Agent] 🔍 Creating authenticated MCP client for user ${userId}`);
+  const tokenManager = new OAuthTokenManager();
+
+  // ユーザーのトークンを取得
+  const notionTokens = await tokenManager.getTokens(userId, 'notion');
+  console.log(`[Agent] 📊 Token retrieval result:`, {
+    hasTokens: !!notionTokens,
+    hasAccessToken: !!(notionTokens?.accessToken),
+    tokenLength: notionTokens?.accessToken ? notionTokens.accessToken.length : 0,
+    expiresAt: notionTokens?.expiresAt,
+    metadata: notionTokens?.metadata
+  });
+
+  if (!notionTokens || !notionTokens.accessToken) {
+    return null;
+  }
+
+  console.log(`[Agent] ✅ Found valid Notion tokens for user ${userId}`);
+  console.log(`[Agent] 🔑 Token details for MCP connection:`, {
+    tokenPrefix: notionTokens.accessToken.substring(0, 10) + '...',
+    tokenLength: notionTokens.accessToken.length,
+    workspaceId: notionTokens.metadata?.workspace_id,
+    workspaceName: notionTokens.metadata?.workspace_name
+  });
+
+  // 公式仕様に基づく正しい環境変数設定
+  const openApiHeaders = JSON.stringify({
+    "Authorization": `Bearer ${notionTokens.accessToken}`,
+    "Notion-Version": "2022-06-28"
+  });
+
+  const userMcp = new MCPClient({
+    id: `notion-mcp-${userId}-${Date.now()}`, // ユニークIDでMCPClient重複エラーを回避
+    servers: {
+      notion: {
+        command: "npx",
+        args: ["-y", "@notionhq/notion-mcp-server"],
+        env: {
+          OPENAPI_MCP_HEADERS: openApiHeaders
+        }
+      }
+    },
+    timeout: 60000
+  });
+  liveMcpClients++;
+
+  console.log(`[Agent] 🛠️ MCPClient created, attempting to get tools...`);
+
+  try {
+    // Mastraの推奨パターン：await mcp.getTools()
+    const allTools = await userMcp.getTools();
+    console.log(`[Agent] ⏱️ MCP tools for user ${userId} ready in ${Date.now() - started}ms (${Object.keys(allTools).length} tools)`);
+    return { notionTokens, mcp: userMcp, allTools };
+  } catch (toolsError: any) {
+    console.error(`[Agent] ❌ Failed to get MCP tools:`, toolsError);
+    console.error(`[Agent] 🔍 Error details:`, {
+      name: toolsError?.name || 'Unknown',
+      message: toolsError?.message || 'Unknown error',
+      stack: toolsError?.stack || 'No stack trace'
+    });
+    await disconnectUserMcp(userMcp).catch(() => {});
+    return { notionTokens, mcp: null, allTools: null };
+  }
+}
+
+async function disconnectUserMcp(client: MCPClient): Promise<void> {
+  try {
+    await client.disconnect();
+  } finally {
+    liveMcpClients--;
+  }
+}
+
+// 準備済みのMCPサーバーを短時間保持し、同じユーザーの次の質問・事前準備で再利用する
+// （以前はリクエストごとにMCPサーバーを起動し、終了させていなかった）
+export const userResources = new IdleResourcePool<UserResources>({
+  load: loadUserResources,
+  dispose: async (resources) => {
+    if (resources.mcp) {
+      await disconnectUserMcp(resources.mcp);
+    }
+  },
+  keep: (resources) => resources.allTools !== null,
+  idleMs: Number(process.env.AGENT_PREWARM_IDLE_SECONDS || 120) * 1000,
+  maxEntries: Number(process.env.AGENT_PREWARM_MAX_USERS || 20)
+});
+
+// 診断用: エージェントキャッシュの件数（期限切れで未使用のものを含む）と接続中のMCPクライアント数
+export function agentCacheStats() {
+  const now = Date.now();
+  let expired = 0;
+  for (const { timestamp } of agentCache.values()) {
+    if (now - timestamp >= CACHE_TTL) expired++;
+  }
+  return { size: agentCache.size, expired };
+}
+
+export function liveMcpClientCount(): number {
+  return liveMcpClients;
+}
+
+// エージェントごとの接続状況に応じた指示（生成時にキャッシュブレークポイント付きのシステムメッセージとして渡す）
+const agentServiceInstructions = new WeakMap<Agent, string>();
+
+export function getServiceInstructions(agent: Agent): string {
+  return agentServiceInstructions.get(agent) || '';
+}
+
+// プロンプトキャッシュが効くよう、固定の指示文と名前順のツール定義でエージェントを作成
+export function buildAssistantAgent(options: {
+  name: string;
+  description: string;
+  instructions: string;
+  service: string;
+  model: any;
+  tools: Record<string, any>;
+}): Agent {
+  const agent = new Agent({
+    name: options.name,
+    description: options.description,
+    instructions: options.instructions,
+    model: options.model,
+    tools: sortTools(options.tools)  // Mastraドキュメント準拠：エージェント作成時にツールを渡す
+  });
+  agentServiceInstructions.set(agent, options.service);
+  return agent;
+}
+
 // エージェントをMCPツールと共に作成する関数（Mastraドキュメント準拠）
 export async function createAIAssistant(userId?: string, message?: string) {
   // メッセージベースのキャッシュキーを生成（ツール設定が変わる可能性があるため）
@@ -21,7 +171,8 @@ export async function createAIAssistant(userId?: string, message?: string) {
   // キャッシュチェック
   if (userId && !message) {  // メッセージがない場合のみキャッシュを使用
     const cached = agentCache.get(cacheKey);
-    if (cached && Date.now() - cached.timestamp < CACHE_TTL) {
+    // 保持期間を過ぎて破棄されたMCPサーバーのツールを持つエージェントは使わない
+    if (cached && Date.now() - cached.timestamp < CACHE_TTL && userResources.has(userId)) {
       console.log(`[Agent] 📦 Returning cached agent for user ${userId}`);
       return cached.agent;
     }
@@ -38,74 +189,18 @@ export async function createAIAssistant(userId?: string, message?: string) {
   const claudeModel = anthropic('claude-sonnet-4-20250514');
   
   try {
-    let tools = {};
+    let tools: Record<string, any> = {};
     let connectedServices: string[] = [];
     
-    // ユーザー認証済みMCPクライアントを作成（Mastraドキュメント準拠）
+    // ユーザー認証済みMCPクライアントを取得（事前準備済み・準備中であればそれを使う）
     if (userId) {
-      console.log(`[Agent] 🔍 Creating authenticated MCP client for user ${userId}`);
-      
       try {
-        const tokenManager = new OAuthTokenManager();
-        console.log(`[Agent] 🔑 TokenManager created, attempting to get tokens for user ${userId}`);
-        
-        // ユーザーのトークンを取得
-        const notionTokens = await tokenManager.getTokens(userId, 'notion');
-        console.log(`[Agent] 📊 Token retrieval result:`, {
-          hasTokens: !!notionTokens,
-          hasAccessToken: !!(notionTokens?.accessToken),
-          tokenLength: notionTokens?.accessToken ? notionTokens.accessToken.length : 0,
-          expiresAt: notionTokens?.expiresAt,
-          metadata: notionTokens?.metadata
-        });
+        const resources = await userResources.get(userId);
+        const notionTokens = resources?.notionTokens;
         
-        if (notionTokens && notionTokens.accessToken) {
-          console.log(`[Agent] ✅ Found valid Notion tokens for user ${userId}`);
-          console.log(`[Agent] 🔗 Creating MCPClient for https://mcp.notion.com/mcp`);
-          
-          // Notion MCP サーバー用の認証設定（デバッグ用詳細ログ付き）
-          console.log(`[Agent] 🔑 Token details for MCP connection:`, {
-            tokenPrefix: notionTokens.accessToken.substring(0, 10) + '...',
-            tokenLength: notionTokens.accessToken.length,
-            workspaceId: notionTokens.metadata?.workspace_id,
-            workspaceName: notionTokens.metadata?.workspace_name
-          });
-          
-          // 公式仕様に基づく正しい環境変数設定
-          const openApiHeaders = JSON.stringify({
-            "Authorization": `Bearer ${notionTokens.accessToken}`,
-            "Notion-Version": "2022-06-28"
-          });
-          
-          console.log(`[Agent] 🔐 Setting OPENAPI_MCP_HEADERS environment variable for MCP server`);
-          console.log(`[Agent] 🔐 Token being passed to MCP server:`, {
-            tokenExists: !!notionTokens.accessToken,
-            tokenLength: notionTokens.accessToken.length,
-            tokenPrefix: notionTokens.accessToken.substring(0, 15) + '...',
-            tokenSuffix: '...' + notionTokens.accessToken.slice(-5),
-            openApiHeadersLength: openApiHeaders.length,
-            openApiHeadersPreview: openApiHeaders.substring(0, 50) + '...'
-          });
-          
-          const userMcp = new MCPClient({
-            id: `notion-mcp-${userId}-${Date.now()}`, // ユニークIDでMCPClient重複エラーを回避
-            servers: {
-              notion: {
-                command: "npx",
-                args: ["-y", "@notionhq/notion-mcp-server"],
-                env: {
-                  OPENAPI_MCP_HEADERS: openApiHeaders
-                }
-              }
-            },
-            timeout: 60000
-          });
-          
-          console.log(`[Agent] 🛠️ MCPClient created, attempting to get tools...`);
-          
-          try {
-            // Mastraの推奨パターン：await mcp.getTools()
-            const allTools = await userMcp.getTools();
+        if (resources && notionTokens && notionTokens.accessToken) {
+          if (resources.allTools) {
+            const allTools = resources.allTools;
             
             // レート制限を避けるため、必要なツールだけをフィルタリング
             // 参考: https://zenn.dev/nikechan/articles/b9b2d40129f736
@@ -146,6 +241,13 @@ export async function createAIAssistant(userId?: string, message?: string) {
                   return false;
                 })
             );
+
+            // ページ取得・検索の結果をキャッシュし、書き込み時に関連する結果を破棄する
+            tools = withToolCache(
+              tools,
+              toolCacheScope(userId, notionTokens.metadata?.workspace_id),
+              createNotionValidator(notionTokens.accessToken)
+            );
             
             connectedServices.push('notion');
             
@@ -172,31 +274,19 @@ export async function createAIAssistant(userId?: string, message?: string) {
                 hasExecute: typeof (toolDef as any)?.execute === 'function'
               });
             });
-            
-          } catch (toolsError: any) {
-            console.error(`[Agent] ❌ Failed to get MCP tools:`, toolsError);
-            console.error(`[Agent] 🔍 Error details:`, {
-              name: toolsError?.name || 'Unknown',
-              message: toolsError?.message || 'Unknown error',
-              stack: toolsError?.stack || 'No stack trace'
-            });
-            
-            // vibeloggerでMCPツール取得エラーを記録（一時的に無効化）
-            console.error(`[Agent] 🚨 MCP tools load error:`, {
-              user_id: userId,
-              error_name: toolsError?.name || 'Unknown',
-              error_message: toolsError?.message || 'Unknown error',
-              has_stack: !!toolsError?.stack
-            });
+          }
+
+          // ローカル検索インデックスが有効な場合は検索ツールを追加し、バックグラウンドで差分同期する
+          if (notionLocalIndexEnabled) {
+            tools[NOTION_LOCAL_SEARCH_TOOL] = createNotionLocalSearchTool(userId);
+            getNotionIndexSyncer().schedule(userId);
+            if (!connectedServices.includes('notion')) {
+              connectedServices.push('notion');
+            }
           }
           
         } else {
           console.log(`[Agent] ❌ No valid Notion tokens found for user ${userId}`);
-          console.log(`[Agent] 🔍 Token state:`, {
-            tokenExists: !!notionTokens,
-            accessTokenExists: !!(notionTokens?.accessToken),
-            rawTokenData: notionTokens
-          });
         }
       } catch (tokenError: any) {
         console.error(`[Agent] ❌ Failed to load user tokens:`, tokenError);
@@ -214,22 +304,20 @@ export async function createAIAssistant(userId?: string, message?: string) {
       console.log("[Agent] No MCP tools available - user needs OAuth authentication");
     }
     
-    // 接続されたサービスに基づいて指示を調整
-    let serviceInstructions = "";
-    if (connectedServices.length > 0) {
-      serviceInstructions = "Notionツールを使用して検索・編集ができます。";
-    } else if (userId) {
-      serviceInstructions = "外部サービス未接続です。「/mcp」コマンドで連携してください。";
-    }
+    // 取り消されたリクエストのツール呼び出しは結果を待たずに終了する
+    tools = withAbortSignal(tools);
+    
+    // 接続されたサービスに基づいて指示を調整（固定の指示文とは分けて渡す）
+    const service = serviceInstructions(connectedServices, !!userId, NOTION_LOCAL_SEARCH_TOOL in tools);
 
     // Mastraの推奨パターンでエージェント作成（ドキュメント準拠）
-    const agent = new Agent({
+    const agent = buildAssistantAgent({
       name: "AI Assistant",
       description: "Notion情報検索アシスタント",
-      instructions: `あなたはNotionの情報検索・管理アシスタントです。${serviceInstructions}
-日本語で簡潔に応答し、検索結果は要約して提示してください。`,
+      instructions: BASE_INSTRUCTIONS,
+      service,
       model: claudeModel,
-      tools: tools  // Mastraドキュメント準拠：エージェント作成時にツールを渡す
+      tools
     });
     
     const toolCount = Object.keys(tools).length;
@@ -246,12 +334,29 @@ export async function createAIAssistant(userId?: string, message?: string) {
     console.error("[Agent] Failed to create AI Assistant:", error);
     
     // フォールバック：ツールなしのエージェントを返す
-    return new Agent({
+    return buildAssistantAgent({
       name: "AI Assistant (Fallback)",
       description: "基本会話アシスタント",
-      instructions: `現在、外部ツールへの接続に問題があるため、一般的な質問にのみお答えできます。`,
+      instructions: FALLBACK_INSTRUCTIONS,
+      service: "",
       model: claudeModel,
       tools: {}
     });
   }
-}
\ No newline at end of file
+}
+
+// ツールなしの小型モデルのエージェント（Notionを参照しない一般的な質問用、ユーザーに依存しない）
+export function createLightAssistant() {
+  const apiKey = process.env.ANTHROPIC_API_KEY;
+  if (!apiKey) {
+    throw new Error("Anthropic API key is missing. Please set ANTHROPIC_API_KEY environment variable.");
+  }
+  return buildAssistantAgent({
+    name: "AI Assistant (Light)",
+    description: "一般的な質問に答える軽量アシスタント",
+    instructions: LIGHT_INSTRUCTIONS,
+    service: "",
+    model: anthropic(process.env.AGENT_SMALL_MODEL || 'claude-3-5-haiku-20241022'),
+    tools: {}
+  });
+}
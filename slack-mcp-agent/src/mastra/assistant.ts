@@ -0,0 +1,33 @@
+import { createAIAssistant, createLightAssistant } from './agents/ai-assistant';
+
+export { agentCacheStats, getServiceInstructions, liveMcpClientCount, userResources } from './agents/ai-assistant';
+
+// デフォルトエージェント（初回アクセス時に作成）
+let defaultAssistant: Promise<any> | null = null;
+let lightAssistant: any = null;
+
+// エージェントへのアクセス用エクスポート
+// Mastraインスタンス（index.ts）を読み込まないため、サーバー起動をブロックしない
+export async function getAIAssistant(userId?: string, message?: string) {
+  // ユーザーごとにエージェントを作成（認証済みMCPツール）
+  if (userId) {
+    return await createAIAssistant(userId, message);
+  }
+  
+  // デフォルトのエージェントを返す（同時アクセス時も作成は1回のみ）
+  if (!defaultAssistant) {
+    defaultAssistant = createAIAssistant().catch((error) => {
+      defaultAssistant = null;
+      throw error;
+    });
+  }
+  return defaultAssistant;
+}
+
+// ツールなしの小型モデルのエージェント（全ユーザーで共有）
+export function getLightAssistant() {
+  if (!lightAssistant) {
+    lightAssistant = createLightAssistant();
+  }
+  return lightAssistant;
+}
@@ -43,16 +43,5 @@ export const mastra = new Mastra({
   }),
 });
 
-// エージェントへのアクセス用エクスポート
-export async function getAIAssistant(userId?: string, message?: string) {
-  // ユーザーごとにエージェントを作成（認証済みMCPツール）
-  if (userId) {
-    return await createAIAssistant(userId, message);
-  }
-  
-  // デフォルトのエージェントを返す
-  if (!aiAssistant) {
-    aiAssistant = await createAIAssistant();
-  }
-  return aiAssistant;
-}
\ No newline at end of file
+// エージェントへのアクセス用エクスポート（サーバーは ./assistant を直接利用）
+export { getAIAssistant } from './assistant';
@@ -0,0 +1,85 @@
+import type { ThreadTurn } from '../utils/thread-store';
+
+// プロンプトの組み立て（Anthropicのプロンプトキャッシュを効かせるための固定プレフィックス）
+// Anthropicはツール定義 → システムプロンプト → メッセージの順にプレフィックスとしてキャッシュするため、
+//   1. 固定の指示文（エージェントのinstructions）
+//   2. 接続状況に応じた指示（キャッシュブレークポイント付きのシステムメッセージ）
+//   3. 名前順に並べたツール定義
+//   4. スレッドの会話履歴（最後の履歴にキャッシュブレークポイント）
+//   5. 新しいユーザー発言
+// の順に並べ、ターンをまたいでも 1〜4 のバイト列が変わらないようにする
+
+// キャッシュブレークポイント（5分間有効なエフェメラルキャッシュ）
+export const CACHE_CONTROL = {
+  anthropic: { cacheControl: { type: 'ephemeral' } }
+} as const;
+
+// エージェントの固定指示文（ユーザー・メッセージに依存する値を含めないこと）
+export const BASE_INSTRUCTIONS = `あなたはNotionの情報検索・管理アシスタントです。
+日本語で簡潔に応答し、検索結果は要約して提示してください。`;
+
+export const FALLBACK_INSTRUCTIONS = `現在、外部ツールへの接続に問題があるため、一般的な質問にのみお答えできます。`;
+
+// 外部サービスの接続状況に応じた指示（取りうる値は数種類のみで、ユーザーごとに安定）
+export function serviceInstructions(connectedServices: string[], authenticated: boolean, localIndex = false): string {
+  if (connectedServices.length > 0 && localIndex) {
+    return 'Notionツールを使用して検索・編集ができます。検索はまず notion_local_search を使い、見つからない場合のみNotion APIで検索してください。';
+  }
+  if (connectedServices.length > 0) {
+    return 'Notionツールを使用して検索・編集ができます。';
+  }
+  if (authenticated) {
+    return '外部サービス未接続です。「/mcp」コマンドで連携してください。';
+  }
+  return '';
+}
+
+// ツールを名前順に並べ替え（MCPサーバーの返却順に依存せず、同じツール構成なら同じ定義列になる）
+export function sortTools<T>(tools: Record<string, T>): Record<string, T> {
+  return Object.fromEntries(
+    Object.keys(tools)
+      .sort()
+      .map((name) => [name, tools[name]])
+  );
+}
+
+export interface ConversationInput {
+  // エージェント側のスレッド記憶から読み込んだ会話履歴
+  history?: ThreadTurn[];
+  // Python側から渡された会話履歴（THREAD_MEMORY_OWNER=local の場合）
+  context?: string;
+  // 接続状況に応じた指示
+  service?: string;
+  message: string;
+}
+
+// エージェントに渡すメッセージ列を組み立てる
+export function buildConversation({ history = [], context, service, message }: ConversationInput): any[] {
+  const messages: any[] = [];
+
+  if (service) {
+    messages.push({ role: 'system', content: service, providerOptions: CACHE_CONTROL });
+  }
+
+  const past: any[] = history.map((turn) => ({ role: turn.role, content: turn.content }));
+  if (past.length === 0 && context) {
+    past.push({ role: 'user', content: `過去の会話:\n${context}` });
+  }
+  if (past.length > 0) {
+    past[past.length - 1] = { ...past[past.length - 1], providerOptions: CACHE_CONTROL };
+    messages.push(...past);
+  }
+
+  messages.push({ role: 'user', content: past.length > 0 ? `現在の質問: ${message}` : message });
+  return messages;
+}
+
+// レート制限の見積もり用に、メッセージ列の文字数を合計
+export function conversationLength(messages: any[]): number {
+  return messages.reduce((total, item) => total + String(item.content).length, 0);
+}
+
+// プレフィックス（システム指示とツール構成）の識別子（キャッシュ済みかどうかの判定用）
+export function prefixKey(service: string | undefined, toolNames: string[]): string {
+  return `${service || ''}|${[...toolNames].sort().join(',')}`;
+}
@@ -0,0 +1,158 @@
+// 質問の振り分け（安いものから順に試す段階的なモデル選択）
+// 挨拶・お礼のような定型の発言はモデルを呼ばずに定型文で応答し、
+// Notionを参照しない一般的な質問はツールなしの小型モデル、それ以外はツール付きの通常モデルで処理する
+//   1. 規則: 定型の発言、Notionへの明示的な言及（URL・「Notion」）
+//   2. 採点モデル: 語句の特徴量の線形和をソフトマックスで確率に変換（オフラインで動作、API呼び出しなし）
+//   3. 確信度が閾値未満の場合は1段上の処理に回す
+// 小型モデルがNotionの情報が必要と判断した場合は ESCALATE_TOKEN を返し、通常モデルで処理し直す
+
+export type RouteTier = 'canned' | 'small' | 'full';
+
+export const ROUTE_TIERS: RouteTier[] = ['canned', 'small', 'full'];
+
+export interface RouteDecision {
+  tier: RouteTier;
+  // 採点モデルが最も高いとした段階（確信度による繰り上げ前）
+  predicted: RouteTier;
+  confidence: number;
+  reason: string;
+  // tier が canned の場合の応答
+  reply?: string;
+}
+
+export interface RouteContext {
+  // スレッドの会話履歴があるか（続きの質問は前の回答の参照が必要なことが多い）
+  hasHistory?: boolean;
+}
+
+// 小型モデルが通常モデルへの切り替えを求める応答
+export const ESCALATE_TOKEN = '[[ESCALATE]]';
+
+// 小型モデルの指示文
+export const LIGHT_INSTRUCTIONS = `あなたは社内のSlackアシスタントです。日本語で簡潔に応答してください。
+あなたはNotionなどの社内情報にアクセスできません。
+社内のページ・議事録・タスク・データベースなど、ワークスペースの情報が必要な質問や、
+ページの作成・更新を求められた場合は、説明を加えずに ${ESCALATE_TOKEN} とだけ出力してください。`;
+
+const CANNED_REPLIES = {
+  greeting: 'こんにちは！Notionのページ検索や内容の確認をお手伝いします。調べたいことを教えてください。',
+  thanks: 'どういたしまして！他にも調べたいことがあればお気軽にどうぞ。'
+};
+
+// 定型の発言（記号・絵文字・空白を除いた全体が一致する場合のみ）
+const GREETING_PATTERN = /^(こんにち[はわ]|こんばん[はわ]|おはよう(ございます)?|はじめまして|よろしく(お願いします|おねがいします)?|お疲れ(様|さま)(です)?|hi|hello|hey|やあ|ユーザーが挨拶をしてきました友好的に応答してください)$/i;
+const THANKS_PATTERN = /^(ありがとう(ございます|ございました)?|助かりました|thanks?|thank you)$/i;
+// 相づち（会話の途中では提案した操作への同意のことがあるため、履歴のない場合のみ定型文で応答）
+const ACKNOWLEDGEMENT_PATTERN = /^(了解(です)?|わかりました|ok|おけ|👍)$/i;
+const NOISE_PATTERN = /[\s!！?？。、,.~〜♪😊🙏✨:]+/g;
+
+// Notionへの明示的な言及
+const EXPLICIT_NOTION_PATTERN = /notion\.so\/|notion|ノーション/i;
+
+interface Feature {
+  pattern: RegExp;
+  // 各段階（canned, small, full）への重み
+  weights: [number, number, number];
+}
+
+// 特徴量と重み（scripts/data/router-eval.jsonl の評価で調整）
+const FEATURES: Feature[] = [
+  // ワークスペースの情報を指す語
+  { pattern: /ページ|データベース|議事録|ドキュメント|資料|メモ|ノート|wiki|ナレッジ|仕様書?|設計書|手順書?|マニュアル|規程|規定|テンプレート?/i, weights: [-2, -1, 2.5] },
+  { pattern: /タスク|todo|チケット|プロジェクト|ロードマップ|スケジュール|締め切り|期限|担当者?|進捗|ステータス/i, weights: [-2, -0.8, 2] },
+  { pattern: /社内|うちの|弊社|チーム|部署|先週|今週|来週|昨日|前回|定例|会議|ミーティング|mtg/i, weights: [-1.5, -0.6, 1.6] },
+  // 検索・操作の依頼
+  { pattern: /探して|検索|調べて|見つけて|どこに(ある|あります)|一覧|リスト|まとめて|要約して/i, weights: [-2, -0.2, 1.5] },
+  { pattern: /作成|作って|追加|登録|更新|編集|変更|修正|書き換え|削除|アーカイブ|移動/i, weights: [-2, -0.5, 2] },
+  // 一般的な知識・文章作成の質問
+  { pattern: /とは|って何|意味|違い|方法|やり方|仕方|なぜ|どうして|どうやって|おすすめ|コツ|例を|書き方/, weights: [-1.5, 1.4, -0.2] },
+  { pattern: /翻訳|英語で|日本語で|言い換え|敬語|文章を|文面|メール|計算|変換|正規表現|python|javascript|typescript|sql|コード|エラー/i, weights: [-1.5, 2, -0.8] },
+  // 質問の形
+  { pattern: /[?？]|教えて|ですか|ますか/, weights: [-1.2, 0.5, 0.3] },
+  // 定型の発言の一部
+  { pattern: /こんにち[はわ]|おはよう|こんばん[はわ]|ありがとう|よろしく|お疲れ|挨拶/, weights: [1.6, 0.1, -1] }
+];
+
+// 各段階の基準値（特徴のない短い発言は一般的な質問として扱う）
+const BIAS: [number, number, number] = [-0.5, 0.6, 0.2];
+
+function softmax(scores: number[]): number[] {
+  const max = Math.max(...scores);
+  const exps = scores.map((score) => Math.exp(score - max));
+  const total = exps.reduce((sum, value) => sum + value, 0);
+  return exps.map((value) => value / total);
+}
+
+// 採点モデル（各段階の確率）
+export function scoreMessage(message: string, context: RouteContext = {}): Record<RouteTier, number> {
+  const scores = [...BIAS];
+  for (const feature of FEATURES) {
+    if (feature.pattern.test(message)) {
+      feature.weights.forEach((weight, index) => (scores[index] += weight));
+    }
+  }
+  // 長い質問ほど具体的な情報を求めていることが多い
+  const length = [...message].length;
+  scores[2] += Math.min(length, 200) / 100;
+  if (context.hasHistory) {
+    scores[0] -= 1;
+    scores[2] += 0.6;
+  }
+  const probabilities = softmax(scores);
+  return { canned: probabilities[0], small: probabilities[1], full: probabilities[2] };
+}
+
+function nextTier(tier: RouteTier): RouteTier {
+  return ROUTE_TIERS[Math.min(ROUTE_TIERS.indexOf(tier) + 1, ROUTE_TIERS.length - 1)];
+}
+
+// 質問の振り分け
+export function routeMessage(message: string, context: RouteContext = {}, minConfidence = 0.6): RouteDecision {
+  const compact = message.trim().replace(NOISE_PATTERN, '');
+
+  // 規則: 挨拶・お礼は会話の途中でも定型文で応答
+  if (compact === '' || GREETING_PATTERN.test(compact)) {
+    return { tier: 'canned', predicted: 'canned', confidence: 1, reason: 'greeting', reply: CANNED_REPLIES.greeting };
+  }
+  if (THANKS_PATTERN.test(compact) || (!context.hasHistory && ACKNOWLEDGEMENT_PATTERN.test(compact))) {
+    return { tier: 'canned', predicted: 'canned', confidence: 1, reason: 'thanks', reply: CANNED_REPLIES.thanks };
+  }
+  // 規則: Notionへの明示的な言及
+  if (EXPLICIT_NOTION_PATTERN.test(message)) {
+    return { tier: 'full', predicted: 'full', confidence: 1, reason: 'explicit' };
+  }
+
+  const probabilities = scoreMessage(message, context);
+  // 定型文は規則に一致した場合のみ使い、採点モデルからは小型モデル以上に回す
+  const predicted = ROUTE_TIERS.reduce((best, tier) => (probabilities[tier] > probabilities[best] ? tier : best), 'small');
+  const confidence = probabilities[predicted];
+  let tier: RouteTier = predicted === 'canned' ? 'small' : predicted;
+  if (predicted !== 'canned' && confidence < minConfidence) {
+    tier = nextTier(tier);
+  }
+  return {
+    tier,
+    predicted,
+    confidence,
+    reason: tier === predicted ? 'scored' : 'escalated'
+  };
+}
+
+// 小型モデルの応答が通常モデルへの切り替えを求めているか
+export function wantsEscalation(text: string | undefined): boolean {
+  return !text || text.trim() === '' || text.includes(ESCALATE_TOKEN);
+}
+
+export interface RouterStats {
+  routed: Record<RouteTier, number>;
+  // 確信度不足または小型モデルの判断で通常モデルに回した件数
+  escalated: { confidence: number; model: number };
+}
+
+export const routerStats: RouterStats = {
+  routed: { canned: 0, small: 0, full: 0 },
+  escalated: { confidence: 0, model: 0 }
+};
+
+export const routerEnabled = (process.env.AGENT_ROUTER || 'true').toLowerCase() === 'true';
+export const routerMinConfidence = Number(process.env.AGENT_ROUTER_MIN_CONFIDENCE || 0.6);
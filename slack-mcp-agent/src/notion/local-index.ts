@@ -0,0 +1,190 @@
+import { createClient, type Client, type InStatement } from '@libsql/client';
+
+// Notionページのローカル全文検索インデックス（libSQL / SQLite FTS5）
+// ユーザーごとにアクセス可能なページのタイトルと本文を保持し、MCP経由の検索を待たずに検索できるようにする
+// 日本語は単語の区切りがないため trigram トークナイザーを使用（3文字未満の語はLIKEで照合）
+
+export interface IndexedPage {
+  id: string;
+  title: string;
+  url: string;
+  lastEditedTime: string;
+  content: string;
+}
+
+export interface LocalSearchHit {
+  id: string;
+  title: string;
+  url: string;
+  lastEditedTime: string;
+  snippet: string;
+}
+
+const SCHEMA: string[] = [
+  `CREATE TABLE IF NOT EXISTS notion_pages (
+     rowid INTEGER PRIMARY KEY,
+     user_id TEXT NOT NULL,
+     page_id TEXT NOT NULL,
+     title TEXT NOT NULL,
+     url TEXT NOT NULL,
+     last_edited_time TEXT NOT NULL,
+     content TEXT NOT NULL,
+     UNIQUE (user_id, page_id)
+   )`,
+  `CREATE VIRTUAL TABLE IF NOT EXISTS notion_pages_fts USING fts5(
+     title, content, content='notion_pages', content_rowid='rowid', tokenize='trigram'
+   )`,
+  // 外部コンテンツ方式のFTSをページ表と同期させるトリガー
+  `CREATE TRIGGER IF NOT EXISTS notion_pages_ai AFTER INSERT ON notion_pages BEGIN
+     INSERT INTO notion_pages_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+   END`,
+  `CREATE TRIGGER IF NOT EXISTS notion_pages_ad AFTER DELETE ON notion_pages BEGIN
+     INSERT INTO notion_pages_fts(notion_pages_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+   END`,
+  `CREATE TRIGGER IF NOT EXISTS notion_pages_au AFTER UPDATE ON notion_pages BEGIN
+     INSERT INTO notion_pages_fts(notion_pages_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+     INSERT INTO notion_pages_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+   END`,
+  // ユーザーごとの同期位置（取り込み済みの最新の last_edited_time）
+  `CREATE TABLE IF NOT EXISTS notion_sync_state (
+     user_id TEXT PRIMARY KEY,
+     cursor TEXT,
+     synced_at INTEGER NOT NULL
+   )`
+];
+
+const MIN_TRIGRAM_LENGTH = 3;
+
+// FTS5のクエリ構文として解釈されないよう、語をフレーズとして引用
+function quoteTerm(term: string): string {
+  return `"${term.replace(/"/g, '""')}"`;
+}
+
+function escapeLike(term: string): string {
+  return term.replace(/[\\%_]/g, (char) => `\\${char}`);
+}
+
+export class NotionLocalIndex {
+  private client: Client;
+  private ready: Promise<void> | null = null;
+
+  constructor(url: string) {
+    this.client = createClient({ url });
+  }
+
+  private init(): Promise<void> {
+    if (!this.ready) {
+      this.ready = this.client.batch(SCHEMA, 'write').then(() => undefined);
+      this.ready.catch(() => {
+        this.ready = null;
+      });
+    }
+    return this.ready;
+  }
+
+  async getCursor(userId: string): Promise<string | null> {
+    await this.init();
+    const result = await this.client.execute({
+      sql: 'SELECT cursor FROM notion_sync_state WHERE user_id = ?',
+      args: [userId]
+    });
+    return (result.rows[0]?.cursor as string | null | undefined) ?? null;
+  }
+
+  async pageCount(userId: string): Promise<number> {
+    await this.init();
+    const result = await this.client.execute({
+      sql: 'SELECT COUNT(*) AS count FROM notion_pages WHERE user_id = ?',
+      args: [userId]
+    });
+    return Number(result.rows[0]?.count ?? 0);
+  }
+
+  // 変更されたページを反映し、同期位置を進める（1トランザクション）
+  async applyChanges(userId: string, pages: IndexedPage[], removedIds: string[], cursor: string | null): Promise<void> {
+    await this.init();
+    const statements: InStatement[] = pages.map((page) => ({
+      sql: `INSERT INTO notion_pages (user_id, page_id, title, url, last_edited_time, content)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, page_id) DO UPDATE SET
+              title = excluded.title, url = excluded.url,
+              last_edited_time = excluded.last_edited_time, content = excluded.content`,
+      args: [userId, page.id, page.title, page.url, page.lastEditedTime, page.content]
+    }));
+    for (const pageId of removedIds) {
+      statements.push({ sql: 'DELETE FROM notion_pages WHERE user_id = ? AND page_id = ?', args: [userId, pageId] });
+    }
+    statements.push({
+      sql: `INSERT INTO notion_sync_state (user_id, cursor, synced_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET cursor = COALESCE(excluded.cursor, cursor), synced_at = excluded.synced_at`,
+      args: [userId, cursor, Date.now()]
+    });
+    await this.client.batch(statements, 'write');
+  }
+
+  async removeUser(userId: string): Promise<void> {
+    await this.init();
+    await this.client.batch([
+      { sql: 'DELETE FROM notion_pages WHERE user_id = ?', args: [userId] },
+      { sql: 'DELETE FROM notion_sync_state WHERE user_id = ?', args: [userId] }
+    ], 'write');
+  }
+
+  // タイトルを本文より重視して検索（3文字以上の語はFTS、短い語はLIKEで絞り込み）
+  async search(userId: string, query: string, limit = 5): Promise<LocalSearchHit[]> {
+    await this.init();
+    const terms = query.split(/\s+/).map((term) => term.trim()).filter(Boolean);
+    if (terms.length === 0) return [];
+
+    const longTerms = terms.filter((term) => [...term].length >= MIN_TRIGRAM_LENGTH);
+    const shortTerms = terms.filter((term) => [...term].length < MIN_TRIGRAM_LENGTH);
+    const likeClauses = shortTerms.map(() => `(p.title LIKE ? ESCAPE '\\' OR p.content LIKE ? ESCAPE '\\')`);
+    const likeArgs = shortTerms.flatMap((term) => [`%${escapeLike(term)}%`, `%${escapeLike(term)}%`]);
+
+    const result = longTerms.length > 0
+      ? await this.client.execute({
+          sql: `SELECT p.page_id, p.title, p.url, p.last_edited_time,
+                       snippet(notion_pages_fts, 1, '', '', '…', 24) AS snippet
+                FROM notion_pages_fts f JOIN notion_pages p ON p.rowid = f.rowid
+                WHERE notion_pages_fts MATCH ? AND p.user_id = ?
+                ${likeClauses.map((clause) => `AND ${clause}`).join(' ')}
+                ORDER BY bm25(notion_pages_fts, 5.0, 1.0)
+                LIMIT ?`,
+          args: [longTerms.map(quoteTerm).join(' OR '), userId, ...likeArgs, limit]
+        })
+      : await this.client.execute({
+          sql: `SELECT p.page_id, p.title, p.url, p.last_edited_time, substr(p.content, 1, 120) AS snippet
+                FROM notion_pages p
+                WHERE p.user_id = ? AND ${likeClauses.join(' AND ')}
+                ORDER BY p.last_edited_time DESC
+                LIMIT ?`,
+          args: [userId, ...likeArgs, limit]
+        });
+
+    return result.rows.map((row) => ({
+      id: String(row.page_id),
+      title: String(row.title),
+      url: String(row.url),
+      lastEditedTime: String(row.last_edited_time),
+      snippet: String(row.snippet ?? '')
+    }));
+  }
+
+  close(): void {
+    this.client.close();
+  }
+}
+
+export const notionLocalIndexEnabled = (process.env.NOTION_LOCAL_INDEX || 'false').toLowerCase() === 'true';
+
+let sharedIndex: NotionLocalIndex | null = null;
+
+// 共有インデックス（NOTION_INDEX_URL、既定はエージェントの作業ディレクトリの notion-index.db）
+export function getNotionLocalIndex(): NotionLocalIndex {
+  if (!sharedIndex) {
+    const url = process.env.NOTION_INDEX_URL || 'file:notion-index.db';
+    console.log(`[NotionIndex] Using local search index: ${url}`);
+    sharedIndex = new NotionLocalIndex(url);
+  }
+  return sharedIndex;
+}
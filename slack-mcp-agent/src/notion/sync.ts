@@ -0,0 +1,280 @@
+import { OAuthTokenManager } from '../oauth/token-manager';
+import { getNotionLocalIndex, type IndexedPage, type NotionLocalIndex } from './local-index';
+
+// Notionページのローカルインデックスへの差分同期
+// ユーザーのOAuthトークンで /v1/search を last_edited_time の新しい順に取得し、
+// 前回の同期位置（カーソル）より新しいページだけ本文を取り直す
+// 同期はバックグラウンドで行い、同時に同期するユーザー数とユーザーごとのページ取得数を制限する
+
+const NOTION_VERSION = '2022-06-28';
+// 1ページあたりに取り込む本文の上限
+const MAX_BLOCKS_PER_PAGE = 200;
+const MAX_CONTENT_CHARS = 20000;
+// 同期対象とする最近のユーザーの保持期間
+const ACTIVE_USER_TTL_MS = 24 * 60 * 60 * 1000;
+
+export interface SyncStats {
+  userId: string;
+  scanned: number;
+  updated: number;
+  removed: number;
+  requests: number;
+  durationMs: number;
+}
+
+interface SyncOptions {
+  apiBaseUrl?: string;
+  // 同時に同期するユーザー数
+  concurrency?: number;
+  // ユーザーごとに同時に本文を取得するページ数
+  pageConcurrency?: number;
+  // 同じユーザーを再同期するまでの最短間隔
+  minIntervalMs?: number;
+  // 初回同期で取り込むページ数の上限
+  maxPages?: number;
+}
+
+type TokenSource = (userId: string) => Promise<string | null>;
+
+// 配列の各要素を最大 limit 件ずつ並行に処理
+async function mapWithConcurrency<T, R>(items: T[], limit: number, fn: (item: T) => Promise<R>): Promise<R[]> {
+  const results: R[] = new Array(items.length);
+  let next = 0;
+  const workers = Array.from({ length: Math.min(limit, items.length) }, async () => {
+    while (next < items.length) {
+      const index = next++;
+      results[index] = await fn(items[index]);
+    }
+  });
+  await Promise.all(workers);
+  return results;
+}
+
+function plainText(richText: any[] | undefined): string {
+  return (richText || []).map((item) => item?.plain_text || '').join('');
+}
+
+function pageTitle(page: any): string {
+  for (const property of Object.values<any>(page.properties || {})) {
+    if (property?.type === 'title') {
+      return plainText(property.title);
+    }
+  }
+  return '';
+}
+
+class NotionApiClient {
+  requests = 0;
+
+  constructor(private baseUrl: string, private token: string) {}
+
+  async call(method: 'GET' | 'POST', path: string, body?: any): Promise<any> {
+    for (let attempt = 0; ; attempt++) {
+      this.requests++;
+      const response = await fetch(`${this.baseUrl}${path}`, {
+        method,
+        headers: {
+          Authorization: `Bearer ${this.token}`,
+          'Notion-Version': NOTION_VERSION,
+          'Content-Type': 'application/json'
+        },
+        body: body ? JSON.stringify(body) : undefined
+      });
+      // レート制限（平均3リクエスト/秒）の場合は指示された時間だけ待って再試行
+      if (response.status === 429 && attempt < 3) {
+        const retryAfter = Number(response.headers.get('retry-after') || '1');
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+        continue;
+      }
+      if (!response.ok) {
+        throw new Error(`Notion API ${method} ${path} failed: ${response.status} ${await response.text()}`);
+      }
+      return response.json();
+    }
+  }
+
+  // 編集日時の新しい順にページを列挙
+  async *pagesByLastEdited(): AsyncGenerator<any> {
+    let cursor: string | undefined;
+    do {
+      const result = await this.call('POST', '/search', {
+        filter: { property: 'object', value: 'page' },
+        sort: { direction: 'descending', timestamp: 'last_edited_time' },
+        page_size: 100,
+        ...(cursor ? { start_cursor: cursor } : {})
+      });
+      for (const page of result.results || []) {
+        yield page;
+      }
+      cursor = result.has_more ? result.next_cursor : undefined;
+    } while (cursor);
+  }
+
+  // ページ直下のブロックのテキストを連結
+  async pageText(pageId: string): Promise<string> {
+    const parts: string[] = [];
+    let cursor: string | undefined;
+    let blocks = 0;
+    do {
+      const query = `page_size=100${cursor ? `&start_cursor=${encodeURIComponent(cursor)}` : ''}`;
+      const result = await this.call('GET', `/blocks/${pageId}/children?${query}`);
+      for (const block of result.results || []) {
+        const text = plainText(block?.[block.type]?.rich_text);
+        if (text) parts.push(text);
+      }
+      blocks += (result.results || []).length;
+      cursor = result.has_more && blocks < MAX_BLOCKS_PER_PAGE ? result.next_cursor : undefined;
+    } while (cursor);
+    return parts.join('\n').slice(0, MAX_CONTENT_CHARS);
+  }
+}
+
+export class NotionIndexSyncer {
+  private apiBaseUrl: string;
+  private concurrency: number;
+  private pageConcurrency: number;
+  private minIntervalMs: number;
+  private maxPages: number;
+  private queue: string[] = [];
+  private running = new Set<string>();
+  private lastSynced = new Map<string, number>();
+  private activeUsers = new Map<string, number>();
+  private timer: NodeJS.Timeout | null = null;
+
+  constructor(private index: NotionLocalIndex, private tokenSource: TokenSource, options: SyncOptions = {}) {
+    this.apiBaseUrl = options.apiBaseUrl || 'https://api.notion.com/v1';
+    this.concurrency = options.concurrency ?? 2;
+    this.pageConcurrency = options.pageConcurrency ?? 3;
+    this.minIntervalMs = options.minIntervalMs ?? 5 * 60 * 1000;
+    this.maxPages = options.maxPages ?? 1000;
+  }
+
+  // 同期を予約（実行中・予約済み・最近同期したユーザーは無視）
+  schedule(userId: string, force = false): void {
+    this.activeUsers.set(userId, Date.now());
+    if (this.running.has(userId) || this.queue.includes(userId)) return;
+    const last = this.lastSynced.get(userId);
+    if (!force && last !== undefined && Date.now() - last < this.minIntervalMs) return;
+    this.queue.push(userId);
+    this.pump();
+  }
+
+  private pump(): void {
+    while (this.running.size < this.concurrency && this.queue.length > 0) {
+      const userId = this.queue.shift()!;
+      this.running.add(userId);
+      this.syncUser(userId)
+        .then((stats) => {
+          if (stats && (stats.updated > 0 || stats.removed > 0)) {
+            console.log(`[NotionIndex] 🔄 Synced user ${userId}: ${stats.updated} updated, ${stats.removed} removed ` +
+              `(${stats.scanned} scanned, ${stats.requests} API calls, ${stats.durationMs} ms)`);
+          }
+        })
+        .catch((error: any) => {
+          console.error(`[NotionIndex] ⚠️ Sync failed for user ${userId}:`, error.message);
+        })
+        .finally(() => {
+          this.running.delete(userId);
+          this.lastSynced.set(userId, Date.now());
+          this.pump();
+        });
+    }
+  }
+
+  // 1ユーザー分の差分同期
+  async syncUser(userId: string): Promise<SyncStats | null> {
+    const startedAt = Date.now();
+    const token = await this.tokenSource(userId);
+    if (!token) return null;
+
+    const api = new NotionApiClient(this.apiBaseUrl, token);
+    const cursor = await this.index.getCursor(userId);
+    const changed: any[] = [];
+    const removed: string[] = [];
+    let newest = cursor;
+    let scanned = 0;
+
+    for await (const page of api.pagesByLastEdited()) {
+      scanned++;
+      // 編集日時は分単位に丸められるため、カーソルと同時刻のページは取り直す
+      if (cursor && page.last_edited_time < cursor) break;
+      if (!newest || page.last_edited_time > newest) newest = page.last_edited_time;
+      if (page.archived || page.in_trash) {
+        removed.push(page.id);
+      } else {
+        changed.push(page);
+      }
+      if (changed.length >= this.maxPages) break;
+    }
+
+    const pages: IndexedPage[] = await mapWithConcurrency(changed, this.pageConcurrency, async (page) => ({
+      id: page.id,
+      title: pageTitle(page),
+      url: page.url || '',
+      lastEditedTime: page.last_edited_time,
+      content: await api.pageText(page.id)
+    }));
+
+    await this.index.applyChanges(userId, pages, removed, newest);
+
+    return {
+      userId,
+      scanned,
+      updated: pages.length,
+      removed: removed.length,
+      requests: api.requests,
+      durationMs: Date.now() - startedAt
+    };
+  }
+
+  // 最近利用したユーザーを定期的に再同期
+  start(intervalMs = this.minIntervalMs): void {
+    if (this.timer) return;
+    this.timer = setInterval(() => {
+      const cutoff = Date.now() - ACTIVE_USER_TTL_MS;
+      for (const [userId, seenAt] of this.activeUsers) {
+        if (seenAt < cutoff) {
+          this.activeUsers.delete(userId);
+        } else {
+          this.schedule(userId);
+        }
+      }
+    }, intervalMs);
+    this.timer.unref();
+  }
+
+  stop(): void {
+    if (this.timer) clearInterval(this.timer);
+    this.timer = null;
+  }
+
+  // 同期の完了を待つ（検証スクリプト用）
+  async idle(): Promise<void> {
+    while (this.running.size > 0 || this.queue.length > 0) {
+      await new Promise((resolve) => setTimeout(resolve, 10));
+    }
+  }
+}
+
+let sharedSyncer: NotionIndexSyncer | null = null;
+let tokenManager: OAuthTokenManager | null = null;
+
+async function notionAccessToken(userId: string): Promise<string | null> {
+  tokenManager ??= new OAuthTokenManager();
+  const tokens = await tokenManager.getTokens(userId, 'notion');
+  return tokens?.accessToken || null;
+}
+
+// 共有の同期処理（初回呼び出し時に定期同期を開始）
+export function getNotionIndexSyncer(): NotionIndexSyncer {
+  if (!sharedSyncer) {
+    sharedSyncer = new NotionIndexSyncer(getNotionLocalIndex(), notionAccessToken, {
+      apiBaseUrl: process.env.NOTION_API_BASE_URL,
+      concurrency: Number(process.env.NOTION_INDEX_SYNC_CONCURRENCY || 2),
+      pageConcurrency: Number(process.env.NOTION_INDEX_PAGE_CONCURRENCY || 3),
+      minIntervalMs: Number(process.env.NOTION_INDEX_SYNC_INTERVAL || 300) * 1000
+    });
+    sharedSyncer.start();
+  }
+  return sharedSyncer;
+}
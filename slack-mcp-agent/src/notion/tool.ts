@@ -0,0 +1,23 @@
+import { createTool } from '@mastra/core/tools';
+import { z } from 'zod';
+import { getNotionLocalIndex } from './local-index';
+
+export const NOTION_LOCAL_SEARCH_TOOL = 'notion_local_search';
+
+// ローカルインデックスを検索するツール（ユーザーごとに作成し、他のユーザーのページは検索しない）
+export function createNotionLocalSearchTool(userId: string) {
+  return createTool({
+    id: NOTION_LOCAL_SEARCH_TOOL,
+    description: 'Notionページをローカルの全文検索インデックスから高速に検索します。タイトル・URL・本文の抜粋を返します。',
+    inputSchema: z.object({
+      query: z.string().describe('検索キーワード（空白区切りで複数指定可）'),
+      limit: z.number().int().min(1).max(20).optional().describe('最大件数（既定: 5）')
+    }),
+    execute: async ({ context }) => {
+      const startedAt = Date.now();
+      const results = await getNotionLocalIndex().search(userId, context.query, context.limit ?? 5);
+      console.log(`[NotionIndex] 🔎 Local search "${context.query}": ${results.length} hits in ${Date.now() - startedAt} ms`);
+      return { results };
+    }
+  });
+}
@@ -1,7 +1,19 @@
 import express from 'express';
 import dotenv from 'dotenv';
-import { getAIAssistant } from './mastra/index';
-import { rateLimiter } from './utils/rate-limiter';
+import { agentCacheStats, getAIAssistant, getLightAssistant, getServiceInstructions, liveMcpClientCount, userResources } from './mastra/assistant';
+import { buildConversation, conversationLength, prefixKey } from './mastra/prompt';
+import { routeMessage, routerEnabled, routerMinConfidence, routerStats, wantsEscalation } from './mastra/router';
+import { rateLimiter, promptUsageFromResult, TokenReservation } from './utils/rate-limiter';
+import { stubModelEnabled, generateStubResponse } from './utils/stub-model';
+import { applyContextDelta } from './utils/thread-context';
+import { loadThreadHistory, recordThreadTurn, threadStore, ThreadTurn } from './utils/thread-store';
+import { toolResultCache } from './utils/tool-cache';
+import { activeRequestCount, beginRequest, cancelRequest, endRequest, isAbortError, RequestCancelledError } from './utils/cancellation';
+import {
+  childProcesses, DiagnosticsBusyError, eventLoopDelay, isLoopbackAddress, memorySnapshot,
+  sampleHeapAllocations, writeHeapSnapshot
+} from './utils/diagnostics';
+import { startIPCServer } from './ipc-server';
 // import { getMCPToolsets } from './mastra/mcp'; // 非推奨：AuthenticatedMCPClientを使用
 
 // .envファイルを読み込む
@@ -25,10 +37,164 @@ app.get('/api/health', (req, res) => {
   });
 });
 
-// エージェント検索エンドポイント
-app.post('/api/agent/search', async (req, res) => {
+// ツール呼び出し結果キャッシュの統計
+app.get('/api/tool-cache/stats', (req, res) => {
+  res.json(toolResultCache.stats());
+});
+
+// 質問の振り分けの統計
+app.get('/api/router/stats', (req, res) => {
+  res.json(routerStats);
+});
+
+// ユーザーごとの準備（MCPサーバー・ツール一覧）の保持と事前準備の統計
+app.get('/api/agent/prewarm/stats', (req, res) => {
+  res.json(userResources.stats());
+});
+
+// 診断用エンドポイント（ローカルからのみ、AGENT_DEBUG_ENDPOINTS=false で無効）
+// GET は定期的な取得（10秒ごとなど）に耐える軽い処理、POST /debug/heap/* は必要な時だけ実行する
+const DEBUG_ENDPOINTS = (process.env.AGENT_DEBUG_ENDPOINTS || 'true').toLowerCase() === 'true';
+
+app.use('/debug', (req, res, next) => {
+  if (!DEBUG_ENDPOINTS) {
+    res.status(404).json({ error: 'debug endpoints are disabled' });
+    return;
+  }
+  if (!isLoopbackAddress(req.socket.remoteAddress)) {
+    res.status(403).json({ error: 'debug endpoints are only available from localhost' });
+    return;
+  }
+  next();
+});
+
+function cacheDiagnostics() {
+  return {
+    agents: agentCacheStats(),
+    userResources: userResources.stats(),
+    toolResults: toolResultCache.stats(),
+    threads: threadStore.stats()
+  };
+}
+
+function processDiagnostics() {
+  const children = childProcesses();
+  return {
+    pid: process.pid,
+    activeRequests: activeRequestCount(),
+    mcpClients: liveMcpClientCount(),
+    childProcesses: children ? children.length : null,
+    children
+  };
+}
+
+// まとめて取得（定期的な取得用）
+app.get('/debug', (req, res) => {
+  res.json({
+    timestamp: new Date().toISOString(),
+    memory: memorySnapshot(),
+    eventLoopDelay: eventLoopDelay(),
+    caches: cacheDiagnostics(),
+    processes: processDiagnostics(),
+    rateLimiter: rateLimiter.snapshot()
+  });
+});
+
+app.get('/debug/memory', (req, res) => {
+  res.json(memorySnapshot());
+});
+
+app.get('/debug/caches', (req, res) => {
+  res.json(cacheDiagnostics());
+});
+
+app.get('/debug/processes', (req, res) => {
+  res.json(processDiagnostics());
+});
+
+app.get('/debug/rate-limiter', (req, res) => {
+  res.json(rateLimiter.snapshot());
+});
+
+// 指定秒数（既定5秒、最大60秒）サンプリングし、生存しているオブジェクトを確保した関数の上位を返す
+app.post('/debug/heap/sample', async (req, res) => {
+  const seconds = Math.min(60, Math.max(1, Number(req.query.seconds) || 5));
+  const top = Math.min(200, Math.max(1, Number(req.query.top) || 20));
+  try {
+    res.json(await sampleHeapAllocations(seconds * 1000, top));
+  } catch (error: any) {
+    res.status(error instanceof DiagnosticsBusyError ? 409 : 500).json({ error: error.message });
+  }
+});
+
+// ヒープスナップショットを AGENT_DEBUG_DIR（既定は一時ディレクトリ）に書き出す
+app.post('/debug/heap/snapshot', async (req, res) => {
+  try {
+    res.json(await writeHeapSnapshot());
+  } catch (error: any) {
+    res.status(error instanceof DiagnosticsBusyError ? 409 : 500).json({ error: error.message });
+  }
+});
+
+// 検索処理の結果（HTTP・IPCの両トランスポートで共通）
+interface SearchResult {
+  status: number;
+  body: Record<string, any>;
+}
+
+// ツールなしの小型モデルで応答（Notionの情報が必要と判断された場合・失敗した場合は null）
+// 小型モデルは通常モデルとは別のレート制限枠のため、rateLimiter には計上しない
+async function generateWithLightModel(history: ThreadTurn[], context: string | undefined, message: string,
+                                      threadId: string, signal: AbortSignal): Promise<string | null> {
   try {
-    const { message, threadId, context, userId } = req.body;
+    const lightAgent = getLightAssistant();
+    const result = await lightAgent.generate(buildConversation({ history, context, message }), {
+      threadId,
+      abortSignal: signal
+    });
+    if (wantsEscalation(result.text)) {
+      routerStats.escalated.model++;
+      console.log('[Router] ⤴️ Small model asked for the tool-equipped model');
+      return null;
+    }
+    return result.text;
+  } catch (error: any) {
+    if (isAbortError(error, signal)) throw error;
+    console.error('[Router] ⚠️ Small model failed, using the tool-equipped model:', error.message);
+    return null;
+  }
+}
+
+// 取り消されたリクエストへの応答（Python側は応答を投稿せずに破棄する）
+const CANCELLED_RESULT: SearchResult = { status: 499, body: { error: 'cancelled' } };
+
+// エージェント検索処理（requestId があれば実行中に取り消し可能）
+async function handleSearch(params: any): Promise<SearchResult> {
+  const controller = beginRequest(params.requestId);
+  // 処理中はユーザーのMCPサーバーを保持期間切れで破棄しない
+  const release = params.userId ? userResources.pin(params.userId) : null;
+  try {
+    return await runSearch(params, controller.signal);
+  } finally {
+    release?.();
+    endRequest(params.requestId, controller);
+  }
+}
+
+async function runSearch(params: any, signal: AbortSignal): Promise<SearchResult> {
+  try {
+    const { message, threadId, userId } = params;
+    let { context } = params;
+    
+    // IPC経由の場合は、保持済みの会話履歴に差分を適用して復元
+    if (threadId && params.contextOffset !== undefined) {
+      const restored = applyContextDelta(threadId, params.contextOffset, params.contextDelta || '', params.contextDigest,
+        params.contextDrop || 0);
+      if (restored === null) {
+        return { status: 409, body: { error: 'context_out_of_sync' } };
+      }
+      context = restored;
+    }
     
     console.log(`[Server] 📥 Received search request from user ${userId}: ${message?.substring(0, 50)}...`);
     console.log(`[Server] 📊 Request details:`, {
@@ -40,36 +206,93 @@ app.post('/api/agent/search', async (req, res) => {
     });
     
     if (!message) {
-      return res.status(400).json({ error: 'メッセージが必要です' });
+      return { status: 400, body: { error: 'メッセージが必要です' } };
+    }
+
+    // ベンチマーク用スタブモデル（エージェント・MCP・Anthropic APIを使用しない）
+    if (stubModelEnabled) {
+      const response = await generateStubResponse(message, signal);
+      return {
+        status: 200,
+        body: {
+          response,
+          threadId: threadId || 'default',
+          timestamp: new Date().toISOString()
+        }
+      };
+    }
+
+    // エージェント側のスレッド記憶を使用する場合は、保存済みの会話履歴を読み込む
+    const useThreadMemory = params.memory === 'agent' && !!threadId;
+    const history: ThreadTurn[] = useThreadMemory ? await loadThreadHistory(threadId) : [];
+    // recordTurn: false の場合は、呼び出し元が応答の投稿を確定してから /api/agent/threads/turns で記録する
+    const recordTurn = useThreadMemory && params.recordTurn !== false;
+
+    // 安いものから順に振り分け（定型文 → ツールなしの小型モデル → ツール付きの通常モデル）
+    if (routerEnabled) {
+      const route = routeMessage(message, { hasHistory: history.length > 0 || !!context }, routerMinConfidence);
+      routerStats.routed[route.tier]++;
+      if (route.reason === 'escalated') {
+        routerStats.escalated.confidence++;
+      }
+      console.log(`[Router] 🧭 Routed to ${route.tier} (${route.reason}, ${route.predicted} ${route.confidence.toFixed(2)})`);
+
+      const lightResponse = route.tier === 'canned'
+        ? route.reply || null
+        : route.tier === 'small'
+          ? await generateWithLightModel(history, context, message, threadId || 'default', signal)
+          : null;
+      if (lightResponse) {
+        // 取り消されたリクエストの応答は投稿されないため、記録しない
+        if (recordTurn && !signal.aborted) {
+          await recordThreadTurn(threadId, message, lightResponse);
+        }
+        return {
+          status: 200,
+          body: {
+            response: lightResponse,
+            threadId: threadId || 'default',
+            route: route.tier,
+            timestamp: new Date().toISOString()
+          }
+        };
+      }
     }
 
     // ユーザーごとにエージェントを初期化（認証済みMCPツールを使用）
     console.log(`[Server] 🤖 Initializing AI Assistant for user ${userId}...`);
     const userAgent = await getAIAssistant(userId, message);
+    if (signal.aborted) {
+      throw new RequestCancelledError();
+    }
     
     // エージェントの状態をログ出力
     const agentTools = await userAgent.getTools();
     console.log(`[Server] 🔧 Agent initialized with ${Object.keys(agentTools).length} tools`);
     console.log(`[Server] 📋 Available agent tools:`, Object.keys(agentTools));
 
-    // メッセージにコンテキストがある場合は結合
-    let fullMessage = message;
-    if (context) {
-      fullMessage = `過去の会話:\n${context}\n\n現在の質問: ${message}`;
-    }
+    // 固定プレフィックス（指示・ツール定義・履歴）の後に新しい発言を置き、プロンプトキャッシュを効かせる
+    const service = getServiceInstructions(userAgent);
+    const conversation = buildConversation({ history, context, service, message });
 
     console.log('[Server] 🎯 Generating response with AI Assistant...');
-    console.log(`[Server] 📝 Full message to process: ${fullMessage.substring(0, 100)}...`);
+    console.log(`[Server] 📝 Conversation to process: ${conversation.length} messages, ${history.length} from thread memory`);
     
     let result;
+    // 予約済みのトークン（取り消された場合に、予約した時間枠のうちに返却する）
+    let reservation: TokenReservation | null = null;
     try {
-      // レート制限チェック
-      const agentTools = await userAgent.getTools();
-      const toolCount = Object.keys(agentTools).length;
-      const estimatedTokens = rateLimiter.estimateTokens(fullMessage, toolCount);
+      // レート制限チェック（キャッシュ済みのツール定義は見積もりに含めない）
+      const toolNames = Object.keys(agentTools);
+      const cacheKey = prefixKey(service, toolNames);
+      const estimatedTokens = rateLimiter.estimateTokens(
+        conversationLength(conversation),
+        toolNames.length,
+        rateLimiter.isPrefixCached(cacheKey)
+      );
       
       console.log(`[Server] 🚦 Checking rate limit for ~${estimatedTokens} tokens...`);
-      await rateLimiter.checkAndWait(estimatedTokens);
+      reservation = await rateLimiter.checkAndWait(estimatedTokens, signal);
       
       // ユーザー認証済みエージェントでレスポンス生成
       console.log('[Server] 🚀 Generating response with user-authenticated agent...');
@@ -79,7 +302,9 @@ app.post('/api/agent/search', async (req, res) => {
       };
       console.log(`[Server] 🔧 Generation options:`, generationOptions);
       
-      result = await userAgent.generate(fullMessage, generationOptions);
+      result = await userAgent.generate(conversation, { ...generationOptions, abortSignal: signal });
+      rateLimiter.recordUsage(reservation, promptUsageFromResult(result));
+      rateLimiter.markPrefixCached(cacheKey);
       
       console.log(`[Server] 📤 Generation completed:`, {
         hasResult: !!result,
@@ -93,13 +318,27 @@ app.post('/api/agent/search', async (req, res) => {
       
       console.log(`[Server] Response generated: ${response.length} characters`);
       
-      res.json({ 
-        response,
-        threadId: threadId || 'default',
-        timestamp: new Date().toISOString()
-      });
+      if (recordTurn && !signal.aborted) {
+        await recordThreadTurn(threadId, message, response);
+      }
+      
+      return {
+        status: 200,
+        body: {
+          response,
+          threadId: threadId || 'default',
+          timestamp: new Date().toISOString()
+        }
+      };
       
     } catch (generateError: any) {
+      // 取り消された場合は、使われなかった予約を返却してフォールバックも行わない
+      if (isAbortError(generateError, signal)) {
+        if (reservation) {
+          rateLimiter.release(reservation);
+        }
+        throw generateError;
+      }
       console.error('[Server] Generation error:', generateError);
       console.error('[Server] Error details:', {
         message: generateError.message,
@@ -121,19 +360,37 @@ app.post('/api/agent/search', async (req, res) => {
         console.log('[Server] MCP tool error detected, trying with fallback agent...');
         try {
           const fallbackAgent = await getAIAssistant(); // ユーザーIDなしでフォールバック
-          const fallbackResult = await fallbackAgent.generate(fullMessage, {
-            threadId: threadId || 'default'
+          const fallbackConversation = buildConversation({
+            history,
+            context,
+            service: getServiceInstructions(fallbackAgent),
+            message
+          });
+          const fallbackResult = await fallbackAgent.generate(fallbackConversation, {
+            threadId: threadId || 'default',
+            abortSignal: signal
           });
           
           const fallbackResponse = fallbackResult.text || 'すみません、応答の生成に失敗しました。';
           console.log(`[Server] Fallback response: ${fallbackResponse.length} chars`);
           
-          res.json({ 
-            response: fallbackResponse,
-            threadId: threadId || 'default',
-            warning: 'MCPツールが一時的に利用できません。OAuth認証を確認してください。'
-          });
+          if (recordTurn && !signal.aborted) {
+            await recordThreadTurn(threadId, message, fallbackResponse);
+          }
+          
+          return {
+            status: 200,
+            body: {
+              response: fallbackResponse,
+              threadId: threadId || 'default',
+              warning: 'MCPツールが一時的に利用できません。OAuth認証を確認してください。'
+            }
+          };
         } catch (fallbackError) {
+          // 取り消された場合は元のエラーに置き換えず、取り消しとして返す
+          if (isAbortError(fallbackError, signal)) {
+            throw fallbackError;
+          }
           console.error('[Server] Fallback also failed:', fallbackError);
           throw generateError;
         }
@@ -143,43 +400,139 @@ app.post('/api/agent/search', async (req, res) => {
     }
     
   } catch (error: any) {
+    if (isAbortError(error, signal)) {
+      console.log('[Server] 🛑 Request cancelled');
+      return CANCELLED_RESULT;
+    }
     console.error('[Server] Agent error:', error);
-    res.status(500).json({ 
-      error: 'エージェント処理中にエラーが発生しました',
-      details: error.message || 'Unknown error'
-    });
+    return {
+      status: 500,
+      body: {
+        error: 'エージェント処理中にエラーが発生しました',
+        details: error.message || 'Unknown error'
+      }
+    };
   }
+}
+
+// エージェント検索エンドポイント
+app.post('/api/agent/search', async (req, res) => {
+  const { status, body } = await handleSearch(req.body);
+  res.status(status).json(body);
+});
+
+// 実行中のリクエストの取り消し
+function handleCancel(params: any): SearchResult {
+  if (!params.requestId) {
+    return { status: 400, body: { error: 'requestId が必要です' } };
+  }
+  return { status: 200, body: { cancelled: cancelRequest(params.requestId) } };
+}
+
+app.post('/api/agent/cancel', (req, res) => {
+  const { status, body } = handleCancel(req.body);
+  res.status(status).json(body);
+});
+
+// 質問が届く前にユーザーの準備（トークン取得・MCPサーバーの起動・ツール一覧の取得）を開始し、完了を待たずに応答
+// refresh: 保持中の準備を破棄してやり直す（OAuthの接続直後など、トークンが変わった場合）
+function handlePrewarm(params: any): SearchResult {
+  if (!params.userId) {
+    return { status: 400, body: { error: 'userId が必要です' } };
+  }
+  if (stubModelEnabled) {
+    return { status: 200, body: { state: 'skipped' } };
+  }
+  const state = userResources.prewarm(params.userId, !!params.refresh);
+  console.log(`[Prewarm] 🔥 User ${params.userId}: ${state}`);
+  return { status: 200, body: { state } };
+}
+
+app.post('/api/agent/prewarm', (req, res) => {
+  const { status, body } = handlePrewarm(req.body);
+  res.status(status).json(body);
+});
+
+// 投稿を確定した応答、または実行中の同一質問に相乗りしたスレッドへ共有された応答を記録
+async function handleRecordTurn(params: any): Promise<SearchResult> {
+  const { threadId, message, response } = params;
+  if (!threadId || !message || typeof response !== 'string') {
+    return { status: 400, body: { error: 'threadId, message, response が必要です' } };
+  }
+  await recordThreadTurn(threadId, message, response);
+  return { status: 200, body: { recorded: true } };
+}
+
+app.post('/api/agent/threads/turns', async (req, res) => {
+  const { status, body } = await handleRecordTurn(req.body);
+  res.status(status).json(body);
 });
 
 // サーバー起動
-async function startServer() {
-  try {
-    // エージェントの事前初期化
-    console.log('[Server] Pre-initializing AI Assistant...');
-    agent = await getAIAssistant();
-    console.log('[Server] AI Assistant pre-initialized successfully');
+function startServer() {
+  // HTTPサーバーを先に起動し、ヘルスチェックに即座に応答できるようにする
+  app.listen(PORT, () => {
+    console.log(`✅ Mastra AI Assistant server running on port ${PORT}`);
+    console.log(`🔗 Health check: http://localhost:${PORT}/api/health`);
+    console.log(`🤖 Agent endpoint: http://localhost:${PORT}/api/agent/search`);
+    if (DEBUG_ENDPOINTS) {
+      console.log(`🩺 Diagnostics: http://localhost:${PORT}/debug`);
+    }
     
-    // HTTPサーバー起動
-    app.listen(PORT, () => {
-      console.log(`✅ Mastra AI Assistant server running on port ${PORT}`);
-      console.log(`🔗 Health check: http://localhost:${PORT}/api/health`);
-      console.log(`🤖 Agent endpoint: http://localhost:${PORT}/api/agent/search`);
-    });
-  } catch (error) {
+    // バイナリIPC（Unixドメインソケット + msgpack）を有効化
+    const ipcSocketPath = process.env.AGENT_IPC_SOCKET;
+    if (ipcSocketPath) {
+      startIPCServer(ipcSocketPath, async (method, params) => {
+        if (method === 'search') {
+          return handleSearch(params);
+        }
+        if (method === 'recordTurn') {
+          return handleRecordTurn(params);
+        }
+        if (method === 'cancel') {
+          return handleCancel(params);
+        }
+        if (method === 'prewarm') {
+          return handlePrewarm(params);
+        }
+        return { status: 404, body: { error: `Unknown method: ${method}` } };
+      });
+    }
+    
+    // エージェントの事前初期化はバックグラウンドで実行（リクエストは遅延初期化で処理可能）
+    console.log('[Server] Pre-initializing AI Assistant in background...');
+    getAIAssistant()
+      .then((defaultAgent) => {
+        agent = defaultAgent;
+        console.log('[Server] AI Assistant pre-initialized successfully');
+      })
+      .catch((error) => {
+        console.error('[Server] ⚠️ AI Assistant pre-initialization failed:', error);
+      });
+  }).on('error', (error) => {
     console.error('❌ Failed to start server:', error);
     process.exit(1);
-  }
+  });
 }
 
 // プロセス終了時のクリーンアップ
+// 保持中のMCPサーバーのプロセスも終了させる（応答しない場合は5秒で打ち切る）
+async function shutdown() {
+  await Promise.race([
+    userResources.close().catch(() => {}),
+    new Promise((resolve) => setTimeout(resolve, 5000))
+  ]);
+  process.exit(0);
+}
+
 process.on('SIGINT', () => {
   console.log('\n🛑 Shutting down gracefully...');
-  process.exit(0);
+  shutdown();
 });
 
 process.on('SIGTERM', () => {
   console.log('\n🛑 Received SIGTERM, shutting down...');
-  process.exit(0);
+  shutdown();
 });
 
 // サーバー起動
@@ -0,0 +1,104 @@
+// リクエストの取り消し
+// Python側から渡されたリクエストIDごとに AbortController を保持し、
+// /api/agent/cancel（IPCでは cancel メソッド）で中断できるようにする
+// 中断の通知はレート制限の待機・モデルの生成・ツール呼び出しに伝える
+
+const activeRequests = new Map<string, AbortController>();
+
+export class RequestCancelledError extends Error {
+  constructor() {
+    super('Request was cancelled');
+    this.name = 'AbortError';
+  }
+}
+
+// リクエストの開始（IDがない場合は取り消しできないコントローラーを返す）
+export function beginRequest(requestId?: string): AbortController {
+  const controller = new AbortController();
+  if (requestId) {
+    activeRequests.get(requestId)?.abort();
+    activeRequests.set(requestId, controller);
+  }
+  return controller;
+}
+
+export function endRequest(requestId: string | undefined, controller: AbortController): void {
+  if (requestId && activeRequests.get(requestId) === controller) {
+    activeRequests.delete(requestId);
+  }
+}
+
+// 実行中のリクエストを中断（該当するリクエストがない場合は false）
+export function cancelRequest(requestId: string): boolean {
+  const controller = activeRequests.get(requestId);
+  if (!controller) return false;
+  controller.abort(new RequestCancelledError());
+  activeRequests.delete(requestId);
+  console.log(`[Cancel] 🛑 Aborted request ${requestId}`);
+  return true;
+}
+
+export function activeRequestCount(): number {
+  return activeRequests.size;
+}
+
+export function isAbortError(error: any, signal?: AbortSignal): boolean {
+  return !!signal?.aborted || error?.name === 'AbortError';
+}
+
+// 中断可能な待機
+export function abortableSleep(ms: number, signal?: AbortSignal): Promise<void> {
+  return new Promise((resolve, reject) => {
+    if (signal?.aborted) {
+      reject(new RequestCancelledError());
+      return;
+    }
+    const onAbort = () => {
+      clearTimeout(timer);
+      reject(new RequestCancelledError());
+    };
+    const timer = setTimeout(() => {
+      signal?.removeEventListener('abort', onAbort);
+      resolve();
+    }, ms);
+    signal?.addEventListener('abort', onAbort, { once: true });
+  });
+}
+
+// 中断されたら結果を待たずに失敗させる
+function raceAbort<T>(promise: Promise<T>, signal?: AbortSignal): Promise<T> {
+  if (!signal) return promise;
+  if (signal.aborted) return Promise.reject(new RequestCancelledError());
+  return new Promise<T>((resolve, reject) => {
+    const onAbort = () => reject(new RequestCancelledError());
+    signal.addEventListener('abort', onAbort, { once: true });
+    promise.then(
+      (value) => {
+        signal.removeEventListener('abort', onAbort);
+        resolve(value);
+      },
+      (error) => {
+        signal.removeEventListener('abort', onAbort);
+        reject(error);
+      }
+    );
+  });
+}
+
+// ツール呼び出しに中断を伝える（AI SDKがツールの実行オプションに渡す abortSignal を使用）
+// MCPサーバー側の処理は止められないが、中断後は結果を待たずに生成を終了する
+export function withAbortSignal(tools: Record<string, any>): Record<string, any> {
+  return Object.fromEntries(
+    Object.entries(tools).map(([name, tool]) => {
+      if (typeof tool?.execute !== 'function') return [name, tool];
+      const execute = tool.execute.bind(tool);
+      const wrapped = Object.assign(Object.create(Object.getPrototypeOf(tool)), tool, {
+        execute: (input: any, options?: any) => raceAbort(Promise.resolve().then(() => {
+          if (options?.abortSignal?.aborted) throw new RequestCancelledError();
+          return execute(input, options);
+        }), options?.abortSignal)
+      });
+      return [name, wrapped];
+    })
+  );
+}
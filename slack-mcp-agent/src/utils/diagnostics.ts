@@ -0,0 +1,173 @@
+// 実行中のプロセスの診断（/debug/* のエンドポイント用）
+//   - memorySnapshot / childProcesses / eventLoopDelay は定期的な取得（10秒ごとなど）に耐える軽い処理
+//   - sampleHeapAllocations / writeHeapSnapshot は必要な時だけ呼び出す重い処理（同時に1つまで）
+
+import fs from 'node:fs';
+import os from 'node:os';
+import path from 'node:path';
+import v8 from 'node:v8';
+import { Session } from 'node:inspector/promises';
+import { monitorEventLoopDelay } from 'node:perf_hooks';
+
+// イベントループの遅延（前回の取得からの分布、取得時にリセット）
+const loopDelay = monitorEventLoopDelay({ resolution: 20 });
+loopDelay.enable();
+
+const toMs = (ns: number) => Math.round(ns / 1e4) / 100;
+
+export function eventLoopDelay() {
+  const result = {
+    p50Ms: toMs(loopDelay.percentile(50)),
+    p99Ms: toMs(loopDelay.percentile(99)),
+    maxMs: toMs(loopDelay.max)
+  };
+  loopDelay.reset();
+  return result;
+}
+
+export function memorySnapshot() {
+  const usage = process.memoryUsage();
+  const heap = v8.getHeapStatistics();
+  return {
+    uptimeSeconds: Math.round(process.uptime()),
+    rss: usage.rss,
+    heapUsed: usage.heapUsed,
+    heapTotal: usage.heapTotal,
+    heapSizeLimit: heap.heap_size_limit,
+    external: usage.external,
+    arrayBuffers: usage.arrayBuffers,
+    mallocedMemory: heap.malloced_memory,
+    // 増え続ける場合は閉じられていない vm コンテキスト・iframe 相当のリーク
+    detachedContexts: heap.number_of_detached_contexts,
+    heapSpaces: Object.fromEntries(
+      v8.getHeapSpaceStatistics().map((space) => [space.space_name, space.space_used_size])
+    )
+  };
+}
+
+export interface ChildProcessInfo {
+  pid: number;
+  ppid: number;
+  command: string;
+}
+
+function readChildren(pid: number): number[] {
+  const children: number[] = [];
+  for (const task of fs.readdirSync(`/proc/${pid}/task`)) {
+    const content = fs.readFileSync(`/proc/${pid}/task/${task}/children`, 'utf8').trim();
+    if (content) {
+      children.push(...content.split(/\s+/).map(Number));
+    }
+  }
+  return children;
+}
+
+// 子孫プロセス（MCPサーバーの npx とその先のプロセスなど）の一覧
+// /proc の children を使うため Linux のみ対応（それ以外では null）
+export function childProcesses(rootPid = process.pid, limit = 500): ChildProcessInfo[] | null {
+  if (!fs.existsSync(`/proc/${rootPid}/task`)) return null;
+  const result: ChildProcessInfo[] = [];
+  const queue = [rootPid];
+  while (queue.length > 0 && result.length < limit) {
+    const ppid = queue.shift()!;
+    let children: number[];
+    try {
+      children = readChildren(ppid);
+    } catch {
+      // 読み取り中に終了したプロセス
+      continue;
+    }
+    for (const pid of children) {
+      let command = '';
+      try {
+        command = fs.readFileSync(`/proc/${pid}/comm`, 'utf8').trim();
+      } catch {
+        continue;
+      }
+      result.push({ pid, ppid, command });
+      queue.push(pid);
+    }
+  }
+  return result;
+}
+
+export class DiagnosticsBusyError extends Error {
+  constructor() {
+    super('Another heap profile or snapshot is in progress');
+    this.name = 'DiagnosticsBusyError';
+  }
+}
+
+let busy = false;
+
+async function exclusive<T>(task: () => Promise<T>): Promise<T> {
+  if (busy) throw new DiagnosticsBusyError();
+  busy = true;
+  try {
+    return await task();
+  } finally {
+    busy = false;
+  }
+}
+
+export interface HeapAllocator {
+  function: string;
+  location: string;
+  bytes: number;
+}
+
+interface SamplingNode {
+  callFrame: { functionName: string; url: string; lineNumber: number };
+  selfSize: number;
+  children: SamplingNode[];
+}
+
+// 一定時間サンプリングし、終了時点で生存しているオブジェクトを確保した関数の上位を返す
+export function sampleHeapAllocations(durationMs: number, top = 20): Promise<{ durationMs: number; totalBytes: number; top: HeapAllocator[] }> {
+  return exclusive(async () => {
+    const session = new Session();
+    session.connect();
+    try {
+      await session.post('HeapProfiler.enable');
+      await session.post('HeapProfiler.startSampling', { samplingInterval: 32 * 1024 });
+      await new Promise((resolve) => setTimeout(resolve, durationMs));
+      const { profile } = await session.post('HeapProfiler.stopSampling') as { profile: { head: SamplingNode } };
+
+      const bytesByFrame = new Map<string, HeapAllocator>();
+      let totalBytes = 0;
+      const stack = [profile.head];
+      while (stack.length > 0) {
+        const node = stack.pop()!;
+        stack.push(...node.children);
+        if (node.selfSize === 0) continue;
+        totalBytes += node.selfSize;
+        const { functionName, url, lineNumber } = node.callFrame;
+        const location = url ? `${url}:${lineNumber + 1}` : '(native)';
+        const key = `${functionName}@${location}`;
+        const entry = bytesByFrame.get(key) || { function: functionName || '(anonymous)', location, bytes: 0 };
+        entry.bytes += node.selfSize;
+        bytesByFrame.set(key, entry);
+      }
+      const sorted = [...bytesByFrame.values()].sort((a, b) => b.bytes - a.bytes).slice(0, top);
+      return { durationMs, totalBytes, top: sorted };
+    } finally {
+      await session.post('HeapProfiler.disable').catch(() => {});
+      session.disconnect();
+    }
+  });
+}
+
+// ヒープスナップショットをファイルに書き出す（書き出し中はイベントループが止まる、Chrome DevTools で開く）
+export function writeHeapSnapshot(directory = process.env.AGENT_DEBUG_DIR || os.tmpdir()): Promise<{ path: string; bytes: number; elapsedMs: number }> {
+  return exclusive(async () => {
+    const started = Date.now();
+    fs.mkdirSync(directory, { recursive: true });
+    const file = v8.writeHeapSnapshot(path.join(directory, `agent-${process.pid}-${Date.now()}.heapsnapshot`));
+    return { path: file, bytes: fs.statSync(file).size, elapsedMs: Date.now() - started };
+  });
+}
+
+// /debug/* はローカルからのアクセスのみ許可する
+export function isLoopbackAddress(address: string | undefined): boolean {
+  return address === '127.0.0.1' || address === '::1' || address === '::ffff:127.0.0.1';
+}
@@ -0,0 +1,235 @@
+// IPC用の最小限のMessagePackエンコーダー／デコーダー
+// 対応型: nil, boolean, 整数, float64, 文字列, バイナリ, 配列, マップ（Python側の msgpack.packb(use_bin_type=True) と互換）
+
+const textEncoder = new TextEncoder();
+const textDecoder = new TextDecoder();
+
+class Writer {
+  private buffer = Buffer.allocUnsafe(256);
+  private offset = 0;
+
+  private ensure(size: number) {
+    if (this.offset + size <= this.buffer.length) return;
+    let length = this.buffer.length * 2;
+    while (length < this.offset + size) length *= 2;
+    const next = Buffer.allocUnsafe(length);
+    this.buffer.copy(next, 0, 0, this.offset);
+    this.buffer = next;
+  }
+
+  u8(value: number) {
+    this.ensure(1);
+    this.buffer[this.offset++] = value;
+  }
+
+  u16(value: number) {
+    this.ensure(2);
+    this.buffer.writeUInt16BE(value, this.offset);
+    this.offset += 2;
+  }
+
+  u32(value: number) {
+    this.ensure(4);
+    this.buffer.writeUInt32BE(value, this.offset);
+    this.offset += 4;
+  }
+
+  i64(value: number) {
+    this.ensure(8);
+    this.buffer.writeBigInt64BE(BigInt(value), this.offset);
+    this.offset += 8;
+  }
+
+  f64(value: number) {
+    this.ensure(8);
+    this.buffer.writeDoubleBE(value, this.offset);
+    this.offset += 8;
+  }
+
+  bytes(value: Uint8Array) {
+    this.ensure(value.length);
+    this.buffer.set(value, this.offset);
+    this.offset += value.length;
+  }
+
+  result(): Buffer {
+    return this.buffer.subarray(0, this.offset);
+  }
+}
+
+function writeLength(writer: Writer, length: number, fix: number, fixMax: number, type16: number, type32: number) {
+  if (length <= fixMax) {
+    writer.u8(fix | length);
+  } else if (length <= 0xffff) {
+    writer.u8(type16);
+    writer.u16(length);
+  } else {
+    writer.u8(type32);
+    writer.u32(length);
+  }
+}
+
+function writeValue(writer: Writer, value: any) {
+  if (value === null || value === undefined) {
+    writer.u8(0xc0);
+  } else if (value === false) {
+    writer.u8(0xc2);
+  } else if (value === true) {
+    writer.u8(0xc3);
+  } else if (typeof value === 'number') {
+    if (Number.isSafeInteger(value)) {
+      if (value >= 0 && value < 128) {
+        writer.u8(value);
+      } else if (value < 0 && value >= -32) {
+        writer.u8(0xe0 | (value + 32));
+      } else {
+        writer.u8(0xd3);
+        writer.i64(value);
+      }
+    } else {
+      writer.u8(0xcb);
+      writer.f64(value);
+    }
+  } else if (typeof value === 'string') {
+    const encoded = textEncoder.encode(value);
+    if (encoded.length < 32) {
+      writer.u8(0xa0 | encoded.length);
+    } else if (encoded.length <= 0xff) {
+      writer.u8(0xd9);
+      writer.u8(encoded.length);
+    } else if (encoded.length <= 0xffff) {
+      writer.u8(0xda);
+      writer.u16(encoded.length);
+    } else {
+      writer.u8(0xdb);
+      writer.u32(encoded.length);
+    }
+    writer.bytes(encoded);
+  } else if (value instanceof Uint8Array) {
+    if (value.length <= 0xff) {
+      writer.u8(0xc4);
+      writer.u8(value.length);
+    } else if (value.length <= 0xffff) {
+      writer.u8(0xc5);
+      writer.u16(value.length);
+    } else {
+      writer.u8(0xc6);
+      writer.u32(value.length);
+    }
+    writer.bytes(value);
+  } else if (Array.isArray(value)) {
+    writeLength(writer, value.length, 0x90, 15, 0xdc, 0xdd);
+    for (const item of value) writeValue(writer, item);
+  } else if (value instanceof Date) {
+    writeValue(writer, value.toISOString());
+  } else if (typeof value === 'object') {
+    const entries = Object.entries(value).filter(([, item]) => item !== undefined);
+    writeLength(writer, entries.length, 0x80, 15, 0xde, 0xdf);
+    for (const [key, item] of entries) {
+      writeValue(writer, key);
+      writeValue(writer, item);
+    }
+  } else {
+    throw new TypeError(`Unsupported msgpack type: ${typeof value}`);
+  }
+}
+
+export function encode(value: any): Buffer {
+  const writer = new Writer();
+  writeValue(writer, value);
+  return writer.result();
+}
+
+class Reader {
+  offset = 0;
+
+  constructor(private readonly buffer: Buffer) {}
+
+  u8(): number {
+    this.check(1);
+    return this.buffer[this.offset++];
+  }
+
+  read(size: number, read: (offset: number) => number | bigint): number {
+    this.check(size);
+    const value = read(this.offset);
+    this.offset += size;
+    return Number(value);
+  }
+
+  slice(size: number): Buffer {
+    this.check(size);
+    const value = this.buffer.subarray(this.offset, this.offset + size);
+    this.offset += size;
+    return value;
+  }
+
+  private check(size: number) {
+    if (this.offset + size > this.buffer.length) {
+      throw new RangeError('Truncated msgpack data');
+    }
+  }
+}
+
+function readValue(reader: Reader): any {
+  const buffer = (reader as any).buffer as Buffer;
+  const type = reader.u8();
+
+  if (type <= 0x7f) return type;
+  if (type >= 0xe0) return type - 0x100;
+  if ((type & 0xf0) === 0x80) return readMap(reader, type & 0x0f);
+  if ((type & 0xf0) === 0x90) return readArray(reader, type & 0x0f);
+  if ((type & 0xe0) === 0xa0) return textDecoder.decode(reader.slice(type & 0x1f));
+
+  switch (type) {
+    case 0xc0: return null;
+    case 0xc2: return false;
+    case 0xc3: return true;
+    case 0xc4: return Buffer.from(reader.slice(reader.u8()));
+    case 0xc5: return Buffer.from(reader.slice(reader.read(2, (o) => buffer.readUInt16BE(o))));
+    case 0xc6: return Buffer.from(reader.slice(reader.read(4, (o) => buffer.readUInt32BE(o))));
+    case 0xca: return reader.read(4, (o) => buffer.readFloatBE(o));
+    case 0xcb: return reader.read(8, (o) => buffer.readDoubleBE(o));
+    case 0xcc: return reader.u8();
+    case 0xcd: return reader.read(2, (o) => buffer.readUInt16BE(o));
+    case 0xce: return reader.read(4, (o) => buffer.readUInt32BE(o));
+    case 0xcf: return reader.read(8, (o) => buffer.readBigUInt64BE(o));
+    case 0xd0: return reader.read(1, (o) => buffer.readInt8(o));
+    case 0xd1: return reader.read(2, (o) => buffer.readInt16BE(o));
+    case 0xd2: return reader.read(4, (o) => buffer.readInt32BE(o));
+    case 0xd3: return reader.read(8, (o) => buffer.readBigInt64BE(o));
+    case 0xd9: return textDecoder.decode(reader.slice(reader.u8()));
+    case 0xda: return textDecoder.decode(reader.slice(reader.read(2, (o) => buffer.readUInt16BE(o))));
+    case 0xdb: return textDecoder.decode(reader.slice(reader.read(4, (o) => buffer.readUInt32BE(o))));
+    case 0xdc: return readArray(reader, reader.read(2, (o) => buffer.readUInt16BE(o)));
+    case 0xdd: return readArray(reader, reader.read(4, (o) => buffer.readUInt32BE(o)));
+    case 0xde: return readMap(reader, reader.read(2, (o) => buffer.readUInt16BE(o)));
+    case 0xdf: return readMap(reader, reader.read(4, (o) => buffer.readUInt32BE(o)));
+    default:
+      throw new TypeError(`Unsupported msgpack type byte: 0x${type.toString(16)}`);
+  }
+}
+
+function readArray(reader: Reader, length: number): any[] {
+  const result = new Array(length);
+  for (let i = 0; i < length; i++) result[i] = readValue(reader);
+  return result;
+}
+
+function readMap(reader: Reader, length: number): Record<string, any> {
+  const result: Record<string, any> = {};
+  for (let i = 0; i < length; i++) {
+    const key = readValue(reader);
+    result[String(key)] = readValue(reader);
+  }
+  return result;
+}
+
+export function decode(data: Buffer): any {
+  const reader = new Reader(data);
+  const value = readValue(reader);
+  if (reader.offset !== data.length) {
+    throw new RangeError('Trailing bytes after msgpack value');
+  }
+  return value;
+}
@@ -1,11 +1,26 @@
 // Simple rate limiter for Anthropic API
 // Claude Sonnet 4 has a limit of 20,000 tokens per minute
 
+import { abortableSleep } from './cancellation';
+
 interface RateLimitState {
   windowStart: number;
   tokenCount: number;
 }
 
+// Tokens reserved by checkAndWait, tied to the window they were counted in
+export interface TokenReservation {
+  tokens: number;
+  windowStart: number;
+}
+
+// Token usage reported by the Anthropic provider for one generation
+export interface PromptUsage {
+  inputTokens?: number;
+  cacheCreationInputTokens?: number;
+  cacheReadInputTokens?: number;
+}
+
 export class RateLimiter {
   private state: RateLimitState = {
     windowStart: Date.now(),
@@ -15,7 +30,13 @@ export class RateLimiter {
   private readonly windowMs = 60 * 1000; // 1 minute
   private readonly maxTokens = 18000; // Leave some buffer (20k limit)
   
-  async checkAndWait(estimatedTokens: number): Promise<void> {
+  // Prompt prefixes (instructions + tool set) sent recently enough to still be cached
+  private readonly cacheTtlMs = 5 * 60 * 1000; // Anthropic ephemeral cache lifetime
+  private cachedPrefixes = new Map<string, number>();
+  
+  // Reserve tokens in the current window, waiting for the next window if needed
+  // An aborted wait throws without reserving anything
+  async checkAndWait(estimatedTokens: number, signal?: AbortSignal): Promise<TokenReservation> {
     const now = Date.now();
     
     // Reset window if it's expired
@@ -33,7 +54,7 @@ export class RateLimiter {
       console.log(`[RateLimiter] Would exceed rate limit. Waiting ${Math.round(waitTime / 1000)}s...`);
       
       if (waitTime > 0) {
-        await new Promise(resolve => setTimeout(resolve, waitTime));
+        await abortableSleep(waitTime, signal);
         // Reset after waiting
         this.state = {
           windowStart: Date.now(),
@@ -45,15 +66,53 @@ export class RateLimiter {
     // Update token count
     this.state.tokenCount += estimatedTokens;
     console.log(`[RateLimiter] Token usage: ${this.state.tokenCount}/${this.maxTokens} in current window`);
+    return { tokens: estimatedTokens, windowStart: this.state.windowStart };
+  }
+  
+  // Whether the reservation was counted in the current window
+  // (after a reset, its tokens are no longer part of tokenCount)
+  private inCurrentWindow(reservation: TokenReservation): boolean {
+    return reservation.windowStart === this.state.windowStart;
+  }
+  
+  // Return a reservation that was not used (e.g. the request was cancelled)
+  release(reservation: TokenReservation): void {
+    if (!this.inCurrentWindow(reservation)) {
+      console.log(`[RateLimiter] Reservation of ${reservation.tokens} tokens expired with its window, nothing to release`);
+      return;
+    }
+    this.state.tokenCount = Math.max(0, this.state.tokenCount - reservation.tokens);
+    console.log(`[RateLimiter] Released ${reservation.tokens} reserved tokens (${this.state.tokenCount}/${this.maxTokens} in current window)`);
+  }
+  
+  // Current window state for diagnostics (does not reset an expired window)
+  snapshot() {
+    const now = Date.now();
+    const elapsed = now - this.state.windowStart;
+    const expired = elapsed > this.windowMs;
+    let cachedPrefixes = 0;
+    for (const expiresAt of this.cachedPrefixes.values()) {
+      if (expiresAt > now) cachedPrefixes++;
+    }
+    return {
+      windowMs: this.windowMs,
+      windowRemainingMs: expired ? 0 : this.windowMs - elapsed,
+      tokenCount: expired ? 0 : this.state.tokenCount,
+      maxTokens: this.maxTokens,
+      utilization: expired ? 0 : this.state.tokenCount / this.maxTokens,
+      cachedPrefixes
+    };
   }
   
   // Estimate tokens based on message length (rough approximation)
-  estimateTokens(message: string, toolCount: number = 0): number {
+  // Cached tool schemas are read from the prompt cache and do not count towards input token limits
+  estimateTokens(messageOrLength: string | number, toolCount: number = 0, prefixCached: boolean = false): number {
     // Rough estimate: 1 token per 4 characters for Japanese/English mix
-    const messageTokens = Math.ceil(message.length / 4);
+    const length = typeof messageOrLength === 'number' ? messageOrLength : messageOrLength.length;
+    const messageTokens = Math.ceil(length / 4);
     
     // Each tool adds approximately 500-1000 tokens for its schema
-    const toolTokens = toolCount * 750;
+    const toolTokens = prefixCached ? 0 : toolCount * 750;
     
     // Add buffer for system messages and response
     const bufferTokens = 500;
@@ -63,6 +122,43 @@ export class RateLimiter {
     
     return total;
   }
+  
+  // Whether a prompt prefix was sent within the cache lifetime
+  isPrefixCached(key: string): boolean {
+    const expiresAt = this.cachedPrefixes.get(key);
+    return expiresAt !== undefined && expiresAt > Date.now();
+  }
+  
+  // Record that a prompt prefix was just sent (each cache hit refreshes the lifetime)
+  markPrefixCached(key: string): void {
+    const now = Date.now();
+    this.cachedPrefixes.set(key, now + this.cacheTtlMs);
+    for (const [prefix, expiresAt] of this.cachedPrefixes) {
+      if (expiresAt <= now) this.cachedPrefixes.delete(prefix);
+    }
+  }
+  
+  // Replace the estimate with the actual usage once known
+  // Cache reads are excluded: they do not count towards the input tokens per minute limit
+  // The prompt was sent in the reservation's window, so an expired window is left as is
+  recordUsage(reservation: TokenReservation, usage: PromptUsage): void {
+    if (usage.inputTokens === undefined) return;
+    const counted = usage.inputTokens + (usage.cacheCreationInputTokens || 0);
+    if (this.inCurrentWindow(reservation)) {
+      this.state.tokenCount = Math.max(0, this.state.tokenCount + counted - reservation.tokens);
+    }
+    console.log(`[RateLimiter] Actual usage: ${counted} tokens counted, ${usage.cacheReadInputTokens || 0} read from cache (estimated ${reservation.tokens})`);
+  }
+}
+
+// Extract prompt usage from a generation result (AI SDK usage + Anthropic provider metadata)
+export function promptUsageFromResult(result: any): PromptUsage {
+  const anthropic = result?.providerMetadata?.anthropic || {};
+  return {
+    inputTokens: result?.usage?.promptTokens,
+    cacheCreationInputTokens: anthropic.cacheCreationInputTokens ?? undefined,
+    cacheReadInputTokens: anthropic.cacheReadInputTokens ?? undefined
+  };
 }
 
 // Singleton instance
@@ -0,0 +1,286 @@
+// ユーザーごとに準備した資源（トークン・MCPサーバーのプロセス・ツール一覧）を短時間保持するプール
+//   - 同じキーの読み込みは1回にまとめ、準備中に届いた取得要求は完了を待って同じ結果を使う
+//   - prewarm で、質問が届く前（メンションの受信時など）に読み込みを始められる
+//   - 最後の使用から idleMs を過ぎた資源は破棄する（使用中＝pin されている間は破棄しない）
+//   - 保持数の上限を超えた場合は、使用中でない最も古いものから破棄する
+// 読み込み結果が null の場合（トークン未登録など）と keep が false を返した場合は保持しない
+
+export interface ResourcePoolOptions<T> {
+  load: (key: string) => Promise<T | null>;
+  dispose: (value: T) => Promise<void> | void;
+  // 保持するかどうか（読み込みに一部失敗した結果などを保持しない場合に使用）
+  keep?: (value: T) => boolean;
+  idleMs?: number;
+  // 使用し続けていても、読み込みからこの時間を過ぎたら読み込み直す（トークンの更新を反映するため）
+  maxAgeMs?: number;
+  maxEntries?: number;
+  // 期限切れの確認間隔（0で自動確認しない）
+  sweepIntervalMs?: number;
+}
+
+export type PrewarmState = 'warm' | 'warming' | 'started';
+
+interface PoolEntry<T> {
+  key: string;
+  promise: Promise<T | null>;
+  value: T | null;
+  settled: boolean;
+  loadedAt: number;
+  lastUsed: number;
+  // プールから外された（更新・追い出し）後、使用中でなくなったら破棄する
+  retired: boolean;
+  disposed: boolean;
+}
+
+export interface ResourcePoolStats {
+  entries: number;
+  // プールから外れ、使用中のため破棄を待っている資源
+  retired: number;
+  pinned: number;
+  loads: number;
+  hits: number;
+  joined: number;
+  prewarms: number;
+  expired: number;
+  evicted: number;
+  failures: number;
+  // 取得を待った平均時間（保持済み・準備中への合流・新規の読み込み別、ミリ秒）
+  avgWaitMs: { hit: number; joined: number; load: number };
+}
+
+type WaitKind = 'hit' | 'joined' | 'load';
+
+export class IdleResourcePool<T> {
+  private entries = new Map<string, PoolEntry<T>>();
+  private retired = new Set<PoolEntry<T>>();
+  private pins = new Map<string, number>();
+  private counters = { loads: 0, hits: 0, joined: 0, prewarms: 0, expired: 0, evicted: 0, failures: 0 };
+  private waits: Record<WaitKind, { total: number; count: number }> = {
+    hit: { total: 0, count: 0 },
+    joined: { total: 0, count: 0 },
+    load: { total: 0, count: 0 }
+  };
+  private timer: ReturnType<typeof setInterval> | null = null;
+  readonly idleMs: number;
+  readonly maxAgeMs: number;
+  readonly maxEntries: number;
+
+  constructor(private options: ResourcePoolOptions<T>) {
+    this.idleMs = options.idleMs ?? 2 * 60 * 1000;
+    this.maxAgeMs = options.maxAgeMs ?? 30 * 60 * 1000;
+    this.maxEntries = options.maxEntries ?? 20;
+    const sweepIntervalMs = options.sweepIntervalMs ?? Math.min(30 * 1000, this.idleMs / 2);
+    if (sweepIntervalMs > 0) {
+      this.timer = setInterval(() => this.sweep(), sweepIntervalMs);
+      this.timer.unref?.();
+    }
+  }
+
+  // 資源を取得（保持中・準備中であればそれを使い、なければ読み込む）
+  async get(key: string): Promise<T | null> {
+    const started = Date.now();
+    let entry = this.usable(key);
+    let kind: WaitKind;
+    if (entry) {
+      kind = entry.settled ? 'hit' : 'joined';
+      this.counters[kind === 'hit' ? 'hits' : 'joined']++;
+      entry.lastUsed = started;
+    } else {
+      kind = 'load';
+      entry = this.start(key);
+    }
+    try {
+      return await entry.promise;
+    } finally {
+      this.waits[kind].total += Date.now() - started;
+      this.waits[kind].count++;
+    }
+  }
+
+  // 質問が届く前に読み込みを開始（refresh の場合は保持中の資源を破棄して読み込み直す）
+  prewarm(key: string, refresh = false): PrewarmState {
+    this.counters.prewarms++;
+    const entry = this.usable(key);
+    if (entry && !refresh) {
+      entry.lastUsed = Date.now();
+      return entry.settled ? 'warm' : 'warming';
+    }
+    if (entry) {
+      this.retire(entry);
+    }
+    // 失敗は取得時に改めて扱うため、ここでは握りつぶす
+    this.start(key).promise.catch(() => {});
+    return 'started';
+  }
+
+  // 使用中の間は破棄しない（返り値の関数で解除、解除した時点から idleMs を数える）
+  pin(key: string): () => void {
+    this.pins.set(key, (this.pins.get(key) || 0) + 1);
+    let released = false;
+    return () => {
+      if (released) return;
+      released = true;
+      const count = (this.pins.get(key) || 1) - 1;
+      if (count > 0) {
+        this.pins.set(key, count);
+      } else {
+        this.pins.delete(key);
+      }
+      const entry = this.entries.get(key);
+      if (entry) {
+        entry.lastUsed = Date.now();
+      }
+      this.disposeRetired();
+    };
+  }
+
+  // 保持中の資源を破棄（トークンの失効時など）
+  invalidate(key: string): void {
+    const entry = this.entries.get(key);
+    if (entry) {
+      this.retire(entry);
+    }
+  }
+
+  // 最後の使用から idleMs を過ぎた資源を破棄
+  sweep(now = Date.now()): number {
+    let expired = 0;
+    for (const entry of [...this.entries.values()]) {
+      if (entry.settled && !this.pinned(entry.key) && now - entry.lastUsed >= this.idleMs) {
+        this.retire(entry);
+        expired++;
+      }
+    }
+    this.counters.expired += expired;
+    this.disposeRetired();
+    return expired;
+  }
+
+  has(key: string): boolean {
+    const entry = this.entries.get(key);
+    return !!entry && entry.settled;
+  }
+
+  stats(): ResourcePoolStats {
+    const average = (kind: WaitKind) => (this.waits[kind].count > 0 ? this.waits[kind].total / this.waits[kind].count : 0);
+    return {
+      entries: this.entries.size,
+      retired: this.retired.size,
+      pinned: this.pins.size,
+      ...this.counters,
+      avgWaitMs: { hit: average('hit'), joined: average('joined'), load: average('load') }
+    };
+  }
+
+  // すべての資源を破棄（プロセス終了時）
+  async close(): Promise<void> {
+    if (this.timer) {
+      clearInterval(this.timer);
+      this.timer = null;
+    }
+    const entries = [...this.entries.values(), ...this.retired];
+    this.entries.clear();
+    this.retired.clear();
+    await Promise.all(entries.map(async (entry) => {
+      await entry.promise.catch(() => null);
+      this.disposeEntry(entry);
+    }));
+  }
+
+  private usable(key: string): PoolEntry<T> | undefined {
+    const entry = this.entries.get(key);
+    if (entry && entry.settled && Date.now() - entry.loadedAt >= this.maxAgeMs) {
+      this.retire(entry);
+      return undefined;
+    }
+    return entry;
+  }
+
+  private pinned(key: string): boolean {
+    return (this.pins.get(key) || 0) > 0;
+  }
+
+  private start(key: string): PoolEntry<T> {
+    const now = Date.now();
+    const entry: PoolEntry<T> = {
+      key,
+      promise: Promise.resolve(null),
+      value: null,
+      settled: false,
+      loadedAt: now,
+      lastUsed: now,
+      retired: false,
+      disposed: false
+    };
+    this.counters.loads++;
+    entry.promise = this.options.load(key).then(
+      (value) => {
+        entry.value = value;
+        entry.settled = true;
+        entry.loadedAt = Date.now();
+        if (value === null || (this.options.keep && !this.options.keep(value))) {
+          this.forget(entry);
+          this.disposeEntry(entry);
+        } else if (entry.retired) {
+          this.disposeRetired();
+        }
+        return value;
+      },
+      (error) => {
+        this.counters.failures++;
+        entry.settled = true;
+        this.forget(entry);
+        throw error;
+      }
+    );
+    this.entries.set(key, entry);
+    this.evictOverflow();
+    return entry;
+  }
+
+  private forget(entry: PoolEntry<T>): void {
+    if (this.entries.get(entry.key) === entry) {
+      this.entries.delete(entry.key);
+    }
+    this.retired.delete(entry);
+  }
+
+  private retire(entry: PoolEntry<T>): void {
+    this.forget(entry);
+    entry.retired = true;
+    this.retired.add(entry);
+    this.disposeRetired();
+  }
+
+  // 保持数の上限を超えた場合は、使用中でない最も古い資源から破棄
+  private evictOverflow(): void {
+    while (this.entries.size > this.maxEntries) {
+      let oldest: PoolEntry<T> | undefined;
+      for (const entry of this.entries.values()) {
+        if (entry.settled && !this.pinned(entry.key) && (!oldest || entry.lastUsed < oldest.lastUsed)) {
+          oldest = entry;
+        }
+      }
+      if (!oldest) return;
+      this.retire(oldest);
+      this.counters.evicted++;
+    }
+  }
+
+  private disposeRetired(): void {
+    for (const entry of [...this.retired]) {
+      if (entry.settled && !this.pinned(entry.key)) {
+        this.retired.delete(entry);
+        this.disposeEntry(entry);
+      }
+    }
+  }
+
+  private disposeEntry(entry: PoolEntry<T>): void {
+    if (entry.disposed || entry.value === null) return;
+    entry.disposed = true;
+    Promise.resolve()
+      .then(() => this.options.dispose(entry.value as T))
+      .catch((error) => console.warn(`[ResourcePool] ⚠️ Failed to dispose resources for ${entry.key}:`, error?.message || error));
+  }
+}
@@ -0,0 +1,20 @@
+// ベンチマーク用のスタブモデル（Anthropic APIを呼ばずに応答を返す）
+// AGENT_STUB_MODEL=true で有効化し、1リクエストあたりの負荷を環境変数で指定する
+//   AGENT_STUB_CPU_MS: プロンプト構築やツールスキーマ処理を模したCPU時間（イベントループを占有）
+//   AGENT_STUB_LATENCY_MS: モデル応答待ちを模した待ち時間
+
+import { abortableSleep } from './cancellation';
+
+export const stubModelEnabled = process.env.AGENT_STUB_MODEL === 'true';
+
+const cpuMs = Number(process.env.AGENT_STUB_CPU_MS || 20);
+const latencyMs = Number(process.env.AGENT_STUB_LATENCY_MS || 200);
+
+export async function generateStubResponse(message: string, signal?: AbortSignal): Promise<string> {
+  const busyUntil = Date.now() + cpuMs;
+  while (Date.now() < busyUntil) {
+    // CPU負荷のシミュレーション
+  }
+  await abortableSleep(latencyMs, signal);
+  return `[stub] ${message.substring(0, 100)}`;
+}
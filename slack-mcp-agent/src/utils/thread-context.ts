@@ -0,0 +1,65 @@
+// スレッドごとの会話履歴キャッシュ（IPC経由の差分送信用）
+// Python側は保持済みの内容から先頭を落とす長さ（contextDrop）、残りの長さ（contextOffset）とそのハッシュ（contextDigest）、
+// 差分（contextDelta）のみを送信する
+// 長さはUTF-8のバイト数、ハッシュはUTF-8のバイト列のSHA-256（Python側の agent_ipc.ContextSync と同じ）
+
+import { createHash } from 'node:crypto';
+
+interface ThreadContextEntry {
+  context: string;
+  bytes: number;
+  digest: string;
+  updatedAt: number;
+}
+
+const MAX_THREADS = 5000;
+const CONTEXT_TTL = 24 * 60 * 60 * 1000; // 24時間（Python側のスレッド記憶と同じ）
+
+// Mapの挿入順を利用したLRU
+const threadContexts = new Map<string, ThreadContextEntry>();
+
+export function contextDigest(context: string): string {
+  return createHash('sha256').update(context, 'utf8').digest('hex');
+}
+
+// 差分を適用して会話履歴を復元（保持内容の先頭 drop バイトを落とした残りと長さ・ハッシュが一致しない場合はnull）
+// Python側の会話履歴は最新の一定件数のみのため、長いスレッドでは先頭の発言を落とした残りに続きを付け足す
+export function applyContextDelta(threadId: string, offset: number, delta: string, digest?: string,
+                                  drop = 0): string | null {
+  let base = '';
+  
+  if (offset > 0) {
+    const entry = threadContexts.get(threadId);
+    if (!entry || Date.now() - entry.updatedAt > CONTEXT_TTL || entry.bytes !== drop + offset) {
+      threadContexts.delete(threadId);
+      return null;
+    }
+    // 文字の途中で落とした場合は置換文字が入り、ハッシュが一致しない
+    base = drop > 0 ? Buffer.from(entry.context, 'utf8').subarray(drop).toString('utf8') : entry.context;
+    if ((drop > 0 ? contextDigest(base) : entry.digest) !== digest) {
+      threadContexts.delete(threadId);
+      return null;
+    }
+  }
+  
+  const context = base + delta;
+  threadContexts.delete(threadId);
+  threadContexts.set(threadId, {
+    context,
+    bytes: Buffer.byteLength(context, 'utf8'),
+    digest: contextDigest(context),
+    updatedAt: Date.now()
+  });
+  
+  while (threadContexts.size > MAX_THREADS) {
+    const oldest = threadContexts.keys().next().value;
+    if (oldest === undefined) break;
+    threadContexts.delete(oldest);
+  }
+  
+  return context;
+}
+
+export function getThreadContextCount(): number {
+  return threadContexts.size;
+}
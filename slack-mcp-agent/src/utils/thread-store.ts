@@ -0,0 +1,143 @@
+import Redis from 'ioredis';
+
+// エージェント側のスレッド記憶
+// threadIdごとに会話履歴を保持し、Python側は新しいユーザー発言のみを送信する
+// 既定はRedis（エージェントの再起動・複数インスタンス間で共有）、AGENT_THREAD_STORE=memory でプロセス内に保持
+
+export interface ThreadTurn {
+  role: 'user' | 'assistant';
+  content: string;
+  timestamp: number;
+}
+
+const MAX_MESSAGES = 20;
+const THREAD_TTL_SECONDS = 24 * 60 * 60; // 24時間
+const MAX_MEMORY_THREADS = 5000;
+
+interface ThreadStore {
+  getHistory(threadId: string): Promise<ThreadTurn[]>;
+  appendTurns(threadId: string, turns: ThreadTurn[]): Promise<void>;
+  clear(threadId: string): Promise<void>;
+  // 診断用の件数（Redisの場合は走査しない）
+  stats(): ThreadStoreStats;
+}
+
+export interface ThreadStoreStats {
+  backend: 'memory' | 'redis';
+  threads?: number;
+  messages?: number;
+  // 発言の文字列のおおよそのバイト数（UTF-16、1文字2バイトで概算）
+  bytes?: number;
+}
+
+class MemoryThreadStore implements ThreadStore {
+  // Mapの挿入順を利用したLRU
+  private threads = new Map<string, ThreadTurn[]>();
+
+  async getHistory(threadId: string): Promise<ThreadTurn[]> {
+    const cutoff = Date.now() - THREAD_TTL_SECONDS * 1000;
+    return (this.threads.get(threadId) || []).filter((turn) => turn.timestamp >= cutoff);
+  }
+
+  async appendTurns(threadId: string, turns: ThreadTurn[]): Promise<void> {
+    const history = [...(await this.getHistory(threadId)), ...turns].slice(-MAX_MESSAGES);
+    this.threads.delete(threadId);
+    this.threads.set(threadId, history);
+
+    while (this.threads.size > MAX_MEMORY_THREADS) {
+      const oldest = this.threads.keys().next().value;
+      if (oldest === undefined) break;
+      this.threads.delete(oldest);
+    }
+  }
+
+  async clear(threadId: string): Promise<void> {
+    this.threads.delete(threadId);
+  }
+
+  stats(): ThreadStoreStats {
+    let messages = 0;
+    let bytes = 0;
+    for (const turns of this.threads.values()) {
+      messages += turns.length;
+      for (const turn of turns) {
+        bytes += turn.content.length * 2;
+      }
+    }
+    return { backend: 'memory', threads: this.threads.size, messages, bytes };
+  }
+}
+
+class RedisThreadStore implements ThreadStore {
+  private redis: Redis;
+
+  constructor(redisUrl: string) {
+    this.redis = new Redis(redisUrl, { maxRetriesPerRequest: 1 });
+    this.redis.on('error', (error) => {
+      console.error('[ThreadStore] ❌ Redis connection error:', error.message);
+    });
+  }
+
+  private key(threadId: string): string {
+    return `thread:messages:${threadId}`;
+  }
+
+  async getHistory(threadId: string): Promise<ThreadTurn[]> {
+    const items = await this.redis.lrange(this.key(threadId), -MAX_MESSAGES, -1);
+    return items.map((item) => JSON.parse(item) as ThreadTurn);
+  }
+
+  async appendTurns(threadId: string, turns: ThreadTurn[]): Promise<void> {
+    if (turns.length === 0) return;
+    const key = this.key(threadId);
+    await this.redis
+      .multi()
+      .rpush(key, ...turns.map((turn) => JSON.stringify(turn)))
+      .ltrim(key, -MAX_MESSAGES, -1)
+      .expire(key, THREAD_TTL_SECONDS)
+      .exec();
+  }
+
+  async clear(threadId: string): Promise<void> {
+    await this.redis.del(this.key(threadId));
+  }
+
+  stats(): ThreadStoreStats {
+    return { backend: 'redis' };
+  }
+}
+
+function createThreadStore(): ThreadStore {
+  if ((process.env.AGENT_THREAD_STORE || 'redis').toLowerCase() === 'memory') {
+    console.log('[ThreadStore] Using in-process thread memory');
+    return new MemoryThreadStore();
+  }
+  const redisUrl = process.env.REDIS_URL || 'redis://localhost:6379';
+  console.log(`[ThreadStore] Using Redis thread memory: ${redisUrl}`);
+  return new RedisThreadStore(redisUrl);
+}
+
+export const threadStore: ThreadStore = createThreadStore();
+
+// 会話履歴を取得（取得できない場合は履歴なしで応答を継続）
+export async function loadThreadHistory(threadId: string): Promise<ThreadTurn[]> {
+  try {
+    return await threadStore.getHistory(threadId);
+  } catch (error: any) {
+    console.error(`[ThreadStore] ⚠️ Failed to load thread ${threadId}:`, error.message);
+    return [];
+  }
+}
+
+// ユーザー発言とエージェントの応答を履歴に追加
+export async function recordThreadTurn(threadId: string, message: string, response: string): Promise<void> {
+  const timestamp = Date.now();
+  try {
+    await threadStore.appendTurns(threadId, [
+      { role: 'user', content: message, timestamp },
+      { role: 'assistant', content: response, timestamp }
+    ]);
+  } catch (error: any) {
+    console.error(`[ThreadStore] ⚠️ Failed to record thread ${threadId}:`, error.message);
+  }
+}
@@ -0,0 +1,337 @@
+// MCPツール呼び出し結果のキャッシュ
+// 同じスレッド内やユーザー間で繰り返されるページ取得・データベース検索・検索の結果を
+// (スコープ, ツール名, 正規化した引数) ごとに保持する
+//   - 保持期間（TTL）と合計バイト数の上限によるLRU
+//   - ページ・ブロックの結果は一定時間を過ぎたら Notion API で last_edited_time だけを確認し、変わっていなければ再利用
+//     （last_edited_time は分単位のため、その分のうちに取得した結果は同じ値でも取り直す）
+//   - 書き込み系ツール（patch-page, post-page 等）の実行時に関連するエントリを破棄
+// スコープは既定でユーザー単位（Notionはユーザーごとに共有されているページが異なるため）
+
+type ToolArgs = Record<string, any>;
+
+interface ReadToolRule {
+  // 関連付けるタグ（書き込み時の破棄に使用）
+  tags: (args: ToolArgs) => string[];
+  // 更新確認の対象（ページまたはブロック）
+  validate?: (args: ToolArgs) => { kind: 'page' | 'block'; id: string } | null;
+  // 一覧系の結果は更新確認ができないため短い保持期間を使う
+  list?: boolean;
+}
+
+// キャッシュする読み取り系ツール
+const READ_TOOLS: Record<string, ReadToolRule> = {
+  'notion_API-retrieve-a-page': {
+    tags: (args) => [`page:${args.page_id}`],
+    validate: (args) => (args.page_id ? { kind: 'page', id: args.page_id } : null)
+  },
+  'notion_API-get-block-children': {
+    tags: (args) => [`page:${args.block_id}`],
+    validate: (args) => (args.block_id ? { kind: 'block', id: args.block_id } : null)
+  },
+  'notion_API-retrieve-a-database': {
+    tags: (args) => [`database:${args.database_id}`]
+  },
+  'notion_API-post-database-query': {
+    tags: (args) => [`database:${args.database_id}`, 'list'],
+    list: true
+  },
+  'notion_API-post-search': {
+    tags: () => ['list'],
+    list: true
+  }
+};
+
+// 書き込み系ツールと破棄するタグ（null はスコープ全体を破棄）
+const WRITE_TOOLS: Record<string, ((args: ToolArgs) => string[]) | null> = {
+  'notion_API-patch-page': (args) => [`page:${args.page_id}`, 'list'],
+  'notion_API-post-page': (args) => [
+    'list',
+    ...(args.parent?.page_id ? [`page:${args.parent.page_id}`] : []),
+    ...(args.parent?.database_id ? [`database:${args.parent.database_id}`] : [])
+  ],
+  'notion_API-patch-block-children': (args) => [`page:${args.block_id}`, 'list'],
+  'notion_API-update-a-database': (args) => [`database:${args.database_id}`, 'list'],
+  // 親ページが分からないブロックの更新・削除、データベースの作成はスコープ全体を破棄
+  'notion_API-update-a-block': null,
+  'notion_API-delete-a-block': null,
+  'notion_API-create-a-database': null
+};
+
+// Notion の last_edited_time は分単位に切り捨てられる
+const EDITED_TIME_RESOLUTION_MS = 60 * 1000;
+
+// 更新確認（対象の現在の last_edited_time を返す、取得できない場合は null）
+export type FreshnessValidator = (kind: 'page' | 'block', id: string) => Promise<string | null>;
+
+interface CacheEntry {
+  scope: string;
+  value: any;
+  bytes: number;
+  tags: string[];
+  storedAt: number;
+  checkedAt: number;
+  expiresAt: number;
+  // 結果に含まれる最新の last_edited_time
+  version: string | null;
+}
+
+export interface ToolCacheStats {
+  entries: number;
+  bytes: number;
+  maxBytes: number;
+  hits: number;
+  revalidated: number;
+  misses: number;
+  stale: number;
+  invalidated: number;
+  evicted: number;
+  hitRate: number;
+}
+
+interface ToolCacheOptions {
+  maxBytes?: number;
+  ttlMs?: number;
+  listTtlMs?: number;
+  freshMs?: number;
+}
+
+// キー順に依存しないJSON表現（undefinedのプロパティは除外し、文字列の前後の空白を除去）
+export function normalizeArgs(value: any): string {
+  return JSON.stringify(value ?? {}, (_key, item) => {
+    if (typeof item === 'string') return item.trim().replace(/\s+/g, ' ');
+    if (item && typeof item === 'object' && !Array.isArray(item)) {
+      return Object.fromEntries(
+        Object.keys(item)
+          .filter((key) => item[key] !== undefined)
+          .sort()
+          .map((key) => [key, item[key]])
+      );
+    }
+    return item;
+  });
+}
+
+// 取得した時点以降に編集されていないか（同じ last_edited_time でも、取得が同じ分のうちなら以降の編集を区別できない）
+function unchangedSinceFetch(current: string, version: string, fetchedAt: number): boolean {
+  if (current !== version) return current < version;
+  const editedAt = Date.parse(version);
+  return Number.isFinite(editedAt) && fetchedAt >= editedAt + EDITED_TIME_RESOLUTION_MS;
+}
+
+// 結果に含まれる last_edited_time の最大値（ISO 8601 の文字列比較で判定）
+function latestEditedTime(serialized: string): string | null {
+  let latest: string | null = null;
+  for (const match of serialized.matchAll(/\\?"last_edited_time\\?"\s*:\s*\\?"([^"\\]+)\\?"/g)) {
+    if (!latest || match[1] > latest) latest = match[1];
+  }
+  return latest;
+}
+
+export class ToolResultCache {
+  // Mapの挿入順を利用したLRU
+  private entries = new Map<string, CacheEntry>();
+  private bytes = 0;
+  private counters = { hits: 0, revalidated: 0, misses: 0, stale: 0, invalidated: 0, evicted: 0 };
+  readonly maxBytes: number;
+  private ttlMs: number;
+  private listTtlMs: number;
+  private freshMs: number;
+
+  constructor(options: ToolCacheOptions = {}) {
+    this.maxBytes = options.maxBytes ?? 32 * 1024 * 1024;
+    this.ttlMs = options.ttlMs ?? 10 * 60 * 1000;
+    this.listTtlMs = options.listTtlMs ?? 60 * 1000;
+    this.freshMs = options.freshMs ?? 30 * 1000;
+  }
+
+  static isCacheable(toolName: string): boolean {
+    return toolName in READ_TOOLS;
+  }
+
+  static isWrite(toolName: string): boolean {
+    return toolName in WRITE_TOOLS;
+  }
+
+  // 読み取り系ツールの呼び出し（キャッシュにあれば再利用、なければ実行して保存）
+  async read(scope: string, toolName: string, args: ToolArgs, run: () => Promise<any>,
+             validator?: FreshnessValidator): Promise<any> {
+    const rule = READ_TOOLS[toolName];
+    const key = `${scope}|${toolName}|${normalizeArgs(args)}`;
+    const entry = this.entries.get(key);
+    const now = Date.now();
+
+    if (entry && entry.expiresAt > now) {
+      // 更新確認ができない結果（一覧・データベース）は保持期間内ならそのまま使う
+      const target = rule.validate?.(args);
+      if (!target || now - entry.checkedAt < this.freshMs) {
+        this.counters.hits++;
+        this.touch(key, entry);
+        return entry.value;
+      }
+      // 確認間隔を過ぎたページは last_edited_time だけを取得して比較
+      if (validator && entry.version) {
+        const current = await validator(target.kind, target.id).catch(() => null);
+        if (current && unchangedSinceFetch(current, entry.version, entry.storedAt)) {
+          this.counters.revalidated++;
+          entry.checkedAt = Date.now();
+          this.touch(key, entry);
+          return entry.value;
+        }
+      }
+      this.counters.stale++;
+    } else {
+      this.counters.misses++;
+    }
+    this.remove(key);
+
+    const value = await run();
+    // エラー結果はキャッシュしない
+    if (!value?.isError) {
+      this.store(key, scope, value, rule.tags(args), rule.list ? this.listTtlMs : this.ttlMs);
+    }
+    return value;
+  }
+
+  // 書き込み系ツールの実行後に関連するエントリを破棄
+  invalidateForWrite(scope: string, toolName: string, args: ToolArgs): number {
+    const tagsFor = WRITE_TOOLS[toolName];
+    const tags = tagsFor ? new Set(tagsFor(args)) : null;
+    let removed = 0;
+    for (const [key, entry] of this.entries) {
+      if (entry.scope !== scope) continue;
+      if (tags && !entry.tags.some((tag) => tags.has(tag))) continue;
+      this.remove(key);
+      removed++;
+    }
+    this.counters.invalidated += removed;
+    return removed;
+  }
+
+  private store(key: string, scope: string, value: any, tags: string[], ttlMs: number): void {
+    let serialized: string;
+    try {
+      serialized = JSON.stringify(value) ?? '';
+    } catch {
+      return;
+    }
+    const bytes = Buffer.byteLength(serialized);
+    // 1件で上限の1/8を超える結果は保持しない
+    if (bytes > this.maxBytes / 8) return;
+
+    const now = Date.now();
+    this.entries.set(key, {
+      scope,
+      value,
+      bytes,
+      tags,
+      storedAt: now,
+      checkedAt: now,
+      expiresAt: now + ttlMs,
+      version: latestEditedTime(serialized)
+    });
+    this.bytes += bytes;
+
+    while (this.bytes > this.maxBytes) {
+      const oldest = this.entries.keys().next().value;
+      if (oldest === undefined) break;
+      this.remove(oldest);
+      this.counters.evicted++;
+    }
+  }
+
+  private touch(key: string, entry: CacheEntry): void {
+    this.entries.delete(key);
+    this.entries.set(key, entry);
+  }
+
+  private remove(key: string): void {
+    const entry = this.entries.get(key);
+    if (!entry) return;
+    this.entries.delete(key);
+    this.bytes -= entry.bytes;
+  }
+
+  clear(): void {
+    this.entries.clear();
+    this.bytes = 0;
+  }
+
+  stats(): ToolCacheStats {
+    const served = this.counters.hits + this.counters.revalidated;
+    const lookups = served + this.counters.misses + this.counters.stale;
+    return {
+      entries: this.entries.size,
+      bytes: this.bytes,
+      maxBytes: this.maxBytes,
+      ...this.counters,
+      hitRate: lookups > 0 ? served / lookups : 0
+    };
+  }
+}
+
+// Notion APIで対象の last_edited_time だけを取得する更新確認
+// （MCPサーバーを経由せず、ページはプロパティを除外して取得する）
+export function createNotionValidator(accessToken: string): FreshnessValidator {
+  const baseUrl = process.env.NOTION_API_BASE_URL || 'https://api.notion.com/v1';
+  return async (kind, id) => {
+    const path = kind === 'page'
+      ? `/pages/${encodeURIComponent(id)}?filter_properties=title`
+      : `/blocks/${encodeURIComponent(id)}`;
+    const response = await fetch(`${baseUrl}${path}`, {
+      headers: { Authorization: `Bearer ${accessToken}`, 'Notion-Version': '2022-06-28' },
+      signal: AbortSignal.timeout(5000)
+    });
+    if (!response.ok) return null;
+    const body: any = await response.json();
+    return typeof body.last_edited_time === 'string' ? body.last_edited_time : null;
+  };
+}
+
+// MCPツールをキャッシュ経由で実行するよう包む（元のツールは変更しない）
+export function withToolCache(tools: Record<string, any>, scope: string, validator?: FreshnessValidator,
+                              cache: ToolResultCache = toolResultCache): Record<string, any> {
+  if (!toolCacheEnabled) return tools;
+  return Object.fromEntries(
+    Object.entries(tools).map(([name, tool]) => {
+      if (typeof tool?.execute !== 'function') return [name, tool];
+      const cacheable = ToolResultCache.isCacheable(name);
+      const write = ToolResultCache.isWrite(name);
+      if (!cacheable && !write) return [name, tool];
+
+      const execute = tool.execute.bind(tool);
+      const wrapped = Object.assign(Object.create(Object.getPrototypeOf(tool)), tool, {
+        execute: async (input: any, options?: any) => {
+          const args = input?.context ?? {};
+          if (cacheable) {
+            return cache.read(scope, name, args, () => execute(input, options), validator);
+          }
+          const result = await execute(input, options);
+          const removed = cache.invalidateForWrite(scope, name, args);
+          if (removed > 0) {
+            console.log(`[ToolCache] 🧹 ${name} invalidated ${removed} cached results`);
+          }
+          return result;
+        }
+      });
+      return [name, wrapped];
+    })
+  );
+}
+
+export const toolCacheEnabled = (process.env.TOOL_CACHE_ENABLED || 'true').toLowerCase() === 'true';
+
+// キャッシュのスコープ（workspace にするとワークスペース内のユーザー間で共有、ページの共有範囲が揃っている場合のみ）
+export function toolCacheScope(userId: string, workspaceId?: string): string {
+  if ((process.env.TOOL_CACHE_SCOPE || 'user').toLowerCase() === 'workspace' && workspaceId) {
+    return `workspace:${workspaceId}`;
+  }
+  return `user:${userId}`;
+}
+
+// Singleton instance
+export const toolResultCache = new ToolResultCache({
+  maxBytes: Number(process.env.TOOL_CACHE_MAX_MB || 32) * 1024 * 1024,
+  ttlMs: Number(process.env.TOOL_CACHE_TTL_SECONDS || 600) * 1000,
+  listTtlMs: Number(process.env.TOOL_CACHE_LIST_TTL_SECONDS || 60) * 1000,
+  freshMs: Number(process.env.TOOL_CACHE_FRESH_SECONDS || 30) * 1000
+});
@@ -1,9 +1,12 @@
 import os
-import redis
 import json
 import logging
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import quote_plus, urlencode
 from dotenv import load_dotenv
 
 # 環境変数を明示的に読み込み
@@ -11,126 +14,138 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Redis connection
-redis_client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+# Redis connection (created on first use so that importing this module stays cheap)
+_redis_client = None
+
+def get_redis_client():
+    """Get the shared Redis client, connecting lazily"""
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+    return _redis_client
 
 # OAuth callback URL
 OAUTH_CALLBACK_URL = os.getenv('OAUTH_REDIRECT_URI', 'https://mei0001.github.io/notion-auth-demo/redirect.html')
 
-def create_mcp_services_blocks() -> list:
-    """Create blocks for MCP services selection"""
-    return [
-        {
-            "type": "header",
-            "text": {
-                "type": "plain_text",
-                "text": "🔗 MCP サービス連携"
-            }
-        },
-        {
-            "type": "section",
-            "text": {
-                "type": "mrkdwn",
-                "text": "どのサービスと連携しますか？"
-            }
-        },
-        {
-            "type": "actions",
-            "elements": [
-                {
-                    "type": "button",
-                    "text": {
-                        "type": "plain_text",
-                        "text": "📝 Notion"
-                    },
-                    "style": "primary",
-                    "value": "notion",
-                    "action_id": "connect_notion"
-                },
-                {
-                    "type": "button",
-                    "text": {
-                        "type": "plain_text",
-                        "text": "📁 Google Drive"
-                    },
-                    "style": "primary",
-                    "value": "google-drive",
-                    "action_id": "connect_google_drive"
-                }
-            ]
-        }
-    ]
+# --- Block Kit テンプレート ---
+# 静的なブロックは読み込み時に1回だけJSON文字列に変換し、描画時は文字列の連結のみで組み立てる
+# （文字列は不変のため、呼び出し元が共有テンプレートを書き換えることもない）
+# render_* はJSON文字列を返し、そのまま chat_postEphemeral(blocks=...) に渡せる
 
-def create_service_status_blocks(user_id: str) -> list:
-    """Create blocks showing connected services status"""
-    blocks = [
-        {
-            "type": "header",
-            "text": {
-                "type": "plain_text",
-                "text": "📊 接続済みサービス"
-            }
+def _fragment(*blocks: dict) -> str:
+    """ブロックをJSON配列の要素部分（前後の [] なし）に変換"""
+    return ",".join(json.dumps(block, ensure_ascii=False, separators=(",", ":")) for block in blocks)
+
+def join_blocks(*fragments: str) -> str:
+    """JSON化済みのブロック断片を連結してブロック配列にする"""
+    return "[" + ",".join(fragment for fragment in fragments if fragment) + "]"
+
+def _mrkdwn_section(text: str) -> str:
+    return _fragment({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+
+_MCP_SERVICES_FRAGMENT = _fragment(
+    {
+        "type": "header",
+        "text": {
+            "type": "plain_text",
+            "text": "🔗 MCP サービス連携"
         }
-    ]
-    
-    # Check connected services
-    connected_services = get_connected_services(user_id)
-    
-    if not connected_services:
-        blocks.append({
-            "type": "section",
-            "text": {
-                "type": "mrkdwn",
-                "text": "現在、接続されているサービスはありません。"
-            }
-        })
-    else:
-        for service in connected_services:
-            status_emoji = "✅" if service['connected'] else "❌"
-            
-            # 表示テキストを構築
-            service_text = f"{status_emoji} *{service['name']}*"
-            if service.get('workspace_info'):
-                service_text += f"\n📁 ワークスペース: {service['workspace_info']}"
-            service_text += f"\n🕒 接続日時: {service['connected_at']}"
-            
-            blocks.append({
-                "type": "section",
+    },
+    {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": "どのサービスと連携しますか？"
+        }
+    },
+    {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
                 "text": {
-                    "type": "mrkdwn",
-                    "text": service_text
+                    "type": "plain_text",
+                    "text": "📝 Notion"
                 },
-                "accessory": {
-                    "type": "button",
-                    "text": {
-                        "type": "plain_text",
-                        "text": "切断"
-                    },
-                    "style": "danger",
-                    "value": service['type'],
-                    "action_id": f"disconnect_{service['type']}"
-                }
-            })
-    
-    blocks.append({"type": "divider"})
-    
-    return blocks
+                "style": "primary",
+                "value": "notion",
+                "action_id": "connect_notion"
+            },
+            {
+                "type": "button",
+                "text": {
+                    "type": "plain_text",
+                    "text": "📁 Google Drive"
+                },
+                "style": "primary",
+                "value": "google-drive",
+                "action_id": "connect_google_drive"
+            }
+        ]
+    }
+)
+_STATUS_HEADER_FRAGMENT = _fragment({
+    "type": "header",
+    "text": {
+        "type": "plain_text",
+        "text": "📊 接続済みサービス"
+    }
+})
+_NO_SERVICES_FRAGMENT = _mrkdwn_section("現在、接続されているサービスはありません。")
+_DIVIDER_FRAGMENT = _fragment({"type": "divider"})
 
-def create_auth_in_progress_blocks(service_name: str) -> list:
-    """Create blocks for auth in progress"""
-    return [
-        {
-            "type": "section",
+@lru_cache(maxsize=1024)
+def _service_status_fragment(
+    service_type: str, name: str, connected: bool, workspace_info: str, connected_at: str
+) -> str:
+    """接続済みサービス1件分のブロック（同じ接続情報の間は同じ文字列を再利用）"""
+    status_emoji = "✅" if connected else "❌"
+    service_text = f"{status_emoji} *{name}*"
+    if workspace_info:
+        service_text += f"\n📁 ワークスペース: {workspace_info}"
+    service_text += f"\n🕒 接続日時: {connected_at}"
+    return _fragment({
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": service_text
+        },
+        "accessory": {
+            "type": "button",
             "text": {
-                "type": "mrkdwn",
-                "text": f"🔄 *{service_name}の認証を開始しています...*\n\nブラウザで認証画面が開きます。認証が完了したら、自動的にSlackに戻ります。"
-            }
+                "type": "plain_text",
+                "text": "切断"
+            },
+            "style": "danger",
+            "value": service_type,
+            "action_id": f"disconnect_{service_type}"
         }
-    ]
+    })
 
-def create_auth_success_blocks(service_name: str) -> list:
-    """Create blocks for successful authentication"""
-    return [
+def _service_status_fragments(user_id: str) -> str:
+    services = get_connected_services(user_id)
+    if not services:
+        rows = _NO_SERVICES_FRAGMENT
+    else:
+        rows = ",".join(
+            _service_status_fragment(
+                service['type'], service['name'], bool(service['connected']),
+                service.get('workspace_info') or "", str(service['connected_at'])
+            )
+            for service in services
+        )
+    return ",".join((_STATUS_HEADER_FRAGMENT, rows, _DIVIDER_FRAGMENT))
+
+@lru_cache(maxsize=32)
+def _auth_in_progress_fragment(service_name: str) -> str:
+    return _mrkdwn_section(
+        f"🔄 *{service_name}の認証を開始しています...*\n\nブラウザで認証画面が開きます。認証が完了したら、自動的にSlackに戻ります。"
+    )
+
+@lru_cache(maxsize=32)
+def _auth_success_fragment(service_name: str) -> str:
+    return _fragment(
         {
             "type": "section",
             "text": {
@@ -147,7 +162,65 @@ def create_auth_success_blocks(service_name: str) -> list:
                 }
             ]
         }
-    ]
+    )
+
+def render_mcp_blocks(user_id: str) -> str:
+    """/mcp の画面（接続状況 + 連携ボタン）をJSON文字列で作成"""
+    return join_blocks(_service_status_fragments(user_id), _MCP_SERVICES_FRAGMENT)
+
+def render_auth_start_blocks(service_name: str, auth_url: str) -> str:
+    """認証開始メッセージ（認証URLへのリンク付き）をJSON文字列で作成"""
+    return join_blocks(
+        _auth_in_progress_fragment(service_name),
+        _mrkdwn_section(f"<{auth_url}|🔗 ここをクリックして{service_name}と連携>")
+    )
+
+def render_auth_success_blocks(service_name: str) -> str:
+    """連携完了メッセージをJSON文字列で作成"""
+    return join_blocks(_auth_success_fragment(service_name))
+
+# --- エージェント応答のテキスト ---
+# Slackボット本体（app.py）とジョブキューのワーカー（agent_worker.py）で共通の文言を使う
+
+def agent_error_message(error_detail: str) -> str:
+    """エージェント呼び出しのエラーをユーザー向けのメッセージに変換"""
+    if "レート制限" in error_detail or "rate limit" in error_detail.lower():
+        return "⚠️ APIレート制限に達しました。数分後に再度お試しください。"
+    if "タイムアウト" in error_detail:
+        return "⏱️ 処理がタイムアウトしました。もう一度お試しください。"
+    if "接続できません" in error_detail:
+        return "🔌 サービスに接続できません。しばらくしてからお試しください。"
+    if "認証" in error_detail or "auth" in error_detail.lower():
+        return "🔐 認証エラーが発生しました。`/mcp` コマンドでサービス連携を確認してください。"
+    return f"❌ エラーが発生しました: {error_detail}"
+
+def agent_response_text(result: dict) -> str:
+    """エージェントの応答に警告を添えて投稿用のテキストにする"""
+    response = result.get('response', 'No response')
+    warning = result.get('warning')
+    if warning:
+        if "MCPツール" in warning:
+            return f"⚠️ 一部機能が制限されています: {warning}\n\n{response}"
+        return f"⚠️ {warning}\n\n{response}"
+    return response
+
+# 以下はブロックをリストで受け取りたい呼び出し元向け（呼び出しごとに新しいリストを返す）
+
+def create_mcp_services_blocks() -> list:
+    """Create blocks for MCP services selection"""
+    return json.loads(join_blocks(_MCP_SERVICES_FRAGMENT))
+
+def create_service_status_blocks(user_id: str) -> list:
+    """Create blocks showing connected services status"""
+    return json.loads(join_blocks(_service_status_fragments(user_id)))
+
+def create_auth_in_progress_blocks(service_name: str) -> list:
+    """Create blocks for auth in progress"""
+    return json.loads(join_blocks(_auth_in_progress_fragment(service_name)))
+
+def create_auth_success_blocks(service_name: str) -> list:
+    """Create blocks for successful authentication"""
+    return json.loads(render_auth_success_blocks(service_name))
 
 def create_auth_error_blocks(service_name: str, error: str) -> list:
     """Create blocks for authentication error"""
@@ -187,7 +260,7 @@ def get_connected_services(user_id: str) -> list:
     
     for service_type in service_types:
         key = f"oauth:tokens:{user_id}:{service_type}"
-        token_data = redis_client.get(key)
+        token_data = get_redis_client().get(key)
         
         if token_data:
             tokens = json.loads(token_data)
@@ -217,6 +290,26 @@ def get_connected_services(user_id: str) -> list:
     
     return services
 
+def get_tool_fingerprint(user_id: str) -> str:
+    """Identify the tool credentials available to a user
+    
+    Users sharing the same integration (workspace and bot) see the same pages,
+    so identical questions from them can share one agent call.
+    """
+    parts = []
+    for service_type in ['notion', 'google-drive']:
+        token_data = get_redis_client().get(f"oauth:tokens:{user_id}:{service_type}")
+        if not token_data:
+            continue
+        metadata = json.loads(token_data).get('metadata', {})
+        workspace_id = metadata.get('workspace_id')
+        bot_id = metadata.get('bot_id')
+        # 識別情報がない場合は共有せずユーザー単位にする
+        scope = f"{workspace_id}:{bot_id}" if workspace_id and bot_id else f"user:{user_id}"
+        parts.append(f"{service_type}={scope}")
+    
+    return "|".join(parts) if parts else "none"
+
 def generate_oauth_state(user_id: str, channel_id: str, service_type: str) -> Optional[str]:
     """Generate OAuth state for authentication flow"""
     try:
@@ -239,59 +332,71 @@ def generate_oauth_state(user_id: str, channel_id: str, service_type: str) -> Op
         }
         
         # Store state with 10 minute TTL
-        redis_client.setex(state_key, 600, json.dumps(state_data))
+        get_redis_client().setex(state_key, 600, json.dumps(state_data))
         return state
     except Exception as e:
         logger.error(f"Failed to generate OAuth state: {e}")
         return None
 
+@dataclass(frozen=True)
+class OAuthProvider:
+    """OAuthプロバイダーの設定（認可URLの固定部分は作成時に組み立て済み）"""
+    service_type: str
+    name: str
+    authorize_url: str
+    client_id: Optional[str]
+    # client_id・redirect_uri などstate以外のクエリパラメータ
+    params: Tuple[Tuple[str, str], ...] = ()
+    url_prefix: str = field(init=False, repr=False, default="")
+
+    def __post_init__(self):
+        query = urlencode((("client_id", self.client_id or ""),) + self.params)
+        object.__setattr__(self, "url_prefix", f"{self.authorize_url}?{query}&state=")
+
+    def authorization_url(self, state: str) -> str:
+        return self.url_prefix + quote_plus(state)
+
+def load_oauth_providers() -> Mapping[str, OAuthProvider]:
+    """環境変数からOAuthプロバイダーの設定を読み込み、変更不可のレジストリを作成"""
+    redirect = (("redirect_uri", OAUTH_CALLBACK_URL), ("response_type", "code"))
+    providers = (
+        OAuthProvider(
+            service_type='notion',
+            name='Notion',
+            authorize_url='https://api.notion.com/v1/oauth/authorize',
+            client_id=os.getenv('NOTION_OAUTH_CLIENT_ID'),
+            # Notion OAuth 2.0 specification requires 'owner=user' for public integrations
+            # Notion doesn't use scope parameter in authorization URL
+            params=redirect + (("owner", "user"),)
+        ),
+        OAuthProvider(
+            service_type='google-drive',
+            name='Google Drive',
+            authorize_url='https://accounts.google.com/o/oauth2/v2/auth',
+            client_id=os.getenv('GOOGLE_CLIENT_ID'),
+            params=redirect + (
+                ("scope", "https://www.googleapis.com/auth/drive.readonly https://www.googleapis.com/auth/drive.file"),
+                ("access_type", "offline"),
+                ("prompt", "consent"),
+            )
+        ),
+    )
+    for provider in providers:
+        if not provider.client_id:
+            logger.warning(f"[OAuth] {provider.name} client ID is not configured")
+    return MappingProxyType({provider.service_type: provider for provider in providers})
+
+@lru_cache(maxsize=None)
+def get_oauth_providers() -> Mapping[str, OAuthProvider]:
+    """OAuthプロバイダーのレジストリ（初回のみ環境変数から読み込む）"""
+    return load_oauth_providers()
+
 def generate_oauth_url(service_type: str, state: str) -> Optional[str]:
     """Generate OAuth authorization URL"""
-    # 環境変数のデバッグ出力
-    notion_client_id = os.getenv('NOTION_OAUTH_CLIENT_ID')
-    logger.info(f"[OAuth URL Generation] Service: {service_type}")
-    logger.info(f"[OAuth URL Generation] NOTION_OAUTH_CLIENT_ID from env: {notion_client_id}")
-    
-    oauth_configs = {
-        'notion': {
-            'auth_url': 'https://api.notion.com/v1/oauth/authorize',
-            'client_id': notion_client_id,
-            'scopes': ''  # Notion doesn't use explicit scopes in URL
-        },
-        'google-drive': {
-            'auth_url': 'https://accounts.google.com/o/oauth2/v2/auth',
-            'client_id': os.getenv('GOOGLE_CLIENT_ID'),
-            'scopes': 'https://www.googleapis.com/auth/drive.readonly https://www.googleapis.com/auth/drive.file'
-        }
-    }
-    
-    config = oauth_configs.get(service_type)
-    logger.info(f"[OAuth URL Generation] Config for {service_type}: {config}")
-    
-    if not config or not config['client_id']:
+    provider = get_oauth_providers().get(service_type)
+    if provider is None or not provider.client_id:
         logger.error(f"OAuth config not found for {service_type}")
-        logger.error(f"Config: {config}")
-        logger.error(f"Client ID: {config.get('client_id') if config else 'No config'}")
         return None
     
-    params = {
-        'client_id': config['client_id'],
-        'redirect_uri': OAUTH_CALLBACK_URL,
-        'response_type': 'code',
-        'state': state
-    }
-    
-    # Service-specific parameters
-    if service_type == 'notion':
-        # Notion OAuth 2.0 specification requires 'owner=user' for public integrations
-        params['owner'] = 'user'
-        # Notion doesn't use scope parameter in authorization URL
-    elif service_type == 'google-drive':
-        params['scope'] = config['scopes']
-        params['access_type'] = 'offline'
-        params['prompt'] = 'consent'
-    
-    from urllib.parse import urlencode
-    auth_url = f"{config['auth_url']}?{urlencode(params)}"
-    logger.info(f"Generated {service_type} OAuth URL: {auth_url}")
-    return auth_url
\ No newline at end of file
+    logger.debug(f"[OAuth] Generated {service_type} authorization URL")
+    return provider.authorization_url(state)
@@ -0,0 +1,147 @@
+"""
+スレッド内の連続したメッセージの集約
+同じスレッドで同じユーザーが短時間に続けて送信したメッセージを、最後のメッセージから一定時間待ってから
+1つの発言にまとめ、エージェント呼び出しを1回にする（呼び出し回数と会話履歴の順序の乱れを抑える）
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PendingTurn:
+    """待機中の発言（送信順のメッセージの集まり）"""
+    thread_ts: str
+    user_id: str
+    channel: Optional[str]
+    say: Callable
+    client: Any
+    started_at: float
+    deadline: float
+    # (元のメッセージのts, 本文) の送信順のリスト
+    parts: List[Tuple[Optional[str], str]] = field(default_factory=list)
+
+class ThreadCoalescer:
+    """スレッド・ユーザーごとにメッセージを待機させ、静かになった時点でまとめて引き渡すクラス
+
+    最後のメッセージから window 秒間次のメッセージがなければ発言を確定する。
+    送信が続いても、最初のメッセージから max_wait 秒で確定する。
+    確定した発言は on_flush に渡す（集約用のスレッドで呼ばれるため、時間のかかる処理はレーンに投入すること）。
+    """
+
+    def __init__(self, window: float = 1.2, max_wait: float = 5.0):
+        self.window = window
+        self.max_wait = max(max_wait, window)
+        self.on_flush: Optional[Callable[[PendingTurn], None]] = None
+        self._pending: Dict[Tuple[str, str], PendingTurn] = {}
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, thread_ts: str, user_id: str, channel: Optional[str], message_ts: Optional[str],
+            text: str, say: Callable, client: Any = None) -> int:
+        """メッセージを待機中の発言に追加し、発言内のメッセージ数を返す"""
+        now = time.monotonic()
+        with self._cond:
+            turn = self._pending.get((thread_ts, user_id))
+            if turn is None:
+                turn = PendingTurn(thread_ts, user_id, channel, say, client, started_at=now, deadline=now + self.window)
+                self._pending[(thread_ts, user_id)] = turn
+            else:
+                turn.deadline = min(now + self.window, turn.started_at + self.max_wait)
+                metrics.increment("coalescer.merged")
+            turn.parts.append((message_ts, text))
+            self._ensure_worker()
+            self._cond.notify()
+            return len(turn.parts)
+
+    def edit(self, channel: Optional[str], message_ts: Optional[str], text: str) -> bool:
+        """待機中のメッセージの本文を差し替える（空の場合は取り除く）。待機中でなければFalse"""
+        if not text:
+            return self.remove(channel, message_ts)
+        with self._cond:
+            turn, index = self._locate(channel, message_ts)
+            if turn is None:
+                return False
+            turn.parts[index] = (message_ts, text)
+            return True
+
+    def remove(self, channel: Optional[str], message_ts: Optional[str]) -> bool:
+        """待機中のメッセージを取り除く（発言が空になれば破棄）。待機中でなければFalse"""
+        with self._cond:
+            turn, index = self._locate(channel, message_ts)
+            if turn is None:
+                return False
+            del turn.parts[index]
+            if not turn.parts:
+                del self._pending[(turn.thread_ts, turn.user_id)]
+            return True
+
+    def has_pending(self, thread_ts: str, user_id: str) -> bool:
+        """スレッド・ユーザーに待機中の発言があるか"""
+        with self._cond:
+            return (thread_ts, user_id) in self._pending
+
+    def has_message(self, channel: Optional[str], message_ts: Optional[str]) -> bool:
+        """メッセージが待機中の発言に含まれているか"""
+        with self._cond:
+            return self._locate(channel, message_ts)[0] is not None
+
+    def _locate(self, channel: Optional[str], message_ts: Optional[str]) -> Tuple[Optional[PendingTurn], int]:
+        if message_ts:
+            for turn in self._pending.values():
+                if turn.channel != channel:
+                    continue
+                for index, (part_ts, _) in enumerate(turn.parts):
+                    if part_ts == message_ts:
+                        return turn, index
+        return None, -1
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="thread-coalescer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [key for key, turn in self._pending.items() if turn.deadline <= now]
+                    if due:
+                        break
+                    next_deadline = min((turn.deadline for turn in self._pending.values()), default=None)
+                    self._cond.wait(None if next_deadline is None else next_deadline - now)
+                turns = [self._pending.pop(key) for key in due]
+            for turn in turns:
+                self._flush(turn)
+
+    def _flush(self, turn: PendingTurn):
+        metrics.increment("coalescer.turns")
+        if len(turn.parts) > 1:
+            logger.info(f"[Coalescer] Merged {len(turn.parts)} messages in thread {turn.thread_ts}")
+        try:
+            if self.on_flush is not None:
+                self.on_flush(turn)
+        except Exception as e:
+            logger.error(f"[Coalescer] ❌ Failed to hand over turn in thread {turn.thread_ts}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+# グローバルインスタンス（THREAD_COALESCE_WINDOW_MS=0 で無効）
+thread_coalescer = ThreadCoalescer(
+    window=float(os.getenv("THREAD_COALESCE_WINDOW_MS", "1200")) / 1000,
+    max_wait=float(os.getenv("THREAD_COALESCE_MAX_WAIT_MS", "5000")) / 1000,
+)
+metrics.register_gauge("coalescer.pending", lambda: len(thread_coalescer))
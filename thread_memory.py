@@ -3,11 +3,17 @@
 同一スレッド内での会話履歴を管理し、コンテキストとして提供
 """
 
+import os
+import json
+import sys
+import threading
 import time
 from typing import Dict, List, Optional
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, fields
 import logging
 
+from metrics import metrics
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -17,19 +23,57 @@ class Message:
     timestamp: float
     user_id: Optional[str] = None
 
+# メッセージ1件あたりの文字列以外の使用メモリ（インスタンス・属性・タイムスタンプ・リストの参照）
+# 3.11以降は属性をインスタンス内に保持する（__dict__ を参照すると辞書が作られるため参照しない）
+_ATTRIBUTES_SIZE = (
+    8 * (len(fields(Message)) + 2) if sys.version_info >= (3, 11)
+    else sys.getsizeof(Message("user", "", 0.0).__dict__)
+)
+_MESSAGE_OVERHEAD = sys.getsizeof(Message("user", "", 0.0)) + _ATTRIBUTES_SIZE + sys.getsizeof(0.0) + 8
+
+# スレッド1件あたりの使用メモリ（メッセージのリストとキーのスレッドID）
+_THREAD_OVERHEAD = sys.getsizeof([]) + sys.getsizeof("1700000000.000100")
+
+def _message_bytes(message: Message) -> int:
+    """メッセージ1件の使用メモリの概算"""
+    user_id_size = sys.getsizeof(message.user_id) if message.user_id else 0
+    return _MESSAGE_OVERHEAD + sys.getsizeof(message.content) + user_id_size
+
+def _format_context(messages: List[Message]) -> str:
+    """会話履歴をコンテキスト文字列に変換"""
+    context_parts = []
+    for msg in messages:
+        if msg.role == 'user':
+            context_parts.append(f"ユーザー: {msg.content}")
+        else:
+            context_parts.append(f"アシスタント: {msg.content}")
+    return "\n".join(context_parts)
+
 class ThreadMemory:
-    """スレッド単位で会話履歴を管理するクラス"""
+    """スレッド単位で会話履歴を管理するクラス
+
+    Boltのリスナーはスレッドプールで並行に実行されるため、スレッドIDのハッシュで選んだロック（ストライプ）で
+    スレッドごとの読み書きを保護する。別の会話同士は異なるロックを使うため、全体を1つのロックで直列化しない。
+    """
     
-    def __init__(self, max_messages: int = 20, max_age_hours: int = 24):
+    def __init__(self, max_messages: int = 20, max_age_hours: int = 24, stripes: int = 64):
         self.max_messages = max_messages
         self.max_age_hours = max_age_hours
         self.threads: Dict[str, List[Message]] = {}
+        self._locks = [threading.Lock() for _ in range(max(1, stripes))]
+        # ストライプごとのメッセージ数・使用メモリの概算（そのストライプのロック内で更新、診断用）
+        self._message_counts = [0] * len(self._locks)
+        self._message_bytes = [0] * len(self._locks)
+    
+    def _stripe(self, thread_id: str) -> int:
+        return hash(thread_id) % len(self._locks)
+    
+    def _lock_for(self, thread_id: str) -> threading.Lock:
+        """スレッドIDに対応するストライプのロック"""
+        return self._locks[self._stripe(thread_id)]
     
     def add_message(self, thread_id: str, role: str, content: str, user_id: Optional[str] = None):
-        """メッセージを追加"""
-        if thread_id not in self.threads:
-            self.threads[thread_id] = []
-        
+        """メッセージを追加（追加と古いメッセージの削除を1つのロック内で行う）"""
         message = Message(
             role=role,
             content=content,
@@ -37,63 +81,183 @@ class ThreadMemory:
             user_id=user_id
         )
         
-        self.threads[thread_id].append(message)
-        
-        # 古いメッセージを削除
-        self._cleanup_old_messages(thread_id)
+        stripe = self._stripe(thread_id)
+        with self._locks[stripe]:
+            messages = self.threads.setdefault(thread_id, [])
+            messages.append(message)
+            self._message_counts[stripe] += 1
+            self._message_bytes[stripe] += _message_bytes(message)
+            
+            # 古いメッセージを削除
+            removed = self._cleanup_old_messages(messages, message.timestamp)
+            self._message_counts[stripe] -= len(removed)
+            self._message_bytes[stripe] -= sum(_message_bytes(msg) for msg in removed)
         
         logger.info(f"[ThreadMemory] Added {role} message to thread {thread_id}")
     
     def get_context(self, thread_id: str) -> str:
         """スレッドの会話履歴をコンテキスト文字列として取得"""
-        if thread_id not in self.threads:
-            return ""
+        with self._lock_for(thread_id):
+            # 最新のメッセージから逆順で取得し、適切な順序に戻す
+            recent_messages = self.threads.get(thread_id, [])[-self.max_messages:]
         
-        messages = self.threads[thread_id]
-        if not messages:
+        if not recent_messages:
             return ""
         
-        # 最新のメッセージから逆順で取得し、適切な順序に戻す
-        recent_messages = messages[-self.max_messages:]
-        
-        context_parts = []
-        for msg in recent_messages:
-            if msg.role == 'user':
-                context_parts.append(f"ユーザー: {msg.content}")
-            else:
-                context_parts.append(f"アシスタント: {msg.content}")
-        
-        context = "\n".join(context_parts)
+        context = _format_context(recent_messages)
         logger.info(f"[ThreadMemory] Retrieved context for thread {thread_id}: {len(context)} chars")
         return context
     
+    def remove_message(self, thread_id: str, role: str, content: str) -> bool:
+        """最後に追加された一致するメッセージを削除（取り消されたリクエストの発言用）"""
+        stripe = self._stripe(thread_id)
+        with self._locks[stripe]:
+            messages = self.threads.get(thread_id) or []
+            for index in range(len(messages) - 1, -1, -1):
+                if messages[index].role == role and messages[index].content == content:
+                    self._message_counts[stripe] -= 1
+                    self._message_bytes[stripe] -= _message_bytes(messages.pop(index))
+                    return True
+        return False
+    
     def has_history(self, thread_id: str) -> bool:
         """スレッドに履歴があるかチェック"""
-        return thread_id in self.threads and len(self.threads[thread_id]) > 0
+        # dictとlistの参照はGILで保護されるためロック不要
+        return len(self.threads.get(thread_id, ())) > 0
     
-    def _cleanup_old_messages(self, thread_id: str):
-        """古いメッセージをクリーンアップ"""
-        if thread_id not in self.threads:
-            return
-        
-        current_time = time.time()
+    def _cleanup_old_messages(self, messages: List[Message], current_time: float) -> List[Message]:
+        """古いメッセージをその場で削除し、削除したメッセージを返す（呼び出し元がスレッドのロックを保持していること）"""
         max_age_seconds = self.max_age_hours * 3600
         
-        # 時間による削除
-        self.threads[thread_id] = [
-            msg for msg in self.threads[thread_id]
-            if current_time - msg.timestamp <= max_age_seconds
-        ]
+        # 時間による削除（古いものから順に並んでいる）
+        expired = 0
+        while expired < len(messages) and current_time - messages[expired].timestamp > max_age_seconds:
+            expired += 1
         
         # 数による削除
-        if len(self.threads[thread_id]) > self.max_messages:
-            self.threads[thread_id] = self.threads[thread_id][-self.max_messages:]
+        excess = max(expired, len(messages) - self.max_messages)
+        if excess <= 0:
+            return []
+        removed = messages[:excess]
+        del messages[:excess]
+        return removed
     
     def clear_thread(self, thread_id: str):
         """特定のスレッドの履歴をクリア"""
-        if thread_id in self.threads:
-            del self.threads[thread_id]
+        stripe = self._stripe(thread_id)
+        with self._locks[stripe]:
+            messages = self.threads.pop(thread_id, None)
+            if messages:
+                self._message_counts[stripe] -= len(messages)
+                self._message_bytes[stripe] -= sum(_message_bytes(msg) for msg in messages)
+        if messages is not None:
             logger.info(f"[ThreadMemory] Cleared thread {thread_id}")
+    
+    def stats(self) -> dict:
+        """保持しているスレッド数・メッセージ数・使用メモリの概算（診断用、全件を走査しない）"""
+        return {
+            "backend": "memory",
+            "threads": len(self.threads),
+            "messages": sum(self._message_counts),
+            "bytes": sum(self._message_bytes) + len(self.threads) * _THREAD_OVERHEAD + sys.getsizeof(self.threads),
+        }
+
+class RedisThreadMemory:
+    """Redisのリストで会話履歴を保持するクラス（HTTPモードの複数ワーカーで共有、ThreadMemoryと同じインターフェース）
+
+    追加と件数による削除は1つのトランザクションで行い、期限切れのメッセージは読み込み時に除く。
+    """
+    
+    def __init__(self, redis_url: str, max_messages: int = 20, max_age_hours: int = 24, prefix: str = "thread_memory:"):
+        self.redis_url = redis_url
+        self.max_messages = max_messages
+        self.max_age_hours = max_age_hours
+        self.prefix = prefix
+        self._client = None
+    
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url)
+        return self._client
+    
+    def add_message(self, thread_id: str, role: str, content: str, user_id: Optional[str] = None):
+        """メッセージを追加"""
+        message = Message(role=role, content=content, timestamp=time.time(), user_id=user_id)
+        key = f"{self.prefix}{thread_id}"
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.rpush(key, json.dumps(asdict(message), ensure_ascii=False))
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.max_age_hours * 3600)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"[ThreadMemory] Redis unavailable, message not stored for thread {thread_id}: {e}")
+            return
+        logger.info(f"[ThreadMemory] Added {role} message to thread {thread_id}")
+    
+    def _load(self, thread_id: str) -> List[Message]:
+        raw = self.client.lrange(f"{self.prefix}{thread_id}", 0, -1)
+        min_timestamp = time.time() - self.max_age_hours * 3600
+        messages = (Message(**json.loads(value)) for value in raw)
+        return [msg for msg in messages if msg.timestamp >= min_timestamp]
+    
+    def get_context(self, thread_id: str) -> str:
+        """スレッドの会話履歴をコンテキスト文字列として取得"""
+        try:
+            messages = self._load(thread_id)
+        except Exception as e:
+            logger.warning(f"[ThreadMemory] Redis unavailable, no context for thread {thread_id}: {e}")
+            return ""
+        if not messages:
+            return ""
+        context = _format_context(messages)
+        logger.info(f"[ThreadMemory] Retrieved context for thread {thread_id}: {len(context)} chars")
+        return context
+    
+    def remove_message(self, thread_id: str, role: str, content: str) -> bool:
+        """最後に追加された一致するメッセージを削除（取り消されたリクエストの発言用）"""
+        key = f"{self.prefix}{thread_id}"
+        try:
+            for value in reversed(self.client.lrange(key, 0, -1)):
+                data = json.loads(value)
+                if data["role"] == role and data["content"] == content:
+                    return bool(self.client.lrem(key, -1, value))
+        except Exception as e:
+            logger.warning(f"[ThreadMemory] Redis unavailable, failed to remove message from thread {thread_id}: {e}")
+        return False
+    
+    def has_history(self, thread_id: str) -> bool:
+        """スレッドに履歴があるかチェック"""
+        try:
+            return bool(self.client.exists(f"{self.prefix}{thread_id}"))
+        except Exception as e:
+            logger.warning(f"[ThreadMemory] Redis unavailable, assuming no history for thread {thread_id}: {e}")
+            return False
+    
+    def stats(self) -> dict:
+        """診断用（Redisのキーは走査しない）"""
+        return {"backend": "redis"}
+    
+    def clear_thread(self, thread_id: str):
+        """特定のスレッドの履歴をクリア"""
+        if self.client.delete(f"{self.prefix}{thread_id}"):
+            logger.info(f"[ThreadMemory] Cleared thread {thread_id}")
+
+def create_thread_memory():
+    """THREAD_STATE_BACKEND に応じた会話履歴の保存先（redis: 複数プロセスで共有、memory: プロセス内）"""
+    if os.getenv("THREAD_STATE_BACKEND", "memory").lower() == "redis":
+        return RedisThreadMemory(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    return ThreadMemory()
+
+def agent_owns_thread_memory() -> bool:
+    """会話履歴をエージェントサーバー側で保持するか（THREAD_MEMORY_OWNER=agent、既定）
+
+    エージェント側で保持する場合、このプロセスは履歴を持たず新しいユーザー発言のみを送信する。
+    """
+    return os.getenv("THREAD_MEMORY_OWNER", "agent").lower() == "agent"
 
 # グローバルインスタンス
-thread_memory = ThreadMemory()
\ No newline at end of file
+thread_memory = create_thread_memory()
+metrics.register_gauge("thread_memory", thread_memory.stats)
\ No newline at end of file